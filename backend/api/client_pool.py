@@ -0,0 +1,356 @@
+"""
+Groq Client Pool - Phân tải và chuyển đổi dự phòng giữa nhiều API key / model
+"""
+from config.config import config
+from backend.api.groq_client import GroqClient
+from backend.api.resilience import Deadline
+from backend.utils.logger import get_logger
+from typing import AsyncGenerator, Dict, Generator, List, Optional, Tuple
+import threading
+import time
+
+logger = get_logger(__name__)
+
+# Hệ số làm mượt EWMA (Exponentially Weighted Moving Average) cho độ trễ và tỉ lệ lỗi:
+# 0.2 = mỗi quan sát mới đóng góp 20%, phản ứng nhanh nhưng không giật theo một lần lỗi lẻ.
+EWMA_ALPHA = 0.2
+
+
+def parse_pool_models(spec: str) -> List[Tuple[str, float]]:
+    """
+    Đọc cấu hình danh sách model kèm trọng số
+
+    Args:
+        spec: Chuỗi dạng "llama-3.3-70b-versatile:3,llama-3.1-8b-instant:1"
+
+    Returns:
+        List[Tuple[str, float]]: [(model, trọng số)]
+    """
+    models = []
+    for item in (spec or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, weight = item.rpartition(':')
+        try:
+            models.append((name, float(weight)) if name else (weight, 1.0))
+        except ValueError:
+            models.append((item, 1.0))
+    return models
+
+
+# Lớp PoolEndpoint đại diện cho một cặp (API key, model) trong pool, kèm các chỉ số sức khỏe:
+# số request đang chạy, EWMA độ trễ (TTFT với stream), EWMA tỉ lệ lỗi, hạn mức còn lại
+# (đọc từ bộ giới hạn lưu lượng vốn được cập nhật theo header x-ratelimit-*) và
+# trạng thái bị loại tạm thời (ejected) kèm thời gian chờ tăng dần (exponential backoff).
+
+
+class PoolEndpoint:
+    """Một endpoint (API key + model) trong pool cùng chỉ số sức khỏe"""
+
+    def __init__(self, client: GroqClient, weight: float = 1.0):
+        self.client = client
+        self.model = client.model
+        self.weight = max(weight, 0.01)
+        self.name = f"{client.api_key[-4:]}:{client.model}"
+
+        self.in_flight = 0
+        self.latency_ewma: Optional[float] = None
+        self.error_ewma = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.eject_reason = None
+        self.daily_exhausted = False
+
+    def quota_fraction(self) -> float:
+        """Tỉ lệ hạn mức token/phút còn lại (1.0 nếu không có limiter)"""
+        limiter = self.client.limiter
+        if not limiter:
+            return 1.0
+        stats = limiter.get_stats()
+        if stats['paused_for_s'] > 0:
+            return 0.0
+        return max(0.0, min(1.0, stats['tokens_available'] / stats['tpm']))
+
+    def is_available(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+    def score(self, quota: float) -> float:
+        """
+        Điểm chọn endpoint: càng thấp càng ưu tiên (ít tải, ít lỗi, còn nhiều hạn mức)
+
+        Args:
+            quota: quota_fraction() đã đọc trước khi vào khóa của pool
+        """
+        load = (self.in_flight + 1) / self.weight
+        return load * (1.0 + 4.0 * self.error_ewma) / max(quota, 0.05)
+
+
+# Lớp GroqClientPool có cùng giao diện với GroqClient (chat / chat_stream / *_async), nên
+# RAGChain dùng được mà không cần sửa. Mỗi request được gửi tới endpoint có điểm thấp nhất
+# (Weighted Least-Loaded). Khi endpoint lỗi, request được chuyển sang endpoint kế tiếp;
+# endpoint hết hạn mức ngày (API_DAILY_LIMIT), lỗi liên tiếp hoặc chậm bất thường sẽ bị
+# loại khỏi vòng chọn một thời gian rồi được thử lại với thời gian chờ tăng dần.
+# Client của từng endpoint chỉ thử GROQ_POOL_ENDPOINT_RETRIES lần (mặc định 1): lỗi 429 được
+# báo ngay cho pool để loại endpoint và chuyển tải, thay vì chờ retry-after tại chỗ.
+
+
+class GroqClientPool:
+    """Pool nhiều Groq client với chính sách weighted least-loaded và failover"""
+
+    def __init__(self, api_keys: List[str] = None, models: List[Tuple[str, float]] = None, base_url: str = None):
+        """
+        Khởi tạo pool
+
+        Args:
+            api_keys: Danh sách API key (nếu None lấy từ GROQ_API_KEYS / GROQ_API_KEY)
+            models: Danh sách (model, trọng số) (nếu None lấy từ GROQ_POOL_MODELS / GROQ_MODEL)
+            base_url: URL gốc API (dùng cho máy chủ giả lập)
+        """
+        api_keys = api_keys or [k.strip() for k in config.GROQ_API_KEYS.split(',') if k.strip()] \
+            or [config.GROQ_API_KEY]
+        models = models or parse_pool_models(config.GROQ_POOL_MODELS) \
+            or [(config.GROQ_MODEL, 1.0)]
+
+        self.endpoints: List[PoolEndpoint] = [
+            PoolEndpoint(GroqClient(api_key=key, model=model, base_url=base_url,
+                                    max_retries=config.GROQ_POOL_ENDPOINT_RETRIES), weight)
+            for key in api_keys
+            for model, weight in models
+        ]
+        self.model = self.endpoints[0].model
+        self._lock = threading.Lock()
+        self._failovers = 0
+
+        logger.info(
+            f"Groq Client Pool: {len(self.endpoints)} endpoints "
+            f"({len(api_keys)} keys x {len(models)} models)")
+
+    # ---------- Chọn endpoint và ghi nhận kết quả ----------
+
+    def _acquire(self, exclude: set) -> PoolEndpoint:
+        """Chọn endpoint tốt nhất chưa thử và tăng bộ đếm in-flight"""
+        # Đọc hạn mức TRƯỚC khi vào khóa: limiter.get_stats() lấy khóa của limiter và (với
+        # trạng thái chia sẻ) một giao dịch SQLite, không được giữ khóa pool trong lúc đó
+        quotas = {e.name: e.quota_fraction() for e in self.endpoints if e.name not in exclude}
+        with self._lock:
+            now = time.time()
+            candidates = [e for e in self.endpoints if e.name not in exclude]
+            if not candidates:
+                raise Exception("API_RATE_LIMIT")
+
+            available = [e for e in candidates if e.is_available(now)]
+            if available:
+                endpoint = min(available, key=lambda e: e.score(quotas[e.name]))
+            elif all(e.daily_exhausted for e in candidates):
+                raise Exception("API_DAILY_LIMIT")
+            else:
+                # Mọi endpoint đều đang bị loại: thử endpoint sắp hết thời gian chờ nhất
+                endpoint = min(candidates, key=lambda e: e.ejected_until)
+
+            endpoint.in_flight += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def _release(self, endpoint: PoolEndpoint, latency: float = None, error: Exception = None):
+        with self._lock:
+            endpoint.in_flight -= 1
+            now = time.time()
+
+            if error is None:
+                endpoint.error_ewma *= (1 - EWMA_ALPHA)
+                endpoint.consecutive_failures = 0
+                endpoint.daily_exhausted = False
+                if latency is not None:
+                    endpoint.latency_ewma = latency if endpoint.latency_ewma is None else \
+                        EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * endpoint.latency_ewma
+                    # Endpoint chậm bất thường: loại ngắn hạn để nhường tải cho endpoint khác
+                    if endpoint.latency_ewma > config.GROQ_POOL_SLOW_SECONDS:
+                        self._eject(endpoint, config.GROQ_POOL_BASE_BACKOFF, 'slow', now)
+                return
+
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            endpoint.error_ewma = EWMA_ALPHA + (1 - EWMA_ALPHA) * endpoint.error_ewma
+
+            error_str = str(error)
+            if 'API_DAILY_LIMIT' in error_str:
+                endpoint.daily_exhausted = True
+                self._eject(endpoint, config.GROQ_POOL_DAILY_BACKOFF, 'daily_limit', now)
+            else:
+                backoff = min(
+                    config.GROQ_POOL_BASE_BACKOFF *
+                    (2 ** (endpoint.consecutive_failures - 1)),
+                    config.GROQ_POOL_MAX_BACKOFF)
+                reason = 'rate_limit' if 'API_RATE_LIMIT' in error_str else \
+                    'load_shed' if 'API_LOAD_SHED' in error_str else 'error'
+                self._eject(endpoint, backoff, reason, now)
+
+    @staticmethod
+    def _eject(endpoint: PoolEndpoint, seconds: float, reason: str, now: float):
+        endpoint.ejected_until = now + seconds
+        endpoint.eject_reason = reason
+        logger.warning(
+            f"Pool: loai endpoint {endpoint.name} trong {seconds:.0f}s (ly do: {reason})")
+
+    def _on_failover(self, endpoint: PoolEndpoint, error: Exception):
+        with self._lock:
+            self._failovers += 1
+        logger.warning(
+            f"Pool: endpoint {endpoint.name} loi ({error}), chuyen sang endpoint khac")
+
+    # ---------- Giao diện tương thích GroqClient ----------
+
+    def chat(self, messages: List[Dict[str, str]], temperature: float = None, max_tokens: int = None, deadline: Deadline = None) -> str:
+        """Gửi chat request qua pool (tự chuyển endpoint khi lỗi)"""
+        tried = set()
+        last_error = None
+        for _ in range(len(self.endpoints)):
+            try:
+                endpoint = self._acquire(tried)
+            except Exception:
+                break
+            tried.add(endpoint.name)
+            start = time.time()
+            try:
+                answer = endpoint.client.chat(
+                    messages, temperature=temperature, max_tokens=max_tokens, deadline=deadline)
+            except Exception as e:
+                self._release(endpoint, error=e)
+                if deadline is not None and deadline.expired():
+                    raise
+                self._on_failover(endpoint, e)
+                last_error = e
+                continue
+            self._release(endpoint, latency=time.time() - start)
+            return answer
+        raise last_error or Exception("API_RATE_LIMIT")
+
+    def chat_stream(self, messages: List[Dict[str, str]], temperature: float = None, max_tokens: int = None, deadline: Deadline = None) -> Generator[str, None, None]:
+        """
+        Streaming qua pool. Chỉ chuyển endpoint khi lỗi xảy ra TRƯỚC token đầu tiên;
+        lỗi giữa chừng được ném ra ngoài để tránh trộn hai câu trả lời khác nhau.
+        """
+        tried = set()
+        last_error = None
+        for _ in range(len(self.endpoints)):
+            try:
+                endpoint = self._acquire(tried)
+            except Exception:
+                break
+            tried.add(endpoint.name)
+            start = time.time()
+            ttft = None
+            try:
+                for chunk in endpoint.client.chat_stream(messages, temperature=temperature, max_tokens=max_tokens, deadline=deadline):
+                    if ttft is None:
+                        ttft = time.time() - start
+                    yield chunk
+            except Exception as e:
+                self._release(endpoint, error=e)
+                if ttft is not None or (deadline is not None and deadline.expired()):
+                    raise
+                self._on_failover(endpoint, e)
+                last_error = e
+                continue
+            except BaseException:
+                # Người tiêu thụ đóng generator giữa chừng (GeneratorExit)
+                self._release(endpoint)
+                raise
+            self._release(endpoint, latency=ttft if ttft is not None else time.time() - start)
+            return
+        raise last_error or Exception("API_RATE_LIMIT")
+
+    async def chat_async(self, messages: List[Dict[str, str]], temperature: float = None, max_tokens: int = None, deadline: Deadline = None) -> str:
+        """Phiên bản bất đồng bộ của chat()"""
+        tried = set()
+        last_error = None
+        for _ in range(len(self.endpoints)):
+            try:
+                endpoint = self._acquire(tried)
+            except Exception:
+                break
+            tried.add(endpoint.name)
+            start = time.time()
+            try:
+                answer = await endpoint.client.chat_async(
+                    messages, temperature=temperature, max_tokens=max_tokens, deadline=deadline)
+            except Exception as e:
+                self._release(endpoint, error=e)
+                if deadline is not None and deadline.expired():
+                    raise
+                self._on_failover(endpoint, e)
+                last_error = e
+                continue
+            self._release(endpoint, latency=time.time() - start)
+            return answer
+        raise last_error or Exception("API_RATE_LIMIT")
+
+    async def chat_stream_async(self, messages: List[Dict[str, str]], temperature: float = None, max_tokens: int = None, deadline: Deadline = None) -> AsyncGenerator[str, None]:
+        """Phiên bản bất đồng bộ của chat_stream()"""
+        tried = set()
+        last_error = None
+        for _ in range(len(self.endpoints)):
+            try:
+                endpoint = self._acquire(tried)
+            except Exception:
+                break
+            tried.add(endpoint.name)
+            start = time.time()
+            ttft = None
+            try:
+                async for chunk in endpoint.client.chat_stream_async(messages, temperature=temperature, max_tokens=max_tokens, deadline=deadline):
+                    if ttft is None:
+                        ttft = time.time() - start
+                    yield chunk
+            except Exception as e:
+                self._release(endpoint, error=e)
+                if ttft is not None or (deadline is not None and deadline.expired()):
+                    raise
+                self._on_failover(endpoint, e)
+                last_error = e
+                continue
+            except BaseException:
+                self._release(endpoint)
+                raise
+            self._release(endpoint, latency=ttft if ttft is not None else time.time() - start)
+            return
+        raise last_error or Exception("API_RATE_LIMIT")
+
+    async def aclose(self):
+        for endpoint in self.endpoints:
+            await endpoint.client.aclose()
+
+    def get_model_info(self) -> Dict:
+        """Thông tin pool (tương thích GroqClient.get_model_info)"""
+        return {
+            'model': self.model,
+            'api_provider': 'Groq (pool)',
+            'endpoints': [e.name for e in self.endpoints],
+            'temperature': config.TEMPERATURE,
+            'max_tokens': config.MAX_TOKENS
+        }
+
+    def get_stats(self) -> Dict:
+        """Chỉ số sức khỏe từng endpoint (phục vụ /api/metrics)"""
+        quotas = {e.name: e.quota_fraction() for e in self.endpoints}
+        with self._lock:
+            now = time.time()
+            endpoints = []
+            for e in self.endpoints:
+                endpoints.append({
+                    'name': e.name,
+                    'weight': e.weight,
+                    'in_flight': e.in_flight,
+                    'requests': e.requests,
+                    'failures': e.failures,
+                    'error_rate_ewma': round(e.error_ewma, 3),
+                    'latency_ewma_s': round(e.latency_ewma, 3) if e.latency_ewma is not None else None,
+                    'quota_fraction': round(quotas[e.name], 3),
+                    'ejected_for_s': round(max(0.0, e.ejected_until - now), 1),
+                    'eject_reason': e.eject_reason if e.ejected_until > now else None,
+                    'circuit': e.client.breaker.get_stats()['state'] if e.client.breaker else None
+                })
+            return {'failovers': self._failovers, 'endpoints': endpoints}
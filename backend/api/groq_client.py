@@ -2,19 +2,32 @@
 Groq API Client - Kết nối và sử dụng Groq LLM
 """
 from config.config import config
-from groq import Groq
-from typing import List, Dict, Generator
+from groq import Groq, AsyncGroq, APITimeoutError
+from typing import List, Dict, Generator, AsyncGenerator, Optional
+import asyncio
+import httpx
 import sys
+import threading
 import time
 import re
 from pathlib import Path
 from backend.utils.logger import get_logger
+from backend.api.rate_limiter import get_rate_limiter, estimate_tokens
+from backend.api.resilience import Deadline, cap_timeout, get_circuit_breaker
 
 logger = get_logger(__name__)
 
 # Import config
 sys.path.append(str(Path(__file__).parent.parent.parent))
 
+# HTTP/2 chỉ khả dụng khi cài thêm gói 'h2' (pip install httpx[http2]).
+# Thiếu gói này, client bất đồng bộ vẫn hoạt động bình thường trên HTTP/1.1 keep-alive.
+try:
+    import h2  # noqa: F401
+    _HTTP2_AVAILABLE = True
+except Exception:
+    _HTTP2_AVAILABLE = False
+
 # Lớp GroqClient đóng vai trò là một Wrapper (Lớp bao bọc).
 # Thay vì gọi trực tiếp thư viện trong toàn bộ dự án, việc dùng Wrapper giúp
 # tập trung quản lý lỗi, cấu hình và tái sử dụng mã (Clean Code).
@@ -23,18 +36,24 @@ sys.path.append(str(Path(__file__).parent.parent.parent))
 class GroqClient:
     """Class quản lý Groq API"""
 
-    def __init__(self, api_key: str = None, model: str = None):
+    def __init__(self, api_key: str = None, model: str = None, base_url: str = None, max_retries: int = 3):
         """
         Khởi tạo Groq client
 
         Args:
             api_key: Groq API key (nếu None sẽ lấy từ config)
             model: Tên model (nếu None sẽ lấy từ config hoặc dùng llama-3.3-70b-versatile)
+            base_url: URL gốc của API (nếu None sẽ lấy GROQ_BASE_URL, rỗng = máy chủ Groq thật).
+                Dùng để trỏ tới máy chủ giả lập backend/api/mock_server.py khi kiểm thử tải.
+            max_retries: Số lần gửi tối đa khi gặp 429 (1 = báo lỗi ngay, dùng trong GroqClientPool
+                để pool chuyển endpoint thay vì chờ retry-after trên endpoint đang bị giới hạn)
         """
         # Ưu tiên lấy API key và tên model từ biến môi trường (config) để đảm bảo bảo mật.
         # Nếu không có cấu hình model, hệ thống tự động sử dụng mặc định Llama 3.3 70B.
         self.api_key = api_key or config.GROQ_API_KEY
         self.model = model or config.GROQ_MODEL or "llama-3.3-70b-versatile"
+        self.base_url = base_url or config.GROQ_BASE_URL or None
+        self.max_retries = max(1, max_retries)
 
         if not self.api_key:
             raise ValueError(
@@ -43,10 +62,30 @@ class GroqClient:
                 "Sau đó thêm vào file config/.env"
             )
 
-        # Khởi tạo đối tượng kết nối chính thức của thư viện Groq
-        self.client = Groq(api_key=self.api_key)
+        # Khởi tạo đối tượng kết nối chính thức của thư viện Groq.
+        # Chế độ fail-fast (max_retries=1) tắt luôn vòng thử lại nội bộ của SDK, vốn cũng tự
+        # chờ retry-after khi gặp 429.
+        self._sdk_options = {} if self.max_retries > 1 else {'max_retries': 0}
+        self.client = Groq(api_key=self.api_key, base_url=self.base_url, **self._sdk_options)
+
+        # Client bất đồng bộ được tạo lười (lazy) ở lần gọi async đầu tiên, vì pool kết nối
+        # của httpx.AsyncClient gắn với event loop đang chạy: mỗi event loop một client.
+        self._async_clients: Dict[asyncio.AbstractEventLoop, AsyncGroq] = {}
+        self._async_lock = threading.Lock()
+
+        # Bộ giới hạn lưu lượng phía client: dùng chung toàn tiến trình cho mỗi cặp
+        # API key + model (Groq tính hạn mức riêng cho từng model). Tên bucket chỉ chứa
+        # 4 ký tự cuối của key để không lộ key qua metrics.
+        self.limiter = get_rate_limiter(
+            f"groq:{self.api_key[-4:]}:{self.model}") if config.GROQ_RATE_LIMITER_ENABLED else None
+
+        # Cầu dao ngắt mạch: dùng chung toàn tiến trình cho mỗi cặp API key + model
+        self.breaker = get_circuit_breaker(
+            f"groq:{self.api_key[-4:]}:{self.model}") if config.CIRCUIT_BREAKER_ENABLED else None
         logger.info("Groq Client khởi tạo thành công!")
         logger.info(f"Model: {self.model}")
+        if self.base_url:
+            logger.info(f"Base URL: {self.base_url}")
 
     # Hàm thực thi lệnh gọi LLM theo phương thức đồng bộ (Synchronous).
     # Phương thức này đợi LLM sinh ra toàn bộ chuỗi văn bản rồi mới trả về một lần.
@@ -56,7 +95,8 @@ class GroqClient:
         messages: List[Dict[str, str]],
         temperature: float = None,
         max_tokens: int = None,
-        stream: bool = False
+        stream: bool = False,
+        deadline: Deadline = None
     ) -> str:
         """
         Gửi chat request đến Groq API
@@ -66,6 +106,7 @@ class GroqClient:
             temperature: Mức độ sáng tạo (0-2)
             max_tokens: Số token tối đa
             stream: Streaming response hay không
+            deadline: Hạn chót của toàn request (None = chỉ dùng timeout từng lần gọi)
 
         Returns:
             str: Phản hồi từ LLM
@@ -73,57 +114,214 @@ class GroqClient:
         temp = temperature if temperature is not None else config.TEMPERATURE
         tokens = max_tokens if max_tokens is not None else config.MAX_TOKENS
 
+        self._circuit_allow()
         # Cơ chế thử lại (Retry Mechanism): Giải quyết bài toán giới hạn lưu lượng (Rate Limit)
-        # của các API cung cấp miễn phí. Hệ thống sẽ thử gọi lại tối đa 3 lần nếu gặp lỗi mạng.
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    temperature=temp,
-                    max_tokens=tokens,
-                    stream=stream
-                )
-
-                if stream:
-                    return response  # Return generator for streaming
-                else:
-                    return response.choices[0].message.content
-
-            # Bắt lỗi cụ thể từ API, đặc biệt là lỗi 429 (Too Many Requests)
-            except Exception as e:
-                error_str = str(e)
-                # Check for rate limit (429)
-                if '429' in error_str or 'rate_limit' in error_str:
-                    # Daily token limit (TPD) -> Đã hết hạn mức ngày, không thể thử lại.
-                    if 'tokens per day' in error_str.lower() or 'TPD' in error_str:
-                        logger.error(
-                            "Daily token quota exhausted (TPD). Cannot retry.")
-                        raise Exception("API_DAILY_LIMIT")
-
-                    # Short rate limit -> Bị giới hạn tốc độ tức thời. Hệ thống gọi hàm phụ
-                    # để trích xuất thời gian cần chờ, sau đó cho thread ngủ (time.sleep).
-                    wait_time = self._parse_retry_after(
-                        error_str, default=10 * (attempt + 1))
-
-                    # Khống chế thời gian chờ tối đa 30s để tránh treo hệ thống quá lâu.
-                    if wait_time > 30:
-                        logger.error(
-                            f"Rate limit wait too long ({wait_time}s). Failing fast.")
-                        raise Exception("API_RATE_LIMIT")
-                    logger.warning(
-                        f"Rate limit hit (attempt {attempt+1}/{max_retries}). Waiting {wait_time}s...")
-                    time.sleep(wait_time)
+        # của các API cung cấp miễn phí. Hệ thống sẽ thử gọi lại tối đa max_retries lần (mặc định 3).
+        # Lần thử cuối không chờ backoff: không còn lần gửi nào để chờ cho.
+        estimated = estimate_tokens(messages, tokens)
+        max_retries = self.max_retries
+        try:
+            for attempt in range(max_retries):
+                # Xếp hàng chờ hạn mức TRƯỚC khi gửi (nằm ngoài try: lỗi load shedding
+                # API_LOAD_SHED phải được ném thẳng ra ngoài, không bị coi là lỗi để retry)
+                self._acquire(estimated, deadline)
+                try:
+                    raw = self.client.chat.completions.with_raw_response.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=temp,
+                        max_tokens=tokens,
+                        stream=stream,
+                        timeout=self._attempt_timeout(deadline, stream=stream)
+                    )
+                    response = self._observe(raw, estimated)
+
+                    self._circuit_record()
+                    if stream:
+                        return response  # Return generator for streaming
+                    else:
+                        return response.choices[0].message.content
+
+                # Bắt lỗi cụ thể từ API, đặc biệt là lỗi 429 (Too Many Requests)
+                except Exception as e:
+                    wait_time = self._rate_limit_wait(e, attempt, max_retries)
+                    if attempt + 1 < max_retries:
+                        self._backoff(wait_time, deadline)
                     continue
-                else:
-                    logger.error(f"Lỗi Groq API: {e}")
-                    raise  # Re-raise non-rate-limit errors
+        except Exception as e:
+            self._circuit_record(e)
+            raise
 
         # All retries exhausted
         logger.error("Groq API rate limit - all retries exhausted")
         raise Exception("API_RATE_LIMIT")
 
+    # ============================================
+    # TÍCH HỢP BỘ GIỚI HẠN LƯU LƯỢNG (CLIENT-SIDE RATE LIMITER)
+    # Khi bật limiter, request chờ hạn mức trong hàng đợi công bằng trước khi gửi.
+    # Sau lỗi 429, bucket bị tạm dừng (pause) thay vì để thread tự ngủ; lần thử lại
+    # sẽ xếp hàng cùng các request khác và bị từ chối nếu vượt hạn chót chờ.
+    # ============================================
+    def _acquire(self, estimated: int, deadline: Deadline = None):
+        if deadline is not None:
+            deadline.check("groq")
+        if self.limiter:
+            self.limiter.acquire(
+                estimated, max_wait=cap_timeout(deadline, self.limiter.max_wait))
+
+    async def _acquire_async(self, estimated: int, deadline: Deadline = None):
+        if deadline is not None:
+            deadline.check("groq")
+        if self.limiter:
+            await self.limiter.acquire_async(
+                estimated, max_wait=cap_timeout(deadline, self.limiter.max_wait))
+
+    def _observe(self, raw, estimated: int):
+        """Đọc header x-ratelimit-* của phản hồi thô rồi trả về đối tượng đã parse"""
+        response = raw.parse()
+        self._record_usage(raw.headers, response, estimated)
+        return response
+
+    async def _observe_async(self, raw, estimated: int):
+        # Với AsyncGroq, parse() là coroutine
+        response = await raw.parse()
+        self._record_usage(raw.headers, response, estimated)
+        return response
+
+    def _record_usage(self, headers, response, estimated: int):
+        if self.limiter:
+            self.limiter.update_from_headers(headers)
+            self._reconcile_usage(getattr(response, 'usage', None), estimated)
+
+    def _reconcile_usage(self, usage, estimated: int):
+        if self.limiter and usage is not None and getattr(usage, 'total_tokens', None):
+            self.limiter.reconcile(estimated, usage.total_tokens)
+
+    def _reconcile_chunk(self, chunk, estimated: int):
+        """Luồng stream chỉ biết số token thực dùng ở chunk cuối (usage hoặc x_groq.usage)"""
+        usage = getattr(chunk, 'usage', None) or \
+            getattr(getattr(chunk, 'x_groq', None), 'usage', None)
+        self._reconcile_usage(usage, estimated)
+
+    def _backoff(self, wait_time: float, deadline: Deadline = None):
+        self._check_backoff_deadline(wait_time, deadline)
+        if self.limiter:
+            self.limiter.pause(wait_time)
+        else:
+            time.sleep(wait_time)
+
+    async def _backoff_async(self, wait_time: float, deadline: Deadline = None):
+        self._check_backoff_deadline(wait_time, deadline)
+        if self.limiter:
+            self.limiter.pause(wait_time)
+        else:
+            # asyncio.sleep nhường event loop cho các request khác trong lúc chờ
+            await asyncio.sleep(wait_time)
+
+    # ============================================
+    # HẠN CHÓT VÀ CẦU DAO NGẮT MẠCH (DEADLINE & CIRCUIT BREAKER)
+    # - Mỗi lần gọi có timeout riêng (GROQ_ATTEMPT_TIMEOUT), bị cắt theo hạn chót còn lại.
+    # - Với stream, read timeout = GROQ_STREAM_TTFT_TIMEOUT: Groq không trả token đầu tiên
+    #   (hoặc ngừng trả token) trong khoảng đó -> hủy kết nối thay vì treo.
+    # - Không chờ retry nếu thời gian chờ vượt quá hạn chót còn lại (thất bại ngay).
+    # ============================================
+    @staticmethod
+    def _attempt_timeout(deadline: Optional[Deadline], stream: bool = False) -> httpx.Timeout:
+        total = max(cap_timeout(deadline, config.GROQ_ATTEMPT_TIMEOUT), 0.1)
+        read = min(config.GROQ_STREAM_TTFT_TIMEOUT, total) if stream else total
+        return httpx.Timeout(total, read=read, connect=min(5.0, total))
+
+    @staticmethod
+    def _check_backoff_deadline(wait_time: float, deadline: Optional[Deadline]):
+        if deadline is not None and wait_time >= deadline.remaining():
+            logger.warning(
+                f"Retry sau {wait_time}s vuot han chot con lai ({deadline.remaining():.1f}s) -> dung")
+            raise Exception("API_TIMEOUT")
+
+    @staticmethod
+    def _check_stream_deadline(deadline: Optional[Deadline]):
+        if deadline is not None and deadline.expired():
+            logger.warning("Request deadline exceeded giua luong stream")
+            raise Exception("API_TIMEOUT")
+
+    def _circuit_allow(self):
+        if self.breaker:
+            self.breaker.allow()
+
+    def _circuit_record(self, error: Exception = None):
+        """Ghi nhận kết quả cho cầu dao (bỏ qua lỗi hạn mức cục bộ và lỗi do chính cầu dao)"""
+        if not self.breaker:
+            return
+        if error is None:
+            self.breaker.record_success()
+        elif not any(code in str(error) for code in ('API_RATE_LIMIT', 'API_LOAD_SHED', 'API_CIRCUIT_OPEN')):
+            self.breaker.record_failure()
+
+    def get_stats(self) -> Dict:
+        """Thống kê bộ giới hạn lưu lượng (queue depth, thời gian chờ, số request bị từ chối) và cầu dao"""
+        return {
+            'model': self.model,
+            'rate_limiter': self.limiter.get_stats() if self.limiter else None,
+            'circuit_breaker': self.breaker.get_stats() if self.breaker else None
+        }
+
+    # Hàm phân loại lỗi dùng chung cho cả 4 đường gọi (sync/async, thường/stream).
+    # Trả về số giây cần chờ trước lần thử lại, hoặc ném lỗi chuẩn hóa
+    # (API_DAILY_LIMIT / API_RATE_LIMIT) để RAGChain hiển thị thông báo phù hợp.
+    def _rate_limit_wait(self, error: Exception, attempt: int, max_retries: int, mode: str = None) -> int:
+        """
+        Phân loại lỗi Groq API và tính thời gian chờ retry
+
+        Args:
+            error: Exception bắt được từ Groq SDK
+            attempt: Lần thử hiện tại (bắt đầu từ 0)
+            max_retries: Tổng số lần thử
+            mode: Nhãn ghi log (vd: "stream", "async")
+
+        Returns:
+            int: Số giây cần chờ trước khi thử lại
+
+        Raises:
+            Exception: API_DAILY_LIMIT, API_RATE_LIMIT hoặc lỗi gốc (không phải rate limit)
+        """
+        # Phản hồi lỗi 429 cũng mang header retry-after / x-ratelimit-* -> cập nhật bucket
+        response = getattr(error, 'response', None)
+        if self.limiter and response is not None:
+            self.limiter.update_from_headers(response.headers)
+
+        # Timeout (từng lần gọi hoặc chờ token đầu tiên) -> lỗi chuẩn hóa API_TIMEOUT
+        if isinstance(error, (APITimeoutError, httpx.TimeoutException)):
+            logger.error(f"Groq API timeout{f' ({mode})' if mode else ''}: {error}")
+            raise Exception("API_TIMEOUT")
+
+        error_str = str(error)
+        # Check for rate limit (429)
+        if '429' in error_str or 'rate_limit' in error_str:
+            # Daily token limit (TPD) -> Đã hết hạn mức ngày, không thể thử lại.
+            if 'tokens per day' in error_str.lower() or 'TPD' in error_str:
+                logger.error(
+                    "Daily token quota exhausted (TPD). Cannot retry.")
+                raise Exception("API_DAILY_LIMIT")
+
+            # Short rate limit -> Bị giới hạn tốc độ tức thời. Trích xuất thời gian cần chờ
+            # từ thông báo lỗi; nơi gọi sẽ tạm dừng bucket (hoặc ngủ khi tắt limiter) rồi thử lại.
+            wait_time = self._parse_retry_after(
+                error_str, default=10 * (attempt + 1))
+
+            # Khống chế thời gian chờ tối đa 30s để tránh treo hệ thống quá lâu.
+            if wait_time > 30:
+                logger.error(
+                    f"Rate limit wait too long ({wait_time}s). Failing fast.")
+                raise Exception("API_RATE_LIMIT")
+            label = f"{mode}, " if mode else ""
+            logger.warning(
+                f"Rate limit hit ({label}attempt {attempt+1}/{max_retries}). Waiting {wait_time}s...")
+            return wait_time
+
+        if 'stream' not in (mode or ''):
+            logger.error(f"Lỗi Groq API: {error}")
+        raise error  # Re-raise non-rate-limit errors
+
     @staticmethod
     # Hàm xử lý chuỗi bằng Biểu thức chính quy (Regex) để tự động hóa việc đọc lỗi.
     # Hàm trích xuất chính xác số giây cần chờ từ thông báo lỗi của Groq (vd: "try again in 5.5s").
@@ -146,7 +344,8 @@ class GroqClient:
         self,
         messages: List[Dict[str, str]],
         temperature: float = None,
-        max_tokens: int = None
+        max_tokens: int = None,
+        deadline: Deadline = None
     ) -> Generator[str, None, None]:
         """
         Streaming chat (trả lời từng từ một)
@@ -155,6 +354,7 @@ class GroqClient:
             messages: List of messages
             temperature: Temperature
             max_tokens: Max tokens
+            deadline: Hạn chót của toàn request
 
         Yields:
             str: Từng phần của response
@@ -162,50 +362,205 @@ class GroqClient:
         temp = temperature if temperature is not None else config.TEMPERATURE
         tokens = max_tokens if max_tokens is not None else config.MAX_TOKENS
 
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                stream = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    temperature=temp,
-                    max_tokens=tokens,
-                    stream=True  # Kích hoạt cờ stream tại API
-                )
-
-                # Sử dụng từ khóa 'yield' trong Python để tạo Generator.
-                # Khi Groq trả về một token (chunk), 'yield' đẩy dữ liệu đó về ngay lập tức
-                # mà không làm kết thúc hàm, tạo ra dòng dữ liệu liên tục.
-                for chunk in stream:
-                    if chunk.choices[0].delta.content:
-                        yield chunk.choices[0].delta.content
-                return  # Success, exit retry loop
-
-            # Logic xử lý giới hạn tốc độ (Rate Limit) cho luồng streaming, tương tự như hàm chat()
-            except Exception as e:
-                error_str = str(e)
-                if '429' in error_str or 'rate_limit' in error_str:
-                    # Daily token limit (TPD) -> fail immediately
-                    if 'tokens per day' in error_str.lower() or 'TPD' in error_str:
-                        logger.error(
-                            "Daily token quota exhausted (TPD). Cannot retry.")
-                        raise Exception("API_DAILY_LIMIT")
-                    wait_time = self._parse_retry_after(
-                        error_str, default=10 * (attempt + 1))
-                    if wait_time > 30:
-                        logger.error(
-                            f"Rate limit wait too long ({wait_time}s). Failing fast.")
-                        raise Exception("API_RATE_LIMIT")
-                    logger.warning(
-                        f"Rate limit hit (stream, attempt {attempt+1}/{max_retries}). Waiting {wait_time}s...")
-                    time.sleep(wait_time)
+        self._circuit_allow()
+        estimated = estimate_tokens(messages, tokens)
+        max_retries = self.max_retries
+        try:
+            for attempt in range(max_retries):
+                self._acquire(estimated, deadline)
+                try:
+                    raw = self.client.chat.completions.with_raw_response.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=temp,
+                        max_tokens=tokens,
+                        stream=True,  # Kích hoạt cờ stream tại API
+                        timeout=self._attempt_timeout(deadline, stream=True)
+                    )
+                    stream = self._observe(raw, estimated)
+
+                    # Sử dụng từ khóa 'yield' trong Python để tạo Generator.
+                    # Khi Groq trả về một token (chunk), 'yield' đẩy dữ liệu đó về ngay lập tức
+                    # mà không làm kết thúc hàm, tạo ra dòng dữ liệu liên tục.
+                    # Đóng luồng HTTP khi generator bị hủy giữa chừng (người dùng ngắt kết nối).
+                    with stream:
+                        for chunk in stream:
+                            if chunk.choices and chunk.choices[0].delta.content:
+                                yield chunk.choices[0].delta.content
+                            elif self.limiter:
+                                self._reconcile_chunk(chunk, estimated)
+                            self._check_stream_deadline(deadline)
+                    self._circuit_record()
+                    return  # Success, exit retry loop
+
+                # Logic xử lý giới hạn tốc độ (Rate Limit) cho luồng streaming, tương tự như hàm chat()
+                except Exception as e:
+                    if 'API_TIMEOUT' in str(e):
+                        raise
+                    wait_time = self._rate_limit_wait(
+                        e, attempt, max_retries, mode="stream")
+                    if attempt + 1 < max_retries:
+                        self._backoff(wait_time, deadline)
                     continue
-                else:
-                    raise
+        except Exception as e:
+            self._circuit_record(e)
+            raise
 
         # All retries exhausted
         raise Exception("API_RATE_LIMIT")
 
+    # ============================================
+    # CLIENT BẤT ĐỒNG BỘ (ASYNC / ASYNCIO)
+    # Mỗi request đồng bộ chiếm trọn một worker thread trong suốt vòng gọi LLM.
+    # Các hàm *_async dưới đây chạy trên event loop và dùng chung một pool kết nối
+    # keep-alive (HTTP/2 nếu có gói h2), nên một tiến trình có thể giữ hàng trăm
+    # luồng stream LLM đồng thời mà không cần một thread cho mỗi người dùng.
+    # ============================================
+    def _get_async_client(self) -> AsyncGroq:
+        """Lấy (hoặc tạo) AsyncGroq dùng chung cho event loop hiện tại"""
+        loop = asyncio.get_running_loop()
+        with self._async_lock:
+            # Kết nối của client thuộc event loop đã đóng đã mất cùng loop -> chỉ cần bỏ đi
+            for closed in [l for l in self._async_clients if l.is_closed()]:
+                del self._async_clients[closed]
+            client = self._async_clients.get(loop)
+            if client is not None:
+                return client
+            use_http2 = config.GROQ_HTTP2 and _HTTP2_AVAILABLE
+            http_client = httpx.AsyncClient(
+                http2=use_http2,
+                limits=httpx.Limits(
+                    max_connections=config.GROQ_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=config.GROQ_HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=config.GROQ_HTTP_KEEPALIVE_EXPIRY
+                ),
+                timeout=httpx.Timeout(config.GROQ_HTTP_TIMEOUT, connect=5.0)
+            )
+            client = AsyncGroq(
+                api_key=self.api_key, base_url=self.base_url, http_client=http_client,
+                **self._sdk_options)
+            self._async_clients[loop] = client
+            logger.info(
+                f"AsyncGroq khoi tao (http2={use_http2}, "
+                f"max_connections={config.GROQ_HTTP_MAX_CONNECTIONS}, "
+                f"so event loop: {len(self._async_clients)})")
+        return client
+
+    async def chat_async(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = None,
+        max_tokens: int = None,
+        deadline: Deadline = None
+    ) -> str:
+        """
+        Phiên bản bất đồng bộ của chat() (cùng cơ chế xử lý 429/TPD, timeout và cầu dao)
+
+        Args:
+            messages: List of message dicts
+            temperature: Mức độ sáng tạo (0-2)
+            max_tokens: Số token tối đa
+            deadline: Hạn chót của toàn request
+
+        Returns:
+            str: Phản hồi từ LLM
+        """
+        temp = temperature if temperature is not None else config.TEMPERATURE
+        tokens = max_tokens if max_tokens is not None else config.MAX_TOKENS
+        client = self._get_async_client()
+
+        self._circuit_allow()
+        estimated = estimate_tokens(messages, tokens)
+        max_retries = self.max_retries
+        try:
+            for attempt in range(max_retries):
+                await self._acquire_async(estimated, deadline)
+                try:
+                    raw = await client.chat.completions.with_raw_response.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=temp,
+                        max_tokens=tokens,
+                        timeout=self._attempt_timeout(deadline)
+                    )
+                    response = await self._observe_async(raw, estimated)
+                    self._circuit_record()
+                    return response.choices[0].message.content
+                except Exception as e:
+                    wait_time = self._rate_limit_wait(
+                        e, attempt, max_retries, mode="async")
+                    if attempt + 1 < max_retries:
+                        await self._backoff_async(wait_time, deadline)
+        except Exception as e:
+            self._circuit_record(e)
+            raise
+
+        logger.error("Groq API rate limit - all retries exhausted (async)")
+        raise Exception("API_RATE_LIMIT")
+
+    async def chat_stream_async(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = None,
+        max_tokens: int = None,
+        deadline: Deadline = None
+    ) -> AsyncGenerator[str, None]:
+        """
+        Phiên bản bất đồng bộ của chat_stream()
+
+        Yields:
+            str: Từng phần của response
+        """
+        temp = temperature if temperature is not None else config.TEMPERATURE
+        tokens = max_tokens if max_tokens is not None else config.MAX_TOKENS
+        client = self._get_async_client()
+
+        self._circuit_allow()
+        estimated = estimate_tokens(messages, tokens)
+        max_retries = self.max_retries
+        try:
+            for attempt in range(max_retries):
+                await self._acquire_async(estimated, deadline)
+                try:
+                    raw = await client.chat.completions.with_raw_response.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=temp,
+                        max_tokens=tokens,
+                        stream=True,
+                        timeout=self._attempt_timeout(deadline, stream=True)
+                    )
+                    stream = await self._observe_async(raw, estimated)
+                    async with stream:
+                        async for chunk in stream:
+                            if chunk.choices and chunk.choices[0].delta.content:
+                                yield chunk.choices[0].delta.content
+                            elif self.limiter:
+                                self._reconcile_chunk(chunk, estimated)
+                            self._check_stream_deadline(deadline)
+                    self._circuit_record()
+                    return
+                except Exception as e:
+                    if 'API_TIMEOUT' in str(e):
+                        raise
+                    wait_time = self._rate_limit_wait(
+                        e, attempt, max_retries, mode="stream-async")
+                    if attempt + 1 < max_retries:
+                        await self._backoff_async(wait_time, deadline)
+        except Exception as e:
+            self._circuit_record(e)
+            raise
+
+        raise Exception("API_RATE_LIMIT")
+
+    async def aclose(self):
+        """Đóng pool kết nối bất đồng bộ của event loop hiện tại (gọi trước khi loop dừng)"""
+        loop = asyncio.get_running_loop()
+        with self._async_lock:
+            client = self._async_clients.pop(loop, None)
+        if client is not None:
+            await client.close()
+
     # Hàm tiện ích giúp định dạng nhanh một câu hỏi đơn lẻ kèm System Prompt
     # thành danh sách Dictionary chuẩn xác cho LLM mà không cần truyền lịch sử hội thoại.
     def simple_ask(
@@ -252,6 +607,7 @@ class GroqClient:
         return {
             'model': self.model,
             'api_provider': 'Groq',
+            'base_url': self.base_url or 'https://api.groq.com',
             'temperature': config.TEMPERATURE,
             'max_tokens': config.MAX_TOKENS
         }
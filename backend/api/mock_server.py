@@ -0,0 +1,343 @@
+"""
+Mock Groq Server - Máy chủ giả lập API Groq/OpenAI cho kiểm thử tải và độ trễ
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+DEFAULT_CANNED_ANSWER = (
+    "Cảm cúm là bệnh nhiễm virus đường hô hấp, thường gây sốt, ho, đau họng và đau mỏi cơ. "
+    "Người bệnh nên nghỉ ngơi, uống nhiều nước và theo dõi nhiệt độ cơ thể.\n\n"
+    "Nguồn: cam_cum.txt"
+)
+
+# Lớp MockGroqServer mô phỏng endpoint /openai/v1/chat/completions của Groq (chuẩn OpenAI),
+# cho phép đo độ trễ, áp lực ngược (backpressure) và hành vi retry của toàn bộ hệ thống
+# mà không tiêu tốn hạn mức thật. Các đặc tính có thể cấu hình:
+# - ttft: thời gian tới token đầu tiên (Time To First Token), tính bằng giây
+# - tokens_per_second: tốc độ sinh token sau token đầu tiên
+# - rate_limit_rate: xác suất trả về 429 ngắn hạn (TPM) cho mỗi request
+# - daily_token_limit: tổng token tối đa trước khi trả về 429 hết hạn mức ngày (TPD)
+# - answer_mode: 'canned' (câu trả lời cố định) hoặc 'echo' (lặp lại câu hỏi cuối)
+# Máy chủ chạy được ngay trong tiến trình (start/stop, dùng trong test) hoặc như một
+# tiến trình riêng: python -m backend.api.mock_server --port 8765 --ttft 0.4 --tps 60
+
+
+class MockGroqServer:
+    """Máy chủ giả lập Groq API (OpenAI-compatible)"""
+
+    def __init__(
+        self,
+        host: str = '127.0.0.1',
+        port: int = 0,
+        ttft: float = 0.2,
+        tokens_per_second: float = 50.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: float = 2.0,
+        daily_token_limit: int = 0,
+        tpm_limit: int = 12000,
+        answer_mode: str = 'canned',
+        canned_answer: str = None,
+        seed: int = None
+    ):
+        """
+        Khởi tạo máy chủ giả lập
+
+        Args:
+            host: Địa chỉ lắng nghe
+            port: Cổng (0 = hệ điều hành tự chọn cổng trống)
+            ttft: Thời gian tới token đầu tiên (giây)
+            tokens_per_second: Tốc độ sinh token
+            rate_limit_rate: Xác suất (0-1) trả về lỗi 429 ngắn hạn
+            retry_after: Giá trị header retry-after (giây) kèm lỗi 429 ngắn hạn
+            daily_token_limit: Hạn mức token/ngày, vượt quá trả về lỗi TPD (0 = không giới hạn)
+            tpm_limit: Giá trị header x-ratelimit-limit-tokens
+            answer_mode: 'canned' hoặc 'echo'
+            canned_answer: Câu trả lời cố định
+            seed: Hạt giống ngẫu nhiên (để kết quả tiêm lỗi lặp lại được)
+        """
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.daily_token_limit = daily_token_limit
+        self.tpm_limit = tpm_limit
+        self.answer_mode = answer_mode
+        self.canned_answer = canned_answer or DEFAULT_CANNED_ANSWER
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._minute_start = time.time()
+        self._minute_tokens = 0
+        self._day_tokens = 0
+
+        self.stats = {
+            'requests': 0,
+            'streams': 0,
+            'rate_limited': 0,
+            'daily_limited': 0,
+            'in_flight': 0,
+            'max_in_flight': 0
+        }
+
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        """URL gốc để truyền vào GroqClient(base_url=...)"""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockGroqServer":
+        """Chạy máy chủ trên thread nền (dùng trong cùng tiến trình)"""
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, name="mock-groq", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Dừng máy chủ"""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def serve_forever(self):
+        """Chạy máy chủ chặn tiến trình hiện tại (dùng khi chạy như tiến trình riêng)"""
+        self._httpd.serve_forever()
+
+    # ---------- Logic giả lập ----------
+
+    @staticmethod
+    def _tokenize(text: str) -> List[str]:
+        return re.findall(r'\S+\s*', text) or [text]
+
+    def _answer_for(self, messages: List[Dict]) -> str:
+        if self.answer_mode == 'echo':
+            last_user = next(
+                (m.get('content', '') for m in reversed(messages) if m.get('role') == 'user'), '')
+            return f"Echo: {last_user[-500:]}\n\nNguồn: Không có"
+        return self.canned_answer
+
+    def _admit(self, prompt_tokens: int, completion_tokens: int):
+        """Quyết định request có bị giới hạn không. Trả về (mã lỗi, thông báo) hoặc None"""
+        with self._lock:
+            now = time.time()
+            if now - self._minute_start >= 60:
+                self._minute_start = now
+                self._minute_tokens = 0
+
+            total = prompt_tokens + completion_tokens
+            if self.daily_token_limit and self._day_tokens + total > self.daily_token_limit:
+                self.stats['daily_limited'] += 1
+                return 'tpd', (
+                    f"Rate limit reached for model `mock` in organization `org_mock` on tokens "
+                    f"per day (TPD): Limit {self.daily_token_limit}, Used {self._day_tokens}, "
+                    f"Requested {total}. Please try again in 12m0s."
+                )
+            if self.rate_limit_rate and self._random.random() < self.rate_limit_rate:
+                self.stats['rate_limited'] += 1
+                return 'tpm', (
+                    f"Rate limit reached for model `mock` in organization `org_mock` on tokens "
+                    f"per minute (TPM): Limit {self.tpm_limit}, Used {self._minute_tokens}, "
+                    f"Requested {total}. Please try again in {self.retry_after}s."
+                )
+
+            self._minute_tokens += total
+            self._day_tokens += total
+            return None
+
+    def _rate_headers(self) -> Dict[str, str]:
+        with self._lock:
+            reset = max(0.0, 60 - (time.time() - self._minute_start))
+            return {
+                'x-ratelimit-limit-requests': '14400',
+                'x-ratelimit-remaining-requests': '14000',
+                'x-ratelimit-reset-requests': '6m0s',
+                'x-ratelimit-limit-tokens': str(self.tpm_limit),
+                'x-ratelimit-remaining-tokens': str(max(0, self.tpm_limit - self._minute_tokens)),
+                'x-ratelimit-reset-tokens': f"{reset:.2f}s"
+            }
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):  # Tắt log truy cập mặc định
+                pass
+
+            def _send_json(self, status: int, payload: Dict, headers: Dict = None):
+                body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path.rstrip('/') == '/openai/v1/models':
+                    self._send_json(200, {'object': 'list', 'data': [
+                        {'id': 'mock-model', 'object': 'model', 'owned_by': 'mock'}]})
+                elif self.path.rstrip('/') == '/mock/stats':
+                    self._send_json(200, dict(server.stats))
+                else:
+                    self._send_json(404, {'error': {'message': 'not found'}})
+
+            def do_POST(self):
+                if self.path.rstrip('/') != '/openai/v1/chat/completions':
+                    self._send_json(404, {'error': {'message': 'not found'}})
+                    return
+
+                length = int(self.headers.get('Content-Length') or 0)
+                request = json.loads(self.rfile.read(length) or b'{}')
+                with server._lock:
+                    server.stats['requests'] += 1
+                    server.stats['in_flight'] += 1
+                    server.stats['max_in_flight'] = max(
+                        server.stats['max_in_flight'], server.stats['in_flight'])
+                try:
+                    self._handle_completion(request)
+                finally:
+                    with server._lock:
+                        server.stats['in_flight'] -= 1
+
+            def _handle_completion(self, request: Dict):
+                messages = request.get('messages', [])
+                answer = server._answer_for(messages)
+                pieces = server._tokenize(answer)
+                max_tokens = request.get('max_tokens')
+                if max_tokens:
+                    pieces = pieces[:max_tokens]
+                prompt_tokens = sum(len(m.get('content') or '')
+                                    for m in messages) // 3
+                completion_tokens = len(pieces)
+
+                limited = server._admit(prompt_tokens, completion_tokens)
+                if limited:
+                    kind, message = limited
+                    headers = server._rate_headers()
+                    if kind == 'tpd':
+                        # Hết hạn mức ngày: báo SDK không tự retry
+                        headers['x-should-retry'] = 'false'
+                    else:
+                        headers['retry-after'] = str(server.retry_after)
+                    self._send_json(429, {'error': {
+                        'message': message, 'type': 'tokens', 'code': 'rate_limit_exceeded'}}, headers)
+                    return
+
+                completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+                model = request.get('model', 'mock-model')
+                created = int(time.time())
+                usage = {
+                    'prompt_tokens': prompt_tokens,
+                    'completion_tokens': completion_tokens,
+                    'total_tokens': prompt_tokens + completion_tokens
+                }
+                delay = 1.0 / server.tokens_per_second if server.tokens_per_second > 0 else 0.0
+
+                if not request.get('stream'):
+                    time.sleep(server.ttft + delay *
+                               max(0, completion_tokens - 1))
+                    self._send_json(200, {
+                        'id': completion_id, 'object': 'chat.completion', 'created': created,
+                        'model': model,
+                        'choices': [{'index': 0, 'finish_reason': 'stop',
+                                     'message': {'role': 'assistant', 'content': ''.join(pieces)}}],
+                        'usage': usage
+                    }, server._rate_headers())
+                    return
+
+                with server._lock:
+                    server.stats['streams'] += 1
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Cache-Control', 'no-cache')
+                self.send_header('Connection', 'close')
+                for key, value in server._rate_headers().items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.close_connection = True
+
+                def _event(delta: Dict, finish_reason=None, extra: Dict = None):
+                    chunk = {
+                        'id': completion_id, 'object': 'chat.completion.chunk', 'created': created,
+                        'model': model,
+                        'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+                    }
+                    if extra:
+                        chunk.update(extra)
+                    self.wfile.write(
+                        f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+                    self.wfile.flush()
+
+                try:
+                    time.sleep(server.ttft)
+                    for i, piece in enumerate(pieces):
+                        if i:
+                            time.sleep(delay)
+                        delta = {'content': piece}
+                        if i == 0:
+                            delta['role'] = 'assistant'
+                        _event(delta)
+                    _event({}, 'stop', {'x_groq': {
+                           'id': completion_id, 'usage': usage}})
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    # Client đã ngắt kết nối giữa chừng
+                    pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="May chu gia lap Groq API cho kiem thu tai")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--ttft', type=float, default=0.2,
+                        help="Thoi gian toi token dau tien (giay)")
+    parser.add_argument('--tps', type=float, default=50.0,
+                        help="So token moi giay")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0,
+                        help="Xac suat tra ve 429 ngan han")
+    parser.add_argument('--retry-after', type=float, default=2.0)
+    parser.add_argument('--daily-token-limit', type=int, default=0,
+                        help="Han muc token/ngay (0 = khong gioi han)")
+    parser.add_argument('--answer-mode', choices=['canned', 'echo'], default='canned')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    server = MockGroqServer(
+        host=args.host, port=args.port, ttft=args.ttft, tokens_per_second=args.tps,
+        rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+        daily_token_limit=args.daily_token_limit, answer_mode=args.answer_mode, seed=args.seed
+    )
+    print(f"[THONG TIN] Mock Groq server: {server.base_url}")
+    print(f"[THONG TIN] Dat GROQ_BASE_URL={server.base_url} de tro GroqClient toi may chu nay")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n[THONG TIN] Dung mock server")
+
+
+if __name__ == "__main__":
+    main()
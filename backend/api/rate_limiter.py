@@ -0,0 +1,444 @@
+"""
+Rate Limiter - Bộ giới hạn lưu lượng phía client cho Groq API (Token Bucket)
+"""
+from config.config import config
+from backend.utils.logger import get_logger
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from pathlib import Path
+import asyncio
+import itertools
+import re
+import sqlite3
+import threading
+import time
+
+logger = get_logger(__name__)
+
+# Hệ số ước lượng token cho tiếng Việt: tokenizer của Llama tách tiếng Việt có dấu
+# thành nhiều token hơn tiếng Anh, trung bình khoảng 3 ký tự / token.
+CHARS_PER_TOKEN = 3
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Khoảng thời gian (giây) các waiter chưa tới lượt kiểm tra lại hàng đợi.
+_POLL_INTERVAL = 0.05
+
+
+def estimate_tokens(messages: List[Dict[str, str]], max_tokens: int = 0) -> int:
+    """
+    Ước lượng số token một request sẽ tiêu thụ (prompt + completion tối đa)
+
+    Args:
+        messages: Danh sách message gửi lên API
+        max_tokens: Số token completion tối đa
+
+    Returns:
+        int: Số token ước lượng
+    """
+    prompt_tokens = sum(
+        len(m.get('content') or '') // CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+        for m in messages
+    )
+    return prompt_tokens + (max_tokens or 0)
+
+
+def parse_reset_duration(value: str) -> Optional[float]:
+    """
+    Chuyển chuỗi thời lượng của header Groq (vd: "7.66s", "2m59.56s", "120ms") thành giây
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    total = 0.0
+    matched = False
+    for amount, unit in re.findall(r'(\d+\.?\d*)(ms|h|m|s)', value):
+        matched = True
+        amount = float(amount)
+        total += {'h': 3600, 'm': 60, 's': 1, 'ms': 0.001}[unit] * amount
+    return total if matched else None
+
+
+# ============================================
+# TRẠNG THÁI BUCKET (STATE BACKENDS)
+# Trạng thái gồm: số request/token còn lại, thời điểm nạp lại gần nhất,
+# thời điểm hết bị tạm dừng (sau 429 hoặc khi hết hạn mức ngày) và dung lượng.
+# - _LocalBucketState: nằm trong RAM, dùng chung cho mọi thread của một tiến trình.
+# - _SqliteBucketState: nằm trong file SQLite, dùng chung giữa nhiều tiến trình
+#   (vd: nhiều worker gunicorn), mỗi thao tác là một giao dịch BEGIN IMMEDIATE.
+# ============================================
+class _LocalBucketState:
+    """Trạng thái bucket trong bộ nhớ tiến trình"""
+
+    def __init__(self, rpm: float, tpm: float):
+        self._state = {
+            'rpm': float(rpm), 'tpm': float(tpm),
+            'req_avail': float(rpm), 'tok_avail': float(tpm),
+            'updated': time.time(), 'paused_until': 0.0
+        }
+
+    @contextmanager
+    def transaction(self):
+        # Được gọi bên trong khóa của RateLimiter nên không cần khóa riêng
+        yield self._state
+
+
+class _SqliteBucketState:
+    """Trạng thái bucket chia sẻ giữa các tiến trình qua SQLite"""
+
+    def __init__(self, path: str, name: str, rpm: float, tpm: float):
+        self.path = str(path)
+        self.name = name
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        # isolation_level=None: tự quản lý giao dịch bằng BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(
+            self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS limiter_state ("
+            "name TEXT PRIMARY KEY, rpm REAL, tpm REAL, req_avail REAL, "
+            "tok_avail REAL, updated REAL, paused_until REAL)"
+        )
+        self._conn.execute(
+            "INSERT OR IGNORE INTO limiter_state VALUES (?, ?, ?, ?, ?, ?, 0)",
+            (name, rpm, tpm, rpm, tpm, time.time())
+        )
+
+    @contextmanager
+    def transaction(self):
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT rpm, tpm, req_avail, tok_avail, updated, paused_until "
+                "FROM limiter_state WHERE name = ?", (self.name,)
+            ).fetchone()
+            state = dict(zip(
+                ('rpm', 'tpm', 'req_avail', 'tok_avail', 'updated', 'paused_until'), row))
+            yield state
+            conn.execute(
+                "UPDATE limiter_state SET rpm = ?, tpm = ?, req_avail = ?, tok_avail = ?, "
+                "updated = ?, paused_until = ? WHERE name = ?",
+                (state['rpm'], state['tpm'], state['req_avail'], state['tok_avail'],
+                 state['updated'], state['paused_until'], self.name)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+# Lớp RateLimiter điều tiết lưu lượng TRƯỚC khi gửi request lên Groq, thay vì gửi bừa
+# rồi ngủ time.sleep() khi nhận 429. Hai bucket (request/phút và token/phút) được nạp lại
+# liên tục và hiệu chỉnh theo header x-ratelimit-* của Groq. Các request xếp hàng FIFO
+# (công bằng theo thứ tự đến); request có thời gian chờ dự kiến vượt hạn chót sẽ bị
+# từ chối ngay với lỗi API_LOAD_SHED (Load Shedding, khác với
+# API_RATE_LIMIT là lỗi 429 thật từ Groq) để người dùng không phải chờ vô ích.
+
+
+class RateLimiter:
+    """Token bucket (RPM + TPM) với hàng đợi công bằng cho Groq API"""
+
+    def __init__(
+        self,
+        name: str = 'default',
+        rpm: float = None,
+        tpm: float = None,
+        max_wait: float = None,
+        state_file: str = None
+    ):
+        """
+        Khởi tạo bộ giới hạn
+
+        Args:
+            name: Tên bucket (mỗi API key một bucket)
+            rpm: Số request tối đa mỗi phút
+            tpm: Số token tối đa mỗi phút
+            max_wait: Thời gian chờ tối đa (giây) trước khi từ chối request
+            state_file: File SQLite để chia sẻ trạng thái giữa các tiến trình (None = trong RAM)
+        """
+        self.name = name
+        self.max_wait = max_wait if max_wait is not None else config.GROQ_LIMITER_MAX_WAIT
+        rpm = rpm or config.GROQ_RPM
+        tpm = tpm or config.GROQ_TPM
+        state_file = state_file if state_file is not None else config.GROQ_LIMITER_STATE_FILE
+
+        if state_file:
+            self._state = _SqliteBucketState(state_file, name, rpm, tpm)
+        else:
+            self._state = _LocalBucketState(rpm, tpm)
+
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._tickets = itertools.count()
+        # Hàng đợi FIFO: danh sách (ticket, số token) theo thứ tự đến
+        self._queue: List = []
+
+        # Số liệu giám sát (Metrics)
+        self._acquired = 0
+        self._shed = 0
+        self._rate_limited = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._max_queue_depth = 0
+
+    # ---------- Thao tác trên trạng thái (gọi khi đang giữ self._lock) ----------
+
+    @staticmethod
+    def _refill(state: Dict, now: float):
+        elapsed = max(0.0, now - state['updated'])
+        state['req_avail'] = min(
+            state['rpm'], state['req_avail'] + elapsed * state['rpm'] / 60.0)
+        state['tok_avail'] = min(
+            state['tpm'], state['tok_avail'] + elapsed * state['tpm'] / 60.0)
+        state['updated'] = now
+
+    @staticmethod
+    def _wait_for(state: Dict, requests: float, tokens: float, now: float) -> float:
+        """
+        Số giây cần chờ để bucket đủ `requests` request và `tokens` token
+
+        Tổng của cả hàng đợi KHÔNG bị cắt theo dung lượng bucket: hàng đợi sâu cần chờ nhiều
+        lượt nạp lại (có thể quá 60s). Chỉ từng request lớn hơn bucket được cắt (_clip_tokens).
+        """
+        wait_req = max(0.0, requests - state['req_avail']) * \
+            60.0 / state['rpm']
+        wait_tok = max(0.0, tokens - state['tok_avail']) * 60.0 / state['tpm']
+        return max(wait_req, wait_tok, state['paused_until'] - now, 0.0)
+
+    @staticmethod
+    def _clip_tokens(state: Dict, tokens: float) -> float:
+        """Một request lớn hơn cả dung lượng bucket chỉ cần chờ bucket đầy"""
+        return min(tokens, state['tpm'])
+
+    def _projected_wait(self, tokens: int) -> float:
+        """Thời gian chờ dự kiến nếu xếp thêm một request vào cuối hàng đợi"""
+        now = time.time()
+        with self._state.transaction() as state:
+            self._refill(state, now)
+            demand = sum(self._clip_tokens(state, t) for _, t in self._queue) + \
+                self._clip_tokens(state, tokens)
+            return self._wait_for(state, len(self._queue) + 1, demand, now)
+
+    def _try_take(self, ticket: int, tokens: int) -> float:
+        """Lấy phần hạn mức cho ticket nếu tới lượt. Trả về 0 khi thành công, ngược lại là số giây nên chờ"""
+        if not self._queue or self._queue[0][0] != ticket:
+            return _POLL_INTERVAL
+        now = time.time()
+        with self._state.transaction() as state:
+            self._refill(state, now)
+            wait = self._wait_for(state, 1, self._clip_tokens(state, tokens), now)
+            if wait <= 0:
+                state['req_avail'] -= 1
+                state['tok_avail'] -= tokens
+        if wait <= 0:
+            self._queue.pop(0)
+            self._cond.notify_all()
+        return wait
+
+    def _enqueue(self, tokens: int, max_wait: float) -> int:
+        projected = self._projected_wait(tokens)
+        if projected > max_wait:
+            self._shed += 1
+            logger.warning(
+                f"Rate limiter [{self.name}] tu choi request: cho du kien {projected:.1f}s "
+                f"> {max_wait:.1f}s (hang doi {len(self._queue)})")
+            raise Exception("API_LOAD_SHED")
+        ticket = next(self._tickets)
+        self._queue.append((ticket, tokens))
+        self._max_queue_depth = max(self._max_queue_depth, len(self._queue))
+        return ticket
+
+    def _abandon(self, ticket: int):
+        self._queue = [item for item in self._queue if item[0] != ticket]
+        self._shed += 1
+        self._cond.notify_all()
+
+    def _record_wait(self, waited: float):
+        self._acquired += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+
+    # ---------- API công khai ----------
+
+    def acquire(self, tokens: int, max_wait: float = None) -> float:
+        """
+        Chờ tới lượt và trừ hạn mức cho một request (chặn thread hiện tại)
+
+        Args:
+            tokens: Số token ước lượng (xem estimate_tokens)
+            max_wait: Hạn chót chờ (giây), mặc định theo config
+
+        Returns:
+            float: Số giây đã chờ
+
+        Raises:
+            Exception: API_LOAD_SHED khi thời gian chờ vượt hạn chót (load shedding)
+        """
+        max_wait = self.max_wait if max_wait is None else max_wait
+        start = time.time()
+        with self._cond:
+            ticket = self._enqueue(tokens, max_wait)
+            while True:
+                wait = self._try_take(ticket, tokens)
+                if wait <= 0:
+                    break
+                # Hạn mức có thể bị thu hẹp trong lúc chờ (vd: nhận 429) -> kiểm tra lại hạn chót
+                if time.time() - start + wait > max_wait:
+                    self._abandon(ticket)
+                    logger.warning(
+                        f"Rate limiter [{self.name}] huy request dang cho (vuot han chot {max_wait:.1f}s)")
+                    raise Exception("API_LOAD_SHED")
+                self._cond.wait(timeout=wait)
+            waited = time.time() - start
+            self._record_wait(waited)
+        return waited
+
+    def _async_step(self, ticket: Optional[int], tokens: int, start: float, max_wait: float):
+        """Một bước của acquire_async dưới khóa (chạy trong thread pool): xếp hàng nếu chưa, rồi thử lấy hạn mức"""
+        with self._lock:
+            if ticket is None:
+                ticket = self._enqueue(tokens, max_wait)
+            wait = self._try_take(ticket, tokens)
+            if wait <= 0:
+                self._record_wait(time.time() - start)
+            elif time.time() - start + wait > max_wait:
+                self._abandon(ticket)
+                raise Exception("API_LOAD_SHED")
+            return ticket, wait
+
+    def _drop_ticket(self, ticket: int):
+        with self._lock:
+            self._abandon(ticket)
+
+    async def acquire_async(self, tokens: int, max_wait: float = None) -> float:
+        """
+        Phiên bản bất đồng bộ của acquire(): chờ bằng asyncio.sleep, không chiếm thread
+
+        Khóa và giao dịch SQLite (BEGIN IMMEDIATE, busy timeout 5 giây) có thể chặn, nên mỗi
+        bước dưới khóa chạy trong thread pool (asyncio.to_thread); event loop chỉ await.
+        """
+        max_wait = self.max_wait if max_wait is None else max_wait
+        start = time.time()
+        loop = asyncio.get_running_loop()
+        ticket, wait, step = None, 1.0, None
+
+        def _drop(done):
+            # Bước bị huỷ vẫn chạy xong trong thread: bỏ ticket nếu nó còn trong hàng đợi
+            if not done.cancelled() and done.exception() is None and done.result()[1] > 0:
+                loop.run_in_executor(None, self._drop_ticket, done.result()[0])
+
+        try:
+            while wait > 0:
+                if ticket is not None:
+                    await asyncio.sleep(min(wait, 1.0))
+                step = asyncio.ensure_future(
+                    asyncio.to_thread(self._async_step, ticket, tokens, start, max_wait))
+                ticket, wait = await asyncio.shield(step)
+        except asyncio.CancelledError:
+            # Không để ticket bị bỏ rơi chặn các request phía sau trong hàng đợi
+            if step is not None and not step.done():
+                step.add_done_callback(_drop)
+            elif ticket is not None and wait > 0:
+                loop.run_in_executor(None, self._drop_ticket, ticket)
+            raise
+        return time.time() - start
+
+    def update_from_headers(self, headers) -> None:
+        """
+        Hiệu chỉnh bucket theo header phản hồi của Groq
+
+        Groq trả về: x-ratelimit-limit-tokens / remaining-tokens / reset-tokens (theo phút),
+        x-ratelimit-remaining-requests / reset-requests (theo ngày) và retry-after (khi 429).
+        """
+        if not headers:
+            return
+        now = time.time()
+
+        def _num(key):
+            try:
+                return float(headers.get(key))
+            except (TypeError, ValueError):
+                return None
+
+        limit_tokens = _num('x-ratelimit-limit-tokens')
+        remaining_tokens = _num('x-ratelimit-remaining-tokens')
+        remaining_requests = _num('x-ratelimit-remaining-requests')
+        retry_after = parse_reset_duration(headers.get('retry-after'))
+
+        with self._lock:
+            with self._state.transaction() as state:
+                self._refill(state, now)
+                if limit_tokens:
+                    state['tpm'] = limit_tokens
+                # Máy chủ là nguồn sự thật: chỉ thu hẹp (không nới rộng) hạn mức cục bộ
+                if remaining_tokens is not None:
+                    state['tok_avail'] = min(
+                        state['tok_avail'], remaining_tokens)
+                if remaining_requests is not None and remaining_requests <= 0:
+                    reset = parse_reset_duration(
+                        headers.get('x-ratelimit-reset-requests'))
+                    if reset:
+                        state['paused_until'] = max(
+                            state['paused_until'], now + reset)
+                if retry_after:
+                    state['paused_until'] = max(
+                        state['paused_until'], now + retry_after)
+            self._cond.notify_all()
+
+    def pause(self, seconds: float) -> None:
+        """Tạm dừng cấp hạn mức trong `seconds` giây (sau khi nhận lỗi 429)"""
+        with self._lock:
+            self._rate_limited += 1
+            with self._state.transaction() as state:
+                state['paused_until'] = max(
+                    state['paused_until'], time.time() + seconds)
+
+    def reconcile(self, estimated: int, actual: int) -> None:
+        """Hoàn trả/trừ thêm phần chênh lệch giữa token ước lượng và token thực dùng"""
+        if actual is None:
+            return
+        with self._lock:
+            with self._state.transaction() as state:
+                state['tok_avail'] = min(
+                    state['tpm'], state['tok_avail'] + estimated - actual)
+            self._cond.notify_all()
+
+    def get_stats(self) -> Dict:
+        """Thống kê hàng đợi và thời gian chờ"""
+        with self._lock:
+            now = time.time()
+            with self._state.transaction() as state:
+                self._refill(state, now)
+                snapshot = dict(state)
+            return {
+                'name': self.name,
+                'queue_depth': len(self._queue),
+                'max_queue_depth': self._max_queue_depth,
+                'acquired': self._acquired,
+                'shed': self._shed,
+                'rate_limited': self._rate_limited,
+                'avg_wait_s': round(self._wait_total / self._acquired, 3) if self._acquired else 0.0,
+                'max_wait_s': round(self._wait_max, 3),
+                'requests_available': round(snapshot['req_avail'], 2),
+                'tokens_available': round(snapshot['tok_avail'], 1),
+                'rpm': snapshot['rpm'],
+                'tpm': snapshot['tpm'],
+                'paused_for_s': round(max(0.0, snapshot['paused_until'] - now), 2),
+                'shared': isinstance(self._state, _SqliteBucketState)
+            }
+
+
+# Sổ đăng ký toàn tiến trình: mọi GroqClient dùng chung API key sẽ dùng chung một bucket.
+_registry: Dict[str, RateLimiter] = {}
+_registry_lock = threading.Lock()
+
+
+def get_rate_limiter(name: str = 'default') -> RateLimiter:
+    """Lấy (hoặc tạo) RateLimiter dùng chung theo tên"""
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = RateLimiter(name=name)
+        return _registry[name]
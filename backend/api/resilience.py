@@ -0,0 +1,233 @@
+"""
+Resilience - Hạn chót toàn request (Deadline) và cầu dao ngắt mạch (Circuit Breaker) cho lệnh gọi LLM
+"""
+from config.config import config
+from backend.utils.logger import get_logger
+from collections import deque
+from typing import Dict, Optional
+import threading
+import time
+
+logger = get_logger(__name__)
+
+# ==========================================================
+# HẠN CHÓT TOÀN REQUEST (DEADLINE PROPAGATION)
+# Hạn chót được tạo MỘT lần ở Flask handler rồi truyền xuyên suốt
+# RAGChain -> GroqClient. Mỗi tầng chỉ được dùng phần thời gian CÒN LẠI:
+# timeout từng lần gọi, thời gian chờ retry, thời gian chờ hạn mức... đều bị
+# cắt theo remaining(), nên một kết nối Groq bị treo không thể giữ worker mãi mãi.
+# Hết hạn -> ném Exception("API_TIMEOUT") (cùng quy ước lỗi chuẩn hóa của GroqClient).
+# ==========================================================
+
+
+class Deadline:
+    """Mốc thời gian tuyệt đối mà request phải hoàn tất"""
+
+    def __init__(self, seconds: float = None):
+        """
+        Args:
+            seconds: Thời gian cho phép tính từ bây giờ (mặc định REQUEST_DEADLINE_SECONDS)
+        """
+        seconds = config.REQUEST_DEADLINE_SECONDS if seconds is None else seconds
+        self.started = time.monotonic()
+        self.expires_at = self.started + seconds
+
+    def remaining(self) -> float:
+        """Số giây còn lại (0 nếu đã hết hạn)"""
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self, stage: str = ""):
+        """Ném API_TIMEOUT nếu đã hết hạn"""
+        if self.expired():
+            logger.warning(
+                f"Request deadline exceeded{f' ({stage})' if stage else ''} "
+                f"sau {self.elapsed():.1f}s")
+            raise Exception("API_TIMEOUT")
+
+    def cap(self, seconds: float) -> float:
+        """Giới hạn một khoảng thời gian theo phần hạn chót còn lại"""
+        return min(seconds, self.remaining())
+
+
+def cap_timeout(deadline: Optional[Deadline], seconds: float) -> float:
+    """Tiện ích: giới hạn `seconds` theo deadline (nếu có)"""
+    return deadline.cap(seconds) if deadline is not None else seconds
+
+
+# ==========================================================
+# HỦY REQUEST (CANCELLATION)
+# Tầng web hủy token khi phát hiện client SSE đã ngắt kết nối. Chain kiểm tra token
+# giữa các token của LLM, đóng luồng Groq ngay (không sinh tiếp token vô ích) rồi
+# ném Exception("REQUEST_CANCELLED"); phần câu trả lời đã sinh được để lại trên token.
+# ==========================================================
+
+
+class CancellationToken:
+    """Cờ hủy dùng chung giữa tầng web và luồng xử lý của chain"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason = None
+        self.partial_answer = ""
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    def check(self):
+        """Ném REQUEST_CANCELLED nếu token đã bị hủy"""
+        if self._event.is_set():
+            raise Exception("REQUEST_CANCELLED")
+
+
+# ==========================================================
+# CẦU DAO NGẮT MẠCH (CIRCUIT BREAKER)
+# Khi Groq liên tục lỗi/timeout, tiếp tục gửi request chỉ làm mỗi người dùng chờ
+# hết timeout rồi vẫn nhận thông báo lỗi. Cầu dao theo dõi tỉ lệ lỗi trong cửa sổ
+# trượt; vượt ngưỡng -> MỞ (open): mọi lệnh gọi thất bại ngay với API_CIRCUIT_OPEN
+# để chain trả câu trả lời dự phòng tức thì. Sau CIRCUIT_OPEN_SECONDS, cầu dao
+# chuyển sang NỬA MỞ (half_open) và cho đúng một request thăm dò đi qua:
+# thành công -> ĐÓNG lại (closed), thất bại -> MỞ tiếp.
+# ==========================================================
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """Cầu dao ngắt mạch theo tỉ lệ lỗi trong cửa sổ thời gian"""
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate: float = None,
+        min_requests: int = None,
+        window_seconds: float = None,
+        open_seconds: float = None
+    ):
+        """
+        Args:
+            name: Tên (hiển thị trong metrics)
+            failure_rate: Tỉ lệ lỗi (0-1) trong cửa sổ để mở cầu dao
+            min_requests: Số lệnh gọi tối thiểu trong cửa sổ trước khi xét tỉ lệ lỗi
+            window_seconds: Độ dài cửa sổ trượt
+            open_seconds: Thời gian giữ trạng thái mở trước khi thăm dò
+        """
+        self.name = name
+        self.failure_rate = config.CIRCUIT_FAILURE_RATE if failure_rate is None else failure_rate
+        self.min_requests = config.CIRCUIT_MIN_REQUESTS if min_requests is None else min_requests
+        self.window_seconds = config.CIRCUIT_WINDOW_SECONDS if window_seconds is None else window_seconds
+        self.open_seconds = config.CIRCUIT_OPEN_SECONDS if open_seconds is None else open_seconds
+
+        self._lock = threading.Lock()
+        self._outcomes = deque()  # (thời điểm, thành công?)
+        self.state = STATE_CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+
+        self._rejected = 0
+        self._times_opened = 0
+
+    def _trim(self, now: float):
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            self._outcomes.popleft()
+
+    def allow(self):
+        """
+        Xin phép thực hiện một lệnh gọi
+
+        Raises:
+            Exception: API_CIRCUIT_OPEN khi cầu dao đang mở
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self.state == STATE_OPEN and now - self._opened_at >= self.open_seconds:
+                self.state = STATE_HALF_OPEN
+                self._probe_in_flight = False
+                logger.info(f"Circuit {self.name}: half_open, thu 1 request tham do")
+            # Request thăm dò bị bỏ dở (vd: người dùng ngắt stream) không được giữ cầu dao mãi
+            probe_stale = now - self._probe_started >= self.open_seconds
+            if self.state == STATE_HALF_OPEN and (not self._probe_in_flight or probe_stale):
+                self._probe_in_flight = True
+                self._probe_started = now
+                return
+            if self.state == STATE_CLOSED:
+                return
+            self._rejected += 1
+        raise Exception("API_CIRCUIT_OPEN")
+
+    def record_success(self):
+        with self._lock:
+            now = time.monotonic()
+            if self.state == STATE_HALF_OPEN:
+                logger.info(f"Circuit {self.name}: tham do thanh cong -> closed")
+                self.state = STATE_CLOSED
+                self._outcomes.clear()
+            self._outcomes.append((now, True))
+            self._trim(now)
+
+    def record_failure(self):
+        with self._lock:
+            now = time.monotonic()
+            if self.state == STATE_HALF_OPEN:
+                self._open(now, "tham do that bai")
+                return
+            self._outcomes.append((now, False))
+            self._trim(now)
+            total = len(self._outcomes)
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            if self.state == STATE_CLOSED and total >= self.min_requests \
+                    and failures / total >= self.failure_rate:
+                self._open(now, f"{failures}/{total} loi trong {self.window_seconds:.0f}s")
+
+    def _open(self, now: float, reason: str):
+        self.state = STATE_OPEN
+        self._opened_at = now
+        self._probe_in_flight = False
+        self._times_opened += 1
+        logger.error(f"Circuit {self.name}: OPEN ({reason})")
+
+    def get_stats(self) -> Dict:
+        """Trạng thái cầu dao cho giám sát"""
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            total = len(self._outcomes)
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            return {
+                'state': self.state,
+                'window_requests': total,
+                'window_failure_rate': round(failures / total, 3) if total else 0.0,
+                'open_for_s': round(max(self.open_seconds - (now - self._opened_at), 0.0), 1)
+                if self.state == STATE_OPEN else 0.0,
+                'times_opened': self._times_opened,
+                'rejected': self._rejected
+            }
+
+
+# Bảng tra cầu dao dùng chung toàn tiến trình (mỗi cặp API key + model một cầu dao)
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """Lấy (hoặc tạo) cầu dao theo tên"""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(name)
+            _breakers[name] = breaker
+        return breaker
@@ -0,0 +1,171 @@
+"""
+Stream Buffer - Bộ đệm sự kiện SSE phía server để client nối lại luồng bằng Last-Event-ID
+"""
+from config.config import config
+from backend.utils.logger import get_logger
+from typing import Callable, Dict, Generator, List, Optional, Tuple
+import threading
+import time
+import uuid
+
+logger = get_logger(__name__)
+
+# Mạng di động chập chờn làm đứt kết nối SSE giữa chừng. Thay vì gửi lại câu hỏi
+# (chạy lại Retrieval + một lượt gọi LLM trọn vẹn), mỗi câu trả lời có một message_id;
+# mọi sự kiện của nó được đánh số thứ tự (seq) và lưu trong RAM STREAM_BUFFER_TTL giây.
+# Client kết nối lại kèm header "Last-Event-ID: <message_id>:<seq>" sẽ nhận tiếp các
+# sự kiện sau seq đó, lấy trực tiếp từ bộ đệm, không chạm tới LLM.
+#
+# Khi client rời đi, luồng xử lý KHÔNG bị hủy ngay mà chờ STREAM_RESUME_GRACE giây:
+# nếu không ai nối lại trong khoảng đó, callback on_abandon (hủy token) mới được gọi.
+
+
+class _BufferedStream:
+    """Các sự kiện đã phát của một câu trả lời + trạng thái kết thúc"""
+
+    def __init__(self, on_abandon: Callable[[], None] = None, owner=None):
+        self.owner = owner  # user_id của người dùng đã gửi câu hỏi
+        self.events: List[Dict] = []
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self.subscribers = 0
+        self.on_abandon = on_abandon
+        self.cond = threading.Condition()
+
+
+def format_event_id(message_id: str, seq: int) -> str:
+    return f"{message_id}:{seq}"
+
+
+def parse_event_id(event_id: str) -> Optional[Tuple[str, int]]:
+    """Tách "<message_id>:<seq>" (None nếu sai định dạng)"""
+    message_id, _, seq = (event_id or '').strip().rpartition(':')
+    if not message_id or not seq.isdigit():
+        return None
+    return message_id, int(seq)
+
+
+class StreamBuffer:
+    """Bộ đệm sự kiện theo message_id với thời hạn sống (TTL)"""
+
+    def __init__(self, ttl: float = None, grace: float = None):
+        """
+        Args:
+            ttl: Số giây giữ bộ đệm sau khi câu trả lời hoàn tất
+            grace: Số giây chờ client nối lại trước khi gọi on_abandon
+        """
+        self.ttl = config.STREAM_BUFFER_TTL if ttl is None else ttl
+        self.grace = config.STREAM_RESUME_GRACE if grace is None else grace
+        self._streams: Dict[str, _BufferedStream] = {}
+        self._lock = threading.Lock()
+
+        self._resumes = 0
+        self._abandoned = 0
+
+    def create(self, on_abandon: Callable[[], None] = None, owner=None) -> str:
+        """Tạo bộ đệm mới (owner: user_id được phép nối lại), trả về message_id"""
+        message_id = uuid.uuid4().hex
+        with self._lock:
+            self._purge()
+            self._streams[message_id] = _BufferedStream(on_abandon, owner)
+        return message_id
+
+    def _purge(self):
+        """Xóa các bộ đệm đã hết hạn (gọi khi đang giữ khóa)"""
+        now = time.time()
+        expired = [mid for mid, s in self._streams.items()
+                   if s.done and now - s.finished_at > self.ttl]
+        for mid in expired:
+            del self._streams[mid]
+
+    def _get(self, message_id: str) -> Optional[_BufferedStream]:
+        with self._lock:
+            self._purge()
+            return self._streams.get(message_id)
+
+    def has(self, message_id: str, owner=None) -> bool:
+        """Bộ đệm còn sống (và thuộc về `owner` nếu được truyền)"""
+        stream = self._get(message_id)
+        return stream is not None and (owner is None or stream.owner == owner)
+
+    def append(self, message_id: str, event: Dict, final: bool = False) -> int:
+        """Thêm một sự kiện, trả về số thứ tự (bắt đầu từ 1)"""
+        stream = self._get(message_id)
+        if stream is None:
+            return 0
+        with stream.cond:
+            stream.events.append(event)
+            if final:
+                stream.done = True
+                stream.finished_at = time.time()
+            stream.cond.notify_all()
+            return len(stream.events)
+
+    def follow(
+        self,
+        message_id: str,
+        after_seq: int = 0,
+        heartbeat: float = None,
+        resume: bool = False
+    ) -> Generator[Tuple[Optional[int], Optional[Dict]], None, None]:
+        """
+        Nhận các sự kiện có seq > after_seq cho tới khi câu trả lời hoàn tất
+
+        Yields:
+            Tuple: (seq, event); (None, None) là nhịp heartbeat khi chưa có sự kiện mới
+        """
+        stream = self._get(message_id)
+        if stream is None:
+            return
+        heartbeat = config.SSE_HEARTBEAT_SECONDS if heartbeat is None else heartbeat
+        with stream.cond:
+            stream.subscribers += 1
+        if resume:
+            with self._lock:
+                self._resumes += 1
+            logger.info(
+                f"SSE resume {message_id[:8]} tu seq {after_seq}")
+
+        position = after_seq
+        try:
+            while True:
+                with stream.cond:
+                    if position >= len(stream.events) and not stream.done:
+                        stream.cond.wait(timeout=heartbeat)
+                    new_events = stream.events[position:]
+                    finished = stream.done
+                if not new_events and not finished:
+                    yield None, None
+                    continue
+                for event in new_events:
+                    position += 1
+                    yield position, event
+                if finished and position >= len(stream.events):
+                    return
+        finally:
+            with stream.cond:
+                stream.subscribers -= 1
+                abandoned = stream.subscribers == 0 and not stream.done
+            if abandoned and stream.on_abandon is not None:
+                threading.Timer(self.grace, self._check_abandoned,
+                                args=(message_id, stream)).start()
+
+    def _check_abandoned(self, message_id: str, stream: _BufferedStream):
+        with stream.cond:
+            abandoned = stream.subscribers == 0 and not stream.done
+        if abandoned:
+            with self._lock:
+                self._abandoned += 1
+            logger.info(
+                f"SSE {message_id[:8]}: khong co client noi lai sau {self.grace}s -> huy")
+            stream.on_abandon()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            self._purge()
+            return {
+                'buffered_streams': len(self._streams),
+                'active': sum(1 for s in self._streams.values() if not s.done),
+                'resumes': self._resumes,
+                'abandoned': self._abandoned
+            }
@@ -3,6 +3,7 @@ Vector Store - Lưu trữ và tìm kiếm embeddings với FAISS
 """
 from config.config import config
 import faiss
+import hashlib
 import numpy as np
 import pickle
 from typing import List, Dict
@@ -42,8 +43,21 @@ class VectorStore:
         # ngược trở lại nội dung văn bản gốc và siêu dữ liệu (Metadata) tương ứng.
         self.documents = []
 
+        # Phiên bản nội dung chỉ mục (Content Hash), dùng để vô hiệu hóa các bộ đệm
+        # phụ thuộc vào dữ liệu (vd: Completion Cache) mỗi khi chỉ mục được build lại.
+        self.version = self._compute_version()
+
         print(f"Khoi tao Vector Store (dimension={dimension})")
 
+    def _compute_version(self) -> str:
+        """Tính dấu vân tay SHA-256 (rút gọn) của toàn bộ nội dung + nguồn trong chỉ mục"""
+        digest = hashlib.sha256(f"{self.dimension}:{len(self.documents)}".encode())
+        for doc in self.documents:
+            digest.update(doc.get('content', '').encode('utf-8'))
+            digest.update(
+                str(doc.get('metadata', {}).get('source', '')).encode('utf-8'))
+        return digest.hexdigest()[:12]
+
     def add_documents(self, documents: List[Dict]):
         """
         Thêm documents vào vector store
@@ -79,6 +93,7 @@ class VectorStore:
             }
             self.documents.append(doc_copy)
 
+        self.version = self._compute_version()
         print(f"Da them {len(documents)} documents")
         print(f"Tong so documents: {self.index.ntotal}")
 
@@ -189,6 +204,7 @@ class VectorStore:
             self.documents = data['documents']
             self.dimension = data['dimension']
 
+        self.version = self._compute_version()
         print(f"Da load vector store: {self.index.ntotal} documents")
         return True
 
@@ -196,6 +212,7 @@ class VectorStore:
         """Xóa toàn bộ dữ liệu trong vector store"""
         self.index.reset()
         self.documents = []
+        self.version = self._compute_version()
         print("Da xoa toan bo vector store")
 
     def get_stats(self) -> Dict:
@@ -204,7 +221,8 @@ class VectorStore:
             'total_documents': self.index.ntotal,
             'dimension': self.dimension,
             'index_type': type(self.index).__name__,
-            'is_trained': self.index.is_trained
+            'is_trained': self.index.is_trained,
+            'version': self.version
         }
 
 # Khối lệnh kiểm thử đơn vị (Unit Test) chạy độc lập để đánh giá mô hình Vector Store
@@ -0,0 +1,296 @@
+"""
+Answer Bank - Kho câu trả lời dựng sẵn (offline) cho các cặp (bệnh, ý định)
+"""
+from config.config import config
+from backend.rag.prompts import PROMPT_VERSION, disease_display_name
+from backend.rag.retriever import DiseaseDetector, QueryIntent
+from backend.utils.query_normalizer import normalize_query
+from backend.utils.logger import get_logger
+from typing import Dict, Iterable, List, Optional, Tuple
+from pathlib import Path
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+
+logger = get_logger(__name__)
+
+# Kho tri thức có ~40 file bệnh và một số ít ý định (QueryIntent), nên không gian câu hỏi
+# "chuẩn" nhỏ và biết trước. scripts/build_answer_bank.py sinh câu hỏi chuẩn cho mọi cặp
+# (file bệnh, ý định), chạy chúng qua RAGChain.ask (đủ mọi cổng kiểm duyệt) và lưu câu trả lời
+# đã kiểm duyệt kèm phiên bản chỉ mục + phiên bản prompt + mã băm file nguồn vào SQLite.
+#
+# Lúc phục vụ, AnswerBank chỉ nạp các câu trả lời khớp phiên bản chỉ mục/prompt đang chạy và
+# trả lời ngay (không truy xuất, không gọi LLM) khi câu hỏi:
+#   - có đúng MỘT ý định và MỘT file bệnh (QueryIntent + DiseaseDetector), và
+#   - không chứa từ nào ngoài tên bệnh, từ khóa của ý định và từ đệm (_FILLER_WORDS),
+#     để "triệu chứng cúm mùa ở trẻ em" KHÔNG nhận câu trả lời chung của "triệu chứng cúm mùa".
+#
+# Dựng lại tăng dần: cặp có file nguồn không đổi chỉ được gắn phiên bản chỉ mục mới; chỉ các
+# cặp có file nguồn thay đổi (hoặc prompt đổi) mới được hỏi lại LLM.
+
+# Câu hỏi mẫu theo ý định; mẫu đầu tiên là câu hỏi chuẩn mà job offline gửi cho chain.
+# Không có 'treatment' (bị chặn bởi chính sách), 'comparison' và 'disease_from_symptom'
+# (không phải câu hỏi về một bệnh).
+INTENT_TEMPLATES = {
+    'general': ("{disease} là gì?", "bệnh {disease} là bệnh gì?"),
+    'symptom': ("Triệu chứng của {disease} là gì?", "Dấu hiệu của {disease}?"),
+    'cause': ("Nguyên nhân gây {disease} là gì?", "Vì sao bị {disease}?"),
+    'prevention': ("Cách phòng ngừa {disease}?", "Làm thế nào để phòng tránh {disease}?"),
+    'when_to_see_doctor': ("Khi nào cần đi khám {disease}?", "Bị {disease} khi nào nên đi bác sĩ?"),
+}
+
+# Từ đệm không làm đổi nghĩa câu hỏi chuẩn
+_FILLER_WORDS = frozenset({
+    'của', 'bệnh', 'là', 'gì', 'có', 'không', 'những', 'các', 'ra', 'sao', 'thế', 'nào',
+    'như', 'về', 'cho', 'tôi', 'mình', 'em', 'hỏi', 'ạ', 'bị', 'mắc', 'thường', 'gặp', 'gây',
+    'nên', 'cần', 'làm', 'bạn', 'nhé', 'vậy', 'hãy', 'biết', 'cách', 'được', 'khi', 'thì',
+    'tình', 'trạng',
+})
+
+_WORD = re.compile(r'\w+')
+
+
+def question_words(text: str) -> set:
+    """Tập từ của câu hỏi sau normalize_query"""
+    return set(_WORD.findall(normalize_query(text).lower()))
+
+
+def file_hash(path) -> str:
+    """Mã băm nội dung file nguồn (phát hiện thay đổi để dựng lại tăng dần)"""
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()[:16]
+
+
+def _intent_vocabulary(intent: str) -> set:
+    vocabulary = set(_FILLER_WORDS)
+    for pattern in QueryIntent.INTENT_PATTERNS.get(intent, []) + \
+            QueryIntent.SECTION_BOOST.get(intent, []):
+        vocabulary |= set(_WORD.findall(pattern))
+    for template in INTENT_TEMPLATES.get(intent, ()):
+        vocabulary |= question_words(template.format(disease=''))
+    return vocabulary
+
+
+def pair_vocabulary(source: str, intent: str) -> set:
+    """
+    Từ vựng của câu hỏi chuẩn (file, ý định): tên bệnh, từ khóa ý định và từ đệm
+
+    Câu hỏi chứa từ ngoài tập này ("ở trẻ sơ sinh", "5 ngày rồi") là câu hỏi có điều kiện,
+    không được nhận câu trả lời chung của cặp.
+    """
+    vocabulary = _intent_vocabulary(intent)
+    for alias in _disease_aliases(source):
+        vocabulary |= question_words(alias)
+    return vocabulary
+
+
+def _disease_aliases(source: str) -> List[str]:
+    """Tên hiển thị rồi tới các từ khóa của DiseaseDetector ánh xạ tới file"""
+    aliases = []
+    display = disease_display_name(source)
+    if display:
+        aliases.append(display.lower())
+    aliases += [k for k, f in DiseaseDetector.DISEASE_TO_FILE.items() if f == source]
+    return aliases
+
+
+def _detect(question: str) -> Optional[Tuple[str, str]]:
+    """(file, ý định) nếu câu hỏi có đúng một ý định và một file bệnh"""
+    intents = QueryIntent.detect_intent(question)
+    files = DiseaseDetector.detect_diseases(question)
+    if len(intents) != 1 or len(files) != 1:
+        return None
+    return files[0], intents[0]
+
+
+def canonical_questions(sources: Iterable[str], intents: Iterable[str] = None) -> Dict[Tuple[str, str], str]:
+    """
+    Câu hỏi chuẩn cho mọi cặp (file, ý định) mà bộ phát hiện nhận đúng
+
+    Returns:
+        Dict[Tuple[str, str], str]: (file, ý định) -> câu hỏi chuẩn
+    """
+    intents = [i for i in (intents or config.ANSWER_BANK_INTENTS) if i in INTENT_TEMPLATES]
+    questions = {}
+    for source in sources:
+        for intent in intents:
+            for alias in _disease_aliases(source):
+                question = INTENT_TEMPLATES[intent][0].format(disease=alias)
+                question = question[0].upper() + question[1:]
+                if _detect(question) == (source, intent):
+                    questions[(source, intent)] = question
+                    break
+    return questions
+
+
+class AnswerBank:
+    """Kho câu trả lời dựng sẵn (SQLite) + bộ so khớp câu hỏi lúc phục vụ"""
+
+    def __init__(self, db_path: str = None):
+        """
+        Args:
+            db_path: File SQLite của kho (mặc định ANSWER_BANK_DB)
+        """
+        db_path = db_path or config.ANSWER_BANK_DB
+        self._lock = threading.Lock()
+        self._conn = None
+        try:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(
+                str(db_path), timeout=5.0, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "source TEXT, intent TEXT, question TEXT, answer TEXT, source_hash TEXT, "
+                "index_version TEXT, prompt_version TEXT, created REAL, "
+                "PRIMARY KEY (source, intent))"
+            )
+            self._conn.commit()
+        except Exception as e:
+            logger.warning(f"Khong mo duoc answer bank ({db_path}): {e}. Tat answer bank.")
+            self._conn = None
+
+        # Trạng thái phục vụ: các câu trả lời của phiên bản chỉ mục đang chạy
+        self._loaded_version = None
+        self._answers: Dict[Tuple[str, str], str] = {}
+        self._vocabulary: Dict[Tuple[str, str], set] = {}
+
+        self._lookups = 0
+        self._hits = 0
+
+    # ============================================
+    # GHI (JOB OFFLINE)
+    # ============================================
+    def entries(self) -> Dict[Tuple[str, str], Dict]:
+        """Toàn bộ bản ghi: (file, ý định) -> {source_hash, index_version, prompt_version}"""
+        if self._conn is None:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT source, intent, source_hash, index_version, prompt_version FROM answers"
+            ).fetchall()
+        return {(r[0], r[1]): {'source_hash': r[2], 'index_version': r[3], 'prompt_version': r[4]}
+                for r in rows}
+
+    def plan(
+        self,
+        questions: Dict[Tuple[str, str], str],
+        hashes: Dict[str, str],
+        index_version: str,
+        force: bool = False
+    ) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]:
+        """
+        Chia các cặp thành cần hỏi lại LLM và chỉ cần gắn phiên bản chỉ mục mới
+
+        Args:
+            questions: Kết quả canonical_questions()
+            hashes: file -> file_hash() hiện tại
+            index_version: Phiên bản chỉ mục đang phục vụ
+            force: Hỏi lại toàn bộ
+
+        Returns:
+            Tuple: (cặp cần dựng lại, cặp giữ nguyên câu trả lời)
+        """
+        stored = self.entries()
+        rebuild, carry = [], []
+        for key in questions:
+            entry = stored.get(key)
+            if force or entry is None or entry['prompt_version'] != PROMPT_VERSION \
+                    or entry['source_hash'] != hashes.get(key[0]):
+                rebuild.append(key)
+            elif entry['index_version'] != index_version:
+                carry.append(key)
+        return rebuild, carry
+
+    def store(self, source: str, intent: str, question: str, answer: str, source_hash: str, index_version: str):
+        """Lưu (ghi đè) câu trả lời đã kiểm duyệt của một cặp"""
+        if self._conn is None:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (source, intent, question, answer, source_hash, index_version,
+                 PROMPT_VERSION, time.time()))
+            self._conn.commit()
+            self._loaded_version = None
+
+    def retag(self, keys: Iterable[Tuple[str, str]], index_version: str):
+        """Gắn phiên bản chỉ mục mới cho các cặp có file nguồn không đổi"""
+        if self._conn is None:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE answers SET index_version = ? WHERE source = ? AND intent = ?",
+                [(index_version, source, intent) for source, intent in keys])
+            self._conn.commit()
+            self._loaded_version = None
+
+    def prune(self, keep: Iterable[Tuple[str, str]]) -> int:
+        """Xóa các cặp không còn trong không gian câu hỏi (file bị xóa / ý định bị tắt)"""
+        if self._conn is None:
+            return 0
+        keep = set(keep)
+        removed = [key for key in self.entries() if key not in keep]
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM answers WHERE source = ? AND intent = ?", removed)
+            self._conn.commit()
+            self._loaded_version = None
+        return len(removed)
+
+    # ============================================
+    # PHỤC VỤ (RUNTIME)
+    # ============================================
+    def _load(self, index_version: str):
+        """Nạp câu trả lời của phiên bản chỉ mục/prompt đang chạy (gọi khi đang giữ khóa)"""
+        self._answers, self._vocabulary = {}, {}
+        if self._conn is not None:
+            rows = self._conn.execute(
+                "SELECT source, intent, answer FROM answers "
+                "WHERE index_version = ? AND prompt_version = ?",
+                (index_version, PROMPT_VERSION)
+            ).fetchall()
+            for source, intent, answer in rows:
+                self._answers[(source, intent)] = answer
+                self._vocabulary[(source, intent)] = pair_vocabulary(source, intent)
+            logger.info(
+                f"Answer bank: {len(self._answers)} cau tra loi cho chi muc {index_version}")
+        self._loaded_version = index_version
+
+    def match(self, question: str) -> Optional[Tuple[str, str]]:
+        """(file, ý định) có câu trả lời dựng sẵn tương đương câu hỏi, None nếu không có"""
+        key = _detect(question)
+        if key is None or key not in self._answers:
+            return None
+        return key if question_words(question) <= self._vocabulary[key] else None
+
+    def lookup(self, question: str, index_version: str) -> Optional[str]:
+        """
+        Câu trả lời dựng sẵn cho câu hỏi mở đầu
+
+        Args:
+            question: Câu hỏi
+            index_version: Phiên bản chỉ mục đang phục vụ (bản ghi khác phiên bản bị bỏ qua)
+
+        Returns:
+            Optional[str]: Câu trả lời cuối cùng (đã qua hậu kiểm khi dựng), None nếu không khớp
+        """
+        with self._lock:
+            if self._loaded_version != index_version:
+                self._load(index_version)
+            self._lookups += 1
+            key = self.match(question)
+            if key is None:
+                return None
+            self._hits += 1
+            return self._answers[key]
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                'index_version': self._loaded_version,
+                'entries': len(self._answers),
+                'lookups': self._lookups,
+                'hits': self._hits,
+                'hit_rate': round(self._hits / self._lookups, 3) if self._lookups else 0.0
+            }
@@ -0,0 +1,143 @@
+"""
+Cascade Dense Search - Truy xuất 2 tầng: model nhỏ trước, PhoBERT khi thiếu tự tin
+"""
+from config.config import config
+from backend.rag.embeddings import EmbeddingModel
+from backend.database.vector_store import VectorStore
+from backend.utils.logger import get_logger
+from typing import List, Dict, Tuple
+import threading
+import numpy as np
+
+logger = get_logger(__name__)
+
+# Lớp CascadeDenseSearcher hiện thực kỹ thuật Truy xuất Phân tầng (Cascaded Retrieval).
+# Phần lớn câu hỏi thực tế là câu hỏi "dễ" về một bệnh duy nhất, mô hình MiniLM nhỏ
+# (nhanh gấp nhiều lần PhoBERT) đã đủ để xác định đúng tài liệu. Chỉ khi kết quả của tầng
+# nhanh nằm ngoài Dải tin cậy (Confidence Band) mới leo thang (Escalate) lên PhoBERT.
+# Hai chỉ mục FAISS được build song song từ CÙNG một danh sách chunks (cùng thứ tự).
+
+
+class CascadeDenseSearcher:
+    """Dense search 2 tầng: fast model -> full model khi độ tin cậy thấp"""
+
+    def __init__(
+        self,
+        full_embedder: EmbeddingModel,
+        full_store: VectorStore,
+        fast_embedder: EmbeddingModel = None,
+        fast_store: VectorStore = None,
+        max_distance: float = None,
+        min_margin: float = None
+    ):
+        """
+        Khởi tạo Cascade Searcher
+
+        Args:
+            full_embedder: Model chính (PhoBERT) dùng khi leo thang
+            full_store: Chỉ mục FAISS của model chính
+            fast_embedder: Model nhỏ (nếu None sẽ dùng EMBEDDING_MODEL_FAST)
+            fast_store: Chỉ mục FAISS song song của model nhỏ (nếu None sẽ load từ đĩa)
+            max_distance: Khoảng cách L2 tối đa của top-1 để tin kết quả tầng nhanh
+            min_margin: Khoảng cách tối thiểu giữa bệnh top-1 và bệnh đứng sau
+        """
+        self.full_embedder = full_embedder
+        self.full_store = full_store
+        self.max_distance = max_distance if max_distance is not None else config.CASCADE_MAX_DISTANCE
+        self.min_margin = min_margin if min_margin is not None else config.CASCADE_MIN_MARGIN
+
+        self.fast_embedder = fast_embedder or EmbeddingModel(
+            model_name=config.EMBEDDING_MODEL_FAST)
+
+        if fast_store:
+            self.fast_store = fast_store
+        else:
+            self.fast_store = VectorStore(
+                dimension=self.fast_embedder.embedding_dim)
+            self.fast_store.load(str(config.VECTOR_STORE_DIR / "health_faiss_fast.index"))
+
+        # Bộ đếm thống kê: bảo vệ bằng Lock vì Flask phục vụ nhiều luồng (threads) đồng thời.
+        self._lock = threading.Lock()
+        self._total = 0
+        self._fast_served = 0
+        self._escalations = {'distance': 0, 'margin': 0, 'empty': 0}
+
+    @property
+    def is_ready(self) -> bool:
+        """Tầng nhanh chỉ dùng được khi chỉ mục song song khớp số lượng với chỉ mục chính"""
+        return (
+            self.fast_store.index.ntotal > 0
+            and self.fast_store.index.ntotal == self.full_store.index.ntotal
+        )
+
+    def _confidence(self, results: List[Dict]) -> Tuple[bool, str]:
+        """Đánh giá kết quả tầng nhanh có nằm trong dải tin cậy hay không"""
+        if not results:
+            return False, 'empty'
+
+        top = results[0]
+        if top['score'] > self.max_distance:
+            return False, 'distance'
+
+        # Biên độ (Margin) được đo giữa tài liệu tốt nhất và tài liệu tốt nhất của một
+        # NGUỒN KHÁC. Các chunk cùng một file luôn sát nhau nên không phản ánh độ chắc chắn.
+        top_source = top.get('metadata', {}).get('source')
+        runner_up = next(
+            (d for d in results[1:]
+             if d.get('metadata', {}).get('source') != top_source),
+            None
+        )
+        if runner_up is not None and runner_up['score'] - top['score'] < self.min_margin:
+            return False, 'margin'
+
+        return True, ''
+
+    def search(self, query: str, top_k: int) -> Tuple[List[Dict], np.ndarray, str]:
+        """
+        Tìm kiếm dense theo cơ chế cascade
+
+        Args:
+            query: Câu truy vấn đã chuẩn hóa
+            top_k: Số candidates cần lấy
+
+        Returns:
+            (results, query_embedding, tier) với tier là 'fast' hoặc 'full'
+        """
+        fast_embedding = self.fast_embedder.encode_text(query)
+        fast_results = self.fast_store.search(fast_embedding, top_k=top_k)
+        confident, reason = self._confidence(fast_results)
+
+        with self._lock:
+            self._total += 1
+            if confident:
+                self._fast_served += 1
+            else:
+                self._escalations[reason] += 1
+
+        if confident:
+            if config.DEBUG:
+                logger.debug(
+                    f" Cascade: fast tier served (top L2={fast_results[0]['score']:.3f})")
+            return fast_results, fast_embedding, 'fast'
+
+        if config.DEBUG:
+            logger.debug(f" Cascade: escalate to full model ({reason})")
+        full_embedding = self.full_embedder.encode_text(query)
+        full_results = self.full_store.search(full_embedding, top_k=top_k)
+        return full_results, full_embedding, 'full'
+
+    def get_stats(self) -> Dict:
+        """Thống kê tỷ lệ leo thang lên model lớn"""
+        with self._lock:
+            escalated = sum(self._escalations.values())
+            return {
+                'fast_model': self.fast_embedder.model_name,
+                'full_model': self.full_embedder.model_name,
+                'total_queries': self._total,
+                'fast_served': self._fast_served,
+                'escalated': escalated,
+                'escalation_rate': escalated / self._total if self._total else 0.0,
+                'escalation_reasons': dict(self._escalations),
+                'max_distance': self.max_distance,
+                'min_margin': self.min_margin
+            }
@@ -3,31 +3,31 @@ RAG Chain - Kết hợp Retrieval + Generation
 """
 from config.config import config
 from backend.rag.prompts import (
-    HEALTH_CHATBOT_SYSTEM_PROMPT,
-    GREETING_RESPONSES,
-    FAREWELL_RESPONSES,
     NO_DOCS_FOUND_RESPONSE,
     STRICT_FALLBACK_RESPONSE,
-    format_context,
-    format_sources,
-    is_greeting,
-    is_farewell,
-    build_messages,
-    sanitize_answer,
-    verify_answer,
-    check_context_relevance,    # Pre-LLM relevance gate
-    extract_sources_from_answer,  # Source extraction from LLM answer
-    extract_sources_from_context,  # Source extraction from retrieved context
+    PROMPT_VERSION,
 )
-from backend.utils.query_normalizer import should_block_query
+from backend.rag.pipeline import RAGPipeline, PipelineContext
+from backend.rag.completion_cache import CompletionCache, replay_stream
+from backend.rag.single_flight import SingleFlight
+from backend.rag.router import ModelRouter, ROUTE_SMALL
+from backend.rag.context_compressor import ContextCompressor
+from backend.rag.extractive import ExtractiveAnswerer
+from backend.rag.degraded import DegradedMode
+from backend.rag.answer_bank import AnswerBank
+from backend.rag.semantic_cache import SemanticCache
 from backend.api.groq_client import GroqClient
+from backend.api.client_pool import GroqClientPool
+from backend.api.resilience import CancellationToken, Deadline
 from backend.rag.retriever import RAGRetriever
 from backend.utils.logger import get_logger
-import re
+from backend.utils import vi_tokenizer
+import asyncio
 import sys
+import threading
+import time
 from pathlib import Path
-from typing import List, Dict, Tuple, Generator
-import random
+from typing import List, Dict, Tuple, Generator, AsyncGenerator, Optional
 
 logger = get_logger(__name__)
 
@@ -68,19 +68,262 @@ class RAGChain:
         # Khởi tạo mô-đun LLM (Groq Client)
         if llm_client:
             self.llm = llm_client
+        elif config.GROQ_POOL_ENABLED:
+            logger.info("Khoi tao Groq LLM Pool...")
+            self.llm = GroqClientPool()
         else:
             logger.info("Khoi tao Groq LLM...")
             self.llm = GroqClient()
 
+        # Bộ đệm câu trả lời LLM (chỉ áp dụng cho lệnh gọi tất định temperature = 0)
+        self.completion_cache = CompletionCache() if config.COMPLETION_CACHE_ENABLED else None
+
+        # Gộp các câu hỏi mở đầu giống hệt nhau đang xử lý đồng thời (Single-flight)
+        self.single_flight = SingleFlight() if config.SINGLE_FLIGHT_ENABLED else None
+
+        # Đếm số request bị hủy giữa chừng (client ngắt kết nối)
+        self._stats_lock = threading.Lock()
+        self._cancelled = 0
+
+        # Nén ngữ cảnh theo câu trước khi đóng gói prompt
+        self.context_compressor = ContextCompressor() if config.CONTEXT_COMPRESSION_ENABLED else None
+
+        # Định tuyến model theo độ phức tạp: câu hỏi đơn giản -> model nhỏ, độ trễ thấp
+        self.router = None
+        self.llm_small = None
+        if config.ROUTER_MODE in ('shadow', 'active'):
+            self.router = ModelRouter()
+            logger.info(
+                f"Khoi tao model nho cho Router ({config.ROUTER_SMALL_MODEL}, mode={config.ROUTER_MODE})...")
+            if config.GROQ_POOL_ENABLED:
+                self.llm_small = GroqClientPool(
+                    models=[(config.ROUTER_SMALL_MODEL, 1.0)])
+            else:
+                self.llm_small = GroqClient(model=config.ROUTER_SMALL_MODEL)
+
+        # Nạp trước mô hình tách từ (cổng kiểm tra độ liên quan) ở luồng nền
+        if config.TOKENIZER_WARMUP:
+            vi_tokenizer.warm_up()
+
+        # Chế độ suy giảm: LLM không khả dụng -> trả trích đoạn tài liệu đã truy xuất
+        self.degraded = DegradedMode() if config.DEGRADED_MODE_ENABLED else None
+
+        # Trả lời trích xuất (không gọi LLM) cho câu hỏi "một ý định x một bệnh"
+        self.extractive = None
+        if config.EXTRACTIVE_ENABLED:
+            self.extractive = ExtractiveAnswerer.from_retriever(self.retriever)
+
+        # Bộ đệm câu trả lời cho câu hỏi gần trùng nghĩa (tái sử dụng query embedding)
+        self.semantic_cache = SemanticCache() if config.SEMANTIC_CACHE_ENABLED else None
+
+        # Kho câu trả lời dựng sẵn offline (scripts/build_answer_bank.py)
+        self.answer_bank = AnswerBank() if config.ANSWER_BANK_ENABLED else None
+
+        # Chuỗi giai đoạn tiền/hậu xử lý dùng chung cho mọi biến thể ask_*
+        self.pipeline = RAGPipeline(
+            self.retriever, self.top_k,
+            context_compressor=self.context_compressor,
+            router=self.router,
+            extractive=self.extractive,
+            answer_bank=self.answer_bank,
+            semantic_cache=self.semantic_cache
+        )
+
         logger.info("RAG Chain san sang!")
 
+    # Chuyển lỗi chuẩn hóa từ GroqClient thành thông báo thân thiện cho người dùng.
+    @staticmethod
+    def _llm_error_answer(error: Exception, tag: str = "") -> str:
+        """Thông báo lỗi hiển thị khi gọi LLM thất bại"""
+        error_str = str(error)
+        if 'API_DAILY_LIMIT' in error_str:
+            logger.error(f"Groq daily token quota exhausted{tag}")
+            return "Hệ thống đã hết quota API trong ngày. Vui lòng thử lại vào ngày mai hoặc nâng cấp tài khoản Groq."
+        elif 'API_RATE_LIMIT' in error_str:
+            logger.error(f"API rate limit exhausted after retries{tag}")
+            return "Hệ thống đang quá tải. Vui lòng thử lại sau vài phút."
+        elif 'API_LOAD_SHED' in error_str:
+            logger.error(f"Request shed by client-side rate limiter{tag}")
+            return "Hệ thống đang quá tải. Vui lòng thử lại sau vài phút."
+        elif 'API_CIRCUIT_OPEN' in error_str:
+            logger.error(f"LLM circuit open, fail fast{tag}")
+            return "Hệ thống AI đang tạm gián đoạn. Vui lòng thử lại sau ít phút."
+        elif 'API_TIMEOUT' in error_str:
+            logger.error(f"LLM request deadline exceeded{tag}")
+            return "Hệ thống phản hồi quá lâu. Vui lòng thử lại sau."
+        else:
+            logger.error(f"LLM Error{tag}: {error_str}")
+            return "Xin lỗi, hệ thống đang gặp sự cố. Vui lòng thử lại sau."
+
+    # ============================================
+    # CHẾ ĐỘ SUY GIẢM (DEGRADED MODE)
+    # Lỗi hạn mức / cầu dao mở sau khi truy xuất đã xong -> trả trích đoạn các chunk tốt nhất
+    # thay cho thông báo lỗi; trong thời gian hồi phục các request sau không gọi LLM nữa.
+    # ============================================
+    def _degraded_event(self, ctx: PipelineContext, error: Exception = None, tag: str = "") -> Optional[Dict]:
+        """
+        Câu trả lời chỉ bằng truy xuất khi LLM không khả dụng
+
+        Args:
+            ctx: Trạng thái request (đã qua giai đoạn truy xuất)
+            error: Lỗi LLM vừa gặp; None -> chỉ kiểm tra chế độ suy giảm có đang bật không
+
+        Returns:
+            Optional[Dict]: {'type': 'degraded', 'content', 'reason'}, None -> xử lý như cũ
+        """
+        if self.degraded is None:
+            return None
+        if error is None:
+            reason = self.degraded.active()
+        elif self._llm_for(ctx.route) is self.llm:
+            reason = self.degraded.trip(error)
+        else:
+            # Lỗi của model nhỏ (tuyến 'small') không nói gì về model lớn -> không bật
+            # chế độ suy giảm toàn cục, chỉ trả lời bằng trích đoạn nếu nó đang bật sẵn
+            reason = self.degraded.active()
+        if reason is None:
+            return None
+        answer = self.degraded.answer(ctx.docs)
+        if answer is None:
+            return None
+        logger.warning(f"Tra loi che do suy giam{tag} ({reason}), bo qua LLM")
+        return {'type': 'degraded', 'content': answer, 'reason': reason}
+
+    # ============================================
+    # GỌI LLM QUA COMPLETION CACHE
+    # Chỉ các lệnh gọi temperature = 0 mới được đệm. Namespace gồm phiên bản chỉ mục
+    # và phiên bản prompt, nên build lại vector DB hoặc sửa prompt sẽ tự vô hiệu hóa cache.
+    # ============================================
+    def _cache_key(self, messages: List[Dict[str, str]], temperature: float, llm=None) -> Tuple[Optional[str], str]:
+        if self.completion_cache is None or temperature != 0.0:
+            return None, ""
+        namespace = f"{getattr(self.retriever, 'index_version', 'unversioned')}:{PROMPT_VERSION}"
+        key = CompletionCache.make_key(
+            getattr(llm or self.llm, 'model', ''), messages, temperature, config.MAX_TOKENS, namespace)
+        return key, namespace
+
+    def _complete(self, messages: List[Dict[str, str]], temperature: float = 0.0, llm=None, deadline: Deadline = None) -> str:
+        """Gọi LLM (đồng bộ), trả về từ cache nếu đã có"""
+        key, namespace = self._cache_key(messages, temperature, llm)
+        llm = llm or self.llm
+        if key:
+            cached = self.completion_cache.get(key, namespace)
+            if cached is not None:
+                logger.info("Completion cache HIT")
+                return cached
+
+        answer = llm.chat(messages, temperature=temperature, deadline=deadline)
+        if key:
+            self.completion_cache.put(key, namespace, answer)
+        return answer
+
+    def _complete_stream(self, messages: List[Dict[str, str]], temperature: float = 0.0, llm=None, deadline: Deadline = None) -> Generator[str, None, None]:
+        """Gọi LLM dạng luồng; câu trả lời đã đệm được phát lại như một luồng"""
+        key, namespace = self._cache_key(messages, temperature, llm)
+        llm = llm or self.llm
+        if key:
+            cached = self.completion_cache.get(key, namespace)
+            if cached is not None:
+                logger.info("Completion cache HIT (stream replay)")
+                yield from replay_stream(cached)
+                return
+
+        parts = []
+        for chunk in llm.chat_stream(messages, temperature=temperature, deadline=deadline):
+            parts.append(chunk)
+            yield chunk
+        # Chỉ lưu khi luồng hoàn tất trọn vẹn (lỗi giữa chừng sẽ ném exception trước dòng này)
+        if key:
+            self.completion_cache.put(key, namespace, "".join(parts))
+
+    async def _complete_async(self, messages: List[Dict[str, str]], temperature: float = 0.0, llm=None, deadline: Deadline = None) -> str:
+        key, namespace = self._cache_key(messages, temperature, llm)
+        llm = llm or self.llm
+        if key:
+            cached = self.completion_cache.get(key, namespace)
+            if cached is not None:
+                logger.info("Completion cache HIT (async)")
+                return cached
+
+        answer = await llm.chat_async(messages, temperature=temperature, deadline=deadline)
+        if key:
+            self.completion_cache.put(key, namespace, answer)
+        return answer
+
+    async def _complete_stream_async(self, messages: List[Dict[str, str]], temperature: float = 0.0, llm=None, deadline: Deadline = None) -> AsyncGenerator[str, None]:
+        key, namespace = self._cache_key(messages, temperature, llm)
+        llm = llm or self.llm
+        if key:
+            cached = self.completion_cache.get(key, namespace)
+            if cached is not None:
+                logger.info("Completion cache HIT (stream replay, async)")
+                for piece in replay_stream(cached):
+                    yield piece
+                return
+
+        parts = []
+        async for chunk in llm.chat_stream_async(messages, temperature=temperature, deadline=deadline):
+            parts.append(chunk)
+            yield chunk
+        if key:
+            self.completion_cache.put(key, namespace, "".join(parts))
+
+    # ============================================
+    # ĐỊNH TUYẾN MODEL (MODEL ROUTER)
+    # Chế độ 'active': tuyến 'small' dùng model nhỏ; mọi trường hợp khác dùng model lớn.
+    # Chế độ 'shadow': luôn trả lời bằng model lớn, một phần câu hỏi đủ điều kiện được
+    # chạy thêm model nhỏ ở nền để so sánh chất lượng (không ảnh hưởng người dùng).
+    # ============================================
+    def _llm_for(self, route: Optional[str]):
+        if self.router is not None and self.router.effective_route(route) == ROUTE_SMALL:
+            return self.llm_small
+        return self.llm
+
+    def _route_done(
+        self,
+        ctx: PipelineContext,
+        answer: str,
+        final_answer: str,
+        latency: float
+    ):
+        """Ghi nhận số liệu của tuyến đã dùng và khởi chạy so sánh shadow nếu được chọn mẫu"""
+        route = ctx.route
+        if self.router is None or route is None:
+            return
+        self.router.record(self.router.effective_route(
+            route), latency, ctx.messages, answer)
+        if self.router.should_shadow(route):
+            self.router.run_shadow(
+                call_small=lambda: self._complete(
+                    ctx.messages, temperature=0.0, llm=self.llm_small),
+                finalize=lambda small_answer: self.pipeline.finalize(
+                    ctx, small_answer, tag=f"{ctx.tag} (shadow)"),
+                large_answer=final_answer,
+                large_latency=latency,
+                fallback_answers=(STRICT_FALLBACK_RESPONSE,
+                                  NO_DOCS_FOUND_RESPONSE)
+            )
+
+    # ============================================
+    # GỘP REQUEST TRÙNG LẶP (SINGLE-FLIGHT)
+    # Khóa gồm câu hỏi đã chuẩn hóa, cờ lịch sử rỗng và phiên bản chỉ mục.
+    # Request đầu tiên thực hiện toàn bộ pipeline; các request giống hệt đến trong lúc
+    # đó nhận chung luồng kết quả thay vì tự truy xuất và gọi Groq lần nữa.
+    # ============================================
+    def _flight_key(self, question: str, chat_history: List[Tuple[str, str]] = None) -> Optional[str]:
+        if self.single_flight is None:
+            return None
+        return SingleFlight.make_key(
+            question, chat_history, getattr(self.retriever, 'index_version', ''))
+
     # Hàm thực thi luồng RAG cơ bản (Đồng bộ).
     # Áp dụng cơ chế kiểm duyệt đa lớp nghiêm ngặt để đảm bảo an toàn y khoa.
     def ask(
         self,
         question: str,
         chat_history: List[Tuple[str, str]] = None,
-        return_sources: bool = True
+        return_sources: bool = True,
+        deadline: Deadline = None
     ) -> str:
         """
         Hỏi đáp với RAG
@@ -89,222 +332,57 @@ class RAGChain:
             question: Câu hỏi
             chat_history: Lịch sử chat [(user_msg, bot_msg), ...]
             return_sources: Có trả về nguồn không
+            deadline: Hạn chót toàn request (tạo ở tầng web, truyền xuống GroqClient)
 
         Returns:
             str: Câu trả lời
         """
-        # BƯỚC 1: Xử lý ý định giao tiếp cơ bản (Intent Matching).
-        # Tiết kiệm tài nguyên API bằng cách trả lời ngay các câu chào hỏi/tạm biệt.
-        if is_greeting(question):
-            return random.choice(GREETING_RESPONSES)
-
-        if is_farewell(question):
-            return random.choice(FAREWELL_RESPONSES)
-
-        # ============================================
-        # BƯỚC 2: CỔNG AN TOÀN SỐ 1 (SAFETY CONTROL)
-        # Sử dụng Query Normalizer để chặn đứng các yêu cầu vi phạm đạo đức y tế
-        # (như yêu cầu kê đơn thuốc, chẩn đoán bệnh lâm sàng) ngay từ đầu.
-        # ============================================
-        should_block, block_reason = should_block_query(question)
-        if should_block:
-            logger.warning(f"QUERY BLOCKED: {block_reason}")
-            return STRICT_FALLBACK_RESPONSE
-
-        # BƯỚC 3: Truy xuất tài liệu (Retrieval) tích hợp màng lọc ngưỡng (Threshold Filtering).
-        # Chỉ những tài liệu có điểm số RRF vượt ngưỡng mới được giữ lại.
-        retrieved_docs = self.retriever.retrieve(
-            question,
-            top_k=self.top_k,
-            apply_threshold=True  # Bật filtering
-        )
-
-        # KIỂM TRA MỨC ĐỘ TỒN TẠI TÀI LIỆU
-        # Nếu không có tài liệu nào vượt qua ngưỡng, hệ thống kích hoạt Fallback
-        # thay vì để LLM tự "ảo giác" (hallucinate) ra câu trả lời.
-        if not retrieved_docs or len(retrieved_docs) == 0:
-            logger.warning(
-                "No documents passed relevance threshold -> Returning fallback")
-            return NO_DOCS_FOUND_RESPONSE
-
-        # Định dạng ngữ cảnh (Context) và Nguồn (Sources) để chèn vào Prompt
-        context = format_context(retrieved_docs)
-        all_sources = format_sources(retrieved_docs)
-
-        # ============================================
-        # BƯỚC 4: CỔNG AN TOÀN SỐ 2 (FOOD/SUPPLEMENT GATE)
-        # Giải quyết triệt để lỗi AI khuyên dùng thực phẩm để "chữa bệnh".
-        # Nếu câu hỏi nhắc đến việc chữa bệnh bằng thực phẩm, hệ thống sẽ dò quét
-        # xem ngữ cảnh (Context) có thực sự xác nhận điều đó không. Nếu không -> Chặn!
-        # ============================================
-        _FOOD_SUPPLEMENT_TERMS = [
-            'vitamin c', 'vitamin d', 'vitamin a', 'vitamin e',
-            'vitamin b1', 'vitamin b2', 'vitamin b6', 'vitamin b12',
-            'sầu riêng', 'mật ong', 'gừng', 'tỏi', 'nghệ',
-            'dầu cá', 'omega-3', 'omega 3', 'canxi', 'kẽm',
-            'magiê', 'collagen', 'probiotic', 'men vi sinh',
-            'nha đam', 'trà xanh', 'cà phê', 'chanh', 'bưởi',
-        ]
-        _CURE_VERBS = ['chữa', 'trị bệnh', 'trị được', 'chữa được',
-                       'chữa bệnh', 'phòng bệnh', 'phòng ngừa bệnh']
-        _q_lower = question.lower()
-        _matched_food = next(
-            (f for f in _FOOD_SUPPLEMENT_TERMS if f in _q_lower), None)
-        if _matched_food and any(v in _q_lower for v in _CURE_VERBS):
-            if _matched_food not in context.lower():
-                logger.info(
-                    f"Food/supplement '{_matched_food}' not in context -> FALLBACK")
-                return f"{NO_DOCS_FOUND_RESPONSE}\n\nNguồn: Không có"
-
-        # ============================================
-        # BƯỚC 5: CỔNG AN TOÀN SỐ 3 (SEMANTIC CONTEXT RELEVANCE)
-        # Đánh giá chéo mức độ liên quan ngữ nghĩa giữa Câu hỏi và Ngữ cảnh.
-        # ============================================
-        if not check_context_relevance(question, context):
-            logger.warning(
-                "Context khong lien quan den cau hoi -> FALLBACK")
-            return f"{NO_DOCS_FOUND_RESPONSE}\n\nNguồn: Không có"
-
-        # Đóng gói Prompt hoàn chỉnh gồm: Chỉ thị hệ thống, Lịch sử, Ngữ cảnh và Câu hỏi.
-        messages = build_messages(
-            question=question,
-            context=context,
-            system_prompt=HEALTH_CHATBOT_SYSTEM_PROMPT,
-            chat_history=chat_history,
-            sources=all_sources
-        )
+        key = self._flight_key(question, chat_history)
+        if key:
+            return self.single_flight.call(
+                key, lambda: self._ask(question, chat_history, deadline))
+        return self._ask(question, chat_history, deadline)
+
+    def _ask(self, question: str, chat_history: List[Tuple[str, str]] = None, deadline: Deadline = None) -> str:
+        ctx = self.pipeline.prepare(question, chat_history)
+        if ctx.short_answer is not None:
+            return ctx.short_answer
+        degraded = self._degraded_event(ctx)
+        if degraded is not None:
+            return degraded['content']
 
         # ============================================
         # BƯỚC 6: SINH VĂN BẢN (GENERATION)
         # Thiết lập temperature=0.0 (Chế độ Strict/Deterministic)
         # để buộc LLM trả lời dựa trên facts (sự thật), triệt tiêu sự sáng tạo tự do.
         # ============================================
+        start = time.time()
         try:
-            answer = self.llm.chat(messages, temperature=0.0)
-        except Exception as e:
-            error_str = str(e)
-            if 'API_DAILY_LIMIT' in error_str:
-                logger.error("Groq daily token quota exhausted")
-                return "Hệ thống đã hết quota API trong ngày. Vui lòng thử lại vào ngày mai hoặc nâng cấp tài khoản Groq."
-            elif 'API_RATE_LIMIT' in error_str:
-                logger.error("API rate limit exhausted after retries")
-                return "Hệ thống đang quá tải. Vui lòng thử lại sau vài phút."
-            else:
-                logger.error(f"LLM Error: {error_str}")
-                return "Xin lỗi, hệ thống đang gặp sự cố. Vui lòng thử lại sau."
-
-        # ============================================
-        # BƯỚC 7: TRÍCH XUẤT VÀ ĐỐI CHIẾU NGUỒN (SOURCE GROUNDING)
-        # Kiểm tra xem các nguồn do LLM sinh ra có thực sự nằm trong danh sách
-        # ngữ cảnh đã cung cấp ban đầu hay không.
-        # ============================================
-        _sources_in_context = extract_sources_from_context(context)
-        _raw_cited = extract_sources_from_answer(answer)
-        _MEDICAL_ANCHORS = [
-            'stress', 'lo âu', 'mất ngủ', 'gout', 'sốt xuất huyết', 'cúm',
-            'covid', 'đái tháo đường', 'béo phì', 'đau khớp', 'đau đầu',
-            'mệt mỏi', 'buồn nôn', 'chóng mặt', 'tim', 'tim mạch', 'huyết áp',
-            'tiêu hóa', 'viêm họng', 'hen', 'trầm cảm',
-        ]
-        _anchor_terms = [a for a in _MEDICAL_ANCHORS if a in question.lower()]
-
-        def _source_is_relevant(src: str) -> bool:
-            """Kiểm tra chunk của source trong context có chứa ít nhất 1 topic word."""
-            src_pattern = re.escape(src)
-            chunk_match = re.search(
-                rf'\[Tài liệu \d+ - {src_pattern}(?:\s*\|[^\]]*)?\](.+?)(?=\[Tài liệu|$)',
-                context, re.DOTALL)
-            if not chunk_match:
-                return True
-            chunk_text = chunk_match.group(1).lower()
-            if not _anchor_terms:
-                return True
-            return any(a in chunk_text for a in _anchor_terms)
-
-        _pre_cited = [
-            s for s in _raw_cited
-            if s in _sources_in_context and _source_is_relevant(s)
-        ][:3]
-        logger.info(f"Raw LLM sources: {_raw_cited} -> valid: {_pre_cited}")
-
-        # ============================================
-        # BƯỚC 8: CỔNG AN TOÀN SỐ 4 - KIỂM DUYỆT HẬU KỲ (POST-GENERATION SAFETY FILTER)
-        # Cắt gọt và làm sạch câu trả lời, đảm bảo không vi phạm quy tắc hệ thống.
-        # ============================================
-        logger.info("Running post-generation safety check...")
-        answer = sanitize_answer(answer)
-
-        # Nếu quy trình sanitize quyết định đây là câu trả lời Fallback, đính kèm nguồn trống.
-        if answer == STRICT_FALLBACK_RESPONSE or answer == NO_DOCS_FOUND_RESPONSE:
-            return f"{answer}\n\nNguồn: Không có"
-
-        # ============================================
-        # BƯỚC 9: CỔNG AN TOÀN SỐ 5 - VERIFICATION AI (GIÁM ĐỊNH VIÊN AI)
-        # Một luồng AI độc lập khác sẽ được gọi để đọc lại câu trả lời vừa sinh ra.
-        # Nếu phát hiện câu trả lời chứa thông tin y tế nằm ngoài ngữ cảnh -> Hủy kết quả.
-        # ============================================
-        logger.info("Running Verification AI...")
-        answer = verify_answer(
-            question=question,
-            context=context,
-            draft_answer=answer
-        )
-
-        # ==========================================
-        # BƯỚC 10: LÀM SẠCH BỀ MẶT BẰNG REGEX (FINAL CLEANUP)
-        # Chuẩn hóa định dạng chuỗi trước khi hiển thị lên giao diện Web.
-        # ==========================================
-        try:
-            parts = re.split(r'\n+Nguồn:\s*', answer, flags=re.IGNORECASE)
-            if len(parts) == 2:
-                main_text, sources_str = parts
-
-                # Loại bỏ từ khóa nhạy cảm "Tiêm chủng" khỏi danh sách liệt kê và dọn dẹp dấu câu
-                main_text = re.sub(r'(?i)tiêm\s*chủng', '', main_text)
-                main_text = re.sub(r'\s*,\s*,', ',', main_text)
-                main_text = re.sub(r':\s*,', ':', main_text)
-                main_text = re.sub(r',\s*\.', '.', main_text)
-                main_text = re.sub(r'\s+', ' ', main_text).strip()
-
-                from backend.rag.prompts import _FILENAME_TO_DISEASE
-                nice_sources = []
-                for src in sources_str.split(','):
-                    src = src.strip()
-                    if src.lower() == 'không có' or not src:
-                        if 'Không có' not in nice_sources:
-                            nice_sources.append('Không có')
-                        continue
-
-                    # Ánh xạ tên file (.txt) thành tên bệnh tiếng Việt có dấu để giao diện thân thiện hơn
-                    if src.endswith('.txt'):
-                        nice_name = _FILENAME_TO_DISEASE.get(
-                            src, src.replace('.txt', '').replace('_', ' ').title())
-                    else:
-                        nice_name = src
-
-                    # Bộ lọc cuối: Chặn "Tiêm chủng" xuất hiện trong danh sách nguồn hiển thị
-                    if nice_name not in nice_sources and nice_name.lower() != 'tiêm chủng':
-                        nice_sources.append(nice_name)
-
-                final_sources_str = ', '.join(
-                    nice_sources) if nice_sources else "Không có"
-                answer = main_text.strip() + f"\n\nNguồn: {final_sources_str}"
+            with self.pipeline.timed(ctx, 'generate'):
+                answer = self._complete(
+                    ctx.messages, temperature=0.0, llm=self._llm_for(ctx.route), deadline=deadline)
         except Exception as e:
-            logger.error(f"Error post-processing answer: {e}")
+            degraded = self._degraded_event(ctx, e)
+            if degraded is not None:
+                return degraded['content']
+            return self._llm_error_answer(e)
+        latency = time.time() - start
 
-        if config.DEBUG:
-            logger.debug(f"Verified Answer: {answer[:200]}...")
-
-        return answer
+        final_answer = self.pipeline.finalize(ctx, answer)
+        self._route_done(ctx, answer, final_answer, latency)
+        self.pipeline.remember(ctx, final_answer)
+        return final_answer
 
     # Hàm thực thi luồng RAG dạng Streaming (Truyền phát liên tục).
-    # Logic bên trong phản chiếu lại toàn bộ 10 bước của hàm ask() đồng bộ ở trên,
+    # Dùng chung các giai đoạn tiền/hậu xử lý với hàm ask() đồng bộ ở trên,
     # nhưng sử dụng từ khóa 'yield' để hỗ trợ Server-Sent Events (SSE) về phía Client.
     def ask_stream(
         self,
         question: str,
         chat_history: List[Tuple[str, str]] = None,
-        return_sources: bool = True
+        return_sources: bool = True,
+        deadline: Deadline = None,
+        cancel_token: CancellationToken = None
     ) -> Generator[str, None, None]:
         """
         Hỏi đáp với streaming response
@@ -313,178 +391,197 @@ class RAGChain:
             question: Câu hỏi
             chat_history: Lịch sử chat
             return_sources: Trả về nguồn
+            deadline: Hạn chót toàn request
+            cancel_token: Token hủy (tầng web kích hoạt khi client ngắt kết nối)
 
         Yields:
             str: Từng phần câu trả lời
+
+        Raises:
+            Exception: REQUEST_CANCELLED khi token bị hủy giữa chừng
         """
-        if is_greeting(question):
-            yield random.choice(GREETING_RESPONSES)
-            return
+        for event in self.ask_events(question, chat_history, deadline, cancel_token):
+            if event['type'] in ('token', 'degraded'):
+                yield event['content']
 
-        if is_farewell(question):
-            yield random.choice(FAREWELL_RESPONSES)
-            return
+    def ask_events(
+        self,
+        question: str,
+        chat_history: List[Tuple[str, str]] = None,
+        deadline: Deadline = None,
+        cancel_token: CancellationToken = None
+    ) -> Generator[Dict, None, None]:
+        """
+        Giống ask_stream() nhưng phát sự kiện có kiểu, để tầng web gửi nguồn trước khi LLM trả lời
 
-        should_block, block_reason = should_block_query(question)
-        if should_block:
-            logger.warning(f"QUERY BLOCKED (stream): {block_reason}")
-            yield STRICT_FALLBACK_RESPONSE
+        Yields:
+            Dict: {'type': 'retrieval_done', 'sources', 'retrieval_ms', 'elapsed_ms'}
+                  (ngay khi ngữ cảnh đã sẵn sàng) rồi {'type': 'token', 'content'};
+                  LLM không khả dụng -> {'type': 'degraded', 'content', 'reason'} thay cho token
+
+        Raises:
+            Exception: REQUEST_CANCELLED khi token bị hủy giữa chừng
+        """
+        key = self._flight_key(question, chat_history)
+        if key:
+            # Lượt gộp chỉ bị hủy khi mọi người đăng ký đều đã rời đi (token của lượt)
+            yield from self.single_flight.stream(
+                key,
+                lambda: self._ask_events(
+                    question, chat_history, deadline, SingleFlight.current_cancel_token()),
+                cancel_token=cancel_token
+            )
             return
+        yield from self._ask_events(question, chat_history, deadline, cancel_token)
 
-        retrieved_docs = self.retriever.retrieve(
-            question,
-            top_k=self.top_k,
-            apply_threshold=True
-        )
+    def _ask_events(
+        self,
+        question: str,
+        chat_history: List[Tuple[str, str]] = None,
+        deadline: Deadline = None,
+        cancel_token: CancellationToken = None
+    ) -> Generator[Dict, None, None]:
+        ctx = self.pipeline.prepare(question, chat_history, tag=" (stream)")
+        if ctx.short_answer is not None:
+            yield {'type': 'token', 'content': ctx.short_answer}
+            return
 
-        if not retrieved_docs or len(retrieved_docs) == 0:
-            logger.warning(
-                "No documents passed relevance threshold (stream) -> Returning fallback")
-            yield NO_DOCS_FOUND_RESPONSE
+        # Truy xuất xong từ lâu trước khi LLM sinh token đầu tiên: báo nguồn cho client ngay
+        yield {
+            'type': 'retrieval_done',
+            'sources': self.pipeline.prompt_sources(ctx),
+            'retrieval_ms': ctx.timings.get('retrieve'),
+            'elapsed_ms': round((time.time() - ctx.started) * 1000, 1)
+        }
+
+        degraded = self._degraded_event(ctx, tag=" (stream)")
+        if degraded is not None:
+            yield degraded
             return
 
-        context = format_context(retrieved_docs)
-        all_sources = format_sources(retrieved_docs)
+        logger.info("Generating answer (streaming mode)...")
+        full_answer = ""
 
-        _FOOD_SUPPLEMENT_TERMS_S = [
-            'vitamin c', 'vitamin d', 'vitamin a', 'vitamin e',
-            'vitamin b1', 'vitamin b2', 'vitamin b6', 'vitamin b12',
-            'sầu riêng', 'mật ong', 'gừng', 'tỏi', 'nghệ',
-            'dầu cá', 'omega-3', 'omega 3', 'canxi', 'kẽm',
-            'magiê', 'collagen', 'probiotic', 'men vi sinh',
-            'nha đam', 'trà xanh', 'cà phê', 'chanh', 'bưởi',
-        ]
-        _CURE_VERBS_S = ['chữa', 'trị bệnh', 'trị được', 'chữa được',
-                         'chữa bệnh', 'phòng bệnh', 'phòng ngừa bệnh']
-        _q_lower_s = question.lower()
-        _matched_food_s = next(
-            (f for f in _FOOD_SUPPLEMENT_TERMS_S if f in _q_lower_s), None)
-        if _matched_food_s and any(v in _q_lower_s for v in _CURE_VERBS_S):
-            if _matched_food_s not in context.lower():
+        # Ghi nhận dần kết quả sinh ra từ Generator để xử lý hậu kỳ.
+        # Token hủy được kiểm tra giữa các token: khi client đã rời đi, đóng generator
+        # để GroqClient đóng luồng HTTP ngay thay vì đợi model sinh hết câu trả lời.
+        start = time.time()
+        llm_stream = self._complete_stream(
+            ctx.messages, temperature=0.0, llm=self._llm_for(ctx.route), deadline=deadline)
+        try:
+            with self.pipeline.timed(ctx, 'generate'):
+                if cancel_token is not None:
+                    cancel_token.check()
+                for chunk in llm_stream:
+                    full_answer += chunk
+                    if cancel_token is not None:
+                        cancel_token.check()
+        except Exception as e:
+            if 'REQUEST_CANCELLED' in str(e):
+                llm_stream.close()
+                cancel_token.partial_answer = full_answer
+                with self._stats_lock:
+                    self._cancelled += 1
                 logger.info(
-                    f"Food/supplement '{_matched_food_s}' not in context (stream) -> FALLBACK")
-                yield f"{NO_DOCS_FOUND_RESPONSE}\n\nNguồn: Không có"
+                    f"Request cancelled ({cancel_token.reason}) sau {len(full_answer)} ky tu -> dong luong LLM")
+                raise
+            degraded = self._degraded_event(ctx, e, tag=" (stream)")
+            if degraded is not None:
+                yield degraded
                 return
-
-        if not check_context_relevance(question, context):
-            logger.warning(
-                "Context khong lien quan (stream) -> FALLBACK")
-            yield f"{NO_DOCS_FOUND_RESPONSE}\n\nNguồn: Không có"
+            yield {'type': 'token', 'content': self._llm_error_answer(e, tag=" (stream)")}
             return
+        latency = time.time() - start
 
-        messages = build_messages(
-            question=question,
-            context=context,
-            system_prompt=HEALTH_CHATBOT_SYSTEM_PROMPT,
-            chat_history=chat_history,
-            sources=all_sources
-        )
-
-        logger.info("Generating answer (streaming mode)...")
-        full_answer = ""
+        # Đẩy toàn bộ khối văn bản đã được kiểm duyệt về lại hàm gọi
+        final_answer = self.pipeline.finalize(ctx, full_answer)
+        self._route_done(ctx, full_answer, final_answer, latency)
+        self.pipeline.remember(ctx, final_answer)
+        yield {'type': 'token', 'content': final_answer}
+
+    # ============================================
+    # CÁC ĐIỂM VÀO BẤT ĐỒNG BỘ (ASYNC ENTRY POINTS)
+    # Truy xuất (nhúng PhoBERT + FAISS/BM25) là tác vụ nặng CPU nên được đẩy sang
+    # thread pool qua asyncio.to_thread; vòng gọi LLM chạy trên event loop bằng
+    # client bất đồng bộ nên không chiếm thread nào trong lúc chờ mạng.
+    # ============================================
+    async def ask_async(
+        self,
+        question: str,
+        chat_history: List[Tuple[str, str]] = None,
+        return_sources: bool = True,
+        deadline: Deadline = None
+    ) -> str:
+        """
+        Phiên bản bất đồng bộ của ask()
 
-        # Ghi nhận dần kết quả sinh ra từ Generator để xử lý hậu kỳ
+        Returns:
+            str: Câu trả lời
+        """
+        ctx = await asyncio.to_thread(
+            self.pipeline.prepare, question, chat_history, " (async)")
+        if ctx.short_answer is not None:
+            return ctx.short_answer
+        degraded = self._degraded_event(ctx, tag=" (async)")
+        if degraded is not None:
+            return degraded['content']
+
+        start = time.time()
         try:
-            for chunk in self.llm.chat_stream(messages, temperature=0.0):
-                full_answer += chunk
+            with self.pipeline.timed(ctx, 'generate'):
+                answer = await self._complete_async(ctx.messages, temperature=0.0, llm=self._llm_for(ctx.route), deadline=deadline)
         except Exception as e:
-            error_str = str(e)
-            if 'API_DAILY_LIMIT' in error_str:
-                logger.error("Groq daily quota exhausted (stream)")
-                yield "Hệ thống đã hết quota API trong ngày. Vui lòng thử lại vào ngày mai hoặc nâng cấp tài khoản Groq."
-            elif 'API_RATE_LIMIT' in error_str:
-                logger.error("API rate limit exhausted (stream)")
-                yield "Hệ thống đang quá tải. Vui lòng thử lại sau vài phút."
-            else:
-                logger.error(f"LLM Error (stream): {error_str}")
-                yield "Xin lỗi, hệ thống đang gặp sự cố. Vui lòng thử lại sau."
-            return
+            degraded = self._degraded_event(ctx, e, tag=" (async)")
+            if degraded is not None:
+                return degraded['content']
+            return self._llm_error_answer(e, tag=" (async)")
+        latency = time.time() - start
+
+        final_answer = self.pipeline.finalize(ctx, answer)
+        self._route_done(ctx, answer, final_answer, latency)
+        self.pipeline.remember(ctx, final_answer)
+        return final_answer
+
+    async def ask_stream_async(
+        self,
+        question: str,
+        chat_history: List[Tuple[str, str]] = None,
+        return_sources: bool = True,
+        deadline: Deadline = None
+    ) -> AsyncGenerator[str, None]:
+        """
+        Phiên bản bất đồng bộ của ask_stream()
 
-        _sources_in_context_s = extract_sources_from_context(context)
-        _raw_cited_s = extract_sources_from_answer(full_answer)
-        _MEDICAL_ANCHORS_S = [
-            'stress', 'lo âu', 'mất ngủ', 'gout', 'sốt xuất huyết', 'cúm',
-            'covid', 'đái tháo đường', 'béo phì', 'đau khớp', 'đau đầu',
-            'mệt mỏi', 'buồn nôn', 'chóng mặt', 'tim', 'tim mạch', 'huyết áp',
-            'tiêu hóa', 'viêm họng', 'hen', 'trầm cảm',
-        ]
-        _anchor_terms_s = [
-            a for a in _MEDICAL_ANCHORS_S if a in question.lower()]
-
-        def _source_is_relevant_s(src: str) -> bool:
-            src_pattern = re.escape(src)
-            chunk_match_s = re.search(
-                rf'\[Tài liệu \d+ - {src_pattern}(?:\s*\|[^\]]*)?\](.+?)(?=\[Tài liệu|$)',
-                context, re.DOTALL)
-            if not chunk_match_s:
-                return True
-            chunk_text_s = chunk_match_s.group(1).lower()
-            if not _anchor_terms_s:
-                return True
-            return any(a in chunk_text_s for a in _anchor_terms_s)
-
-        _pre_cited_s = [
-            s for s in _raw_cited_s
-            if s in _sources_in_context_s and _source_is_relevant_s(s)
-        ][:3]
-        logger.info(
-            f"Raw LLM sources (stream): {_raw_cited_s} -> valid: {_pre_cited_s}")
-
-        logger.info("Running post-generation safety check (stream)...")
-        full_answer = sanitize_answer(full_answer)
-
-        if full_answer == STRICT_FALLBACK_RESPONSE or full_answer == NO_DOCS_FOUND_RESPONSE:
-            yield f"{full_answer}\n\nNguồn: Không có"
+        Yields:
+            str: Từng phần câu trả lời
+        """
+        ctx = await asyncio.to_thread(
+            self.pipeline.prepare, question, chat_history, " (stream-async)")
+        if ctx.short_answer is not None:
+            yield ctx.short_answer
+            return
+        degraded = self._degraded_event(ctx, tag=" (stream-async)")
+        if degraded is not None:
+            yield degraded['content']
             return
 
-        logger.info("Running Verification AI (stream)...")
-        full_answer = verify_answer(
-            question=question,
-            context=context,
-            draft_answer=full_answer
-        )
-
+        full_answer = ""
+        start = time.time()
         try:
-            parts = re.split(r'\n+Nguồn:\s*', full_answer, flags=re.IGNORECASE)
-            if len(parts) == 2:
-                main_text, sources_str = parts
-
-                main_text = re.sub(r'(?i)tiêm\s*chủng', '', main_text)
-                main_text = re.sub(r'\s*,\s*,', ',', main_text)
-                main_text = re.sub(r':\s*,', ':', main_text)
-                main_text = re.sub(r',\s*\.', '.', main_text)
-                main_text = re.sub(r'\s+', ' ', main_text).strip()
-
-                from backend.rag.prompts import _FILENAME_TO_DISEASE
-                nice_sources = []
-                for src in sources_str.split(','):
-                    src = src.strip()
-                    if src.lower() == 'không có' or not src:
-                        if 'Không có' not in nice_sources:
-                            nice_sources.append('Không có')
-                        continue
-
-                    if src.endswith('.txt'):
-                        nice_name = _FILENAME_TO_DISEASE.get(
-                            src, src.replace('.txt', '').replace('_', ' ').title())
-                    else:
-                        nice_name = src
-
-                    if nice_name not in nice_sources and nice_name.lower() != 'tiêm chủng':
-                        nice_sources.append(nice_name)
-
-                final_sources_str = ', '.join(
-                    nice_sources) if nice_sources else "Không có"
-                full_answer = main_text.strip(
-                ) + f"\n\nNguồn: {final_sources_str}"
+            with self.pipeline.timed(ctx, 'generate'):
+                async for chunk in self._complete_stream_async(ctx.messages, temperature=0.0, llm=self._llm_for(ctx.route), deadline=deadline):
+                    full_answer += chunk
         except Exception as e:
-            logger.error(f"Error post-processing answer (stream): {e}")
+            degraded = self._degraded_event(ctx, e, tag=" (stream-async)")
+            yield degraded['content'] if degraded is not None else \
+                self._llm_error_answer(e, tag=" (stream-async)")
+            return
+        latency = time.time() - start
 
-        if config.DEBUG:
-            logger.debug(f"Verified Answer (stream): {full_answer[:200]}...")
-
-        # Đẩy toàn bộ khối văn bản đã được kiểm duyệt về lại hàm gọi
-        yield full_answer
+        final_answer = self.pipeline.finalize(ctx, full_answer)
+        self._route_done(ctx, full_answer, final_answer, latency)
+        self.pipeline.remember(ctx, final_answer)
+        yield final_answer
 
     # Hàm tiện ích chỉ dùng để trích xuất Context (dùng cho phân tích/debug)
     def get_relevant_info(self, question: str, top_k: int = None, apply_threshold: bool = True) -> List[Dict]:
@@ -502,6 +599,35 @@ class RAGChain:
         k = top_k or self.top_k
         return self.retriever.retrieve(question, top_k=k, apply_threshold=apply_threshold)
 
+    def get_stats(self) -> Dict:
+        """Thống kê vận hành của các thành phần trong chain (phục vụ giám sát)"""
+        stats = {
+            'retriever': self.retriever.get_stats(),
+            'requests_cancelled': self._cancelled,
+            'pipeline': self.pipeline.get_stats(),
+            'pre_gate': self.pipeline.pre_gate.get_stats(),
+            'tokenizer': vi_tokenizer.get_stats()
+        }
+        if hasattr(self.llm, 'get_stats'):
+            stats['llm'] = self.llm.get_stats()
+        if self.semantic_cache is not None:
+            stats['semantic_cache'] = self.semantic_cache.get_stats()
+        if self.answer_bank is not None:
+            stats['answer_bank'] = self.answer_bank.get_stats()
+        if self.degraded is not None:
+            stats['degraded'] = self.degraded.get_stats()
+        if self.extractive is not None:
+            stats['extractive'] = self.extractive.get_stats()
+        if self.completion_cache is not None:
+            stats['completion_cache'] = self.completion_cache.get_stats()
+        if self.single_flight is not None:
+            stats['single_flight'] = self.single_flight.get_stats()
+        if self.context_compressor is not None:
+            stats['context_compression'] = self.context_compressor.get_stats()
+        if self.router is not None:
+            stats['router'] = self.router.get_stats()
+        return stats
+
 # Lớp HealthChatbot là một Wrapper chuyên quản lý Trạng thái (Stateful).
 # Nó bao bọc lấy RAGChain vô trạng thái (Stateless) và cung cấp thêm tính năng
 # duy trì Ngữ cảnh Hội thoại (Conversational Memory) qua nhiều lượt chat.
@@ -533,12 +659,13 @@ class HealthChatbot:
 
         logger.info("Health Chatbot san sang phuc vu!")
 
-    def chat(self, user_message: str) -> str:
+    def chat(self, user_message: str, deadline: Deadline = None) -> str:
         """
         Chat với bot (có lưu history)
 
         Args:
             user_message: Tin nhắn từ user
+            deadline: Hạn chót toàn request
 
         Returns:
             str: Phản hồi
@@ -547,7 +674,8 @@ class HealthChatbot:
         bot_response = self.rag_chain.ask(
             question=user_message,
             chat_history=self.chat_history,
-            return_sources=True
+            return_sources=True,
+            deadline=deadline
         )
 
         # Lưu lượt chat hiện tại vào bộ nhớ
@@ -559,12 +687,13 @@ class HealthChatbot:
 
         return bot_response
 
-    def chat_stream(self, user_message: str) -> Generator[str, None, None]:
+    def chat_stream(self, user_message: str, deadline: Deadline = None) -> Generator[str, None, None]:
         """
         Chat với streaming response
 
         Args:
             user_message: Tin nhắn
+            deadline: Hạn chót toàn request
 
         Yields:
             str: Từng phần response
@@ -575,7 +704,8 @@ class HealthChatbot:
         for chunk in self.rag_chain.ask_stream(
             question=user_message,
             chat_history=self.chat_history,
-            return_sources=True
+            return_sources=True,
+            deadline=deadline
         ):
             full_response += chunk
             yield chunk
@@ -586,6 +716,60 @@ class HealthChatbot:
         if len(self.chat_history) > self.max_history_turns:
             self.chat_history = self.chat_history[-self.max_history_turns:]
 
+    async def chat_async(self, user_message: str, deadline: Deadline = None) -> str:
+        """
+        Phiên bản bất đồng bộ của chat() (có lưu history)
+
+        Args:
+            user_message: Tin nhắn từ user
+            deadline: Hạn chót toàn request
+
+        Returns:
+            str: Phản hồi
+        """
+        bot_response = await self.rag_chain.ask_async(
+            question=user_message,
+            chat_history=self.chat_history,
+            return_sources=True,
+            deadline=deadline
+        )
+
+        self.chat_history.append((user_message, bot_response))
+        if len(self.chat_history) > self.max_history_turns:
+            self.chat_history = self.chat_history[-self.max_history_turns:]
+
+        return bot_response
+
+    async def chat_stream_async(
+        self,
+        user_message: str,
+        deadline: Deadline = None
+    ) -> AsyncGenerator[str, None]:
+        """
+        Phiên bản bất đồng bộ của chat_stream()
+
+        Args:
+            user_message: Tin nhắn
+            deadline: Hạn chót toàn request
+
+        Yields:
+            str: Từng phần response
+        """
+        full_response = ""
+
+        async for chunk in self.rag_chain.ask_stream_async(
+            question=user_message,
+            chat_history=self.chat_history,
+            return_sources=True,
+            deadline=deadline
+        ):
+            full_response += chunk
+            yield chunk
+
+        self.chat_history.append((user_message, full_response))
+        if len(self.chat_history) > self.max_history_turns:
+            self.chat_history = self.chat_history[-self.max_history_turns:]
+
     def clear_history(self):
         """Xóa lịch sử chat"""
         self.chat_history = []
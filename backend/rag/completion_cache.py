@@ -0,0 +1,200 @@
+"""
+Completion Cache - Bộ đệm câu trả lời LLM cho các lệnh gọi tất định (temperature = 0)
+"""
+from config.config import config
+from backend.utils.logger import get_logger
+from collections import OrderedDict
+from typing import Dict, Generator, List, Optional
+from pathlib import Path
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+
+logger = get_logger(__name__)
+
+# Lớp CompletionCache lưu câu trả lời thô của LLM theo khóa băm của toàn bộ đầu vào
+# (model, messages, temperature, max_tokens). Với temperature = 0, cùng một prompt
+# (System Prompt + Context + Câu hỏi + Lịch sử) sinh ra câu trả lời tương đương,
+# nên gọi lại Groq chỉ tốn token và vài giây độ trễ.
+#
+# Kiến trúc 2 tầng:
+# - Tầng 1 (L1): LRU trong RAM (OrderedDict), tra cứu O(1).
+# - Tầng 2 (L2): SQLite trên đĩa, sống sót qua các lần khởi động lại server.
+#
+# Mỗi bản ghi thuộc một "namespace" = phiên bản chỉ mục + phiên bản prompt.
+# Khi build lại vector DB hoặc sửa prompt, namespace đổi -> các bản ghi cũ không
+# bao giờ được trả về nữa và bị dọn khỏi SQLite ở lần truy cập namespace mới.
+
+
+class CompletionCache:
+    """Bộ đệm LRU (RAM) + SQLite (đĩa) cho câu trả lời LLM"""
+
+    def __init__(self, max_entries: int = None, db_path: str = None):
+        """
+        Khởi tạo bộ đệm
+
+        Args:
+            max_entries: Số bản ghi tối đa trong RAM
+            db_path: File SQLite cho tầng bền vững (chuỗi rỗng = chỉ dùng RAM)
+        """
+        self.max_entries = max_entries or config.COMPLETION_CACHE_SIZE
+        db_path = db_path if db_path is not None else config.COMPLETION_CACHE_DB
+
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._namespace = None
+
+        self._conn = None
+        if db_path:
+            try:
+                Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+                self._conn = sqlite3.connect(
+                    str(db_path), timeout=5.0, check_same_thread=False)
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS completions ("
+                    "key TEXT PRIMARY KEY, namespace TEXT, answer TEXT, created REAL)"
+                )
+                self._conn.commit()
+            except Exception as e:
+                logger.warning(
+                    f"Khong mo duoc SQLite cache ({db_path}): {e}. Chi dung RAM.")
+                self._conn = None
+
+        self._hits_memory = 0
+        self._hits_disk = 0
+        self._misses = 0
+        self._stores = 0
+
+    @staticmethod
+    def make_key(
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        namespace: str = ""
+    ) -> str:
+        """
+        Tạo khóa băm SHA-256 cho một lệnh gọi LLM
+
+        Returns:
+            str: Khóa dạng hex
+        """
+        payload = json.dumps(
+            {
+                'ns': namespace,
+                'model': model,
+                'messages': messages,
+                'temperature': temperature,
+                'max_tokens': max_tokens
+            },
+            ensure_ascii=False, sort_keys=True, separators=(',', ':')
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _switch_namespace(self, namespace: str):
+        """Dọn các bản ghi thuộc namespace cũ (gọi khi đang giữ khóa)"""
+        if namespace == self._namespace:
+            return
+        if self._namespace is not None:
+            logger.info(
+                f"Completion cache: namespace doi ({self._namespace} -> {namespace}), xoa ban ghi cu")
+        self._memory.clear()
+        if self._conn is not None:
+            try:
+                cur = self._conn.execute(
+                    "DELETE FROM completions WHERE namespace != ?", (namespace,))
+                self._conn.commit()
+                if cur.rowcount:
+                    logger.info(
+                        f"Completion cache: da xoa {cur.rowcount} ban ghi het han tren dia")
+            except Exception as e:
+                logger.warning(f"Loi don dep SQLite cache: {e}")
+        self._namespace = namespace
+
+    def get(self, key: str, namespace: str) -> Optional[str]:
+        """Tra cứu câu trả lời đã lưu (None nếu chưa có)"""
+        with self._lock:
+            self._switch_namespace(namespace)
+
+            answer = self._memory.get(key)
+            if answer is not None:
+                self._memory.move_to_end(key)
+                self._hits_memory += 1
+                return answer
+
+            if self._conn is not None:
+                try:
+                    row = self._conn.execute(
+                        "SELECT answer FROM completions WHERE key = ? AND namespace = ?",
+                        (key, namespace)
+                    ).fetchone()
+                except Exception as e:
+                    logger.warning(f"Loi doc SQLite cache: {e}")
+                    row = None
+                if row:
+                    # Nâng bản ghi lên tầng RAM cho các lần tra cứu sau
+                    self._remember(key, row[0])
+                    self._hits_disk += 1
+                    return row[0]
+
+            self._misses += 1
+            return None
+
+    def _remember(self, key: str, answer: str):
+        self._memory[key] = answer
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def put(self, key: str, namespace: str, answer: str):
+        """Lưu câu trả lời vào cả hai tầng"""
+        if not answer:
+            return
+        with self._lock:
+            self._switch_namespace(namespace)
+            self._remember(key, answer)
+            self._stores += 1
+            if self._conn is not None:
+                try:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?)",
+                        (key, namespace, answer, time.time())
+                    )
+                    self._conn.commit()
+                except Exception as e:
+                    logger.warning(f"Loi ghi SQLite cache: {e}")
+
+    def clear(self):
+        """Xóa toàn bộ bộ đệm"""
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM completions")
+                self._conn.commit()
+
+    def get_stats(self) -> Dict:
+        """Thống kê tỉ lệ trúng bộ đệm"""
+        with self._lock:
+            lookups = self._hits_memory + self._hits_disk + self._misses
+            return {
+                'namespace': self._namespace,
+                'entries_memory': len(self._memory),
+                'hits_memory': self._hits_memory,
+                'hits_disk': self._hits_disk,
+                'misses': self._misses,
+                'stores': self._stores,
+                'hit_rate': round((self._hits_memory + self._hits_disk) / lookups, 3) if lookups else 0.0,
+                'persistent': self._conn is not None
+            }
+
+
+def replay_stream(answer: str) -> Generator[str, None, None]:
+    """
+    Phát lại câu trả lời đã lưu dưới dạng luồng (từng từ kèm khoảng trắng phía sau),
+    để phía tiêu thụ không phân biệt được với luồng sinh trực tiếp từ LLM
+    """
+    for piece in re.findall(r'\S+\s*|\s+', answer):
+        yield piece
@@ -0,0 +1,173 @@
+"""
+Context Compressor - Nén ngữ cảnh theo câu trước khi đưa vào prompt
+"""
+from config.config import config
+from backend.utils.logger import get_logger
+from typing import Dict, List, Optional
+import numpy as np
+import re
+import threading
+
+logger = get_logger(__name__)
+
+# Mỗi chunk dài tới ~1000 ký tự nhưng thường chỉ vài câu thực sự trả lời câu hỏi.
+# Lớp ContextCompressor tách chunk thành câu, chấm điểm từng câu theo câu hỏi và
+# chỉ giữ các câu điểm cao nhất (theo đúng thứ tự trong tài liệu) trong một ngân sách ký tự.
+#
+# Điểm của câu = w * cosine(query_embedding, câu) + (1 - w) * độ phủ từ khóa kiểu BM25
+# (tổng IDF các từ của câu hỏi xuất hiện trong câu / tổng IDF các từ của câu hỏi).
+# query_embedding được tái sử dụng từ bước truy xuất (trace) nên không phải encode lại câu hỏi.
+#
+# Dòng tiêu đề [Tài liệu i - nguồn] do format_context sinh ra SAU bước này nên luôn
+# được giữ nguyên; mỗi tài liệu giữ ít nhất một câu để nguồn không biến mất khỏi prompt.
+
+# Tách câu: sau dấu kết thúc câu hoặc tại xuống dòng
+_SENTENCE_SPLIT = re.compile(r'(?<=[.!?;])\s+|\n+')
+
+# Dòng cấu trúc (tiêu đề mục "## ...", "Triệu chứng:") luôn được giữ để LLM biết ngữ cảnh của câu
+_STRUCTURAL_LINE = re.compile(r'^\s*(#+\s|.{1,60}:\s*$)')
+
+_WORD = re.compile(r'\w+')
+
+
+def split_sentences(text: str) -> List[str]:
+    """Tách đoạn văn thành danh sách câu (bỏ câu rỗng)"""
+    return [s.strip() for s in _SENTENCE_SPLIT.split(text or '') if s and s.strip()]
+
+
+class ContextCompressor:
+    """Chọn lọc câu liên quan nhất trong các chunk đã truy xuất"""
+
+    def __init__(self, max_chars: int = None, embedding_weight: float = None):
+        """
+        Args:
+            max_chars: Ngân sách ký tự cho toàn bộ ngữ cảnh sau khi nén
+            embedding_weight: Trọng số của độ tương đồng ngữ nghĩa (phần còn lại cho từ khóa)
+        """
+        self.max_chars = max_chars or config.CONTEXT_COMPRESSION_MAX_CHARS
+        self.embedding_weight = config.CONTEXT_COMPRESSION_EMBEDDING_WEIGHT \
+            if embedding_weight is None else embedding_weight
+
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._compressed = 0
+        self._chars_in = 0
+        self._chars_out = 0
+
+    def _keyword_scores(self, query: str, sentences: List[str], idf: Optional[Dict[str, float]]) -> np.ndarray:
+        query_terms = set(_WORD.findall(query.lower()))
+        if not query_terms:
+            return np.zeros(len(sentences))
+        weights = {t: max((idf or {}).get(t, 1.0), 0.0) or 0.01
+                   for t in query_terms}
+        total = sum(weights.values())
+        scores = []
+        for sentence in sentences:
+            words = set(_WORD.findall(sentence.lower()))
+            scores.append(
+                sum(w for t, w in weights.items() if t in words) / total)
+        return np.array(scores)
+
+    def _semantic_scores(self, sentences: List[str], query_embedding, embedder) -> np.ndarray:
+        if query_embedding is None or embedder is None or self.embedding_weight <= 0:
+            return np.zeros(len(sentences))
+        try:
+            vectors = np.asarray(embedder.encode_batch(
+                sentences, show_progress=False), dtype=np.float32)
+            query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+            norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+            norms[norms == 0] = 1.0
+            return np.clip(vectors @ query / norms, 0.0, 1.0)
+        except Exception as e:
+            logger.warning(f"Khong tinh duoc embedding cau de nen context: {e}")
+            return np.zeros(len(sentences))
+
+    def compress(
+        self,
+        docs: List[Dict],
+        query: str,
+        query_embedding=None,
+        embedder=None,
+        idf: Optional[Dict[str, float]] = None
+    ) -> List[Dict]:
+        """
+        Nén nội dung các tài liệu đã truy xuất
+
+        Args:
+            docs: Tài liệu theo thứ hạng (mỗi phần tử có 'content' và 'metadata')
+            query: Câu hỏi đã chuẩn hóa
+            query_embedding: Vector câu hỏi từ bước truy xuất
+            embedder: Mô hình đã sinh query_embedding (để encode câu cùng không gian)
+            idf: Bảng IDF của BM25 (từ -> trọng số)
+
+        Returns:
+            List[Dict]: Bản sao các tài liệu với 'content' đã nén (cùng thứ tự)
+        """
+        chars_in = sum(len(d.get('content', '')) for d in docs)
+        with self._lock:
+            self._calls += 1
+            self._chars_in += chars_in
+        if chars_in <= self.max_chars:
+            with self._lock:
+                self._chars_out += chars_in
+            return docs
+
+        # Gom toàn bộ câu của mọi tài liệu để chấm điểm một lượt (một batch embedding)
+        entries = []  # (chỉ số tài liệu, vị trí câu, câu, là dòng cấu trúc)
+        for doc_idx, doc in enumerate(docs):
+            for pos, sentence in enumerate(split_sentences(doc.get('content', ''))):
+                entries.append((doc_idx, pos, sentence,
+                               bool(_STRUCTURAL_LINE.match(sentence))))
+
+        candidates = [e for e in entries if not e[3]]
+        sentences = [e[2] for e in candidates]
+        w = self.embedding_weight
+        scores = w * self._semantic_scores(sentences, query_embedding, embedder) + \
+            (1 - w) * self._keyword_scores(query, sentences, idf)
+
+        selected = {(e[0], e[1]) for e in entries if e[3]}
+        used = sum(len(e[2]) + 1 for e in entries if e[3])
+
+        # Mỗi tài liệu giữ câu tốt nhất của nó, sau đó phân phần ngân sách còn lại theo điểm toàn cục
+        order = sorted(range(len(candidates)), key=lambda i: -scores[i])
+        best_per_doc = {}
+        for i in order:
+            best_per_doc.setdefault(candidates[i][0], i)
+        for i in list(best_per_doc.values()) + order:
+            doc_idx, pos, sentence, _ = candidates[i]
+            if (doc_idx, pos) in selected:
+                continue
+            if used + len(sentence) + 1 > self.max_chars and i not in best_per_doc.values():
+                continue
+            selected.add((doc_idx, pos))
+            used += len(sentence) + 1
+
+        compressed_docs = []
+        for doc_idx, doc in enumerate(docs):
+            kept = [e[2] for e in entries if e[0] ==
+                    doc_idx and (e[0], e[1]) in selected]
+            new_doc = dict(doc)
+            new_doc['content'] = "\n".join(kept) if kept else doc.get('content', '')
+            # Nội dung đã đổi -> bản chữ thường tính sẵn lúc lập chỉ mục không còn đúng
+            new_doc.pop('content_lower', None)
+            compressed_docs.append(new_doc)
+
+        chars_out = sum(len(d['content']) for d in compressed_docs)
+        with self._lock:
+            self._compressed += 1
+            self._chars_out += chars_out
+        logger.info(
+            f"Context compression: {chars_in} -> {chars_out} chars "
+            f"({len(selected)}/{len(entries)} cau, {len(docs)} tai lieu)")
+        return compressed_docs
+
+    def get_stats(self) -> Dict:
+        """Thống kê tỉ lệ nén"""
+        with self._lock:
+            return {
+                'calls': self._calls,
+                'compressed': self._compressed,
+                'chars_in': self._chars_in,
+                'chars_out': self._chars_out,
+                'ratio': round(self._chars_out / self._chars_in, 3) if self._chars_in else 1.0
+            }
@@ -0,0 +1,156 @@
+"""
+Degraded Mode - Phục vụ chỉ bằng truy xuất khi LLM không khả dụng
+"""
+from config.config import config
+from backend.rag.extractive import section_items, strip_chunk_header
+from backend.rag.pipeline import display_source_name
+from backend.rag.prompts import scan_policy_terms
+from backend.utils.query_normalizer import MEDICINE_PATTERN, TREATMENT_PATTERN
+from backend.utils.logger import get_logger
+from typing import Dict, List, Optional
+import re
+import threading
+import time
+
+logger = get_logger(__name__)
+
+# Khi Groq hết hạn mức ngày (API_DAILY_LIMIT), vẫn trả 429 sau mọi lần thử lại (API_RATE_LIMIT)
+# hoặc cầu dao đang mở (API_CIRCUIT_OPEN), giai đoạn truy xuất đã xong và ngữ cảnh vẫn còn trong ctx.docs. Thay vì
+# chỉ trả thông báo lỗi, chain trả về trích đoạn của các chunk tốt nhất kèm nguồn, và tầng web
+# báo cho client bằng sự kiện SSE riêng ('degraded').
+#
+# Sau lỗi đầu tiên, chế độ suy giảm được giữ DEGRADED_COOLDOWN giây (hết hạn mức ngày:
+# DEGRADED_DAILY_COOLDOWN): các request trong khoảng đó KHÔNG gọi LLM, tránh dồn dập thử lại
+# vào một hạn mức đã cạn. Hết thời gian, request kế tiếp gọi LLM như bình thường.
+# Chỉ sự cố thật phía Groq mới kích hoạt: request bị bộ giới hạn phía client từ chối
+# (API_LOAD_SHED) chỉ là hàng đợi cục bộ đang đầy, Groq vẫn phục vụ bình thường.
+
+DEGRADED_ERRORS = ('API_DAILY_LIMIT', 'API_RATE_LIMIT', 'API_CIRCUIT_OPEN')
+
+DEGRADED_NOTICE = ("Hệ thống AI đang tạm gián đoạn. "
+                   "Dưới đây là trích đoạn từ các tài liệu liên quan nhất:")
+
+# Trích đoạn nguyên văn nên vẫn loại các ý nói về thuốc/điều trị và cụm từ vai bác sĩ
+_OUT_OF_SCOPE = re.compile(f"{TREATMENT_PATTERN}|{MEDICINE_PATTERN}")
+
+
+def _allowed(item: str) -> bool:
+    if _OUT_OF_SCOPE.search(item.lower()):
+        return False
+    hits = scan_policy_terms(item, stop_labels=('policy', 'forbidden'))
+    return 'policy' not in hits and 'forbidden' not in hits
+
+
+def summarize_chunks(docs: List[Dict], max_chunks: int = None, max_items: int = None) -> Optional[str]:
+    """
+    Tóm tắt trích xuất các chunk truy xuất được (không gọi LLM)
+
+    Args:
+        docs: Các chunk theo thứ tự xếp hạng
+        max_chunks: Số chunk tối đa đưa vào câu trả lời
+        max_items: Số ý tối đa lấy từ mỗi chunk
+
+    Returns:
+        Optional[str]: Câu trả lời có dòng "Nguồn:" (tên hiển thị), None nếu không còn ý nào
+    """
+    max_chunks = max_chunks or config.DEGRADED_MAX_CHUNKS
+    max_items = max_items or config.DEGRADED_MAX_ITEMS
+
+    lines, sources = [], []
+    for doc in docs or []:
+        if len(lines) >= max_chunks:
+            break
+        metadata = doc.get('metadata', {})
+        body = strip_chunk_header(doc.get('content', ''))
+        items = [i for i in section_items(body, max_items * 2) if _allowed(i)][:max_items]
+        if not items:
+            continue
+        source = display_source_name(metadata.get('source', ''))
+        title = metadata.get('section_title')
+        heading = f"{source} - {title}" if title else source
+        lines.append(f"- {heading}: {'; '.join(items)}.")
+        if source and source not in sources:
+            sources.append(source)
+
+    if not lines:
+        return None
+    return f"{DEGRADED_NOTICE}\n\n" + "\n".join(lines) + \
+        f"\n\nNguồn: {', '.join(sources) or 'Không có'}"
+
+
+class DegradedMode:
+    """Trạng thái chế độ suy giảm dùng chung cho mọi request của một chain"""
+
+    def __init__(self, cooldown: float = None, daily_cooldown: float = None):
+        """
+        Args:
+            cooldown: Số giây ngừng gọi LLM sau API_RATE_LIMIT / API_CIRCUIT_OPEN
+            daily_cooldown: Số giây ngừng gọi LLM sau API_DAILY_LIMIT
+        """
+        self.cooldown = config.DEGRADED_COOLDOWN if cooldown is None else cooldown
+        self.daily_cooldown = config.DEGRADED_DAILY_COOLDOWN if daily_cooldown is None else daily_cooldown
+
+        self._lock = threading.Lock()
+        self._until = 0.0
+        self.reason: Optional[str] = None
+
+        self._entered = 0
+        self._served = 0
+        self._skipped_llm = 0
+
+    @staticmethod
+    def error_code(error: Exception) -> Optional[str]:
+        """Mã lỗi LLM kích hoạt chế độ suy giảm (None nếu là lỗi khác)"""
+        error_str = str(error)
+        for code in DEGRADED_ERRORS:
+            if code in error_str:
+                return code
+        return None
+
+    def trip(self, error: Exception) -> Optional[str]:
+        """
+        Ghi nhận lỗi LLM; bật chế độ suy giảm nếu lỗi thuộc DEGRADED_ERRORS
+
+        Returns:
+            Optional[str]: Mã lỗi đã kích hoạt, None nếu lỗi không thuộc diện suy giảm
+        """
+        code = self.error_code(error)
+        if code is None:
+            return None
+        seconds = self.daily_cooldown if code == 'API_DAILY_LIMIT' else self.cooldown
+        with self._lock:
+            if time.monotonic() >= self._until:
+                self._entered += 1
+                logger.warning(
+                    f"Che do suy giam BAT ({code}): ngung goi LLM trong {seconds:.0f}s")
+            self._until = max(self._until, time.monotonic() + seconds)
+            self.reason = code
+        return code
+
+    def active(self) -> Optional[str]:
+        """Mã lỗi đang giữ chế độ suy giảm, None nếu LLM được gọi bình thường"""
+        with self._lock:
+            if time.monotonic() < self._until:
+                self._skipped_llm += 1
+                return self.reason
+            return None
+
+    def answer(self, docs: List[Dict]) -> Optional[str]:
+        """Câu trả lời suy giảm từ các chunk đã truy xuất"""
+        answer = summarize_chunks(docs)
+        if answer is not None:
+            with self._lock:
+                self._served += 1
+        return answer
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            remaining = max(self._until - time.monotonic(), 0.0)
+            return {
+                'active': remaining > 0,
+                'reason': self.reason if remaining > 0 else None,
+                'remaining_s': round(remaining, 1),
+                'times_entered': self._entered,
+                'served': self._served,
+                'llm_calls_skipped': self._skipped_llm
+            }
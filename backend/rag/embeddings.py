@@ -2,6 +2,7 @@
 Embeddings - Chuyển đổi văn bản thành vector embeddings (với caching)
 """
 from backend.utils.logger import get_logger
+from backend.rag.model_store import ModelArtifactStore
 from config.config import config
 from typing import List
 from sentence_transformers import SentenceTransformer
@@ -45,6 +46,28 @@ class EmbeddingModel:
                 logger.info(f"Su dung model da ngon ngu: {self.model_name}")
 
         logger.info("Dang tai model embedding...")
+        store = ModelArtifactStore()
+        if store.has(self.model_name) or config.MODEL_STORE_OFFLINE:
+            # Nạp từ kho artifact cục bộ (safetensors + checksum), không đi qua Hub.
+            # Lỗi ở nhánh này KHÔNG được chuyển sang model dự phòng: model sai sẽ làm lệch
+            # không gian vector so với chỉ mục FAISS, nên phải báo lỗi ngay (ModelArtifactError).
+            self.model = store.load(self.model_name)
+            self.embedding_dim = self.model.get_sentence_embedding_dimension()
+            logger.info(
+                f"Model da san sang tu kho cuc bo! (Dimension: {self.embedding_dim})")
+        else:
+            self._load_from_hub()
+
+        # Khởi tạo cơ chế Bộ nhớ đệm (Caching).
+        # Thay vì dùng decorator @lru_cache của Python (dễ gây rò rỉ bộ nhớ - Memory Leak khi dùng trên instance method),
+        # ta thiết kế một dictionary nội bộ để lưu vết các câu đã được tính toán vector.
+        self._cache_hits = 0
+        self._cache_misses = 0
+        # Cấu trúc: text (str) -> np.ndarray (vector)
+        self._embedding_cache: dict = {}
+
+    def _load_from_hub(self):
+        """Nạp model qua Hugging Face Hub (có model dự phòng khi lỗi)"""
         try:
             # Khởi tạo mô hình học sâu. Trọng số (weights) của mô hình sẽ được tải lên RAM/VRAM.
             self.model = SentenceTransformer(self.model_name)
@@ -63,14 +86,6 @@ class EmbeddingModel:
             self.embedding_dim = self.model.get_sentence_embedding_dimension()
             logger.info(f"Da tai model backup: {self.model_name}")
 
-        # Khởi tạo cơ chế Bộ nhớ đệm (Caching).
-        # Thay vì dùng decorator @lru_cache của Python (dễ gây rò rỉ bộ nhớ - Memory Leak khi dùng trên instance method),
-        # ta thiết kế một dictionary nội bộ để lưu vết các câu đã được tính toán vector.
-        self._cache_hits = 0
-        self._cache_misses = 0
-        # Cấu trúc: text (str) -> np.ndarray (vector)
-        self._embedding_cache: dict = {}
-
     def _compute_embedding(self, text: str) -> np.ndarray:
         """Cache embedding theo text, tránh dùng lru_cache trên instance method."""
         # Nếu câu hỏi đã tồn tại trong bộ đệm (Cache Hit), trả về ngay vector đã lưu.
@@ -0,0 +1,176 @@
+"""
+Extractive Answerer - Trả lời không cần LLM cho câu hỏi "một ý định x một bệnh"
+"""
+from config.config import config
+from backend.rag.answer_bank import pair_vocabulary, question_words
+from backend.rag.prompts import disease_display_name
+from backend.rag.retriever import DiseaseDetector, QueryIntent
+from backend.utils.logger import get_logger
+from typing import Dict, Iterable, List, Optional, Tuple
+import re
+import threading
+
+logger = get_logger(__name__)
+
+# Dạng câu hỏi phổ biến nhất là "<ý định> của <bệnh>" ("Triệu chứng của cúm mùa?",
+# "Cách phòng ngừa sốt xuất huyết?"). Khi QueryIntent chỉ thấy MỘT ý định được hỗ trợ và
+# DiseaseDetector chỉ thấy MỘT file bệnh, câu trả lời đúng chính là mục tương ứng của tài
+# liệu đó. ExtractiveAnswerer dựng sẵn (lúc khởi động, từ chỉ mục) câu trả lời cho mọi cặp
+# (file, ý định) có mục khớp, nên lúc phục vụ chỉ là một lượt tra bảng: không nhúng câu hỏi,
+# không FAISS/BM25, không gọi LLM. Câu trả lời vẫn đi qua các cổng hậu kiểm của pipeline.
+# Như AnswerBank, câu hỏi phải nằm gọn trong từ vựng của câu hỏi chuẩn (pair_vocabulary):
+# "triệu chứng cúm mùa ở trẻ sơ sinh" KHÔNG nhận mục triệu chứng chung của cúm mùa.
+
+# Từ khóa nhận diện tiêu đề mục (section_title) ứng với từng ý định
+INTENT_SECTION_KEYWORDS = {
+    'symptom': ('dấu hiệu', 'triệu chứng', 'biểu hiện'),
+    'cause': ('nguyên nhân',),
+    'prevention': ('phòng ngừa', 'phòng tránh'),
+    'when_to_see_doctor': ('khi nào',),
+}
+
+# Câu dẫn theo ý định ({disease} = tên bệnh hiển thị)
+INTENT_LEADS = {
+    'symptom': "Dấu hiệu thường gặp của {disease} gồm",
+    'cause': "Nguyên nhân và yếu tố nguy cơ của {disease} gồm",
+    'prevention': "Để phòng ngừa {disease}, bạn có thể",
+    'when_to_see_doctor': "Với {disease}, nên đến cơ sở y tế khi",
+}
+
+# Gắn vào cuối câu trả lời (cùng câu, để bước giới hạn độ dài không cắt mất)
+EXTRACTIVE_DISCLAIMER = "(thông tin tham khảo, không thay thế tư vấn của nhân viên y tế)"
+
+_CHUNK_HEADER = re.compile(r'^[^\n]*:\n\n')
+_INNER_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+# Tiêu đề mục con dạng "6.1. Xây dựng lối sống lành mạnh"
+_SUBHEADING = re.compile(r'^\d+(\.\d+)+\.?\s')
+
+
+def _merge_overlap(previous: str, following: str) -> str:
+    """Nối hai sub-chunk liên tiếp, bỏ phần chồng lấp do bộ chia văn bản tạo ra"""
+    for size in range(min(len(previous), len(following)), 0, -1):
+        if previous.endswith(following[:size]):
+            return previous + following[size:]
+    return previous + "\n" + following
+
+
+def strip_chunk_header(content: str) -> str:
+    """Bỏ dòng tiêu đề "<Tài liệu> - <Mục>:" ở đầu chunk (chỉ sub-chunk đầu của mục có)"""
+    return _CHUNK_HEADER.sub('', content, count=1)
+
+
+def section_items(text: str, limit: int) -> List[str]:
+    """Các dòng nội dung của một mục (bỏ tiêu đề phụ kết thúc bằng ':' và tiêu đề mục con)"""
+    items = []
+    for line in text.split('\n'):
+        line = line.strip().rstrip('.;').strip()
+        if not line or line.endswith(':') or _SUBHEADING.match(line):
+            continue
+        # Mỗi mục là một vế trong câu trả lời một câu
+        line = _INNER_SENTENCE_END.sub(', ', line).replace('.,', ',')
+        items.append(line[0].lower() + line[1:])
+        if len(items) >= limit:
+            break
+    return items
+
+
+class ExtractiveAnswerer:
+    """Bảng câu trả lời trích xuất theo (file bệnh, ý định), dựng từ chỉ mục"""
+
+    def __init__(self, documents: Iterable[Dict], intents: Iterable[str] = None, max_items: int = None):
+        """
+        Args:
+            documents: Các chunk đã lập chỉ mục (content + metadata có section_title)
+            intents: Các ý định được trả lời trích xuất (mặc định EXTRACTIVE_INTENTS)
+            max_items: Số ý tối đa lấy từ mục
+        """
+        self.intents = tuple(i for i in (intents or config.EXTRACTIVE_INTENTS)
+                             if i in INTENT_SECTION_KEYWORDS)
+        self.max_items = max_items or config.EXTRACTIVE_MAX_ITEMS
+
+        # (file, ý định) -> danh sách chunk của mục đó, theo thứ tự trong tài liệu
+        sections: Dict[Tuple[str, str], List[Dict]] = {}
+        for doc in documents or []:
+            metadata = doc.get('metadata', {})
+            title = (metadata.get('section_title') or '').lower()
+            for intent in self.intents:
+                if any(k in title for k in INTENT_SECTION_KEYWORDS[intent]):
+                    sections.setdefault((metadata.get('source', ''), intent), []).append(doc)
+                    break
+
+        self._answers: Dict[Tuple[str, str], Tuple[str, List[Dict]]] = {}
+        self._vocabulary: Dict[Tuple[str, str], set] = {}
+        for (source, intent), chunks in sections.items():
+            chunks.sort(key=lambda d: (d['metadata'].get('chunk_index', 0),
+                                       d['metadata'].get('sub_chunk_index', 0)))
+            # Mục dài bị chia thành nhiều sub-chunk: chỉ giữ các sub-chunk của mục đầu tiên khớp
+            first_section = chunks[0]['metadata'].get('section_number')
+            chunks = [c for c in chunks if c['metadata'].get('section_number') == first_section]
+            body = strip_chunk_header(chunks[0].get('content', ''))
+            for chunk in chunks[1:]:
+                body = _merge_overlap(body, chunk.get('content', ''))
+            items = section_items(body, self.max_items)
+            if not items:
+                continue
+            disease = disease_display_name(source) or \
+                chunks[0]['metadata'].get('document_title') or source
+            lead = INTENT_LEADS[intent].format(disease=disease)
+            # "nên đến cơ sở y tế khi: khi có dấu hiệu..." -> bỏ từ lặp lại với câu dẫn
+            repeated = lead.rsplit(' ', 1)[-1] + ' '
+            items = [i[len(repeated):] if i.startswith(repeated) else i for i in items]
+            answer = f"{lead}: {'; '.join(items)} {EXTRACTIVE_DISCLAIMER}.\n\nNguồn: {source}"
+            self._answers[(source, intent)] = (answer, chunks)
+            self._vocabulary[(source, intent)] = pair_vocabulary(source, intent)
+
+        self._lock = threading.Lock()
+        self._checked = 0
+        self._answered = {intent: 0 for intent in self.intents}
+        logger.info(
+            f"Extractive answers san sang: {len(self._answers)} cap (benh, y dinh)")
+
+    @classmethod
+    def from_retriever(cls, retriever) -> 'ExtractiveAnswerer':
+        store = getattr(retriever, 'vector_store', None)
+        return cls(getattr(store, 'documents', None) or [])
+
+    def match(self, question: str) -> Optional[Tuple[str, str]]:
+        """(file, ý định) nếu câu hỏi đúng dạng một ý định x một bệnh, ngược lại None"""
+        intents = QueryIntent.detect_intent(question)
+        if len(intents) != 1 or intents[0] not in self.intents:
+            return None
+        files = DiseaseDetector.detect_diseases(question)
+        if len(files) != 1:
+            return None
+        key = (files[0], intents[0])
+        if key not in self._answers:
+            return None
+        return key if question_words(question) <= self._vocabulary[key] else None
+
+    def answer(self, question: str) -> Optional[Tuple[str, List[Dict]]]:
+        """
+        Câu trả lời trích xuất cho câu hỏi
+
+        Returns:
+            Optional[Tuple[str, List[Dict]]]: (câu trả lời thô có dòng "Nguồn:", các chunk nguồn)
+        """
+        key = self.match(question)
+        with self._lock:
+            self._checked += 1
+            if key is not None:
+                self._answered[key[1]] += 1
+        if key is None:
+            return None
+        answer, chunks = self._answers[key]
+        return answer, [dict(c) for c in chunks]
+
+    def get_stats(self) -> Dict:
+        """Tỉ lệ lưu lượng được trả lời trích xuất (trên số câu hỏi đã qua pre_gates)"""
+        with self._lock:
+            answered = sum(self._answered.values())
+            return {
+                'pairs': len(self._answers),
+                'checked': self._checked,
+                'answered': answered,
+                'by_intent': dict(self._answered),
+                'coverage': round(answered / self._checked, 3) if self._checked else 0.0
+            }
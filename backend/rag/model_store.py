@@ -0,0 +1,205 @@
+"""
+Model Artifact Store - Kho mô hình nhúng cục bộ, nạp nhanh và hoạt động ngoại tuyến
+"""
+from config.config import config
+from backend.utils.logger import get_logger
+from typing import Dict, List
+from pathlib import Path
+from datetime import datetime
+import hashlib
+import json
+
+logger = get_logger(__name__)
+
+MANIFEST_FILE = 'manifest.json'
+VERIFIED_STAMP_FILE = '.verified.json'
+
+# Lớp ModelArtifactError được ném ra khi kho mô hình không hợp lệ (thiếu model, sai checksum).
+# Khác với luồng tải từ Hugging Face Hub (có model dự phòng), kho cục bộ phải
+# "thất bại ồn ào" (Fail Loudly) để tránh việc worker âm thầm chạy sai mô hình
+# làm lệch không gian vector so với chỉ mục FAISS đã build.
+
+
+class ModelArtifactError(RuntimeError):
+    """Lỗi kho model cục bộ (thiếu artifact hoặc checksum không khớp)"""
+
+
+# Lớp ModelArtifactStore quản lý thư mục artifact được chuẩn bị MỘT LẦN bằng CLI
+# (scripts/prepare_models.py). Trọng số được lưu dưới dạng safetensors để thư viện
+# transformers ánh xạ bộ nhớ (Memory-mapping) thay vì giải nén pickle, và mọi file
+# đều được ghi dấu SHA-256 trong manifest để phát hiện artifact bị hỏng/bị sửa.
+
+
+class ModelArtifactStore:
+    """Quản lý artifact model nhúng cục bộ (safetensors + manifest checksum)"""
+
+    def __init__(self, root: str = None):
+        """
+        Khởi tạo kho artifact
+
+        Args:
+            root: Thư mục gốc của kho (nếu None sẽ lấy MODEL_STORE_DIR từ config)
+        """
+        self.root = Path(root) if root else Path(config.MODEL_STORE_DIR)
+
+    def path_for(self, model_name: str) -> Path:
+        """Đường dẫn thư mục artifact của một model (vd: org/name -> org__name)"""
+        return self.root / model_name.replace('/', '__')
+
+    def has(self, model_name: str) -> bool:
+        """Kiểm tra model đã được chuẩn bị trong kho chưa"""
+        return (self.path_for(model_name) / MANIFEST_FILE).exists()
+
+    @staticmethod
+    def _sha256(file_path: Path) -> str:
+        """Tính SHA-256 theo từng khối 1MB để không nạp cả file lớn vào RAM"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _artifact_files(self, model_dir: Path) -> List[Path]:
+        return sorted(
+            p for p in model_dir.rglob('*')
+            if p.is_file() and p.name not in (MANIFEST_FILE, VERIFIED_STAMP_FILE)
+        )
+
+    def prepare(self, model_name: str, force: bool = False) -> Path:
+        """
+        Tải model từ Hugging Face Hub và lưu thành artifact cục bộ (chạy một lần qua CLI)
+
+        Args:
+            model_name: Tên model trên Hub
+            force: Ghi đè artifact cũ nếu đã tồn tại
+
+        Returns:
+            Path: Thư mục artifact
+        """
+        from sentence_transformers import SentenceTransformer
+
+        model_dir = self.path_for(model_name)
+        if self.has(model_name) and not force:
+            logger.info(f"Artifact da ton tai: {model_dir}")
+            return model_dir
+
+        logger.info(f"Dang tai model tu Hub: {model_name}")
+        model = SentenceTransformer(model_name)
+
+        model_dir.mkdir(parents=True, exist_ok=True)
+        # safe_serialization=True: lưu trọng số dạng .safetensors (hỗ trợ mmap, không dùng pickle)
+        model.save(str(model_dir), safe_serialization=True)
+
+        files = {}
+        for file_path in self._artifact_files(model_dir):
+            rel = file_path.relative_to(model_dir).as_posix()
+            files[rel] = {
+                'sha256': self._sha256(file_path),
+                'size': file_path.stat().st_size
+            }
+
+        if not any(rel.endswith('.safetensors') for rel in files):
+            raise ModelArtifactError(
+                f"Model {model_name} khong xuat duoc trong so safetensors")
+
+        manifest = {
+            'model_name': model_name,
+            'embedding_dimension': model.get_sentence_embedding_dimension(),
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'files': files
+        }
+        with open(model_dir / MANIFEST_FILE, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        # Artifact vừa tạo chắc chắn khớp checksum -> ghi dấu để lần nạp đầu không phải băm lại
+        self._write_stamp(model_dir, files)
+        logger.info(f"Da chuan bi artifact: {model_dir} ({len(files)} files)")
+        return model_dir
+
+    def _read_manifest(self, model_name: str) -> Dict:
+        manifest_path = self.path_for(model_name) / MANIFEST_FILE
+        if not manifest_path.exists():
+            raise ModelArtifactError(
+                f"Khong tim thay artifact cho model '{model_name}' tai {manifest_path.parent}. "
+                f"Hay chay: python scripts/prepare_models.py {model_name}"
+            )
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('model_name') != model_name:
+            raise ModelArtifactError(
+                f"Manifest tai {manifest_path} thuoc ve model '{manifest.get('model_name')}', "
+                f"khong phai '{model_name}'")
+        return manifest
+
+    @staticmethod
+    def _file_signature(file_path: Path) -> List[int]:
+        stat = file_path.stat()
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def _write_stamp(self, model_dir: Path, files: Dict):
+        stamp = {
+            rel: self._file_signature(model_dir / rel) for rel in files
+        }
+        with open(model_dir / VERIFIED_STAMP_FILE, 'w', encoding='utf-8') as f:
+            json.dump(stamp, f)
+
+    def verify(self, model_name: str, full: bool = False) -> Dict:
+        """
+        Kiểm tra toàn vẹn artifact theo manifest
+
+        Kích thước file luôn được kiểm tra. SHA-256 chỉ được tính lại khi file thay đổi
+        (kích thước/mtime khác dấu đã xác minh) hoặc khi full=True, nhờ vậy worker khởi động
+        nhanh mà vẫn phát hiện được artifact bị ghi đè.
+
+        Returns:
+            Dict: Manifest của model
+
+        Raises:
+            ModelArtifactError: Khi thiếu file hoặc checksum không khớp
+        """
+        manifest = self._read_manifest(model_name)
+        model_dir = self.path_for(model_name)
+
+        stamp = {}
+        stamp_path = model_dir / VERIFIED_STAMP_FILE
+        if stamp_path.exists() and not full:
+            with open(stamp_path, 'r', encoding='utf-8') as f:
+                stamp = json.load(f)
+
+        rehashed = False
+        for rel, meta in manifest['files'].items():
+            file_path = model_dir / rel
+            if not file_path.exists():
+                raise ModelArtifactError(f"Artifact thieu file: {file_path}")
+            if file_path.stat().st_size != meta['size']:
+                raise ModelArtifactError(
+                    f"Kich thuoc file khong khop: {file_path}")
+            if stamp.get(rel) == self._file_signature(file_path):
+                continue
+            if self._sha256(file_path) != meta['sha256']:
+                raise ModelArtifactError(f"Checksum khong khop: {file_path}")
+            rehashed = True
+
+        if rehashed or not stamp_path.exists():
+            self._write_stamp(model_dir, manifest['files'])
+
+        return manifest
+
+    def load(self, model_name: str, device: str = None):
+        """
+        Nạp model từ artifact cục bộ, hoàn toàn không truy cập mạng
+
+        Raises:
+            ModelArtifactError: Khi artifact thiếu hoặc hỏng
+        """
+        from sentence_transformers import SentenceTransformer
+
+        self.verify(model_name, full=config.MODEL_STORE_FULL_VERIFY)
+
+        # local_files_only=True: nạp trực tiếp từ thư mục, bỏ qua bước phân giải
+        # (resolution) trên Hugging Face Hub nên node không có mạng vẫn khởi động được.
+        return SentenceTransformer(
+            str(self.path_for(model_name)),
+            device=device,
+            local_files_only=True
+        )
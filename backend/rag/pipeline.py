@@ -0,0 +1,530 @@
+"""
+RAG Pipeline - Chuỗi giai đoạn xử lý dùng chung cho mọi biến thể ask_* của RAGChain
+"""
+from config.config import config
+from backend.rag.prompts import (
+    HEALTH_CHATBOT_SYSTEM_PROMPT,
+    GREETING_RESPONSES,
+    FAREWELL_RESPONSES,
+    NO_DOCS_FOUND_RESPONSE,
+    STRICT_FALLBACK_RESPONSE,
+    format_context,
+    format_sources,
+    build_messages,
+    sanitize_answer,
+    verify_answer,
+    check_context_relevance,    # Pre-LLM relevance gate
+    extract_sources_from_answer,  # Source extraction from LLM answer
+    scan_policy_terms,           # Single-pass policy term scanner
+    ANSWER_STOP_LABELS,
+    StructuredContext,
+    disease_display_name,
+)
+from backend.rag.pre_gate import (
+    PreGate,
+    VERDICT_BLOCKED,
+    VERDICT_FAREWELL,
+    VERDICT_GREETING,
+    VERDICT_NEGATIVE,
+    VERDICT_OUT_OF_DOMAIN,
+)
+from backend.utils.logger import get_logger
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+import random
+import re
+import threading
+import time
+
+logger = get_logger(__name__)
+
+# Pipeline gồm các giai đoạn cố định:
+#   pre_gates -> [answer_bank] -> [extractive] -> retrieve -> [semantic_cache] -> context_gates -> build_prompt -> [generate] -> post_gates -> source_rewrite
+# Mỗi giai đoạn được đo thời gian (PipelineContext.timings + thống kê cộng dồn) và có thể
+# ngắt mạch bằng cách đặt ctx.short_answer. Riêng bước generate do các điểm vào của
+# RAGChain (đồng bộ / streaming / async) tự thực hiện, bọc trong pipeline.timed(ctx, 'generate').
+# Danh sách từ khóa và regex được biên dịch MỘT lần khi import thay vì ở mỗi request.
+
+STAGES = ('pre_gates', 'answer_bank', 'extractive', 'retrieve', 'semantic_cache',
+          'context_gates', 'build_prompt', 'generate', 'post_gates', 'source_rewrite')
+
+# Cổng thực phẩm/thực phẩm chức năng (BƯỚC 4)
+FOOD_SUPPLEMENT_TERMS = (
+    'vitamin c', 'vitamin d', 'vitamin a', 'vitamin e',
+    'vitamin b1', 'vitamin b2', 'vitamin b6', 'vitamin b12',
+    'sầu riêng', 'mật ong', 'gừng', 'tỏi', 'nghệ',
+    'dầu cá', 'omega-3', 'omega 3', 'canxi', 'kẽm',
+    'magiê', 'collagen', 'probiotic', 'men vi sinh',
+    'nha đam', 'trà xanh', 'cà phê', 'chanh', 'bưởi',
+)
+CURE_VERBS = ('chữa', 'trị bệnh', 'trị được', 'chữa được',
+              'chữa bệnh', 'phòng bệnh', 'phòng ngừa bệnh')
+
+# Làm sạch bề mặt (BƯỚC 10)
+_SOURCES_SPLIT = re.compile(r'\n+Nguồn:\s*', re.IGNORECASE)
+_VACCINATION = re.compile(r'(?i)tiêm\s*chủng')
+_DOUBLE_COMMA = re.compile(r'\s*,\s*,')
+_COLON_COMMA = re.compile(r':\s*,')
+_COMMA_PERIOD = re.compile(r',\s*\.')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def display_source_name(src: str) -> str:
+    """Ánh xạ tên file (.txt) thành tên bệnh tiếng Việt có dấu để giao diện thân thiện hơn"""
+    if src.endswith('.txt'):
+        return disease_display_name(src) or src.replace('.txt', '').replace('_', ' ').title()
+    return src
+
+
+class PipelineContext:
+    """Trạng thái của một request khi đi qua các giai đoạn"""
+
+    def __init__(self, question: str, chat_history: List[Tuple[str, str]] = None, tag: str = ""):
+        self.question = question
+        self.chat_history = chat_history
+        self.tag = tag
+        self.started = time.time()
+
+        self.short_answer: Optional[str] = None
+        self.short_circuit_stage: Optional[str] = None
+        self.trace: Dict = {}
+        self.docs: List[Dict] = []
+        self.context: Optional[StructuredContext] = None
+        self.sources = ""
+        self.messages: List[Dict[str, str]] = []
+        self.route: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+
+    def stop(self, answer: str):
+        """Ngắt mạch: trả `answer` cho người dùng, bỏ qua các giai đoạn còn lại"""
+        self.short_answer = answer
+
+
+class RAGPipeline:
+    """Các giai đoạn tiền/hậu xử lý quanh lệnh gọi LLM, có đo thời gian từng giai đoạn"""
+
+    def __init__(
+        self,
+        retriever,
+        top_k: int,
+        context_compressor=None,
+        router=None,
+        pre_gate: PreGate = None,
+        extractive=None,
+        answer_bank=None,
+        semantic_cache=None
+    ):
+        """
+        Args:
+            retriever: RAG Retriever instance
+            top_k: Số documents retrieve
+            context_compressor: ContextCompressor (tùy chọn)
+            router: ModelRouter (tùy chọn)
+            pre_gate: PreGate (mặc định dựng từ kho tài liệu của retriever)
+            extractive: ExtractiveAnswerer (tùy chọn) - trả lời không qua LLM
+            answer_bank: AnswerBank (tùy chọn) - câu trả lời dựng sẵn offline
+            semantic_cache: SemanticCache (tùy chọn) - câu trả lời của câu hỏi gần trùng nghĩa
+        """
+        self.retriever = retriever
+        self.top_k = top_k
+        self.context_compressor = context_compressor
+        self.router = router
+        self.pre_gate = pre_gate or PreGate.from_retriever(retriever)
+        self.extractive = extractive
+        self.answer_bank = answer_bank
+        self.semantic_cache = semantic_cache
+
+        self._lock = threading.Lock()
+        self._stage_calls = {name: 0 for name in STAGES}
+        self._stage_ms = {name: 0.0 for name in STAGES}
+        self._short_circuits = {name: 0 for name in STAGES}
+
+    # ============================================
+    # ĐO THỜI GIAN GIAI ĐOẠN
+    # ============================================
+    def _record(self, ctx: Optional[PipelineContext], stage: str, elapsed_ms: float):
+        if ctx is not None:
+            ctx.timings[stage] = round(elapsed_ms, 1)
+        with self._lock:
+            self._stage_calls[stage] += 1
+            self._stage_ms[stage] += elapsed_ms
+
+    @contextmanager
+    def timed(self, ctx: Optional[PipelineContext], stage: str):
+        """Đo thời gian một giai đoạn (dùng cho bước generate ở các điểm vào của chain)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(ctx, stage, (time.perf_counter() - start) * 1000)
+
+    def _run(self, ctx: PipelineContext, stage: str, fn) -> bool:
+        """Chạy một giai đoạn; trả về False nếu giai đoạn đã ngắt mạch pipeline"""
+        with self.timed(ctx, stage):
+            fn(ctx)
+        if ctx.short_answer is not None:
+            ctx.short_circuit_stage = stage
+            with self._lock:
+                self._short_circuits[stage] += 1
+            return False
+        return True
+
+    # ============================================
+    # GIAI ĐOẠN TIỀN XỬ LÝ (BƯỚC 1 -> 5)
+    # ============================================
+    def prepare(
+        self,
+        question: str,
+        chat_history: List[Tuple[str, str]] = None,
+        tag: str = ""
+    ) -> PipelineContext:
+        """
+        Chạy các cổng kiểm duyệt trước LLM và đóng gói prompt
+
+        Args:
+            question: Câu hỏi
+            chat_history: Lịch sử chat
+            tag: Nhãn ghi log (vd: " (stream)")
+
+        Returns:
+            PipelineContext: short_answer khác None nếu một cổng đã chặn câu hỏi
+        """
+        ctx = PipelineContext(question, chat_history, tag)
+        # Giai đoạn tùy chọn chỉ chạy (và chỉ được đo) khi thành phần tương ứng được bật
+        optional = {'answer_bank': self.answer_bank, 'extractive': self.extractive,
+                    'semantic_cache': self.semantic_cache}
+        for stage, fn in (('pre_gates', self._pre_gates),
+                          ('answer_bank', self._answer_bank),
+                          ('extractive', self._extractive),
+                          ('retrieve', self._retrieve),
+                          ('semantic_cache', self._semantic_cache),
+                          ('context_gates', self._context_gates),
+                          ('build_prompt', self._build_prompt)):
+            if stage in optional and optional[stage] is None:
+                continue
+            if not self._run(ctx, stage, fn):
+                break
+        # Câu hỏi không tìm được tài liệu phù hợp -> lần hỏi lại trả lời ngay ở pre_gates
+        if ctx.short_circuit_stage in ('retrieve', 'context_gates'):
+            self.pre_gate.remember_negative(
+                question, ctx.short_answer,
+                getattr(self.retriever, 'index_version', 'unversioned'))
+        return ctx
+
+    def _pre_gates(self, ctx: PipelineContext):
+        # BƯỚC 1 + 2: Phân loại câu hỏi MỘT lượt (PreGate), không chạm tới bộ mã hóa.
+        # - Chào hỏi/tạm biệt: trả lời ngay, tiết kiệm tài nguyên API.
+        # - CỔNG AN TOÀN SỐ 1: chặn đứng yêu cầu vi phạm đạo đức y tế
+        #   (kê đơn thuốc, điều trị) ngay từ đầu.
+        # - Câu hỏi lạc đề / đã biết là không có tài liệu: trả lời dự phòng ngay.
+        verdict, detail = self.pre_gate.classify(
+            ctx.question, getattr(self.retriever, 'index_version', 'unversioned'))
+        if verdict == VERDICT_GREETING:
+            return ctx.stop(random.choice(GREETING_RESPONSES))
+
+        if verdict == VERDICT_FAREWELL:
+            return ctx.stop(random.choice(FAREWELL_RESPONSES))
+
+        if verdict == VERDICT_BLOCKED:
+            logger.warning(f"QUERY BLOCKED{ctx.tag}: {detail}")
+            return ctx.stop(STRICT_FALLBACK_RESPONSE)
+
+        if verdict == VERDICT_OUT_OF_DOMAIN:
+            logger.info(f"Cau hoi ngoai mien{ctx.tag} ({detail}) -> FALLBACK")
+            return ctx.stop(f"{NO_DOCS_FOUND_RESPONSE}\n\nNguồn: Không có")
+
+        if verdict == VERDICT_NEGATIVE:
+            logger.info(f"Cau hoi da biet khong co tai lieu{ctx.tag} -> FALLBACK (cache)")
+            return ctx.stop(detail)
+
+    def _answer_bank(self, ctx: PipelineContext):
+        # BƯỚC 2.4: KHO CÂU TRẢ LỜI DỰNG SẴN (ANSWER BANK)
+        # Câu hỏi mở đầu tương đương một câu hỏi chuẩn (bệnh x ý định) nhận ngay câu trả lời
+        # đã được dựng offline qua toàn bộ pipeline của đúng phiên bản chỉ mục/prompt này.
+        if ctx.chat_history:
+            return
+        answer = self.answer_bank.lookup(
+            ctx.question, getattr(self.retriever, 'index_version', 'unversioned'))
+        if answer is None:
+            return
+        logger.info(f"Answer bank HIT{ctx.tag}")
+        return ctx.stop(answer)
+
+    def _extractive(self, ctx: PipelineContext):
+        # BƯỚC 2.5: TRẢ LỜI TRÍCH XUẤT (EXTRACTIVE ANSWER)
+        # Câu hỏi "một ý định x một bệnh" được trả lời bằng đúng mục tài liệu tương ứng,
+        # không truy xuất, không gọi LLM. Câu trả lời vẫn qua các cổng hậu kiểm (BƯỚC 7 -> 10);
+        # nếu bị hậu kiểm từ chối thì quay lại luồng RAG đầy đủ. Câu hỏi nối tiếp hội thoại
+        # có thể phụ thuộc ngữ cảnh trước đó nên luôn đi luồng RAG.
+        if ctx.chat_history:
+            return
+        extracted = self.extractive.answer(ctx.question)
+        if extracted is None:
+            return
+        answer, docs = extracted
+        ctx.docs = docs
+        ctx.context = format_context(docs)
+        ctx.sources = format_sources(docs)
+        final_answer = self.finalize(ctx, answer)
+        if final_answer.startswith((STRICT_FALLBACK_RESPONSE, NO_DOCS_FOUND_RESPONSE)):
+            logger.warning(f"Extractive answer bi hau kiem tu choi{ctx.tag} -> RAG day du")
+            ctx.docs, ctx.context, ctx.sources = [], None, ""
+            return
+        logger.info(f"Extractive answer{ctx.tag}: {self.extractive.match(ctx.question)}")
+        return ctx.stop(final_answer)
+
+    def _retrieve(self, ctx: PipelineContext):
+        # BƯỚC 3: Truy xuất tài liệu (Retrieval) tích hợp màng lọc ngưỡng (Threshold Filtering).
+        # Chỉ những tài liệu có điểm số RRF vượt ngưỡng mới được giữ lại.
+        ctx.docs = self.retriever.retrieve(
+            ctx.question,
+            top_k=self.top_k,
+            apply_threshold=True,  # Bật filtering
+            trace=ctx.trace
+        )
+
+        # KIỂM TRA MỨC ĐỘ TỒN TẠI TÀI LIỆU
+        # Nếu không có tài liệu nào vượt qua ngưỡng, hệ thống kích hoạt Fallback
+        # thay vì để LLM tự "ảo giác" (hallucinate) ra câu trả lời.
+        if not ctx.docs:
+            logger.warning(
+                f"No documents passed relevance threshold{ctx.tag} -> Returning fallback")
+            return ctx.stop(NO_DOCS_FOUND_RESPONSE)
+
+        # Định dạng ngữ cảnh (Context) và Nguồn (Sources) để chèn vào Prompt
+        ctx.context = format_context(ctx.docs)
+        ctx.sources = format_sources(ctx.docs)
+
+    def _semantic_cache(self, ctx: PipelineContext):
+        # BƯỚC 3.5: BỘ ĐỆM NGỮ NGHĨA (SEMANTIC CACHE)
+        # Tái sử dụng query embedding vừa tính ở BƯỚC 3: câu hỏi mở đầu gần trùng nghĩa với một
+        # câu hỏi đã trả lời (cùng ý định + bệnh đích) nhận lại câu trả lời cuối cùng đã kiểm duyệt.
+        if ctx.chat_history:
+            return
+        answer = self.semantic_cache.get(
+            ctx.trace.get('query_embedding'),
+            ctx.trace.get('intents', ['general']),
+            ctx.trace.get('target_diseases', []),
+            getattr(self.retriever, 'index_version', 'unversioned'),
+            tier=ctx.trace.get('dense_tier', 'full')
+        )
+        if answer is not None:
+            return ctx.stop(answer)
+
+    def remember(self, ctx: PipelineContext, final_answer: str):
+        """Ghi câu trả lời cuối cùng (đã hậu kiểm) của câu hỏi mở đầu vào bộ đệm ngữ nghĩa"""
+        if self.semantic_cache is None or ctx.chat_history:
+            return
+        # Cùng tiêu chí với is_verified (scripts/build_answer_bank.py): không đệm câu trả lời
+        # dự phòng / không có tài liệu, thông báo lỗi LLM, hay câu trả lời không có nguồn thật
+        if not final_answer or "Nguồn:" not in final_answer or "Nguồn: Không có" in final_answer:
+            return
+        if final_answer.startswith((STRICT_FALLBACK_RESPONSE, NO_DOCS_FOUND_RESPONSE)):
+            return
+        self.semantic_cache.put(
+            ctx.question,
+            ctx.trace.get('query_embedding'),
+            ctx.trace.get('intents', ['general']),
+            ctx.trace.get('target_diseases', []),
+            final_answer,
+            getattr(self.retriever, 'index_version', 'unversioned'),
+            tier=ctx.trace.get('dense_tier', 'full')
+        )
+
+    def _context_gates(self, ctx: PipelineContext):
+        # ============================================
+        # BƯỚC 4: CỔNG AN TOÀN SỐ 2 (FOOD/SUPPLEMENT GATE)
+        # Nếu câu hỏi nhắc đến việc chữa bệnh bằng thực phẩm, hệ thống sẽ dò quét
+        # xem ngữ cảnh (Context) có thực sự xác nhận điều đó không. Nếu không -> Chặn!
+        # ============================================
+        q_lower = ctx.question.lower()
+        matched_food = next(
+            (f for f in FOOD_SUPPLEMENT_TERMS if f in q_lower), None)
+        if matched_food and any(v in q_lower for v in CURE_VERBS):
+            if not ctx.context.contains(matched_food):
+                logger.info(
+                    f"Food/supplement '{matched_food}' not in context{ctx.tag} -> FALLBACK")
+                return ctx.stop(f"{NO_DOCS_FOUND_RESPONSE}\n\nNguồn: Không có")
+
+        # ============================================
+        # BƯỚC 5: CỔNG AN TOÀN SỐ 3 (SEMANTIC CONTEXT RELEVANCE)
+        # Đánh giá chéo mức độ liên quan ngữ nghĩa giữa Câu hỏi và Ngữ cảnh.
+        # ============================================
+        if not check_context_relevance(ctx.question, ctx.context):
+            logger.warning(
+                f"Context khong lien quan den cau hoi{ctx.tag} -> FALLBACK")
+            return ctx.stop(f"{NO_DOCS_FOUND_RESPONSE}\n\nNguồn: Không có")
+
+    def _build_prompt(self, ctx: PipelineContext):
+        # NÉN NGỮ CẢNH (CONTEXT COMPRESSION)
+        # Chạy SAU các cổng an toàn (vốn cần toàn văn chunk) để chỉ rút gọn phần gửi cho LLM:
+        # giữ các câu liên quan nhất, tiêu đề [Tài liệu i - nguồn] được sinh lại nguyên vẹn.
+        if self.context_compressor is not None:
+            ctx.docs = self.context_compressor.compress(
+                ctx.docs,
+                ctx.trace.get('query_for_search', ctx.question),
+                query_embedding=ctx.trace.get('query_embedding'),
+                embedder=ctx.trace.get('embedder'),
+                idf=ctx.trace.get('bm25_idf')
+            )
+            ctx.context = format_context(ctx.docs)
+
+        # Đóng gói Prompt hoàn chỉnh gồm: Chỉ thị hệ thống, Lịch sử, Ngữ cảnh và Câu hỏi.
+        # Prompt được cắt theo ngân sách token; hậu xử lý đối chiếu nguồn trên đúng
+        # phần ngữ cảnh đã thực sự gửi cho LLM.
+        budget_report = {}
+        ctx.messages = build_messages(
+            question=ctx.question,
+            context=ctx.context,
+            system_prompt=HEALTH_CHATBOT_SYSTEM_PROMPT,
+            chat_history=ctx.chat_history,
+            sources=ctx.sources,
+            budget_report=budget_report
+        )
+        ctx.context = budget_report.get('context_obj', ctx.context)
+
+        # Phân loại độ phức tạp (intent, số bệnh đích, độ dài context/lịch sử) để chọn model
+        if self.router is not None:
+            ctx.route = self.router.decide(
+                ctx.trace.get('intents', ['general']),
+                ctx.trace.get('target_diseases', []),
+                ctx.context,
+                ctx.chat_history
+            )
+
+    def prompt_sources(self, ctx: PipelineContext) -> List[str]:
+        """Tên hiển thị của các nguồn đã thực sự đưa vào prompt (theo thứ hạng)"""
+        sources = []
+        for src in ctx.context.sources():
+            name = display_source_name(src)
+            if name not in sources and name.lower() != 'tiêm chủng':
+                sources.append(name)
+        return sources
+
+    # ============================================
+    # GIAI ĐOẠN HẬU XỬ LÝ (BƯỚC 7 -> 10): Kiểm duyệt câu trả lời thô của LLM.
+    # Toàn bộ là xử lý chuỗi cục bộ (không gọi mạng) nên an toàn khi chạy trên event loop.
+    # ============================================
+    def finalize(self, ctx: PipelineContext, answer: str, tag: str = None) -> str:
+        """
+        Đối chiếu nguồn, lọc an toàn, xác minh và làm sạch câu trả lời
+
+        Args:
+            ctx: Trạng thái request (câu hỏi, ngữ cảnh đã đưa vào prompt)
+            answer: Câu trả lời thô của LLM
+            tag: Nhãn ghi log (mặc định ctx.tag)
+
+        Returns:
+            str: Câu trả lời cuối cùng
+        """
+        tag = ctx.tag if tag is None else tag
+        with self.timed(ctx, 'post_gates'):
+            answer = self._post_gates(ctx, answer, tag)
+        if answer == STRICT_FALLBACK_RESPONSE or answer == NO_DOCS_FOUND_RESPONSE:
+            # Nếu quy trình sanitize quyết định đây là câu trả lời Fallback, đính kèm nguồn trống.
+            return f"{answer}\n\nNguồn: Không có"
+        with self.timed(ctx, 'source_rewrite'):
+            answer = self._rewrite_sources(answer, tag)
+        if config.DEBUG:
+            logger.debug(f"Verified Answer{tag}: {answer[:200]}...")
+        return answer
+
+    def _post_gates(self, ctx: PipelineContext, answer: str, tag: str) -> str:
+        # ============================================
+        # BƯỚC 7: TRÍCH XUẤT VÀ ĐỐI CHIẾU NGUỒN (SOURCE GROUNDING)
+        # Kiểm tra xem các nguồn do LLM sinh ra có thực sự nằm trong danh sách
+        # ngữ cảnh đã cung cấp ban đầu hay không.
+        # ============================================
+        # Chủ đề y khoa (MEDICAL_ANCHORS) nhắc tới trong câu hỏi
+        anchor_terms = list(scan_policy_terms(ctx.question).get('anchor', {}))
+
+        def _source_is_relevant(src: str) -> bool:
+            """Kiểm tra chunk của source trong context có chứa ít nhất 1 topic word."""
+            chunk = ctx.context.chunk_for(src)
+            if chunk is None or not anchor_terms:
+                return True
+            return any(a in chunk.lower for a in anchor_terms)
+
+        sources_in_context = ctx.context.sources()
+        raw_cited = extract_sources_from_answer(answer)
+        pre_cited = [
+            s for s in raw_cited
+            if s in sources_in_context and _source_is_relevant(s)
+        ][:3]
+        logger.info(
+            f"Raw LLM sources{tag}: {raw_cited} -> valid: {pre_cited}")
+
+        # ============================================
+        # BƯỚC 8: CỔNG AN TOÀN SỐ 4 - KIỂM DUYỆT HẬU KỲ (POST-GENERATION SAFETY FILTER)
+        # Cắt gọt và làm sạch câu trả lời, đảm bảo không vi phạm quy tắc hệ thống.
+        # ============================================
+        # Câu trả lời được quét cụm từ chính sách MỘT lần, dùng chung cho BƯỚC 8 và 9
+        logger.info(f"Running post-generation safety check{tag}...")
+        answer_hits = scan_policy_terms(answer, stop_labels=ANSWER_STOP_LABELS)
+        answer = sanitize_answer(answer, answer_hits)
+        if answer == STRICT_FALLBACK_RESPONSE or answer == NO_DOCS_FOUND_RESPONSE:
+            return answer
+
+        # ============================================
+        # BƯỚC 9: CỔNG AN TOÀN SỐ 5 - VERIFICATION AI (GIÁM ĐỊNH VIÊN AI)
+        # Một luồng AI độc lập khác sẽ được gọi để đọc lại câu trả lời vừa sinh ra.
+        # Nếu phát hiện câu trả lời chứa thông tin y tế nằm ngoài ngữ cảnh -> Hủy kết quả.
+        # ============================================
+        logger.info(f"Running Verification AI{tag}...")
+        return verify_answer(
+            question=ctx.question,
+            context=ctx.context,
+            draft_answer=answer,
+            answer_hits=answer_hits
+        )
+
+    def _rewrite_sources(self, answer: str, tag: str) -> str:
+        # ==========================================
+        # BƯỚC 10: LÀM SẠCH BỀ MẶT BẰNG REGEX (FINAL CLEANUP)
+        # Chuẩn hóa định dạng chuỗi trước khi hiển thị lên giao diện Web.
+        # ==========================================
+        try:
+            parts = _SOURCES_SPLIT.split(answer)
+            if len(parts) == 2:
+                main_text, sources_str = parts
+
+                # Loại bỏ từ khóa nhạy cảm "Tiêm chủng" khỏi danh sách liệt kê và dọn dẹp dấu câu
+                main_text = _VACCINATION.sub('', main_text)
+                main_text = _DOUBLE_COMMA.sub(',', main_text)
+                main_text = _COLON_COMMA.sub(':', main_text)
+                main_text = _COMMA_PERIOD.sub('.', main_text)
+                main_text = _WHITESPACE.sub(' ', main_text).strip()
+
+                nice_sources = []
+                for src in sources_str.split(','):
+                    src = src.strip()
+                    if src.lower() == 'không có' or not src:
+                        if 'Không có' not in nice_sources:
+                            nice_sources.append('Không có')
+                        continue
+
+                    nice_name = display_source_name(src)
+
+                    # Bộ lọc cuối: Chặn "Tiêm chủng" xuất hiện trong danh sách nguồn hiển thị
+                    if nice_name not in nice_sources and nice_name.lower() != 'tiêm chủng':
+                        nice_sources.append(nice_name)
+
+                final_sources_str = ', '.join(
+                    nice_sources) if nice_sources else "Không có"
+                answer = main_text.strip() + f"\n\nNguồn: {final_sources_str}"
+        except Exception as e:
+            logger.error(f"Error post-processing answer{tag}: {e}")
+        return answer
+
+    def get_stats(self) -> Dict:
+        """Thời gian trung bình và số lần ngắt mạch của từng giai đoạn"""
+        with self._lock:
+            return {
+                name: {
+                    'calls': self._stage_calls[name],
+                    'avg_ms': round(self._stage_ms[name] / self._stage_calls[name], 1)
+                    if self._stage_calls[name] else 0.0,
+                    'short_circuits': self._short_circuits[name]
+                }
+                for name in STAGES
+            }
@@ -0,0 +1,204 @@
+"""
+Pre-Gate - Phân loại câu hỏi một lượt trước khi chạm tới bộ mã hóa / FAISS / BM25
+"""
+from config.config import config
+from backend.rag.prompts import FAREWELL_TERMS, GREETING_PATTERNS, MEDICAL_ANCHORS
+from backend.rag.retriever import DiseaseDetector
+from backend.utils.query_normalizer import (
+    HEALTH_KEYWORDS, MEDICINE_PATTERN, TREATMENT_PATTERN, normalize_query)
+from backend.utils.logger import get_logger
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+import re
+import threading
+import time
+import unicodedata
+
+logger = get_logger(__name__)
+
+# Trước đây is_greeting, is_farewell và should_block_query (-> extract_health_intent) mỗi hàm
+# tự chạy regex / phép `in` riêng, còn câu hỏi lạc đề ("cách làm bánh kem") vẫn phải đi qua
+# embedding, FAISS, BM25 và cổng độ liên quan rồi mới rơi vào câu trả lời dự phòng.
+#
+# PreGate gộp mọi tín hiệu vào MỘT regex biên dịch sẵn (mỗi loại là một nhóm có tên, xếp theo
+# thứ tự ưu tiên: chào -> tạm biệt -> điều trị -> thuốc -> từ khóa y khoa) và quyết định:
+#   greeting | farewell | blocked | out_of_domain | negative (đã biết là rơi vào dự phòng) | proceed
+#
+# Ngoài miền (out_of_domain, mặc định TẮT): chỉ từ chối khi có bằng chứng lạc đề thật sự -
+# câu hỏi không chứa từ khóa y khoa nào, KHÔNG có cặp âm tiết liền kề (bigram) nào trong kho
+# tài liệu, và sau normalize_query cũng KHÔNG có âm tiết nào (đã bỏ dấu, để câu gõ không dấu
+# "trieu chung cum mua" vẫn khớp) xuất hiện trong kho. Câu hỏi triệu chứng ngôi thứ nhất
+# ("mắt tôi bị đỏ và ngứa") thường không trùng bigram nào nhưng luôn trùng âm tiết, nên vẫn
+# được truy xuất. Chỉ xét khi câu hỏi có đủ PRE_GATE_MIN_BIGRAMS bigram.
+#
+# Bộ đệm kết quả âm (negative cache): câu hỏi vừa bị giai đoạn retrieve/context_gates trả về
+# câu trả lời dự phòng được ghi nhớ (LRU nhỏ, có TTL) để lần hỏi lại trả lời ngay. Khóa gồm
+# phiên bản chỉ mục: build lại vector DB thì các kết quả âm cũ không còn được dùng.
+
+VERDICT_GREETING = 'greeting'
+VERDICT_FAREWELL = 'farewell'
+VERDICT_BLOCKED = 'blocked'
+VERDICT_OUT_OF_DOMAIN = 'out_of_domain'
+VERDICT_NEGATIVE = 'negative'
+VERDICT_PROCEED = 'proceed'
+
+VERDICTS = (VERDICT_GREETING, VERDICT_FAREWELL, VERDICT_BLOCKED,
+            VERDICT_OUT_OF_DOMAIN, VERDICT_NEGATIVE, VERDICT_PROCEED)
+
+# Lý do chặn giống hệt should_block_query
+_BLOCK_REASONS = {
+    'treatment': "Yeu cau thong tin dieu tri (ngoai pham vi)",
+    'medicine': "Yeu cau thong tin ve thuoc (ngoai pham vi)",
+}
+
+_WORD = re.compile(r'\w+')
+_SPACES = re.compile(r'\s+')
+
+
+def _alternation(terms: Iterable[str]) -> str:
+    """Các cụm từ (dài trước) thành một nhóm regex không bắt"""
+    return '(?:' + '|'.join(re.escape(t) for t in sorted(set(terms), key=len, reverse=True)) + ')'
+
+
+def _bigrams(text: str) -> set:
+    words = _WORD.findall(text)
+    return set(zip(words, words[1:]))
+
+
+def _folded_words(text: str) -> set:
+    """Các âm tiết đã bỏ dấu tiếng Việt ("triệu" -> "trieu", "đỏ" -> "do")"""
+    text = unicodedata.normalize('NFD', text.lower().replace('đ', 'd'))
+    return set(_WORD.findall(''.join(c for c in text if unicodedata.category(c) != 'Mn')))
+
+
+# Lookahead tại mỗi vị trí: mọi vị trí bắt đầu đều được xét, nhóm đứng trước thắng khi
+# nhiều nhóm khớp cùng vị trí (đúng thứ tự ưu tiên của các cổng cũ).
+_SIGNALS = re.compile('(?=' + '|'.join([
+    '(?P<greeting>' + '|'.join(GREETING_PATTERNS) + ')',
+    '(?P<farewell>' + _alternation(FAREWELL_TERMS) + ')',
+    '(?P<treatment>' + TREATMENT_PATTERN + ')',
+    '(?P<medicine>' + MEDICINE_PATTERN + ')',
+    r'(?P<anchor>\b' + _alternation(
+        list(HEALTH_KEYWORDS) + list(MEDICAL_ANCHORS) + list(DiseaseDetector.DISEASE_TO_FILE)) + r'\b)',
+]) + ')')
+
+
+class PreGate:
+    """Bộ phân loại câu hỏi trước truy xuất"""
+
+    def __init__(self, documents: Iterable[Dict] = None, cache_size: int = None, cache_ttl: float = None):
+        """
+        Args:
+            documents: Tài liệu đã lập chỉ mục (dựng từ vựng bigram cho cổng ngoài miền);
+                None -> tắt cổng ngoài miền
+            cache_size: Số câu hỏi tối đa trong bộ đệm kết quả âm
+            cache_ttl: Thời gian sống (giây) của một mục trong bộ đệm kết quả âm
+        """
+        self.cache_size = config.PRE_GATE_NEGATIVE_CACHE_SIZE if cache_size is None else cache_size
+        self.cache_ttl = config.PRE_GATE_NEGATIVE_CACHE_TTL if cache_ttl is None else cache_ttl
+        self.min_bigrams = config.PRE_GATE_MIN_BIGRAMS
+
+        self.vocabulary = None
+        self.words = None
+        if documents is not None and config.PRE_GATE_OUT_OF_DOMAIN_ENABLED:
+            self.vocabulary = set()
+            self.words = set()
+            for doc in documents:
+                text = doc.get('content_lower') or doc.get('content', '').lower()
+                self.vocabulary |= _bigrams(text)
+                self.words |= _folded_words(text)
+            logger.info(f"Pre-gate: tu vung {len(self.vocabulary)} bigram, "
+                        f"{len(self.words)} am tiet tu kho tai lieu")
+
+        # (phiên bản chỉ mục, khóa câu hỏi) -> (hết hạn, câu trả lời)
+        self._negative: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._verdicts = {verdict: 0 for verdict in VERDICTS}
+
+    @classmethod
+    def from_retriever(cls, retriever) -> 'PreGate':
+        """Dựng PreGate với từ vựng lấy từ vector store của retriever (nếu có)"""
+        store = getattr(retriever, 'vector_store', None)
+        return cls(getattr(store, 'documents', None) or None)
+
+    @staticmethod
+    def _key(question: str) -> str:
+        return _SPACES.sub(' ', question.lower()).strip()
+
+    def classify(self, question: str, index_version: str = None) -> Tuple[str, str]:
+        """
+        Phân loại câu hỏi
+
+        Args:
+            question: Câu hỏi
+            index_version: Phiên bản chỉ mục đang phục vụ (khóa của bộ đệm kết quả âm)
+
+        Returns:
+            Tuple[str, str]: (verdict, lý do / câu trả lời đã đệm với VERDICT_NEGATIVE)
+        """
+        verdict, detail = self._classify(question or '', index_version)
+        with self._lock:
+            self._verdicts[verdict] += 1
+        return verdict, detail
+
+    def _classify(self, question: str, index_version: str = None) -> Tuple[str, str]:
+        text = question.lower()
+        hits = {name for found in _SIGNALS.finditer(text)
+                for name, value in found.groupdict().items() if value is not None}
+
+        if 'greeting' in hits:
+            return VERDICT_GREETING, ''
+        if 'farewell' in hits:
+            return VERDICT_FAREWELL, ''
+        if 'treatment' in hits:
+            return VERDICT_BLOCKED, _BLOCK_REASONS['treatment']
+        if 'medicine' in hits:
+            return VERDICT_BLOCKED, _BLOCK_REASONS['medicine']
+
+        cached = self._lookup_negative(question, index_version)
+        if cached is not None:
+            return VERDICT_NEGATIVE, cached
+
+        if self.vocabulary is not None and 'anchor' not in hits:
+            bigrams = _bigrams(text)
+            if len(bigrams) >= self.min_bigrams and not bigrams & self.vocabulary \
+                    and not _folded_words(normalize_query(question)) & self.words:
+                return VERDICT_OUT_OF_DOMAIN, "khong co bigram/am tiet nao trong kho tai lieu"
+        return VERDICT_PROCEED, ''
+
+    # ============================================
+    # BỘ ĐỆM KẾT QUẢ ÂM (NEGATIVE CACHE)
+    # ============================================
+    def _lookup_negative(self, question: str, index_version: str = None) -> Optional[str]:
+        if self.cache_size <= 0:
+            return None
+        key = (index_version, self._key(question))
+        with self._lock:
+            entry = self._negative.get(key)
+            if entry is None:
+                return None
+            expires_at, answer = entry
+            if time.monotonic() >= expires_at:
+                del self._negative[key]
+                return None
+            self._negative.move_to_end(key)
+            return answer
+
+    def remember_negative(self, question: str, answer: str, index_version: str = None):
+        """Ghi nhớ câu trả lời dự phòng của một câu hỏi không tìm được tài liệu phù hợp"""
+        if self.cache_size <= 0 or not question:
+            return
+        key = (index_version, self._key(question))
+        with self._lock:
+            self._negative[key] = (time.monotonic() + self.cache_ttl, answer)
+            self._negative.move_to_end(key)
+            while len(self._negative) > self.cache_size:
+                self._negative.popitem(last=False)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                'verdicts': dict(self._verdicts),
+                'negative_cache_size': len(self._negative),
+                'vocabulary_bigrams': len(self.vocabulary) if self.vocabulary is not None else 0
+            }
@@ -7,6 +7,13 @@ Module này chịu trách nhiệm quản lý toàn bộ các chỉ thị hệ th
 và các hàm tiện ích tiền/hậu xử lý ngôn ngữ tự nhiên (NLP) cho mô hình LLM.
 """
 
+import hashlib
+import re
+from typing import Optional
+
+from backend.utils.multi_pattern import MultiPatternMatcher
+from backend.utils import vi_tokenizer
+
 # ============================================
 # PROMPTS - CẬP NHẬT CHO HÀNH VI RAG CHUẨN XÁC
 # (Version dùng cho Đồ án - đã loại bỏ over-blocking)
@@ -153,42 +160,44 @@ Nguồn: [LỆNH CẤM KỴ: CHỈ liệt kê DUY NHẤT tên tài liệu trực
 # ==========================================================
 
 
+# Từ dừng bỏ qua khi đối chiếu từ khóa câu hỏi với ngữ cảnh
+_RELEVANCE_STOPWORDS = frozenset({
+    'là', 'của', 'và', 'có', 'thì', 'được', 'trong', 'cho', 'với', 'theo',
+    'để', 'từ', 'hoặc', 'như', 'nếu', 'khi', 'hay', 'những', 'các', 'về',
+    'bị', 'mà', 'vì', 'rằng', 'này', 'đó', 'nào', 'gì', 'không', 'sẽ',
+    'thế', 'tại', 'sao', 'ăn', 'uống', 'bệnh', 'triệu', 'chứng',
+    'tôi', 'tao', 'mình', 'anh', 'chị', 'bạn', 'ông', 'bà', 'em',
+    'nhẹ', 'nặng', 'nhiều', 'ngày',
+})
+
+# Dòng tiêu đề tài liệu trong context dạng chuỗi (đã chữ thường)
+_CONTEXT_HEADER = re.compile(r'\[tài liệu \d+ - [^\]]+\]')
+
+
 def check_context_relevance(question: str, context: str) -> bool:
     """
     Kiểm tra xem context có thực sự liên quan đến câu hỏi không.
     Mục đích: Ngăn chặn hallucination khi câu hỏi nằm ngoài dataset.
     """
-    import re
-
-    if not context or len(context.strip()) < 20:
+    if not context or len(str(context).strip()) < 20:
         return False
 
-    stopwords = {
-        'là', 'của', 'và', 'có', 'thì', 'được', 'trong', 'cho', 'với', 'theo',
-        'để', 'từ', 'hoặc', 'như', 'nếu', 'khi', 'hay', 'những', 'các', 'về',
-        'bị', 'mà', 'vì', 'rằng', 'này', 'đó', 'nào', 'gì', 'không', 'sẽ',
-        'thế', 'tại', 'sao', 'ăn', 'uống', 'bệnh', 'triệu', 'chứng',
-        'tôi', 'tao', 'mình', 'anh', 'chị', 'bạn', 'ông', 'bà', 'em',
-        'nhẹ', 'nặng', 'nhiều', 'ngày',
-    }
-
-    try:
-        from underthesea import word_tokenize
-        question_tokens = word_tokenize(question.lower())
-    except Exception:
-        question_tokens = question.lower().split()
+    # Tách từ qua underthesea (nạp một lần, ghi nhớ kết quả theo câu hỏi)
+    question_tokens = vi_tokenizer.tokenize(question.lower())
 
     key_terms = [
         token for token in question_tokens
-        if len(token) > 2 and token not in stopwords
+        if len(token) > 2 and token not in _RELEVANCE_STOPWORDS
     ]
 
     if not key_terms:
         return True
 
-    context_normalized = context.lower()
-    context_normalized = re.sub(
-        r'\[tài liệu \d+ - [^\]]+\]', '', context_normalized)
+    if isinstance(context, StructuredContext):
+        # Nội dung chữ thường đã tính sẵn, không kèm dòng tiêu đề
+        context_normalized = context.lower_text()
+    else:
+        context_normalized = _CONTEXT_HEADER.sub('', context.lower())
 
     matched_terms = 0
     for term in key_terms:
@@ -255,58 +264,265 @@ _FILENAME_TO_DISEASE = {
 }
 
 
-def format_context(retrieved_docs: list) -> str:
-    """Format retrieved documents thành context string."""
-    if not retrieved_docs:
-        return "Không có thông tin liên quan."
+def disease_display_name(source: str) -> Optional[str]:
+    """Tên bệnh tiếng Việt có dấu của một file tài liệu (None nếu file chưa được ánh xạ)"""
+    return _FILENAME_TO_DISEASE.get(source)
 
-    context_parts = []
 
-    for i, doc in enumerate(retrieved_docs, 1):
-        content = doc.get('content', '')
-        metadata = doc.get('metadata', {})
-        source = metadata.get('source', 'Unknown')
+# Dấu phân cách giữa các chunk khi render context thành chuỗi prompt
+_CHUNK_SEPARATOR = "\n---\n"
+
+# Tên nguồn hợp lệ để trích dẫn (cùng quy tắc với extract_sources_from_answer)
+_SOURCE_FILE = re.compile(r'[\w_.-]+\.txt')
 
-        disease_name = _FILENAME_TO_DISEASE.get(source, '')
-        if disease_name:
-            header = f"[Tài liệu {i} - {source} | Bệnh/Chủ đề: {disease_name}]"
-        else:
-            header = f"[Tài liệu {i} - {source}]"
 
-        context_parts.append(f"{header}\n{content}")
+class ContextChunk:
+    """Một tài liệu trong context: nguồn, tên bệnh, nội dung và bản chữ thường tính sẵn"""
 
-    return "\n---\n".join(context_parts)
+    __slots__ = ('index', 'source', 'disease', 'text', 'lower')
+
+    def __init__(self, index: int, source: str, text: str, lower: str = None):
+        self.index = index
+        self.source = source
+        self.disease = disease_display_name(source) or ''
+        self.text = text
+        # `lower` tính sẵn lúc lập chỉ mục (doc['content_lower']) được dùng lại nếu có
+        self.lower = lower if lower is not None else text.lower()
+
+    @property
+    def header(self) -> str:
+        if self.disease:
+            return f"[Tài liệu {self.index} - {self.source} | Bệnh/Chủ đề: {self.disease}]"
+        return f"[Tài liệu {self.index} - {self.source}]"
+
+    def render(self) -> str:
+        return f"{self.header}\n{self.text}"
+
+
+class StructuredContext:
+    """
+    Context có cấu trúc do format_context trả về
+
+    Các cổng an toàn và bước đối chiếu nguồn truy vấn trực tiếp danh sách chunk
+    (nguồn, nội dung chữ thường) thay vì regex lại chuỗi prompt. Chuỗi prompt chỉ
+    được render khi cần (str(), len(), .format()) và được lưu lại sau lần đầu.
+    """
+
+    EMPTY_TEXT = "Không có thông tin liên quan."
+
+    def __init__(self, chunks: list):
+        self.chunks = list(chunks)
+        self._rendered = None
+        self._lower = None
+        self._sources = None
+
+    @classmethod
+    def from_docs(cls, retrieved_docs: list) -> 'StructuredContext':
+        return cls([
+            ContextChunk(i, doc.get('metadata', {}).get('source', 'Unknown'),
+                         doc.get('content', ''), doc.get('content_lower'))
+            for i, doc in enumerate(retrieved_docs or [], 1)
+        ])
+
+    def render(self) -> str:
+        if self._rendered is None:
+            self._rendered = _CHUNK_SEPARATOR.join(
+                c.render() for c in self.chunks) if self.chunks else self.EMPTY_TEXT
+        return self._rendered
+
+    def __str__(self) -> str:
+        return self.render()
+
+    def __len__(self) -> int:
+        return len(self.render())
+
+    def __bool__(self) -> bool:
+        return bool(self.chunks)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, StructuredContext):
+            return self.render() == other.render()
+        return isinstance(other, str) and self.render() == other
+
+    __hash__ = None
+
+    def sources(self) -> list:
+        """Danh sách file nguồn (không trùng, theo thứ hạng)"""
+        if self._sources is None:
+            seen = set()
+            self._sources = []
+            for c in self.chunks:
+                if c.source not in seen and _SOURCE_FILE.fullmatch(c.source):
+                    seen.add(c.source)
+                    self._sources.append(c.source)
+        return self._sources
+
+    def chunk_for(self, source: str):
+        """Chunk đầu tiên của một nguồn (None nếu không có)"""
+        return next((c for c in self.chunks if c.source == source), None)
+
+    def contains(self, term: str) -> bool:
+        """`term` (chữ thường) có xuất hiện trong nội dung hoặc tên bệnh của chunk nào không"""
+        return any(term in c.lower or term in c.disease.lower() for c in self.chunks)
+
+    def lower_text(self) -> str:
+        """Nội dung chữ thường của mọi chunk (không kèm dòng tiêu đề)"""
+        return "\n".join(c.lower for c in self.chunks)
+
+    def lower(self) -> str:
+        """Toàn bộ chuỗi prompt dạng chữ thường (kể cả tiêu đề), tính một lần"""
+        if self._lower is None:
+            self._lower = self.render().lower()
+        return self._lower
+
+    def truncated(self, keep: int, last_text: str = None) -> 'StructuredContext':
+        """Context mới gồm `keep` chunk đầu; chunk cuối được thay nội dung nếu có `last_text`"""
+        chunks = self.chunks[:keep]
+        if last_text is not None and chunks:
+            last = chunks[-1]
+            chunks[-1] = ContextChunk(last.index, last.source, last_text)
+        return StructuredContext(chunks)
+
+
+def format_context(retrieved_docs: list) -> StructuredContext:
+    """Format retrieved documents thành context có cấu trúc (render thành chuỗi khi cần)."""
+    return StructuredContext.from_docs(retrieved_docs)
 
 # ==========================================================
-# 6. SAFETY FILTER - KIỂM DUYỆT ĐẦU RA (OUTPUT MODERATION)
+# 6. BỘ QUÉT CỤM TỪ CHÍNH SÁCH (POLICY TERM SCANNER)
+# Mọi danh sách cụm từ dùng cho kiểm duyệt được gộp vào MỘT bộ dò nhiều cụm từ (trie -> regex)
+# dựng sẵn khi import. Mỗi câu trả lời / ngữ cảnh chỉ cần quét một lượt để biết toàn bộ
+# cụm từ xuất hiện (kèm vị trí), thay vì chạy `term in text` cho từng cụm từ ở mỗi hàm.
 # ==========================================================
 
+# Cụm từ vai bác sĩ -> câu trả lời vi phạm chính sách (sanitize_answer)
+POLICY_DIAGNOSIS_FLAGS = [
+    "tôi chẩn đoán",
+    "bạn bị bệnh",
+    "tôi kết luận"
+]
 
-def violates_policy(answer: str) -> bool:
-    """Kiểm tra xem câu trả lời có vi phạm chính sách không"""
-    if not answer:
-        return False
+# Dấu hiệu LLM đã tự trả lời Fallback
+FALLBACK_MARKERS = [
+    "hiện tài liệu chưa cung cấp",
+    "không có thông tin về nội dung này",
+    "nguồn: không có",
+]
 
-    text_lower = answer.lower()
+# Tên bệnh phải có trong ngữ cảnh nếu xuất hiện trong câu trả lời (chống ảo giác)
+DATASET_DISEASE_TERMS = [
+    'ebola', 'malaria', 'sốt rét', 'viêm màng não',
+    'viêm não nhật bản', 'parkinson', 'alzheimer',
+    'multiple sclerosis', 'xơ cứng bì', 'lupus', 'bệnh crohn',
+    'lao phổi', 'bệnh lao', 'bạch hầu', 'uốn ván', 'bại liệt',
+    'covid-19', 'covid19', 'covid 19', 'coronavirus', 'sars-cov', 'sars',
+    'sốt xuất huyết', 'dengue',
+    'đái tháo đường', 'tiểu đường type',
+    'tăng huyết áp', 'cao huyết áp',
+    'hen phế quản', 'hen suyễn',
+    'bệnh gút', 'gout',
+    'mụn trứng cá',
+    'viêm gan b',
+    'viêm da cơ địa',
+    'sỏi thận',
+    'nhiễm trùng đường tiết niệu',
+    'rối loạn lo âu',
+    'trầm cảm',
+    'ung thư',
+    'u nang buồng trứng',
+    'suy giáp',
+    'viêm kết mạc', 'đau mắt đỏ',
+    'thoái hóa khớp',
+    'còi xương',
+    'say nắng',
+    'suy dinh dưỡng',
+    'béo phì',
+    'rối loạn tiêu hóa',
+    'viêm họng cấp', 'viêm họng kích ứng',
+    'cảm lạnh',
+    'cúm mùa',
+    'mất nước',
+    'mất ngủ',
+    'stress',
+    'suy tim', 'nhồi máu cơ tim', 'rối loạn nhịp tim',
+    'đau lưng',
+    'đau bụng kinh',
+    'sỏi tiết niệu',
+    'giang mai', 'lậu', 'hiv', 'aids', 'sùi mào gà', 'đậu mùa khỉ',
+    'dại', 'tay chân miệng', 'thủy đậu', 'rubella',
+]
 
-    diagnosis_flags = [
-        "tôi chẩn đoán",
-        "bạn bị bệnh",
-        "tôi kết luận"
-    ]
+# Câu mang sắc thái chẩn đoán -> làm mềm
+DIAGNOSIS_PHRASES = [
+    'bạn bị bệnh', 'bạn mắc bệnh', 'bạn đang bị',
+    'tôi chẩn đoán', 'tôi kết luận'
+]
+
+# Bệnh hiểm nghèo: chỉ khi xuất hiện mới cần chạy regex phủ định triệu chứng
+DENIAL_TRIGGERS = ['ung thư', 'khối u', 'bệnh tim']
+
+# Chủ đề y khoa dùng để đối chiếu nguồn được trích dẫn với câu hỏi
+MEDICAL_ANCHORS = [
+    'stress', 'lo âu', 'mất ngủ', 'gout', 'sốt xuất huyết', 'cúm',
+    'covid', 'đái tháo đường', 'béo phì', 'đau khớp', 'đau đầu',
+    'mệt mỏi', 'buồn nôn', 'chóng mặt', 'tim', 'tim mạch', 'huyết áp',
+    'tiêu hóa', 'viêm họng', 'hen', 'trầm cảm',
+]
+
+POLICY_MATCHER = MultiPatternMatcher({
+    'policy': POLICY_DIAGNOSIS_FLAGS,
+    'forbidden': FORBIDDEN_MEDICAL_ADVICE_PATTERNS + FORBIDDEN_PHRASES,
+    'fallback': FALLBACK_MARKERS,
+    'disease': DATASET_DISEASE_TERMS,
+    'diagnosis': DIAGNOSIS_PHRASES,
+    'denial': DENIAL_TRIGGERS,
+    'anchor': MEDICAL_ANCHORS,
+})
+
+
+# Nhãn khiến câu trả lời bị thay bằng STRICT_FALLBACK_RESPONSE (sanitize_answer / verify_answer):
+# gặp một cụm từ mang nhãn này thì phần còn lại của câu trả lời không cần quét nữa
+ANSWER_STOP_LABELS = ('policy', 'fallback')
 
-    if any(flag in text_lower for flag in diagnosis_flags):
-        return True
 
-    return False
+def scan_policy_terms(text: str, lowered: bool = False, stop_labels: tuple = ()) -> dict:
+    """
+    Quét văn bản một lượt, trả về mọi cụm từ chính sách xuất hiện
+
+    Args:
+        text: Văn bản cần quét
+        lowered: True nếu text đã ở dạng chữ thường
+        stop_labels: Dừng ngay khi gặp cụm từ mang một trong các nhãn này (vd: ANSWER_STOP_LABELS)
 
+    Returns:
+        dict: {nhãn: {cụm từ: [vị trí bắt đầu, ...]}}
+    """
+    if not text:
+        return {}
+    return POLICY_MATCHER.find_grouped(text if lowered else text.lower(), stop_labels)
 
-def sanitize_answer(answer: str) -> str:
+
+# ==========================================================
+# 6. SAFETY FILTER - KIỂM DUYỆT ĐẦU RA (OUTPUT MODERATION)
+# ==========================================================
+
+
+def violates_policy(answer: str, hits: dict = None) -> bool:
+    """Kiểm tra xem câu trả lời có vi phạm chính sách không (hits: kết quả scan_policy_terms có sẵn)"""
+    if not answer:
+        return False
+
+    if hits is None:
+        hits = scan_policy_terms(answer)
+    return 'policy' in hits
+
+
+def sanitize_answer(answer: str, hits: dict = None) -> str:
     """Làm sạch câu trả lời và áp dụng safety filter"""
     if not answer or not answer.strip():
         return STRICT_FALLBACK_RESPONSE
 
-    if violates_policy(answer):
+    if violates_policy(answer, hits):
         return STRICT_FALLBACK_RESPONSE
 
     return answer
@@ -316,10 +532,49 @@ def sanitize_answer(answer: str) -> str:
 # ==========================================================
 
 
+_ANSWER_SOURCE_LINE = re.compile(r'Nguồn:\s*(.+?)(?:\n|$)', re.IGNORECASE)
+_CONTEXT_SOURCE = re.compile(r'\[Tài liệu \d+ - ([\w_.-]+\.txt)(?:\s*\|[^\]]*)?\]')
+_SOURCE_LINE_REPLACE = re.compile(r'Nguồn:.*?(?:\n|$)', re.IGNORECASE)
+_DIAGNOSIS_REWRITE = re.compile(
+    r'bạn (bị|mắc|đang bị) ([\w\s]+?)(?=[,.\n]|$)', re.IGNORECASE)
+_DENIAL_PATTERNS = [re.compile(p) for p in [
+    r'không phải( là)? (dấu hiệu|triệu chứng) của (ung thư|khối u|bệnh tim)',
+    r'không có dấu hiệu( của)? ung thư',
+]]
+_COMMENTARY_PATTERNS = [re.compile(p, re.IGNORECASE) for p in [
+    r'thông tin không được đề cập rõ ràng trong tài liệu',
+    r'tài liệu (không|chưa) (cung cấp|mô tả|nói đến|nhắc đến|ghi rõ|đề cập)( đầy đủ| chi tiết| rõ ràng)?',
+    r'thông tin (không|chưa) (được|đề cập)( chi tiết| đầy đủ| rõ ràng)?',
+    r'dataset (không|chưa) có( đủ)? thông tin',
+    r'theo tài liệu hiện có[,]?',
+    r'trong phạm vi tài liệu[,]?',
+    r'thông tin (trong|từ) (tài liệu|dataset) (không|chưa|hạn chế)',
+    r'không có tài liệu nào (mô tả|nói đến|đề cập)',
+    r'ngoài phạm vi của tài liệu',
+    r'các tài liệu (không|chưa) (cung cấp|đề cập)',
+    r'[Tt]uy nhiên[,\s]+không có thông tin[^.!?]*[.!?]\s*',
+    r'không có thông tin cụ thể về(?: việc)?[^.!?]*[.!?]\s*',
+    r'không có thông tin(?: cụ thể)? về(?: việc)?[^.!?\n]*[.!?]\s*',
+    r'chưa có thông tin(?: cụ thể)?[^.!?\n]*[.!?]\s*',
+    r'[Tt]uy nhiên[,\s]+chưa có thông tin[^.!?]*[.!?]\s*',
+    r'[^.!?\n]*không được đề cập trực tiếp[^.!?]*[.!?]\s*',
+    r'[^.!?\n]*trong các tài liệu cung cấp[^.!?]*[.!?]\s*',
+    r'[Tt]uy nhiên[,\s]+[^.!?]*được khuyến nghị[^.!?]*[.!?]\s*',
+    r'[Tt]uy nhiên[,\s]+[^.!?]*được khuyến khích[^.!?]*[.!?]\s*',
+    r'[Vv]í dụ[,\s]+trong chăm sóc cho[^.!?]*[.!?]\s*',
+    r'trong chăm sóc[^.!?]*được khuyến[^.!?]*[.!?]\s*',
+]]
+# Mỗi mẫu bình luận đều chứa một trong các từ khóa này: câu trả lời không có từ khóa nào
+# thì bỏ qua cả loạt regex của RULE 3
+_COMMENTARY_KEYWORDS = ('tài liệu', 'thông tin', 'dataset', 'đề cập', 'khuyến', 'chăm sóc')
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+_PURE_SYMPTOM_QUESTION = re.compile(
+    r'(là (dấu hiệu|triệu chứng|biểu hiện) của bệnh gì)|(là bệnh gì)|((dấu hiệu|triệu chứng|biểu hiện) của (bệnh )?)|(có phải (là )?(dấu hiệu|triệu chứng))')
+
+
 def extract_sources_from_answer(answer: str) -> list:
     """Trích xuất sources từ phần cuối câu trả lời"""
-    import re
-    source_match = re.search(r'Nguồn:\s*(.+?)(?:\n|$)', answer, re.IGNORECASE)
+    source_match = _ANSWER_SOURCE_LINE.search(answer)
     if not source_match:
         return []
 
@@ -327,16 +582,16 @@ def extract_sources_from_answer(answer: str) -> list:
     if 'không có' in source_text.lower():
         return []
 
-    sources = re.findall(r'[\w_.-]+\.txt', source_text)
+    sources = _SOURCE_FILE.findall(source_text)
     sources = [s for s in sources if len(s) > 4 and not s.startswith('.')]
     return sources
 
 
-def extract_sources_from_context(context: str) -> list:
-    """Trích xuất danh sách file từ context gốc bằng Regex"""
-    import re
-    matches = re.findall(
-        r'\[Tài liệu \d+ - ([\w_.-]+\.txt)(?:\s*\|[^\]]*)?\]', context)
+def extract_sources_from_context(context) -> list:
+    """Trích xuất danh sách file từ context (đọc trực tiếp nếu là StructuredContext)"""
+    if isinstance(context, StructuredContext):
+        return list(context.sources())
+    matches = _CONTEXT_SOURCE.findall(context)
     seen = set()
     ordered = []
     for s in matches:
@@ -346,124 +601,55 @@ def extract_sources_from_context(context: str) -> list:
     return ordered
 
 
-def verify_answer(question: str, context: str, draft_answer: str) -> str:
-    """Xác minh và sửa lỗi câu trả lời trước khi trả về user."""
-    import re
+def verify_answer(question: str, context: str, draft_answer: str, answer_hits: dict = None) -> str:
+    """
+    Xác minh và sửa lỗi câu trả lời trước khi trả về user.
 
-    _FALLBACK_MARKERS_V = [
-        "hiện tài liệu chưa cung cấp",
-        "không có thông tin về nội dung này",
-        "nguồn: không có",
-    ]
+    answer_hits: kết quả scan_policy_terms(draft_answer) nếu đã quét ở bước trước
+    """
+    if not draft_answer:
+        return STRICT_FALLBACK_RESPONSE
+    if answer_hits is None:
+        answer_hits = scan_policy_terms(draft_answer)
 
-    if not draft_answer or any(m in draft_answer.lower() for m in _FALLBACK_MARKERS_V):
+    if 'fallback' in answer_hits:
         return STRICT_FALLBACK_RESPONSE
 
-    if not context or context.strip() == "Không có thông tin liên quan.":
+    if not context or str(context).strip() == StructuredContext.EMPTY_TEXT:
         return f"{STRICT_FALLBACK_RESPONSE}\n\nNguồn: Không có"
 
-    context_lower = context.lower()
-    answer_lower = draft_answer.lower()
-
     # [RULE 1]: HALLUCINATION DETECTION (Phát hiện Ảo giác)
-    DATASET_DISEASE_TERMS = [
-        'ebola', 'malaria', 'sốt rét', 'viêm màng não',
-        'viêm não nhật bản', 'parkinson', 'alzheimer',
-        'multiple sclerosis', 'xơ cứng bì', 'lupus', 'bệnh crohn',
-        'lao phổi', 'bệnh lao', 'bạch hầu', 'uốn ván', 'bại liệt',
-        'covid-19', 'covid19', 'covid 19', 'coronavirus', 'sars-cov', 'sars',
-        'sốt xuất huyết', 'dengue',
-        'đái tháo đường', 'tiểu đường type',
-        'tăng huyết áp', 'cao huyết áp',
-        'hen phế quản', 'hen suyễn',
-        'bệnh gút', 'gout',
-        'mụn trứng cá',
-        'viêm gan b',
-        'viêm da cơ địa',
-        'sỏi thận',
-        'nhiễm trùng đường tiết niệu',
-        'rối loạn lo âu',
-        'trầm cảm',
-        'ung thư',
-        'u nang buồng trứng',
-        'suy giáp',
-        'viêm kết mạc', 'đau mắt đỏ',
-        'thoái hóa khớp',
-        'còi xương',
-        'say nắng',
-        'suy dinh dưỡng',
-        'béo phì',
-        'rối loạn tiêu hóa',
-        'viêm họng cấp', 'viêm họng kích ứng',
-        'cảm lạnh',
-        'cúm mùa',
-        'mất nước',
-        'mất ngủ',
-        'stress',
-        'suy tim', 'nhồi máu cơ tim', 'rối loạn nhịp tim',
-        'đau lưng',
-        'đau bụng kinh',
-        'sỏi tiết niệu',
-        'giang mai', 'lậu', 'hiv', 'aids', 'sùi mào gà', 'đậu mùa khỉ',
-        'dại', 'tay chân miệng', 'thủy đậu', 'rubella',
-    ]
-
-    for term in DATASET_DISEASE_TERMS:
-        if term in answer_lower and term not in context_lower:
+    # Chỉ tên bệnh đã thấy trong câu trả lời mới được tra trong ngữ cảnh: phép `in` dừng ở
+    # lần khớp đầu tiên, không cần quét toàn bộ ngữ cảnh (dài gấp nhiều lần câu trả lời).
+    answer_diseases = answer_hits.get('disease')
+    context_lower = context.lower() if answer_diseases else ""
+    for term in answer_diseases or ():
+        if term not in context_lower:
             print(
                 f"[CANH BAO] HALLUCINATION DETECTED: '{term}' not in retrieved context")
             return f"{STRICT_FALLBACK_RESPONSE}\n\nNguồn: Không có"
 
     # [RULE 2]: TONE SOFTENING (Làm mềm sắc thái chẩn đoán)
-    diagnosis_phrases = [
-        'bạn bị bệnh', 'bạn mắc bệnh', 'bạn đang bị',
-        'tôi chẩn đoán', 'tôi kết luận'
-    ]
-    if any(phrase in answer_lower for phrase in diagnosis_phrases):
-        draft_answer = re.sub(
-            r'bạn (bị|mắc|đang bị) ([\w\s]+?)(?=[,.\n]|$)',
+    if 'diagnosis' in answer_hits:
+        draft_answer = _DIAGNOSIS_REWRITE.sub(
             r'các triệu chứng này có thể liên quan đến \2',
-            draft_answer,
-            flags=re.IGNORECASE
+            draft_answer
         )
     # [RULE 2.5]: CHỐNG SUY LUẬN PHỦ ĐỊNH SAI LỆCH VỀ TRIỆU CHỨNG (Symptom Denial Prevention)
     # Bắt các câu trả lời khẳng định "không phải là dấu hiệu của ung thư/bệnh hiểm nghèo"
     # vì hệ thống không được phép loại trừ bệnh lý lâm sàng.
-    denial_patterns = [
-        r'không phải( là)? (dấu hiệu|triệu chứng) của (ung thư|khối u|bệnh tim)',
-        r'không có dấu hiệu( của)? ung thư',
-    ]
-    if any(re.search(pattern, answer_lower) for pattern in denial_patterns):
-        print(
-            "[CANH BAO] PHAT HIEN SUY LUAN PHU DINH NGUY HIEM (Negative Medical Denial).")
-        return f"{STRICT_FALLBACK_RESPONSE}\n\nNguồn: Không có"
+    # Regex chỉ chạy khi bộ quét đã thấy tên bệnh hiểm nghèo trong câu trả lời.
+    if 'denial' in answer_hits:
+        answer_lower = draft_answer.lower()
+        if any(pattern.search(answer_lower) for pattern in _DENIAL_PATTERNS):
+            print(
+                "[CANH BAO] PHAT HIEN SUY LUAN PHU DINH NGUY HIEM (Negative Medical Denial).")
+            return f"{STRICT_FALLBACK_RESPONSE}\n\nNguồn: Không có"
     # [RULE 3]: METADATA COMMENTARY REMOVAL (Xóa bỏ các câu bình luận rác của AI)
-    commentary_patterns = [
-        r'thông tin không được đề cập rõ ràng trong tài liệu',
-        r'tài liệu (không|chưa) (cung cấp|mô tả|nói đến|nhắc đến|ghi rõ|đề cập)( đầy đủ| chi tiết| rõ ràng)?',
-        r'thông tin (không|chưa) (được|đề cập)( chi tiết| đầy đủ| rõ ràng)?',
-        r'dataset (không|chưa) có( đủ)? thông tin',
-        r'theo tài liệu hiện có[,]?',
-        r'trong phạm vi tài liệu[,]?',
-        r'thông tin (trong|từ) (tài liệu|dataset) (không|chưa|hạn chế)',
-        r'không có tài liệu nào (mô tả|nói đến|đề cập)',
-        r'ngoài phạm vi của tài liệu',
-        r'các tài liệu (không|chưa) (cung cấp|đề cập)',
-        r'[Tt]uy nhiên[,\s]+không có thông tin[^.!?]*[.!?]\s*',
-        r'không có thông tin cụ thể về(?: việc)?[^.!?]*[.!?]\s*',
-        r'không có thông tin(?: cụ thể)? về(?: việc)?[^.!?\n]*[.!?]\s*',
-        r'chưa có thông tin(?: cụ thể)?[^.!?\n]*[.!?]\s*',
-        r'[Tt]uy nhiên[,\s]+chưa có thông tin[^.!?]*[.!?]\s*',
-        r'[^.!?\n]*không được đề cập trực tiếp[^.!?]*[.!?]\s*',
-        r'[^.!?\n]*trong các tài liệu cung cấp[^.!?]*[.!?]\s*',
-        r'[Tt]uy nhiên[,\s]+[^.!?]*được khuyến nghị[^.!?]*[.!?]\s*',
-        r'[Tt]uy nhiên[,\s]+[^.!?]*được khuyến khích[^.!?]*[.!?]\s*',
-        r'[Vv]í dụ[,\s]+trong chăm sóc cho[^.!?]*[.!?]\s*',
-        r'trong chăm sóc[^.!?]*được khuyến[^.!?]*[.!?]\s*',
-    ]
-    for pattern in commentary_patterns:
-        draft_answer = re.sub(pattern, '', draft_answer, flags=re.IGNORECASE)
-
+    answer_lower = draft_answer.lower()
+    if any(keyword in answer_lower for keyword in _COMMENTARY_KEYWORDS):
+        for pattern in _COMMENTARY_PATTERNS:
+            draft_answer = pattern.sub('', draft_answer)
     # [RULE 4]: SOURCE GROUNDING (Đối chiếu và Sửa lỗi Nguồn tham khảo)
     sources_in_context = extract_sources_from_context(context)
     sources_in_answer = extract_sources_from_answer(draft_answer)
@@ -478,12 +664,8 @@ def verify_answer(question: str, context: str, draft_answer: str) -> str:
                 s for s in sources_in_answer if s in sources_in_context]
             replacement = ', '.join(
                 valid_sources) if valid_sources else ', '.join(sources_in_context)
-            draft_answer = re.sub(
-                r'Nguồn:.*?(?:\n|$)',
-                f'Nguồn: {replacement}\n',
-                draft_answer,
-                flags=re.IGNORECASE
-            )
+            draft_answer = _SOURCE_LINE_REPLACE.sub(
+                f'Nguồn: {replacement}\n', draft_answer)
 
     # [RULE 5]: HARD LENGTH ENFORCEMENT (Kiểm soát độ dài bằng thuật toán cắt tỉa)
     lines = draft_answer.split('\n')
@@ -499,15 +681,12 @@ def verify_answer(question: str, context: str, draft_answer: str) -> str:
     if not main_text:
         return f"{STRICT_FALLBACK_RESPONSE}\n\nNguồn: Không có"
 
-    sentences = re.split(r'(?<=[.!?])\s+', main_text)
+    sentences = _SENTENCE_END.split(main_text)
 
     # =====================================================
     # THUẬT TOÁN ĐIỀU CHỈNH ĐỘ DÀI DỰA THEO Ý ĐỊNH NGƯỜI DÙNG
     # =====================================================
-    is_pure_question = bool(re.search(
-        r'(là (dấu hiệu|triệu chứng|biểu hiện) của bệnh gì)|(là bệnh gì)|((dấu hiệu|triệu chứng|biểu hiện) của (bệnh )?)|(có phải (là )?(dấu hiệu|triệu chứng))',
-        question.lower()
-    ))
+    is_pure_question = bool(_PURE_SYMPTOM_QUESTION.search(question.lower()))
 
     if is_pure_question and len(sentences) > 1:
         main_text = sentences[0].strip()
@@ -562,28 +741,27 @@ def format_sources(retrieved_docs: list) -> str:
     return ", ".join(sources)
 
 
+GREETING_PATTERNS = [
+    r'\bxin chào\b', r'\bchào\b', r'\bhello\b',
+    r'\bhi\b', r'\bhey\b', r'\bchào bạn\b', r'\bchào bot\b'
+]
+_GREETING_PATTERN = re.compile('|'.join(GREETING_PATTERNS))
+
+FAREWELL_TERMS = ['tạm biệt', 'bye', 'goodbye',
+                  'hẹn gặp lại', 'cảm ơn', 'thank']
+
+
 def is_greeting(text: str) -> bool:
     """Kiểm tra xem có phải lời chào không - Dùng Regex Word Boundary (\b)."""
-    import re
-    greetings = [
-        r'\bxin chào\b', r'\bchào\b', r'\bhello\b',
-        r'\bhi\b', r'\bhey\b', r'\bchào bạn\b', r'\bchào bot\b'
-    ]
-    text_lower = text.lower().strip()
-    for pattern in greetings:
-        if re.search(pattern, text_lower):
-            return True
-    return False
+    return _GREETING_PATTERN.search(text.lower().strip()) is not None
 
 # CHÍNH XÁC: ĐÂY LÀ HÀM is_farewell MÀ HỆ THỐNG ĐÃ BÁO LỖI THIẾU
 
 
 def is_farewell(text: str) -> bool:
     """Kiểm tra xem có phải lời tạm biệt không"""
-    farewells = ['tạm biệt', 'bye', 'goodbye',
-                 'hẹn gặp lại', 'cảm ơn', 'thank']
     text_lower = text.lower().strip()
-    return any(farewell in text_lower for farewell in farewells)
+    return any(farewell in text_lower for farewell in FAREWELL_TERMS)
 
 
 def build_messages(
@@ -591,26 +769,52 @@ def build_messages(
     context: str,
     system_prompt: str = None,
     chat_history: list = None,
-    sources: str = ""
+    sources: str = "",
+    token_budget: int = None,
+    budget_report: dict = None
 ) -> list:
-    """Xây dựng messages cho Groq API"""
-    messages = []
-
-    if system_prompt:
-        messages.append({
-            "role": "system",
-            "content": system_prompt
-        })
-    else:
-        messages.append({
-            "role": "system",
-            "content": HEALTH_CHATBOT_SYSTEM_PROMPT
-        })
+    """
+    Xây dựng messages cho Groq API
 
-    if chat_history:
-        for user_msg, bot_msg in chat_history[-5:]:
-            messages.append({"role": "user", "content": user_msg})
-            messages.append({"role": "assistant", "content": bot_msg})
+    Khi có ngân sách token (mặc định PROMPT_TOKEN_BUDGET, 0 = tắt), các lượt lịch sử
+    cũ nhất và các chunk ngữ cảnh hạng thấp nhất bị cắt bỏ trước để prompt vừa ngân sách.
+    Nếu truyền dict `budget_report`, bảng phân bổ của allocate() ('context' là số token của
+    ngữ cảnh) và context thực sự đưa vào prompt (khóa 'context_obj') được ghi vào đó.
+    """
+    from config.config import config
+    from backend.rag.token_budget import allocate
+
+    system_prompt = system_prompt or HEALTH_CHATBOT_SYSTEM_PROMPT
+    history = list(chat_history or [])[-config.PROMPT_MAX_HISTORY_TURNS:]
+    budget = config.PROMPT_TOKEN_BUDGET if token_budget is None else token_budget
+
+    if budget and budget > 0:
+        template_text = RAG_PROMPT_TEMPLATE.format(
+            context="",
+            question=question,
+            sources=sources if sources else "Không có tài liệu nào được truy xuất"
+        )
+        fitted_context, history, report = allocate(
+            system_prompt, template_text, context, history, budget)
+        # Bỏ các nguồn không còn chunk nào trong ngữ cảnh đã cắt
+        if fitted_context is not context and sources:
+            kept_sources = extract_sources_from_context(fitted_context)
+            sources = ", ".join(
+                s for s in sources.split(", ") if s in kept_sources)
+        context = fitted_context
+        if budget_report is not None:
+            budget_report.update(report)
+    if budget_report is not None:
+        budget_report['context_obj'] = context
+
+    messages = [{
+        "role": "system",
+        "content": system_prompt
+    }]
+
+    for user_msg, bot_msg in history:
+        messages.append({"role": "user", "content": user_msg})
+        messages.append({"role": "assistant", "content": bot_msg})
 
     user_message = RAG_PROMPT_TEMPLATE.format(
         context=context,
@@ -631,6 +835,16 @@ Chatbot này chỉ cung cấp thông tin sức khỏe tham khảo, KHÔNG thay t
 Mọi quyết định về sức khỏe cần được thực hiện dưới sự hướng dẫn của bác sĩ hoặc chuyên gia y tế có chứng chỉ hành nghề.
 """
 
+# ==========================================================
+# PHIÊN BẢN PROMPT (PROMPT VERSION)
+# Dấu vân tay của các mẫu prompt gửi lên LLM. Bất kỳ chỉnh sửa nào trên
+# System Prompt hoặc RAG Template đều làm đổi phiên bản, qua đó vô hiệu hóa
+# các câu trả lời đã lưu trong Completion Cache.
+# ==========================================================
+PROMPT_VERSION = hashlib.sha256(
+    (HEALTH_CHATBOT_SYSTEM_PROMPT + RAG_PROMPT_TEMPLATE).encode('utf-8')
+).hexdigest()[:12]
+
 # ==========================================================
 # EXPORT - DANH SÁCH XUẤT MODULE BẮT BUỘC PHẢI CHÍNH XÁC
 # ==========================================================
@@ -640,6 +854,7 @@ __all__ = [
     'RAG_PROMPT_TEMPLATE',
     'sanitize_answer',
     'format_context',
+    'StructuredContext',
     'format_sources',
     'GREETING_RESPONSES',
     'FAREWELL_RESPONSES',
@@ -647,9 +862,13 @@ __all__ = [
     'NO_DOCS_FOUND_RESPONSE',
     'DISCLAIMER_TEXT',
     'violates_policy',
+    'scan_policy_terms',
+    'disease_display_name',
+    'ANSWER_STOP_LABELS',
     'is_greeting',
     'is_farewell',  # Cực kỳ quan trọng: Định danh xuất hàm
     'build_messages',
+    'PROMPT_VERSION',
     'FORBIDDEN_MEDICAL_ADVICE_PATTERNS',
     'FORBIDDEN_PHRASES'
 ]
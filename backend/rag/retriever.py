@@ -312,6 +312,23 @@ class RAGRetriever:
         self.bm25_model = None
         self._build_bm25_index()
 
+        # ============================================
+        # CASCADE DENSE SEARCH (TRUY XUẤT PHÂN TẦNG - TÙY CHỌN)
+        # ============================================
+        # Chỉ kích hoạt khi bật cấu hình và chỉ mục song song của model nhỏ khớp với chỉ mục chính.
+        self.cascade = None
+        if config.EMBEDDING_CASCADE_ENABLED:
+            from backend.rag.cascade import CascadeDenseSearcher
+            cascade = CascadeDenseSearcher(
+                full_embedder=self.embedder, full_store=self.vector_store)
+            if cascade.is_ready:
+                self.cascade = cascade
+                logger.info(
+                    f"Cascade retrieval san sang (fast model: {cascade.fast_embedder.model_name})")
+            else:
+                logger.warning(
+                    "Chi muc fast khong khop voi chi muc chinh, tat cascade retrieval")
+
         if config.DEBUG:
             logger.info(f"Hybrid Retriever san sang! (Top-K: {self.top_k})")
             logger.info(
@@ -339,8 +356,14 @@ class RAGRetriever:
 
         logger.info("Dang build BM25 index...")
 
+        # Bản chữ thường của nội dung được tính một lần tại đây và gắn vào tài liệu
+        # ('content_lower'): các bản sao trả về khi truy xuất mang theo nó, nên bước
+        # boost theo mục và cổng kiểm tra độ liên quan không phải lower() lại mỗi request.
+        for doc in self.vector_store.documents:
+            doc['content_lower'] = doc.get('content', '').lower()
+
         self.bm25_corpus = [
-            self._tokenize_text(doc.get('content', ''))
+            self._tokenize_text(doc['content_lower'])
             for doc in self.vector_store.documents
         ]
 
@@ -383,6 +406,11 @@ class RAGRetriever:
 
         return matched_keywords
 
+    @property
+    def index_version(self) -> str:
+        """Phiên bản nội dung của chỉ mục đang phục vụ (dùng làm namespace cho bộ đệm)"""
+        return getattr(self.vector_store, 'version', None) or 'unversioned'
+
     def load_vector_store(self, path: str = None) -> bool:
         """Load vector store từ file"""
         load_path = path or str(
@@ -402,7 +430,13 @@ class RAGRetriever:
 
     # Hàm truy xuất cốt lõi. Áp dụng quy trình phức hợp 6 bước (Pipeline)
     # để đảm bảo tài liệu đầu ra luôn chuẩn xác nhất có thể.
-    def retrieve(self, query: str, top_k: int = None, apply_threshold: bool = True) -> List[Dict]:
+    def retrieve(
+        self,
+        query: str,
+        top_k: int = None,
+        apply_threshold: bool = True,
+        trace: Dict = None
+    ) -> List[Dict]:
         """
         HYBRID RETRIEVAL với RRF (Reciprocal Rank Fusion) + SMART SECTION BOOSTING
 
@@ -413,6 +447,9 @@ class RAGRetriever:
         4. Section Boosting -> Phạt/Thưởng điểm các tài liệu khớp ý định.
         5. RRF Fusion -> Dung hợp thứ hạng từ 2 hệ thống tìm kiếm.
         6. Re-rank -> Sắp xếp lại và lọc tính đa dạng (Diversity Filter).
+
+        Nếu truyền vào dict `trace`, các kết quả trung gian (intents, bệnh đích,
+        query embedding, tầng dense đã dùng) sẽ được ghi vào để chain tái sử dụng.
         """
         k = top_k or self.top_k
 
@@ -456,8 +493,6 @@ class RAGRetriever:
         # ============================================
         # TÌM KIẾM DENSE (FAISS VECTOR SEARCH)
         # ============================================
-        query_embedding = self.embedder.encode_text(query_for_search)
-
         # Lấy dải truy xuất ban đầu (Initial Retrieval) rộng hơn Top-K
         # để đảm bảo không lọt mất tài liệu tốt.
         candidate_size = config.TOP_K_INITIAL if hasattr(
@@ -466,8 +501,24 @@ class RAGRetriever:
         if config.DEBUG:
             logger.debug(f" Stage 1: Retrieving {candidate_size} candidates")
 
-        dense_results = self.vector_store.search(
-            query_embedding, top_k=candidate_size)
+        if self.cascade:
+            dense_results, query_embedding, dense_tier = self.cascade.search(
+                query_for_search, top_k=candidate_size)
+        else:
+            query_embedding = self.embedder.encode_text(query_for_search)
+            dense_results = self.vector_store.search(
+                query_embedding, top_k=candidate_size)
+            dense_tier = 'full'
+
+        if trace is not None:
+            trace['intents'] = detected_intents
+            trace['target_diseases'] = target_diseases
+            trace['query_for_search'] = query_for_search
+            trace['query_embedding'] = query_embedding
+            trace['dense_tier'] = dense_tier
+            trace['embedder'] = (self.cascade.fast_embedder
+                                 if dense_tier == 'fast' else self.embedder)
+            trace['bm25_idf'] = self.bm25_model.idf if self.bm25_model else None
 
         # Trích xuất và lưu thứ hạng (Rank) của FAISS vào biến dense_ranks.
         dense_ranks = {}
@@ -537,7 +588,7 @@ class RAGRetriever:
 
             # [THUẬT TOÁN ĐIỀU CHỈNH ĐIỂM SỐ]: Tăng trọng số cho mục tương ứng với Ý định (Intent)
             if section_keywords and doc:
-                content = doc.get('content', '').lower()
+                content = doc.get('content_lower') or doc.get('content', '').lower()
                 metadata = doc.get('metadata', {})
                 section_title = metadata.get('section_title', '').lower()
                 boost_factor = 1.0
@@ -612,7 +663,9 @@ class RAGRetriever:
         # BỘ LỌC NGƯỠNG VÀ TÍNH ĐA DẠNG (THRESHOLD & DIVERSITY FILTERING)
         # ============================================
         if apply_threshold:
-            threshold = config.RELEVANCE_THRESHOLD
+            # Khoảng cách L2 của model nhỏ nằm trên thang đo khác PhoBERT nên cần ngưỡng riêng.
+            threshold = (config.CASCADE_FAST_RELEVANCE_THRESHOLD
+                         if dense_tier == 'fast' else config.RELEVANCE_THRESHOLD)
 
             # Cắt bỏ các tài liệu có khoảng cách L2 (dense_score) cao hơn ngưỡng cho phép.
             filtered = [doc for doc in final_results
@@ -781,9 +834,12 @@ class RAGRetriever:
         """Lấy thống kê về retriever"""
         vs_stats = self.vector_store.get_stats()
 
-        return {
+        stats = {
             'vector_store': vs_stats,
             'embedding_dim': self.embedder.embedding_dim,
             'top_k': self.top_k,
             'total_documents': vs_stats['total_documents']
         }
+        if self.cascade:
+            stats['cascade'] = self.cascade.get_stats()
+        return stats
@@ -0,0 +1,199 @@
+"""
+Model Router - Định tuyến câu hỏi tới model nhỏ (độ trễ thấp) hoặc model lớn (70B)
+"""
+from config.config import config
+from backend.api.rate_limiter import estimate_tokens
+from backend.utils.logger import get_logger
+from typing import Callable, Dict, List, Tuple
+import random
+import re
+import threading
+import time
+
+logger = get_logger(__name__)
+
+ROUTE_SMALL = 'small'
+ROUTE_LARGE = 'large'
+
+# Các ý định đòi hỏi suy luận tổng hợp nhiều nguồn -> luôn dùng model lớn
+_COMPLEX_INTENTS = {'comparison', 'disease_from_symptom', 'general'}
+
+
+def _word_set(text: str) -> set:
+    return set(re.findall(r'\w+', (text or '').lower()))
+
+
+def _sources_of(answer: str) -> set:
+    match = re.search(r'Nguồn:\s*(.+)$', answer or '', re.IGNORECASE)
+    if not match:
+        return set()
+    return {s.strip().lower() for s in match.group(1).split(',') if s.strip()}
+
+
+# Lớp ModelRouter quyết định model cho từng câu hỏi dựa trên độ phức tạp:
+# - Model NHỎ: câu hỏi đơn ý định (vd: chỉ hỏi triệu chứng), tối đa một bệnh đích,
+#   ngữ cảnh ngắn và lịch sử hội thoại ngắn -> câu trả lời gần như nằm gọn trong một mục tài liệu.
+# - Model LỚN: so sánh, đa bệnh, suy luận từ triệu chứng, ngữ cảnh/lịch sử dài.
+#
+# Ba chế độ (ROUTER_MODE):
+# - 'off': luôn dùng model lớn (hành vi cũ).
+# - 'shadow': vẫn trả lời bằng model lớn, nhưng với một tỉ lệ câu hỏi đủ điều kiện đi model nhỏ,
+#   gọi thêm model nhỏ trên thread nền và so sánh kết quả (độ trùng từ vựng, khớp nguồn,
+#   có bị cổng an toàn chặn không) để ước lượng tác động chất lượng TRƯỚC khi bật thật.
+# - 'active': định tuyến thật.
+
+
+class ModelRouter:
+    """Định tuyến theo độ phức tạp + thống kê theo tuyến + chế độ shadow"""
+
+    def __init__(self, mode: str = None, shadow_rate: float = None):
+        """
+        Args:
+            mode: 'off' | 'shadow' | 'active' (mặc định theo ROUTER_MODE)
+            shadow_rate: Tỉ lệ (0-1) câu hỏi đủ điều kiện được chạy song song model nhỏ ở chế độ shadow
+        """
+        self.mode = (mode or config.ROUTER_MODE).lower()
+        self.shadow_rate = config.ROUTER_SHADOW_RATE if shadow_rate is None else shadow_rate
+        self._lock = threading.Lock()
+        self._routes = {
+            route: {'requests': 0, 'latency_total': 0.0,
+                    'prompt_tokens': 0, 'completion_tokens': 0}
+            for route in (ROUTE_SMALL, ROUTE_LARGE)
+        }
+        self._decisions = {ROUTE_SMALL: 0, ROUTE_LARGE: 0}
+        self._shadow = {
+            'runs': 0, 'errors': 0, 'similarity_total': 0.0,
+            'source_agree': 0, 'small_fallback': 0, 'large_fallback': 0,
+            'latency_small_total': 0.0, 'latency_large_total': 0.0
+        }
+
+    def decide(
+        self,
+        intents: List[str],
+        target_diseases: List[str],
+        context: str,
+        chat_history: List[Tuple[str, str]] = None
+    ) -> str:
+        """
+        Phân loại độ phức tạp của câu hỏi
+
+        Returns:
+            str: 'small' hoặc 'large' (đề xuất, chưa xét chế độ)
+        """
+        history_turns = len(chat_history or [])
+        simple = (
+            len(intents) == 1
+            and intents[0] not in _COMPLEX_INTENTS
+            and len(target_diseases) <= 1
+            and len(context) <= config.ROUTER_SMALL_MAX_CONTEXT_CHARS
+            and history_turns <= config.ROUTER_SMALL_MAX_HISTORY_TURNS
+        )
+        route = ROUTE_SMALL if simple else ROUTE_LARGE
+        with self._lock:
+            self._decisions[route] += 1
+        logger.info(
+            f"Router: intents={intents}, diseases={len(target_diseases)}, context={len(context)} chars, "
+            f"history={history_turns} -> {route} (mode={self.mode})")
+        return route
+
+    def effective_route(self, suggested: str) -> str:
+        """Tuyến thực sự dùng để trả lời (chỉ 'active' mới đi model nhỏ)"""
+        return suggested if self.mode == 'active' else ROUTE_LARGE
+
+    def record(self, route: str, latency: float, messages: List[Dict[str, str]], answer: str):
+        """Ghi nhận độ trễ và số token (ước lượng) của một lệnh gọi LLM theo tuyến"""
+        with self._lock:
+            stats = self._routes[route]
+            stats['requests'] += 1
+            stats['latency_total'] += latency
+            stats['prompt_tokens'] += estimate_tokens(messages)
+            stats['completion_tokens'] += estimate_tokens(
+                [{'content': answer or ''}]) - 4
+
+    def should_shadow(self, suggested: str) -> bool:
+        return (self.mode == 'shadow' and suggested == ROUTE_SMALL
+                and random.random() < self.shadow_rate)
+
+    def run_shadow(
+        self,
+        call_small: Callable[[], str],
+        finalize: Callable[[str], str],
+        large_answer: str,
+        large_latency: float,
+        fallback_answers: Tuple[str, ...]
+    ):
+        """
+        Chạy model nhỏ trên thread nền và so sánh với câu trả lời của model lớn
+
+        Args:
+            call_small: Hàm gọi model nhỏ với cùng messages, trả về câu trả lời thô
+            finalize: Hàm hậu xử lý của chain (áp dụng cùng các cổng an toàn)
+            large_answer: Câu trả lời cuối cùng của model lớn
+            large_latency: Độ trễ của model lớn (giây)
+            fallback_answers: Các câu trả lời fallback (dùng để phát hiện bị chặn)
+        """
+        def _is_fallback(answer: str) -> bool:
+            return any(answer.startswith(fb) for fb in fallback_answers)
+
+        def _worker():
+            start = time.time()
+            try:
+                small_answer = finalize(call_small())
+            except Exception as e:
+                logger.warning(f"Router shadow: model nho loi ({e})")
+                with self._lock:
+                    self._shadow['errors'] += 1
+                return
+            latency = time.time() - start
+
+            large_words = _word_set(large_answer)
+            small_words = _word_set(small_answer)
+            union = large_words | small_words
+            similarity = len(large_words & small_words) / \
+                len(union) if union else 1.0
+
+            with self._lock:
+                shadow = self._shadow
+                shadow['runs'] += 1
+                shadow['similarity_total'] += similarity
+                shadow['source_agree'] += int(
+                    _sources_of(small_answer) == _sources_of(large_answer))
+                shadow['small_fallback'] += int(_is_fallback(small_answer))
+                shadow['large_fallback'] += int(_is_fallback(large_answer))
+                shadow['latency_small_total'] += latency
+                shadow['latency_large_total'] += large_latency
+            self.record(ROUTE_SMALL, latency, [], small_answer)
+
+        threading.Thread(target=_worker, name="router-shadow",
+                         daemon=True).start()
+
+    def get_stats(self) -> Dict:
+        """Thống kê theo tuyến và kết quả shadow"""
+        with self._lock:
+            routes = {}
+            for route, s in self._routes.items():
+                n = s['requests']
+                routes[route] = {
+                    'requests': n,
+                    'avg_latency_s': round(s['latency_total'] / n, 3) if n else None,
+                    'prompt_tokens': s['prompt_tokens'],
+                    'completion_tokens': s['completion_tokens']
+                }
+            sh = self._shadow
+            runs = sh['runs']
+            shadow = {
+                'runs': runs,
+                'errors': sh['errors'],
+                'avg_similarity': round(sh['similarity_total'] / runs, 3) if runs else None,
+                'source_agreement': round(sh['source_agree'] / runs, 3) if runs else None,
+                'small_fallback_rate': round(sh['small_fallback'] / runs, 3) if runs else None,
+                'large_fallback_rate': round(sh['large_fallback'] / runs, 3) if runs else None,
+                'avg_latency_small_s': round(sh['latency_small_total'] / runs, 3) if runs else None,
+                'avg_latency_large_s': round(sh['latency_large_total'] / runs, 3) if runs else None
+            }
+            return {
+                'mode': self.mode,
+                'decisions': dict(self._decisions),
+                'routes': routes,
+                'shadow': shadow
+            }
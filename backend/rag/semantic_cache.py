@@ -0,0 +1,180 @@
+"""
+Semantic Cache - Bộ đệm câu trả lời cho các câu hỏi gần trùng nghĩa (dựa trên query embedding)
+"""
+from config.config import config
+from backend.utils.logger import get_logger
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+import faiss
+import itertools
+import numpy as np
+import threading
+
+logger = get_logger(__name__)
+
+# Người dùng hỏi cùng một ý theo nhiều cách ("cúm có triệu chứng gì", "dấu hiệu bệnh cúm"),
+# nên bộ đệm khớp chính xác (CompletionCache, khóa theo toàn bộ prompt) trượt phần lớn.
+# SemanticCache tái sử dụng query embedding mà retrieve() đã tính (ctx.trace), tìm trong một
+# chỉ mục FAISS nhỏ các câu hỏi đã trả lời, và chỉ trả lại câu trả lời cũ khi:
+#   - khoảng cách cosine <= SEMANTIC_CACHE_MAX_DISTANCE (ngưỡng chặt), và
+#   - ý định (QueryIntent) và bệnh đích (DiseaseDetector) của hai câu hỏi trùng khớp,
+#     để "triệu chứng cúm" không bao giờ nhận câu trả lời của "phòng ngừa cúm".
+#
+# Chỉ câu hỏi mở đầu (không có lịch sử chat) mới được tra cứu/lưu. Mỗi tầng embedding
+# (cascade 'fast' / 'full') có chỉ mục riêng vì số chiều khác nhau. Vượt SEMANTIC_CACHE_SIZE
+# bản ghi -> loại bản ghi ít dùng gần đây nhất (LRU); phiên bản chỉ mục đổi -> xóa toàn bộ.
+
+
+def _unit(embedding) -> np.ndarray:
+    """Vector hàng float32 đã chuẩn hóa (tích vô hướng = độ tương đồng cosine)"""
+    vector = np.asarray(embedding, dtype='float32').reshape(1, -1).copy()
+    faiss.normalize_L2(vector)
+    return vector
+
+
+class SemanticCache:
+    """Bộ đệm LRU tra cứu theo láng giềng gần nhất của query embedding"""
+
+    def __init__(self, max_entries: int = None, max_distance: float = None, candidates: int = None):
+        """
+        Args:
+            max_entries: Số câu hỏi tối đa được ghi nhớ
+            max_distance: Khoảng cách cosine (1 - cos) tối đa để coi là cùng câu hỏi
+            candidates: Số láng giềng gần nhất được xét khi tra cứu
+        """
+        self.max_entries = max_entries or config.SEMANTIC_CACHE_SIZE
+        self.max_distance = config.SEMANTIC_CACHE_MAX_DISTANCE if max_distance is None else max_distance
+        self.candidates = candidates or config.SEMANTIC_CACHE_CANDIDATES
+
+        self._lock = threading.Lock()
+        self._indexes: Dict[str, faiss.Index] = {}  # tầng embedding -> chỉ mục FAISS
+        self._entries: "OrderedDict[int, Dict]" = OrderedDict()  # id -> bản ghi (thứ tự LRU)
+        self._ids = itertools.count()
+        self._index_version = None
+
+        self._hits = 0
+        self._misses = 0
+        self._rejected = 0  # đủ gần nhưng khác ý định / bệnh đích
+        self._stores = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    @staticmethod
+    def _signature(intents: Iterable[str], diseases: Iterable[str]) -> tuple:
+        return tuple(sorted(set(intents or ()))), tuple(sorted(set(diseases or ())))
+
+    def _check_version(self, index_version: str):
+        """Xóa toàn bộ khi phiên bản chỉ mục đổi (gọi khi đang giữ khóa)"""
+        if index_version == self._index_version:
+            return
+        if self._entries:
+            self._invalidations += 1
+            logger.info(
+                f"Semantic cache: chi muc doi ({self._index_version} -> {index_version}), "
+                f"xoa {len(self._entries)} ban ghi")
+        self._indexes.clear()
+        self._entries.clear()
+        self._index_version = index_version
+
+    def _index_for(self, tier: str, dimension: int) -> faiss.Index:
+        index = self._indexes.get(tier)
+        if index is None:
+            index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+            self._indexes[tier] = index
+        return index
+
+    def get(
+        self,
+        embedding,
+        intents: Iterable[str],
+        diseases: Iterable[str],
+        index_version: str,
+        tier: str = 'full'
+    ) -> Optional[str]:
+        """
+        Tra cứu câu trả lời của một câu hỏi gần trùng nghĩa
+
+        Args:
+            embedding: Query embedding do retrieve() tính
+            intents: Ý định của câu hỏi
+            diseases: File bệnh đích của câu hỏi
+            index_version: Phiên bản chỉ mục đang phục vụ
+            tier: Tầng embedding đã dùng ('fast' / 'full')
+
+        Returns:
+            Optional[str]: Câu trả lời đã đệm, None nếu không có câu hỏi đủ gần
+        """
+        if embedding is None:
+            return None
+        signature = self._signature(intents, diseases)
+        vector = _unit(embedding)
+        with self._lock:
+            self._check_version(index_version)
+            index = self._indexes.get(tier)
+            if index is None or index.ntotal == 0:
+                self._misses += 1
+                return None
+            scores, ids = index.search(vector, min(self.candidates, index.ntotal))
+            near = False
+            for score, entry_id in zip(scores[0], ids[0]):
+                if entry_id < 0 or 1.0 - float(score) > self.max_distance:
+                    continue
+                near = True
+                entry = self._entries[int(entry_id)]
+                if entry['signature'] == signature:
+                    self._entries.move_to_end(int(entry_id))
+                    self._hits += 1
+                    logger.info(
+                        f"Semantic cache HIT (d={1.0 - float(score):.3f}): '{entry['question'][:60]}'")
+                    return entry['answer']
+            if near:
+                self._rejected += 1
+            self._misses += 1
+            return None
+
+    def put(
+        self,
+        question: str,
+        embedding,
+        intents: Iterable[str],
+        diseases: Iterable[str],
+        answer: str,
+        index_version: str,
+        tier: str = 'full'
+    ):
+        """Ghi nhớ câu trả lời cuối cùng của một câu hỏi mở đầu"""
+        if embedding is None or not answer:
+            return
+        vector = _unit(embedding)
+        with self._lock:
+            self._check_version(index_version)
+            entry_id = next(self._ids)
+            self._index_for(tier, vector.shape[1]).add_with_ids(
+                vector, np.array([entry_id], dtype='int64'))
+            self._entries[entry_id] = {
+                'question': question,
+                'answer': answer,
+                'signature': self._signature(intents, diseases),
+                'tier': tier
+            }
+            self._stores += 1
+            while len(self._entries) > self.max_entries:
+                old_id, old = self._entries.popitem(last=False)
+                self._indexes[old['tier']].remove_ids(np.array([old_id], dtype='int64'))
+                self._evictions += 1
+
+    def get_stats(self) -> Dict:
+        """Tỉ lệ trúng bộ đệm và số bản ghi"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'index_version': self._index_version,
+                'entries': len(self._entries),
+                'hits': self._hits,
+                'misses': self._misses,
+                'rejected_by_intent_or_disease': self._rejected,
+                'stores': self._stores,
+                'evictions': self._evictions,
+                'invalidations': self._invalidations,
+                'hit_rate': round(self._hits / lookups, 3) if lookups else 0.0
+            }
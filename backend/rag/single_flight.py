@@ -0,0 +1,198 @@
+"""
+Single-flight - Gộp các câu hỏi giống hệt nhau đang được xử lý đồng thời
+"""
+from backend.utils.query_normalizer import normalize_query
+from backend.api.resilience import CancellationToken
+from backend.utils.logger import get_logger
+from typing import Callable, Dict, Generator, Iterable, List, Optional, Tuple
+import hashlib
+import threading
+
+logger = get_logger(__name__)
+
+# Trong mùa dịch (vd: sốt xuất huyết), rất nhiều người dùng gửi cùng một câu hỏi đầu tiên
+# trong vài giây. Thay vì mỗi request tự chạy Retrieval + gọi Groq, request đến trước
+# khởi động MỘT lượt xử lý (flight); các request giống hệt đến sau chỉ "đăng ký theo dõi"
+# (subscribe) cùng luồng token và câu trả lời cuối cùng của lượt đó.
+#
+# Lượt xử lý chạy trên một thread nền độc lập với người gửi, nên khi người đầu tiên
+# ngắt kết nối, những người đăng ký còn lại vẫn nhận đủ câu trả lời. Chỉ khi NGƯỜI
+# ĐĂNG KÝ CUỐI CÙNG rời đi trước lúc lượt kết thúc, token hủy của lượt mới được kích hoạt
+# (producer lấy token qua SingleFlight.current_cancel_token()) để dừng gọi LLM vô ích.
+
+# Token hủy của lượt đang chạy trên thread producer hiện tại
+_producer_context = threading.local()
+
+
+class _Flight:
+    """Một lượt xử lý đang chạy: bộ đệm các phần đã sinh + trạng thái kết thúc"""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[Exception] = None
+        self.subscribers = 0
+        self.cond = threading.Condition()
+        self.cancel_token = CancellationToken()
+
+    def publish(self, chunk: str):
+        with self.cond:
+            self.chunks.append(chunk)
+            self.cond.notify_all()
+
+    def finish(self, error: Exception = None):
+        with self.cond:
+            self.error = error
+            self.done = True
+            self.cond.notify_all()
+
+    def follow(self, cancel_token: CancellationToken = None) -> Generator[str, None, None]:
+        """Phát lại các phần đã có rồi tiếp tục nhận phần mới cho tới khi lượt kết thúc"""
+        position = 0
+        while True:
+            with self.cond:
+                while position >= len(self.chunks) and not self.done:
+                    if cancel_token is not None:
+                        cancel_token.check()
+                    self.cond.wait(timeout=1.0)
+                new_chunks = self.chunks[position:]
+                position = len(self.chunks)
+                finished = self.done
+                error = self.error
+            for chunk in new_chunks:
+                yield chunk
+            if finished:
+                if error is not None:
+                    raise error
+                return
+
+
+class SingleFlight:
+    """Gộp request trùng lặp theo khóa (câu hỏi chuẩn hóa, lịch sử rỗng, phiên bản chỉ mục)"""
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+
+        # Số liệu giám sát
+        self._started = 0
+        self._coalesced = 0
+        self._max_subscribers = 0
+
+    @staticmethod
+    def make_key(question: str, chat_history: Iterable = None, index_version: str = "") -> Optional[str]:
+        """
+        Tạo khóa gộp cho một câu hỏi
+
+        Chỉ câu hỏi MỞ ĐẦU hội thoại (lịch sử rỗng) mới được gộp: khi đã có lịch sử,
+        prompt phụ thuộc vào từng cuộc hội thoại riêng nên trả về None (không gộp).
+
+        Returns:
+            Optional[str]: Khóa gộp hoặc None
+        """
+        if chat_history:
+            return None
+        normalized = normalize_query(question or "").strip().lower()
+        if not normalized:
+            return None
+        raw = f"{normalized}|empty_history|{index_version}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def current_cancel_token() -> Optional[CancellationToken]:
+        """Token hủy của lượt đang chạy (chỉ có giá trị bên trong producer)"""
+        return getattr(_producer_context, 'cancel_token', None)
+
+    def _run(self, key: str, flight: _Flight, producer: Callable[[], Iterable[str]]):
+        error = None
+        _producer_context.cancel_token = flight.cancel_token
+        try:
+            for chunk in producer():
+                flight.publish(chunk)
+        except Exception as e:  # Chuyển lỗi cho toàn bộ subscriber
+            error = e
+            if 'REQUEST_CANCELLED' in str(e):
+                logger.info("Single-flight: luot xu ly da bi huy")
+            else:
+                logger.error(f"Single-flight producer loi: {e}")
+        finally:
+            # Gỡ lượt khỏi bảng TRƯỚC khi báo kết thúc: request đến sau sẽ mở lượt mới
+            # (và thường trúng Completion Cache) thay vì bám vào một lượt đã xong.
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.finish(error)
+
+    def _join(self, key: str, producer: Callable[[], Iterable[str]]) -> Tuple[_Flight, bool]:
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+                self._started += 1
+            else:
+                self._coalesced += 1
+            flight.subscribers += 1
+            self._max_subscribers = max(
+                self._max_subscribers, flight.subscribers)
+
+        if leader:
+            threading.Thread(
+                target=self._run, args=(key, flight, producer),
+                name="single-flight", daemon=True
+            ).start()
+        else:
+            logger.info(
+                f"Single-flight: gop request trung lap ({flight.subscribers} subscribers)")
+        return flight, leader
+
+    def stream(
+        self,
+        key: str,
+        producer: Callable[[], Iterable[str]],
+        cancel_token: CancellationToken = None
+    ) -> Generator[str, None, None]:
+        """
+        Đăng ký vào lượt xử lý của `key` (tạo mới nếu chưa có) và nhận luồng kết quả
+
+        Args:
+            key: Khóa gộp (xem make_key)
+            producer: Hàm tạo generator thực hiện công việc thật (chỉ chạy ở request đầu tiên)
+            cancel_token: Token hủy của người đăng ký này (ngừng theo dõi khi bị hủy)
+
+        Yields:
+            str: Các phần kết quả theo đúng thứ tự producer sinh ra
+        """
+        flight, _ = self._join(key, producer)
+        try:
+            yield from flight.follow(cancel_token)
+        finally:
+            with self._lock:
+                with flight.cond:
+                    flight.subscribers -= 1
+                    abandoned = flight.subscribers == 0 and not flight.done
+                # Gỡ lượt bị bỏ rơi khỏi bảng để request mới không bám vào lượt sắp bị hủy
+                if abandoned and self._flights.get(key) is flight:
+                    del self._flights[key]
+            if abandoned:
+                logger.info("Single-flight: khong con subscriber, huy luot xu ly")
+                flight.cancel_token.cancel("all_subscribers_left")
+
+    def call(self, key: str, fn: Callable[[], str]) -> str:
+        """Phiên bản không streaming: trả về kết quả cuối cùng của lượt xử lý"""
+        return "".join(self.stream(key, lambda: iter([fn()])))
+
+    def get_stats(self) -> Dict:
+        """Thống kê số lượt xử lý và số request được gộp"""
+        with self._lock:
+            in_flight = list(self._flights.values())
+            total = self._started + self._coalesced
+            return {
+                'in_flight': len(in_flight),
+                'current_subscribers': sum(f.subscribers for f in in_flight),
+                'flights_started': self._started,
+                'requests_coalesced': self._coalesced,
+                'max_subscribers': self._max_subscribers,
+                'coalesce_rate': round(self._coalesced / total, 3) if total else 0.0
+            }
@@ -0,0 +1,188 @@
+"""
+Token Budget - Phân bổ ngân sách token cho prompt (System Prompt, Context, Lịch sử)
+"""
+from config.config import config
+from backend.rag.prompts import StructuredContext
+from backend.utils.logger import get_logger
+from typing import Dict, List, Optional, Tuple
+
+logger = get_logger(__name__)
+
+# Bộ đếm token cục bộ: dùng tiktoken nếu có (không cần mạng sau lần tải đầu),
+# nếu không thì ước lượng theo số ký tự (~3 ký tự/token với tiếng Việt có dấu,
+# cùng hệ số với bộ giới hạn tốc độ để hai nơi ước lượng nhất quán).
+try:
+    import tiktoken
+    _ENCODER = tiktoken.get_encoding(config.PROMPT_TOKENIZER)
+except Exception:
+    _ENCODER = None
+
+# Dấu phân cách giữa các chunk do format_context sinh ra
+CHUNK_SEPARATOR = "\n---\n"
+
+# Chi phí cố định mỗi message trong định dạng chat (role + ký tự điều khiển)
+_MESSAGE_OVERHEAD = 4
+
+# Dấu hiệu nội dung đã bị cắt bớt
+_TRUNCATION_MARK = " …"
+
+
+def count_tokens(text: str) -> int:
+    """Đếm số token của một chuỗi"""
+    if not text:
+        return 0
+    if _ENCODER is not None:
+        return len(_ENCODER.encode(text, disallowed_special=()))
+    return len(text) // 3 + 1
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cắt chuỗi về tối đa `max_tokens` token (cắt tại ranh giới từ khi có thể)"""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _ENCODER is not None:
+        cut = _ENCODER.decode(_ENCODER.encode(
+            text, disallowed_special=())[:max_tokens])
+    else:
+        cut = text[:max_tokens * 3]
+    space = cut.rfind(' ')
+    if space > len(cut) // 2:
+        cut = cut[:space]
+    return cut.rstrip() + _TRUNCATION_MARK
+
+
+# ==========================================================
+# PHÂN BỔ NGÂN SÁCH
+# Thứ tự ưu tiên (giữ lại trước, cắt bỏ sau):
+#   1. System Prompt + khung RAG template + câu hỏi (bắt buộc, không cắt)
+#   2. Các chunk ngữ cảnh theo thứ hạng truy xuất (chunk hạng thấp bị bỏ trước;
+#      chunk cuối cùng còn chỗ có thể bị cắt bớt nội dung, giữ nguyên dòng tiêu đề)
+#   3. Lịch sử hội thoại, từ lượt MỚI nhất về cũ (lượt cũ nhất bị bỏ trước;
+#      mỗi câu trả lời cũ của bot bị cắt về PROMPT_HISTORY_TURN_TOKENS)
+# Lịch sử được giới hạn trong PROMPT_HISTORY_SHARE của phần ngân sách còn lại để
+# một cuộc hội thoại dài không bao giờ đẩy ngữ cảnh y khoa ra khỏi prompt.
+# ==========================================================
+
+
+def _fit_history(
+    chat_history: List[Tuple[str, str]],
+    max_tokens: int
+) -> Tuple[List[Tuple[str, str]], int]:
+    """Chọn các lượt hội thoại mới nhất vừa với ngân sách"""
+    kept = []
+    used = 0
+    turn_cap = config.PROMPT_HISTORY_TURN_TOKENS
+    for user_msg, bot_msg in reversed(chat_history):
+        user_msg = truncate_to_tokens(user_msg, turn_cap)
+        bot_msg = truncate_to_tokens(bot_msg, turn_cap)
+        cost = count_tokens(user_msg) + count_tokens(bot_msg) + \
+            2 * _MESSAGE_OVERHEAD
+        if used + cost > max_tokens:
+            break
+        kept.append((user_msg, bot_msg))
+        used += cost
+    kept.reverse()
+    return kept, used
+
+
+def _chunk_count(context) -> int:
+    if isinstance(context, StructuredContext):
+        return len(context.chunks)
+    return len(context.split(CHUNK_SEPARATOR)) if context else 0
+
+
+def _fit_context(context, max_tokens: int) -> Tuple[object, int, int]:
+    """
+    Giữ các chunk hạng cao nhất vừa với ngân sách; trả về (context, số chunk giữ, token)
+
+    `context` là StructuredContext (kết quả trả về cùng kiểu, giữ nguyên đối tượng nếu
+    không phải cắt gì) hoặc chuỗi đã render.
+    """
+    structured = isinstance(context, StructuredContext)
+    chunks = [c.render() for c in context.chunks] if structured \
+        else context.split(CHUNK_SEPARATOR)
+    kept = 0
+    used = 0
+    last_body = None
+    sep_cost = count_tokens(CHUNK_SEPARATOR)
+    for chunk in chunks:
+        cost = count_tokens(chunk) + (sep_cost if kept else 0)
+        if used + cost <= max_tokens:
+            kept += 1
+            used += cost
+            continue
+        # Cắt bớt chunk đầu tiên không vừa nếu phần còn lại đủ lớn để có ích
+        room = max_tokens - used - (sep_cost if kept else 0)
+        header, _, body = chunk.partition("\n")
+        body_room = room - count_tokens(header) - 1
+        if body_room >= config.PROMPT_MIN_CHUNK_TOKENS:
+            last_body = truncate_to_tokens(body, body_room)
+            chunks[kept] = f"{header}\n{last_body}"
+            kept += 1
+            used += count_tokens(chunks[kept - 1]) + \
+                (sep_cost if kept > 1 else 0)
+        break
+
+    if structured:
+        if kept == len(chunks) and last_body is None:
+            return context, kept, used
+        return context.truncated(kept, last_body), kept, used
+    return CHUNK_SEPARATOR.join(chunks[:kept]), kept, used
+
+
+def allocate(
+    system_prompt: str,
+    template_text: str,
+    context: str,
+    chat_history: Optional[List[Tuple[str, str]]],
+    budget: int
+) -> Tuple[str, List[Tuple[str, str]], Dict]:
+    """
+    Phân bổ ngân sách token cho prompt
+
+    Args:
+        system_prompt: Chỉ thị hệ thống
+        template_text: RAG template đã điền câu hỏi/nguồn nhưng CHƯA có context
+        context: Ngữ cảnh đã định dạng (StructuredContext hoặc chuỗi, các chunk theo thứ hạng)
+        chat_history: Lịch sử [(user, bot), ...] đã giới hạn số lượt
+        budget: Tổng số token tối đa cho đầu vào
+
+    Returns:
+        Tuple: (context đã cắt, lịch sử đã cắt, bảng phân bổ)
+    """
+    chat_history = chat_history or []
+    fixed = count_tokens(system_prompt) + count_tokens(template_text) + \
+        2 * _MESSAGE_OVERHEAD
+    available = max(budget - fixed, 0)
+
+    history, history_used = _fit_history(
+        chat_history, int(available * config.PROMPT_HISTORY_SHARE))
+    context_budget = available - history_used
+    fitted_context, chunks_kept, context_used = _fit_context(
+        context, context_budget)
+
+    # Ngữ cảnh ngắn hơn dự kiến -> nhường phần dư cho các lượt lịch sử cũ hơn
+    spare = context_budget - context_used
+    if spare > 0 and len(history) < len(chat_history):
+        history, history_used = _fit_history(
+            chat_history, history_used + spare)
+
+    report = {
+        'budget': budget,
+        'fixed': fixed,
+        'context': context_used,
+        'history': history_used,
+        'total': fixed + context_used + history_used,
+        'chunks_kept': chunks_kept,
+        'chunks_total': _chunk_count(context),
+        'turns_kept': len(history),
+        'turns_total': len(chat_history),
+        'tokenizer': config.PROMPT_TOKENIZER if _ENCODER is not None else 'heuristic'
+    }
+    logger.info(
+        f"Token budget: {report['total']}/{budget} (fixed={fixed}, context={context_used} "
+        f"[{chunks_kept}/{report['chunks_total']} chunks], history={history_used} "
+        f"[{len(history)}/{len(chat_history)} turns], tokenizer={report['tokenizer']})")
+    return fitted_context, history, report
@@ -0,0 +1,179 @@
+"""
+Multi-pattern Matcher - Dò tìm đồng thời nhiều cụm từ trong một lượt quét văn bản
+"""
+import re
+from typing import Dict, Iterable, List, NamedTuple
+
+# Các bộ lọc an toàn kiểm tra hàng chục cụm từ (tên bệnh, câu chẩn đoán...) bằng
+# `term in text` lần lượt: mỗi cụm từ là một lần quét toàn bộ văn bản. Ở đây mọi cụm
+# từ được gộp thành MỘT cây tiền tố (trie) rồi biên dịch thành một regex duy nhất, nên
+# bộ máy regex (viết bằng C) chỉ đi qua văn bản một lần và tại mỗi vị trí chỉ thử các
+# nhánh khớp ký tự đầu. (Một automaton Aho-Corasick viết bằng Python thuần chậm hơn
+# vài lần so với chuỗi phép `in` cũ do chi phí vòng lặp theo từng ký tự.)
+#
+# Regex trả về cụm từ DÀI NHẤT tại vị trí khớp sớm nhất. Mọi cụm từ nằm trọn bên trong nó
+# (kể cả các tiền tố) được suy ra từ bảng tính sẵn; lượt tìm kế tiếp bắt đầu tại vị trí sớm
+# nhất mà một cụm từ khác có thể bắt đầu và vượt ra ngoài nó. Kết quả là mọi lần xuất hiện
+# (kể cả chồng lấn) kèm vị trí, tương đương hoàn toàn phép `in` trên từng cụm từ.
+# Mỗi cụm từ mang một hay nhiều nhãn (danh sách chính sách mà nó thuộc về).
+
+
+class Match(NamedTuple):
+    """Một lần xuất hiện: vị trí bắt đầu/kết thúc (không gồm) trong văn bản, cụm từ, nhãn"""
+    start: int
+    end: int
+    term: str
+    labels: frozenset
+
+
+def _trie_pattern(node: Dict) -> str:
+    """Chuyển cây tiền tố thành regex; nhánh dài được ưu tiên (lượng từ tham lam)"""
+    terminal = '' in node
+    branches = [re.escape(char) + _trie_pattern(child)
+                for char, child in sorted(node.items()) if char != '']
+    if not branches:
+        return ''
+    body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    if terminal:
+        body = ('(?:' + body + ')' if len(branches) == 1 and len(body) > 1 else body) + '?'
+    return body
+
+
+class MultiPatternMatcher:
+    """Bộ dò nhiều cụm từ, biên dịch một lần và dùng lại (an toàn khi đọc đồng thời)"""
+
+    def __init__(self, terms: Dict[str, Iterable[str]]):
+        """
+        Args:
+            terms: {nhãn: danh sách cụm từ (chữ thường)}
+        """
+        labels: Dict[str, set] = {}
+        for label, items in terms.items():
+            for term in items:
+                if term:
+                    labels.setdefault(term, set()).add(label)
+        self._labels = {term: frozenset(ls) for term, ls in labels.items()}
+        self.max_length = max((len(t) for t in self._labels), default=0)
+
+        # Với mỗi cụm từ T: vị trí tìm tiếp (độ lệch nhỏ nhất >= 1 mà phần đuôi của T là tiền tố
+        # thực sự của một cụm từ khác) và các cụm từ nằm trọn trong T trước vị trí đó
+        self._restart: Dict[str, int] = {}
+        self._within: Dict[str, List] = {}
+        for term in self._labels:
+            restart = next(
+                (o for o in range(1, len(term)) if any(
+                    len(t) > len(term) - o and t.startswith(term[o:]) for t in self._labels)),
+                len(term))
+            self._restart[term] = restart
+            self._within[term] = [
+                (o, t, self._labels[t]) for o in range(restart) for t in self._labels
+                if term.startswith(t, o)]
+
+        trie: Dict = {}
+        for term in self._labels:
+            node = trie
+            for char in term:
+                node = node.setdefault(char, {})
+            node[''] = True
+        self._regex = re.compile(_trie_pattern(trie)) if trie else None
+
+    def _occurrences(self, text: str):
+        """Sinh (vị trí bắt đầu, cụm từ, nhãn) cho mọi lần xuất hiện"""
+        if self._regex is None or not text:
+            return
+        search = self._regex.search
+        found = search(text)
+        while found is not None:
+            start = found.start()
+            longest = found.group()
+            for offset, term, labels in self._within[longest]:
+                yield start + offset, term, labels
+            found = search(text, start + self._restart[longest])
+
+    def find_all(self, text: str) -> List[Match]:
+        """Mọi lần xuất hiện của mọi cụm từ trong `text` (theo vị trí bắt đầu)"""
+        return [Match(start, start + len(term), term, labels)
+                for start, term, labels in self._occurrences(text)]
+
+    def find_grouped(self, text: str, stop_labels: Iterable[str] = ()) -> Dict[str, Dict[str, List[int]]]:
+        """
+        Như group_matches(find_all(text)) nhưng không tạo đối tượng Match trung gian
+
+        Args:
+            text: Văn bản cần quét
+            stop_labels: Dừng quét ngay khi gặp cụm từ mang một trong các nhãn này (kết quả
+                khi đó chỉ gồm các lần xuất hiện tới điểm dừng)
+        """
+        grouped: Dict[str, Dict[str, List[int]]] = {}
+        if self._regex is None or not text:
+            return grouped
+        # Vòng lặp nội tuyến (không qua generator): đây là đường nóng của bộ lọc an toàn
+        search = self._regex.search
+        within = self._within
+        restart = self._restart
+        stop = frozenset(stop_labels)
+        found = search(text)
+        while found is not None:
+            start = found.start()
+            longest = found.group()
+            for offset, term, labels in within[longest]:
+                if stop and not stop.isdisjoint(labels):
+                    for label in labels:
+                        grouped.setdefault(label, {}).setdefault(term, []).append(start + offset)
+                    return grouped
+                for label in labels:
+                    by_term = grouped.get(label)
+                    if by_term is None:
+                        grouped[label] = {term: [start + offset]}
+                    elif term in by_term:
+                        by_term[term].append(start + offset)
+                    else:
+                        by_term[term] = [start + offset]
+            found = search(text, start + restart[longest])
+        return grouped
+
+    def scanner(self) -> 'StreamScanner':
+        """Bộ quét tăng dần cho văn bản đến theo từng phần (luồng token của LLM)"""
+        return StreamScanner(self)
+
+    @property
+    def terms(self) -> List[str]:
+        return list(self._labels)
+
+
+class StreamScanner:
+    """
+    Quét văn bản đến theo từng phần; cụm từ vắt qua ranh giới giữa hai phần vẫn được nhận ra
+
+    Giữ lại (max_length - 1) ký tự cuối của phần trước để quét nối tiếp; chỉ các lần xuất hiện
+    kết thúc trong phần mới được báo, nên không có kết quả trùng lặp.
+    """
+
+    def __init__(self, matcher: MultiPatternMatcher):
+        self._matcher = matcher
+        self._tail = ""
+        self._offset = 0  # vị trí (trong toàn luồng) của ký tự đầu tiên của _tail
+        self.matches: List[Match] = []
+
+    def feed(self, text: str) -> List[Match]:
+        """Quét tiếp một phần văn bản; trả về các lần xuất hiện mới (vị trí tính từ đầu luồng)"""
+        window = self._tail + text
+        boundary = len(self._tail)
+        new = [Match(m.start + self._offset, m.end + self._offset, m.term, m.labels)
+               for m in self._matcher.find_all(window) if m.end > boundary]
+        keep = max(self._matcher.max_length - 1, 0)
+        cut = max(len(window) - keep, 0)
+        self._tail = window[cut:]
+        self._offset += cut
+        self.matches.extend(new)
+        return new
+
+
+def group_matches(matches: Iterable[Match]) -> Dict[str, Dict[str, List[int]]]:
+    """Gom kết quả theo nhãn: {nhãn: {cụm từ: [vị trí bắt đầu, ...]}}"""
+    grouped: Dict[str, Dict[str, List[int]]] = {}
+    for match in matches:
+        for label in match.labels:
+            grouped.setdefault(label, {}).setdefault(
+                match.term, []).append(match.start)
+    return grouped
@@ -1,8 +1,14 @@
 """
 Query Normalizer - Chuẩn hóa câu hỏi người dùng trước khi tìm kiếm
 """
+from config.config import config
+from backend.utils.logger import get_logger
+from functools import lru_cache
+from typing import Dict, List, Optional, Set
+import logging
 import re
-from typing import Dict
+
+logger = get_logger(__name__)
 
 # ============================================
 # NORMALIZATION RULES (QUY TẮC CHUẨN HÓA VĂN BẢN)
@@ -113,6 +119,112 @@ MEDICAL_DIAGNOSIS_PATTERNS = [
     r'\b(u hiểu|ung thư|hiểm nghèo)\b.*tôi\b'
 ]
 
+# Cờ đỏ của Cổng an toàn số 1 (should_block_query): yêu cầu điều trị / hỏi về thuốc
+TREATMENT_PATTERN = r'(điều trị|chữa trị|dùng thuốc|uống thuốc|liều|kê đơn)'
+MEDICINE_PATTERN = r'(paracetamol|ibuprofen|aspirin|kháng sinh|thuốc)'
+
+
+# ============================================
+# BỘ MÁY LUẬT BIÊN DỊCH SẴN (COMPILED RULE ENGINE)
+# ============================================
+# Mọi luật (SYNONYM_PATTERNS rồi FILLER_WORDS, đúng thứ tự khai báo) được biên dịch một
+# lần khi import. Mỗi luật kèm tập "chữ bắt buộc": regex chỉ có thể khớp khi ít nhất một
+# chuỗi trong tập xuất hiện trong câu hỏi, nên phép `in` (chạy bằng C) cho phép bỏ qua
+# phần lớn luật mà không cần chạy regex. Luật vẫn áp dụng tuần tự trên chuỗi đang biến đổi,
+# nên kết quả giống hệt cách chạy re.search/re.sub lần lượt như trước.
+
+_REGEX_META = set('.^$*+?{}[]\\|()')
+
+
+def _split_alternatives(body: str) -> List[str]:
+    """Tách "a|b|(c|d)" theo dấu | ở cấp ngoài cùng"""
+    parts, depth, current = [], 0, ''
+    for char in body:
+        if char == '|' and depth == 0:
+            parts.append(current)
+            current = ''
+            continue
+        depth += char == '('
+        depth -= char == ')'
+        current += char
+    parts.append(current)
+    return parts
+
+
+def _required_literals(pattern: str) -> Optional[Set[str]]:
+    """
+    Tập chuỗi mà ít nhất một phần tử phải có mặt khi `pattern` khớp
+
+    Chỉ hiểu tập con cú pháp mà các luật ở trên dùng (chữ, \\b, nhóm (...) có/không có ?).
+    Gặp cú pháp khác -> None (luật luôn được chạy, không lọc trước).
+    """
+    pattern = pattern.replace('\\b', '')
+    runs: List[str] = []
+    groups: List[List[str]] = []
+    current = ''
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '(':
+            depth, j = 1, i + 1
+            while j < len(pattern) and depth:
+                depth += pattern[j] == '('
+                depth -= pattern[j] == ')'
+                j += 1
+            if depth:
+                return None
+            runs.append(current)
+            current = ''
+            if j < len(pattern) and pattern[j] == '?':
+                j += 1  # Nhóm tùy chọn: không bắt buộc gì
+            else:
+                groups.append(_split_alternatives(pattern[i + 1:j - 1]))
+            i = j
+            continue
+        if char in _REGEX_META or (i + 1 < len(pattern) and pattern[i + 1] in '?*+{'):
+            return None
+        current += char
+        i += 1
+    runs.append(current)
+
+    # Ứng viên: từng đoạn chữ liền mạch, hoặc từng nhóm bắt buộc (một trong các nhánh).
+    # Chọn ứng viên chọn lọc nhất = chuỗi ngắn nhất trong tập dài nhất.
+    candidates = [{run} for run in runs if run.strip()]
+    for alternatives in groups:
+        required = set()
+        for alternative in alternatives:
+            literals = _required_literals(alternative)
+            if not literals:
+                break
+            required |= literals
+        else:
+            candidates.append(required)
+    if not candidates:
+        return None
+    return max(candidates, key=lambda c: min(len(lit.strip()) for lit in c))
+
+
+class _Rule:
+    """Một luật thay thế đã biên dịch"""
+
+    __slots__ = ('source', 'regex', 'replacement', 'required')
+
+    def __init__(self, source: str, replacement: str):
+        self.source = source
+        self.regex = re.compile(source)
+        self.replacement = replacement
+        self.required = _required_literals(source)
+
+    def may_match(self, text: str) -> bool:
+        return self.required is None or any(lit in text for lit in self.required)
+
+
+_SYNONYM_RULES = [_Rule(p, r) for p, r in SYNONYM_PATTERNS.items()]
+_FILLER_RULES = [_Rule(p, '') for p in FILLER_WORDS]
+_RULES = _SYNONYM_RULES + _FILLER_RULES
+_PUNCTUATION = re.compile(r'[?!.,;]+')
+_WHITESPACE = re.compile(r'\s+')
+
 
 # ============================================
 # QUERY NORMALIZATION FUNCTION (HÀM XỬ LÝ CHÍNH)
@@ -130,38 +242,38 @@ def normalize_query(query: str) -> str:
     """
     if not query or not query.strip():
         return query
+    return _normalize_cached(query)
+
+
+@lru_cache(maxsize=config.QUERY_NORMALIZE_CACHE_SIZE)
+def _normalize_cached(query: str) -> str:
+    """Chuẩn hóa (kết quả được ghi nhớ theo câu hỏi gốc)"""
+    trace = logger.isEnabledFor(logging.DEBUG)
 
     # Bước 1: Lowercasing (Chuyển chữ thường) để đảm bảo Case-Insensitive matching
     normalized = query.lower().strip()
 
-    # Log quá trình biến đổi để hỗ trợ Debugging
-    print("\n[THONG TIN] QUERY NORMALIZATION:")
-    print(f"   Original: '{query}'")
-
     # Bước 2: Kích hoạt bộ lọc Đồng nghĩa (Synonym mapping)
-    for pattern, replacement in SYNONYM_PATTERNS.items():
-        if re.search(pattern, normalized):
-            old_normalized = normalized
-            normalized = re.sub(pattern, replacement, normalized)
-            if old_normalized != normalized:
-                print(f"   [CHI TIET] Synonym: '{pattern}' -> '{replacement}'")
-
     # Bước 3: Cắt tỉa Từ dư thừa (Stopword Removal)
-    for filler in FILLER_WORDS:
-        if re.search(filler, normalized):
-            old_normalized = normalized
-            normalized = re.sub(filler, '', normalized)
-            if old_normalized != normalized:
-                print(f"   [XOA BO] Removed: '{filler}'")
+    steps = []
+    for rule in _RULES:
+        if not rule.may_match(normalized):
+            continue
+        rewritten = rule.regex.sub(rule.replacement, normalized)
+        if rewritten != normalized:
+            normalized = rewritten
+            if trace:
+                steps.append(f"'{rule.source}' -> '{rule.replacement}'")
 
     # Bước 4: Dọn dẹp Dấu câu (Punctuation Removal)
-    normalized = re.sub(r'[?!.,;]+', ' ', normalized)
+    normalized = _PUNCTUATION.sub(' ', normalized)
 
     # Bước 5: Cắt xén khoảng trắng thừa (Whitespace normalization)
-    normalized = re.sub(r'\s+', ' ', normalized).strip()
-
-    print(f"   Normalized: '{normalized}'")
+    normalized = _WHITESPACE.sub(' ', normalized).strip()
 
+    if trace:
+        logger.debug(
+            f"Query normalization: '{query}' -> '{normalized}' ({'; '.join(steps) or 'khong doi'})")
     return normalized
 
 # Hàm Heuristic dựa trên Quy tắc (Rule-based Intent Extraction).
@@ -213,10 +325,10 @@ def extract_health_intent(query: str) -> Dict[str, any]:
         intent['asks_for_when_doctor'] = True
 
     # KÍCH HOẠT CỜ ĐỎ (RED FLAGS): Phát hiện yêu cầu vi phạm đạo đức y tế
-    if re.search(r'(điều trị|chữa trị|dùng thuốc|uống thuốc|liều|kê đơn)', query_lower):
+    if re.search(TREATMENT_PATTERN, query_lower):
         intent['mentions_treatment'] = True
 
-    if re.search(r'(paracetamol|ibuprofen|aspirin|kháng sinh|thuốc)', query_lower):
+    if re.search(MEDICINE_PATTERN, query_lower):
         intent['mentions_medicine'] = True
 
     return intent
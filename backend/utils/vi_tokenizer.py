@@ -0,0 +1,84 @@
+"""
+Vietnamese Tokenizer - Tách từ tiếng Việt (underthesea) nạp một lần, kết quả được ghi nhớ (LRU)
+"""
+from config.config import config
+from backend.utils.logger import get_logger
+from functools import lru_cache
+from typing import Dict, Tuple
+import threading
+
+logger = get_logger(__name__)
+
+# word_tokenize của underthesea chạy mô hình CRF: lần gọi đầu phải nạp model từ đĩa,
+# các lần sau vẫn tốn vài ms cho mỗi câu. Cổng kiểm tra độ liên quan gọi nó cho MỌI câu
+# hỏi, nên:
+#   - Hàm tách từ được import/nạp đúng một lần (có thể nạp trước ở luồng nền khi khởi động).
+#   - Kết quả được ghi nhớ theo câu (lru_cache trên hàm cấp module, không phải instance method).
+# Thiếu underthesea -> tách theo khoảng trắng như hành vi dự phòng cũ.
+
+_word_tokenize = None
+_loaded = False
+_load_lock = threading.Lock()
+
+
+def _load():
+    """Nạp hàm tách từ (gọi một lần; các luồng khác chờ trên khóa)"""
+    global _word_tokenize, _loaded
+    if _loaded:
+        return _word_tokenize
+    with _load_lock:
+        if not _loaded:
+            try:
+                from underthesea import word_tokenize
+                # Gọi thử một lần để mô hình CRF được nạp ngay tại đây
+                word_tokenize("khởi động")
+                _word_tokenize = word_tokenize
+                logger.info("Underthesea tokenizer san sang")
+            except Exception as e:
+                logger.warning(
+                    f"Khong dung duoc underthesea ({e}), tach tu theo khoang trang")
+            _loaded = True
+    return _word_tokenize
+
+
+def warm_up(background: bool = True):
+    """
+    Nạp trước tokenizer để request đầu tiên không phải chờ
+
+    Args:
+        background: Nạp trong luồng nền (không chặn quá trình khởi động)
+    """
+    if _loaded:
+        return
+    if background:
+        threading.Thread(target=_load, name="tokenizer-warmup", daemon=True).start()
+    else:
+        _load()
+
+
+@lru_cache(maxsize=config.TOKENIZE_CACHE_SIZE)
+def tokenize(text: str) -> Tuple[str, ...]:
+    """
+    Tách từ một câu (đã chữ thường hóa bởi nơi gọi nếu cần)
+
+    Returns:
+        Tuple[str, ...]: Các từ/cụm từ (tuple để kết quả ghi nhớ không bị sửa đổi)
+    """
+    word_tokenize = _load()
+    if word_tokenize is not None:
+        try:
+            return tuple(word_tokenize(text))
+        except Exception as e:
+            logger.warning(f"Loi tach tu underthesea: {e}")
+    return tuple(text.split())
+
+
+def get_stats() -> Dict:
+    info = tokenize.cache_info()
+    return {
+        'backend': 'underthesea' if _word_tokenize is not None else
+        ('whitespace' if _loaded else 'loading'),
+        'cache_hits': info.hits,
+        'cache_misses': info.misses,
+        'cache_size': info.currsize
+    }
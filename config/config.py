@@ -21,6 +21,47 @@ class Config:
     # ============ GROQ API (LLM ENGINE) ============
     GROQ_API_KEY = os.getenv('GROQ_API_KEY')
     GROQ_MODEL = os.getenv('GROQ_MODEL', 'llama-3.3-70b-versatile')
+    # Rỗng = máy chủ Groq thật. Đặt thành URL của backend/api/mock_server.py để kiểm thử tải.
+    GROQ_BASE_URL = os.getenv('GROQ_BASE_URL', '')
+
+    # --- Pool nhiều API key / model (Failover Pool) ---
+    # GROQ_API_KEYS: danh sách key cách nhau bởi dấu phẩy (rỗng = chỉ dùng GROQ_API_KEY).
+    # GROQ_POOL_MODELS: "model:trọng_số,..." (rỗng = chỉ dùng GROQ_MODEL).
+    # Endpoint hết hạn mức ngày bị loại GROQ_POOL_DAILY_BACKOFF giây; lỗi khác bị loại theo
+    # thời gian chờ tăng dần từ GROQ_POOL_BASE_BACKOFF tới GROQ_POOL_MAX_BACKOFF giây.
+    # GROQ_POOL_ENDPOINT_RETRIES: số lần thử của mỗi endpoint trước khi chuyển endpoint khác
+    # (1 = lỗi 429 được báo cho pool ngay, không chờ retry-after trên endpoint đang bị giới hạn).
+    GROQ_POOL_ENABLED = os.getenv(
+        'GROQ_POOL_ENABLED', 'False').lower() in ('true', '1', 'yes')
+    GROQ_API_KEYS = os.getenv('GROQ_API_KEYS', '')
+    GROQ_POOL_MODELS = os.getenv('GROQ_POOL_MODELS', '')
+    GROQ_POOL_SLOW_SECONDS = float(os.getenv('GROQ_POOL_SLOW_SECONDS', 20.0))
+    GROQ_POOL_BASE_BACKOFF = float(os.getenv('GROQ_POOL_BASE_BACKOFF', 5.0))
+    GROQ_POOL_MAX_BACKOFF = float(os.getenv('GROQ_POOL_MAX_BACKOFF', 300.0))
+    GROQ_POOL_DAILY_BACKOFF = float(
+        os.getenv('GROQ_POOL_DAILY_BACKOFF', 3600.0))
+    GROQ_POOL_ENDPOINT_RETRIES = int(os.getenv('GROQ_POOL_ENDPOINT_RETRIES', 1))
+
+    # --- Pool kết nối cho client bất đồng bộ (AsyncGroq) ---
+    # HTTP/2 chỉ được bật khi đã cài gói 'h2'; keep-alive giữ kết nối TLS để tái sử dụng.
+    GROQ_HTTP2 = os.getenv('GROQ_HTTP2', 'True').lower() in ('true', '1', 'yes')
+    GROQ_HTTP_MAX_CONNECTIONS = int(os.getenv('GROQ_HTTP_MAX_CONNECTIONS', 200))
+    GROQ_HTTP_MAX_KEEPALIVE = int(os.getenv('GROQ_HTTP_MAX_KEEPALIVE', 50))
+    GROQ_HTTP_KEEPALIVE_EXPIRY = float(
+        os.getenv('GROQ_HTTP_KEEPALIVE_EXPIRY', 30.0))
+    GROQ_HTTP_TIMEOUT = float(os.getenv('GROQ_HTTP_TIMEOUT', 60.0))
+
+    # --- Bộ giới hạn lưu lượng phía client (Token Bucket) ---
+    # RPM/TPM mặc định theo hạn mức gói miễn phí của llama-3.3-70b-versatile,
+    # được hiệu chỉnh lại theo header x-ratelimit-* mà Groq trả về.
+    # GROQ_LIMITER_MAX_WAIT: chờ dự kiến vượt ngưỡng này -> từ chối ngay (API_LOAD_SHED).
+    # GROQ_LIMITER_STATE_FILE: đường dẫn SQLite để chia sẻ bucket giữa nhiều tiến trình (rỗng = trong RAM).
+    GROQ_RATE_LIMITER_ENABLED = os.getenv(
+        'GROQ_RATE_LIMITER_ENABLED', 'True').lower() in ('true', '1', 'yes')
+    GROQ_RPM = float(os.getenv('GROQ_RPM', 30))
+    GROQ_TPM = float(os.getenv('GROQ_TPM', 12000))
+    GROQ_LIMITER_MAX_WAIT = float(os.getenv('GROQ_LIMITER_MAX_WAIT', 20.0))
+    GROQ_LIMITER_STATE_FILE = os.getenv('GROQ_LIMITER_STATE_FILE', '')
 
     # ============ CƠ SỞ DỮ LIỆU QUAN HỆ (SQL SERVER) ============
     SQL_SERVER = os.getenv('SQL_SERVER', 'localhost')
@@ -57,6 +98,19 @@ class Config:
     EMBEDDING_MODEL_VI = os.getenv(
         'EMBEDDING_MODEL_VI', 'VoVanPhuc/sup-SimCSE-VietNamese-phobert-base')
 
+    # --- Truy xuất Phân tầng (Cascade Embedding) ---
+    # Câu hỏi được nhúng bằng model nhỏ (MiniLM đa ngôn ngữ) trên một chỉ mục song song,
+    # chỉ leo thang lên PhoBERT khi khoảng cách top-1 hoặc biên độ giữa các bệnh
+    # nằm ngoài dải tin cậy. Các ngưỡng L2 dưới đây thuộc không gian của model nhỏ.
+    EMBEDDING_CASCADE_ENABLED = os.getenv(
+        'EMBEDDING_CASCADE_ENABLED', 'False').lower() in ('true', '1', 'yes')
+    EMBEDDING_MODEL_FAST = os.getenv(
+        'EMBEDDING_MODEL_FAST', 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2')
+    CASCADE_MAX_DISTANCE = float(os.getenv('CASCADE_MAX_DISTANCE', 8.0))
+    CASCADE_MIN_MARGIN = float(os.getenv('CASCADE_MIN_MARGIN', 0.5))
+    CASCADE_FAST_RELEVANCE_THRESHOLD = float(
+        os.getenv('CASCADE_FAST_RELEVANCE_THRESHOLD', 20.0))
+
     # ============ THÔNG SỐ RAG (HYPERPARAMETERS) ============
 
     # Kích thước khối (Chunk Size): Xác định lượng ký tự tối đa đưa vào LLM mỗi lần.
@@ -96,8 +150,137 @@ class Config:
     # Hạ xuống 0.25 để nới lỏng bộ lọc cho các câu hỏi ngắn chỉ gồm 1-2 từ (vd: "đau bụng").
     SEMANTIC_THRESHOLD = float(os.getenv('SEMANTIC_THRESHOLD', 0.25))
 
+    # --- Hạn chót request & cầu dao ngắt mạch (Deadline & Circuit Breaker) ---
+    # REQUEST_DEADLINE_SECONDS: tổng thời gian tối đa của một request chat (tính từ Flask handler).
+    # GROQ_ATTEMPT_TIMEOUT: timeout mỗi lần gọi Groq; GROQ_STREAM_TTFT_TIMEOUT: chờ token đầu tiên
+    # (và khoảng lặng giữa các token) tối đa khi stream.
+    REQUEST_DEADLINE_SECONDS = float(
+        os.getenv('REQUEST_DEADLINE_SECONDS', 45.0))
+    GROQ_ATTEMPT_TIMEOUT = float(os.getenv('GROQ_ATTEMPT_TIMEOUT', 20.0))
+    GROQ_STREAM_TTFT_TIMEOUT = float(
+        os.getenv('GROQ_STREAM_TTFT_TIMEOUT', 8.0))
+    # Cầu dao mở khi tỉ lệ lỗi >= CIRCUIT_FAILURE_RATE trong CIRCUIT_WINDOW_SECONDS
+    # (cần tối thiểu CIRCUIT_MIN_REQUESTS lệnh gọi), giữ mở CIRCUIT_OPEN_SECONDS rồi thăm dò lại.
+    CIRCUIT_BREAKER_ENABLED = os.getenv(
+        'CIRCUIT_BREAKER_ENABLED', 'True').lower() in ('true', '1', 'yes')
+    CIRCUIT_FAILURE_RATE = float(os.getenv('CIRCUIT_FAILURE_RATE', 0.5))
+    CIRCUIT_MIN_REQUESTS = int(os.getenv('CIRCUIT_MIN_REQUESTS', 5))
+    CIRCUIT_WINDOW_SECONDS = float(os.getenv('CIRCUIT_WINDOW_SECONDS', 60.0))
+    CIRCUIT_OPEN_SECONDS = float(os.getenv('CIRCUIT_OPEN_SECONDS', 30.0))
+    # Chế độ suy giảm: khi LLM hết hạn mức / quá tải / cầu dao mở, trả về trích đoạn của
+    # DEGRADED_MAX_CHUNKS chunk truy xuất tốt nhất thay cho thông báo lỗi. Trong thời gian
+    # DEGRADED_COOLDOWN (hết hạn mức ngày: DEGRADED_DAILY_COOLDOWN) giây sau đó không gọi LLM nữa.
+    DEGRADED_MODE_ENABLED = os.getenv(
+        'DEGRADED_MODE_ENABLED', 'True').lower() in ('true', '1', 'yes')
+    DEGRADED_COOLDOWN = float(os.getenv('DEGRADED_COOLDOWN', 30.0))
+    DEGRADED_DAILY_COOLDOWN = float(os.getenv('DEGRADED_DAILY_COOLDOWN', 3600.0))
+    DEGRADED_MAX_CHUNKS = int(os.getenv('DEGRADED_MAX_CHUNKS', 3))
+    DEGRADED_MAX_ITEMS = int(os.getenv('DEGRADED_MAX_ITEMS', 4))
+
+    # --- Bộ đệm câu trả lời LLM (Completion Cache) ---
+    # Chỉ đệm các lệnh gọi tất định (temperature = 0). COMPLETION_CACHE_DB rỗng = chỉ dùng RAM.
+    COMPLETION_CACHE_ENABLED = os.getenv(
+        'COMPLETION_CACHE_ENABLED', 'True').lower() in ('true', '1', 'yes')
+    COMPLETION_CACHE_SIZE = int(os.getenv('COMPLETION_CACHE_SIZE', 512))
+    COMPLETION_CACHE_DB = os.getenv(
+        'COMPLETION_CACHE_DB', './data/cache/completions.sqlite')
+
+    # --- Bộ đệm ngữ nghĩa (Semantic Cache) ---
+    # Câu hỏi mở đầu có query embedding cách một câu hỏi đã trả lời <= SEMANTIC_CACHE_MAX_DISTANCE
+    # (khoảng cách cosine) và cùng ý định + bệnh đích nhận lại câu trả lời đó, bỏ qua LLM.
+    SEMANTIC_CACHE_ENABLED = os.getenv(
+        'SEMANTIC_CACHE_ENABLED', 'False').lower() in ('true', '1', 'yes')
+    SEMANTIC_CACHE_SIZE = int(os.getenv('SEMANTIC_CACHE_SIZE', 512))
+    SEMANTIC_CACHE_MAX_DISTANCE = float(
+        os.getenv('SEMANTIC_CACHE_MAX_DISTANCE', 0.05))
+    SEMANTIC_CACHE_CANDIDATES = int(os.getenv('SEMANTIC_CACHE_CANDIDATES', 4))
+
+    # --- Gộp câu hỏi trùng lặp đang xử lý đồng thời (Single-flight) ---
+    SINGLE_FLIGHT_ENABLED = os.getenv(
+        'SINGLE_FLIGHT_ENABLED', 'True').lower() in ('true', '1', 'yes')
+
+    # --- Nén ngữ cảnh theo câu (Context Compression) ---
+    # Giữ các câu liên quan nhất trong tối đa CONTEXT_COMPRESSION_MAX_CHARS ký tự.
+    # Điểm câu = trọng số * cosine embedding + (1 - trọng số) * độ phủ từ khóa BM25.
+    CONTEXT_COMPRESSION_ENABLED = os.getenv(
+        'CONTEXT_COMPRESSION_ENABLED', 'False').lower() in ('true', '1', 'yes')
+    CONTEXT_COMPRESSION_MAX_CHARS = int(
+        os.getenv('CONTEXT_COMPRESSION_MAX_CHARS', 2500))
+    CONTEXT_COMPRESSION_EMBEDDING_WEIGHT = float(
+        os.getenv('CONTEXT_COMPRESSION_EMBEDDING_WEIGHT', 0.6))
+
+    # --- Tách từ tiếng Việt (underthesea) ---
+    # TOKENIZER_WARMUP: nạp mô hình tách từ ở luồng nền khi khởi động thay vì ở request đầu tiên.
+    # TOKENIZE_CACHE_SIZE: số câu hỏi gần nhất được ghi nhớ kết quả tách từ (LRU).
+    TOKENIZER_WARMUP = os.getenv(
+        'TOKENIZER_WARMUP', 'True').lower() in ('true', '1', 'yes')
+    TOKENIZE_CACHE_SIZE = int(os.getenv('TOKENIZE_CACHE_SIZE', 2048))
+    # Số câu hỏi gốc gần nhất được ghi nhớ kết quả normalize_query (LRU)
+    QUERY_NORMALIZE_CACHE_SIZE = int(os.getenv('QUERY_NORMALIZE_CACHE_SIZE', 2048))
+
+    # --- Cổng phân loại trước truy xuất (Pre-Gate) ---
+    # PRE_GATE_OUT_OF_DOMAIN_ENABLED (mặc định tắt): trả lời dự phòng ngay cho câu hỏi lạc đề (không
+    # có từ khóa y khoa, không có bigram nào và không có âm tiết nào trùng kho tài liệu), xét khi câu
+    # hỏi có >= PRE_GATE_MIN_BIGRAMS bigram.
+    # Bộ đệm kết quả âm: câu hỏi vừa rơi vào câu trả lời dự phòng được ghi nhớ để trả lời ngay lần sau.
+    PRE_GATE_OUT_OF_DOMAIN_ENABLED = os.getenv(
+        'PRE_GATE_OUT_OF_DOMAIN_ENABLED', 'False').lower() in ('true', '1', 'yes')
+    PRE_GATE_MIN_BIGRAMS = int(os.getenv('PRE_GATE_MIN_BIGRAMS', 2))
+    PRE_GATE_NEGATIVE_CACHE_SIZE = int(
+        os.getenv('PRE_GATE_NEGATIVE_CACHE_SIZE', 512))
+    PRE_GATE_NEGATIVE_CACHE_TTL = float(
+        os.getenv('PRE_GATE_NEGATIVE_CACHE_TTL', 600))
+
+    # --- Trả lời trích xuất không qua LLM (Extractive Answers) ---
+    # Câu hỏi chỉ có MỘT ý định (trong EXTRACTIVE_INTENTS) và MỘT bệnh được trả lời trực tiếp
+    # từ mục tương ứng của tài liệu (tối đa EXTRACTIVE_MAX_ITEMS ý), bỏ qua truy xuất và LLM.
+    EXTRACTIVE_ENABLED = os.getenv(
+        'EXTRACTIVE_ENABLED', 'False').lower() in ('true', '1', 'yes')
+    EXTRACTIVE_INTENTS = [i.strip() for i in os.getenv(
+        'EXTRACTIVE_INTENTS', 'symptom,cause,prevention,when_to_see_doctor').split(',') if i.strip()]
+    EXTRACTIVE_MAX_ITEMS = int(os.getenv('EXTRACTIVE_MAX_ITEMS', 6))
+
+    # --- Kho câu trả lời dựng sẵn (Answer Bank) ---
+    # scripts/build_answer_bank.py chạy câu hỏi chuẩn của mọi cặp (bệnh, ý định trong
+    # ANSWER_BANK_INTENTS) qua RAGChain.ask và lưu câu trả lời đã kiểm duyệt vào ANSWER_BANK_DB.
+    # Bật ANSWER_BANK_ENABLED để phục vụ các câu trả lời này ngay sau pre_gates (chỉ câu hỏi mở đầu).
+    ANSWER_BANK_ENABLED = os.getenv(
+        'ANSWER_BANK_ENABLED', 'False').lower() in ('true', '1', 'yes')
+    ANSWER_BANK_DB = os.getenv('ANSWER_BANK_DB', './data/cache/answer_bank.sqlite')
+    ANSWER_BANK_INTENTS = [i.strip() for i in os.getenv(
+        'ANSWER_BANK_INTENTS', 'general,symptom,cause,prevention,when_to_see_doctor').split(',') if i.strip()]
+    ANSWER_BANK_WORKERS = int(os.getenv('ANSWER_BANK_WORKERS', 4))
+
+    # --- Ngân sách token cho prompt (Token Budget) ---
+    # PROMPT_TOKEN_BUDGET: tổng token đầu vào tối đa (0 = không giới hạn).
+    # Lịch sử chiếm tối đa PROMPT_HISTORY_SHARE phần ngân sách còn lại sau System Prompt + câu hỏi.
+    PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', 6000))
+    PROMPT_TOKENIZER = os.getenv('PROMPT_TOKENIZER', 'cl100k_base')
+    PROMPT_MAX_HISTORY_TURNS = int(os.getenv('PROMPT_MAX_HISTORY_TURNS', 5))
+    PROMPT_HISTORY_SHARE = float(os.getenv('PROMPT_HISTORY_SHARE', 0.3))
+    PROMPT_HISTORY_TURN_TOKENS = int(
+        os.getenv('PROMPT_HISTORY_TURN_TOKENS', 300))
+    PROMPT_MIN_CHUNK_TOKENS = int(os.getenv('PROMPT_MIN_CHUNK_TOKENS', 80))
+
+    # --- Định tuyến model theo độ phức tạp (Model Router) ---
+    # ROUTER_MODE: 'off' (luôn dùng GROQ_MODEL) | 'shadow' (đo chất lượng model nhỏ ở nền) | 'active'
+    ROUTER_MODE = os.getenv('ROUTER_MODE', 'off').lower()
+    ROUTER_SMALL_MODEL = os.getenv(
+        'ROUTER_SMALL_MODEL', 'llama-3.1-8b-instant')
+    ROUTER_SMALL_MAX_CONTEXT_CHARS = int(
+        os.getenv('ROUTER_SMALL_MAX_CONTEXT_CHARS', 4000))
+    ROUTER_SMALL_MAX_HISTORY_TURNS = int(
+        os.getenv('ROUTER_SMALL_MAX_HISTORY_TURNS', 1))
+    ROUTER_SHADOW_RATE = float(os.getenv('ROUTER_SHADOW_RATE', 0.2))
+
     # ============ MÁY CHỦ WEB (FLASK SERVER) ============
     FLASK_PORT = os.getenv('FLASK_PORT', '5000')
+    # Chu kỳ gửi heartbeat SSE (giây): phát hiện client ngắt kết nối khi chain chưa có dữ liệu mới
+    SSE_HEARTBEAT_SECONDS = float(os.getenv('SSE_HEARTBEAT_SECONDS', 2.0))
+    # Bộ đệm sự kiện SSE để client nối lại bằng Last-Event-ID (giây giữ sau khi hoàn tất)
+    STREAM_BUFFER_TTL = float(os.getenv('STREAM_BUFFER_TTL', 120))
+    # Thời gian chờ client nối lại trước khi hủy luồng LLM đang chạy
+    STREAM_RESUME_GRACE = float(os.getenv('STREAM_RESUME_GRACE', 15))
     SECRET_KEY = os.getenv('SECRET_KEY', 'default_secret_key')
 
     # ============ MÔI TRƯỜNG PHÁT TRIỂN (ENV MODES) ============
@@ -117,13 +300,24 @@ class Config:
     VECTOR_STORE_DIR = DATA_DIR / 'vector_store'
     LOGS_DIR = BASE_DIR / 'logs'
 
+    # ============ KHO MÔ HÌNH CỤC BỘ (MODEL ARTIFACT STORE) ============
+    # Thư mục chứa artifact model nhúng (safetensors + manifest checksum) được chuẩn bị
+    # một lần bằng scripts/prepare_models.py. MODEL_STORE_OFFLINE=True bắt buộc mọi model
+    # phải nạp từ kho cục bộ (node không có mạng), thiếu artifact sẽ báo lỗi ngay lúc khởi động.
+    MODEL_STORE_DIR = Path(os.getenv('MODEL_STORE_DIR', str(DATA_DIR / 'models')))
+    MODEL_STORE_OFFLINE = os.getenv(
+        'MODEL_STORE_OFFLINE', 'False').lower() in ('true', '1', 'yes')
+    # True = băm lại SHA-256 toàn bộ file mỗi lần khởi động (chậm hơn, dùng khi nghi ngờ artifact hỏng)
+    MODEL_STORE_FULL_VERIFY = os.getenv(
+        'MODEL_STORE_FULL_VERIFY', 'False').lower() in ('true', '1', 'yes')
+
     @classmethod
     # Hàm tự kiểm tra (Self-validation) lúc khởi động ứng dụng.
     def validate(cls):
         """Kiểm tra các cấu hình bắt buộc"""
         errors = []
 
-        if not cls.GROQ_API_KEY:
+        if not cls.GROQ_API_KEY and not cls.GROQ_API_KEYS:
             errors.append("[LOI] GROQ_API_KEY chua duoc cau hinh")
 
         if not cls.SQL_PASSWORD:
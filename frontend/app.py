@@ -4,6 +4,8 @@ Giao diện web giống Gemini
 """
 from backend.utils.logger import get_logger
 from backend.rag.chain import HealthChatbot
+from backend.api.resilience import CancellationToken, Deadline
+from backend.api.stream_buffer import StreamBuffer, format_event_id, parse_event_id
 from backend.auth.auth_service import AuthService
 from backend.database.sql_handler import SQLHandler
 from flask_limiter.util import get_remote_address
@@ -15,6 +17,7 @@ import os
 from pathlib import Path
 import json
 import secrets
+import threading
 
 # =====================================================================
 # BƯỚC 1: CẤU HÌNH ĐƯỜNG DẪN HỆ THỐNG (PYTHON PATH MANIPULATION)
@@ -61,6 +64,12 @@ logger.info("Rate limiter initialized")
 chatbot = None
 auth_service = AuthService()
 
+# Tiền tố đánh dấu câu trả lời bị hủy do client ngắt kết nối giữa chừng
+CANCELLED_MARKER = "[Đã hủy]"
+
+# Bộ đệm sự kiện SSE cho phép client nối lại luồng bằng Last-Event-ID
+stream_buffer = StreamBuffer()
+
 # Khởi tạo và kiểm tra kết nối với CSDL quan hệ (SQL Server) ngay khi khởi động Web
 db = SQLHandler()
 if db.connect():
@@ -243,6 +252,49 @@ def delete_chat_session(session_id):
 # =====================================================================
 
 
+def sse_events(message_id: str, after_seq: int = 0, resume: bool = False):
+    """Generator SSE đọc từ bộ đệm: mỗi sự kiện mang 'id: <message_id>:<seq>'"""
+    events = stream_buffer.follow(message_id, after_seq, resume=resume)
+    try:
+        for seq, event in events:
+            if event is None:
+                # Dòng chú thích SSE: client bỏ qua, nhưng buộc server ghi ra socket
+                yield ": heartbeat\n\n"
+                continue
+            yield f"id: {format_event_id(message_id, seq)}\ndata: {json.dumps(event)}\n\n"
+    finally:
+        # Client ngắt kết nối (GeneratorExit) -> rời bộ đệm ngay để bắt đầu đếm thời gian chờ nối lại
+        events.close()
+
+
+def resume_stream(last_event_id: str, session_id, user_id):
+    """Nối lại luồng theo Last-Event-ID; bộ đệm đã hết hạn thì trả câu trả lời đã lưu trong DB"""
+    # Chỉ người dùng đã gửi câu hỏi mới được nối lại luồng / đọc lại câu trả lời của phiên đó
+    parsed = parse_event_id(last_event_id)
+    if parsed and stream_buffer.has(parsed[0], owner=user_id):
+        message_id, after_seq = parsed
+        return Response(stream_with_context(sse_events(message_id, after_seq, resume=True)),
+                        mimetype='text/event-stream')
+
+    answer = None
+    try:
+        session_id_int = int(session_id)
+        user_sessions = db.get_user_sessions(user_id)
+        if any(item['session_id'] == session_id_int for item in user_sessions):
+            history = db.get_chat_history(session_id_int)
+            if history and history[-1]['sender_type'] == 'BOT':
+                answer = history[-1]['message_text']
+    except (TypeError, ValueError):
+        pass
+    if answer is None:
+        return jsonify({'error': 'Stream expired'}), 410
+
+    def replay():
+        yield f"data: {json.dumps({'type': 'token', 'content': answer, 'replace': True})}\n\n"
+        yield f"data: {json.dumps({'type': 'done'})}\n\n"
+    return Response(stream_with_context(replay()), mimetype='text/event-stream')
+
+
 @app.route('/api/chat/stream', methods=['POST'])
 @limiter.limit("20 per minute")
 def chat_stream():
@@ -250,10 +302,16 @@ def chat_stream():
         return jsonify({'error': 'Unauthorized'}), 401
 
     try:
-        data = request.get_json(force=True, silent=True)
+        data = request.get_json(force=True, silent=True) or {}
         user_message = data.get('message', '').strip()
         session_id = data.get('session_id')
 
+        # Client kết nối lại sau khi mất mạng: phát tiếp từ bộ đệm, không gọi lại LLM
+        last_event_id = request.headers.get(
+            'Last-Event-ID') or data.get('last_event_id')
+        if last_event_id:
+            return resume_stream(last_event_id, session_id, session['user_id'])
+
         if not user_message:
             return jsonify({'error': 'Message cannot be empty'}), 400
 
@@ -290,58 +348,113 @@ def chat_stream():
             if msg['sender_type'] == 'USER':
                 temp_user_msg = msg['message_text']
             elif msg['sender_type'] == 'BOT' and temp_user_msg:
-                rag_history.append((temp_user_msg, msg['message_text']))
+                # Câu trả lời bị hủy giữa chừng chưa qua kiểm duyệt -> không đưa vào prompt
+                if not msg['message_text'].startswith(CANCELLED_MARKER):
+                    rag_history.append((temp_user_msg, msg['message_text']))
                 temp_user_msg = ""
 
         # Ghi nhận ngay lập tức tin nhắn của User vào DB
         db.save_chat_message(session_id, 'USER', user_message)
 
-        # Hàm Generator dùng cho giao thức Server-Sent Events (SSE)
-        def generate():
+        # Hạn chót toàn request bắt đầu tính từ đây và được truyền xuống tới GroqClient
+        deadline = Deadline()
+
+        # Luồng RAG chạy trên một thread riêng (producer) và ghi sự kiện vào bộ đệm SSE.
+        # generate() chỉ đọc bộ đệm và gửi heartbeat định kỳ trong lúc chain đang truy xuất/
+        # chờ LLM: khi client đã đóng tab, lần ghi heartbeat thất bại và WSGI server đóng
+        # generate(). Nếu client không nối lại (Last-Event-ID) trong STREAM_RESUME_GRACE giây,
+        # token bị hủy -> chain đóng luồng Groq ngay lập tức.
+        cancel_token = CancellationToken()
+        message_id = stream_buffer.create(
+            on_abandon=lambda: cancel_token.cancel('client_disconnected'),
+            owner=session['user_id'])
+        # Phát (Yield) ID chuẩn xác về Frontend để đồng bộ luồng
+        stream_buffer.append(message_id, {
+            'type': 'session_id', 'session_id': session_id, 'message_id': message_id})
+
+        def produce():
+            full_answer = ""
             try:
-                full_answer = ""
-                # Phát (Yield) ID chuẩn xác về Frontend để đồng bộ luồng
-                yield f"data: {json.dumps({'type': 'session_id', 'session_id': session_id})}\n\n"
-
-                # Duyệt qua từng Chunk (Mảnh văn bản) được nhả về từ RAG Pipeline
-                for chunk in bot.rag_chain.ask_stream(
+                for event in bot.rag_chain.ask_events(
                     question=user_message,
                     # Giới hạn bộ nhớ ngắn hạn: 10 tin nhắn gần nhất
                     chat_history=rag_history[-10:],
-                    return_sources=True
+                    deadline=deadline,
+                    cancel_token=cancel_token
                 ):
-                    full_answer += chunk
-                    # Bắn ngay chunk vừa nhận được qua HTTP Connection đang mở
-                    yield f"data: {json.dumps({'type': 'token', 'content': chunk})}\n\n"
-
-                # Kỹ thuật bóc tách Nguồn (Source Parsing) bằng chuỗi ở bước hậu kỳ
-                sources = []
+                    if event['type'] in ('token', 'degraded'):
+                        full_answer += event['content']
+                    # 'retrieval_done' tới trước token đầu tiên: giao diện hiển thị nguồn sớm;
+                    # 'degraded': LLM không khả dụng, nội dung là trích đoạn tài liệu (không qua AI)
+                    stream_buffer.append(message_id, event)
+
+                # Kỹ thuật bóc tách Nguồn (Source Parsing) bằng chuỗi ở bước hậu kỳ:
+                # sự kiện cuối xác nhận các nguồn câu trả lời thực sự trích dẫn
                 if "Nguồn:" in full_answer:
                     parts = full_answer.split("Nguồn:")
                     sources_text = parts[1].strip()
                     sources = [s.strip()
                                for s in sources_text.split(',') if s.strip()]
                     if sources:
-                        yield f"data: {json.dumps({'type': 'sources', 'sources': sources})}\n\n"
+                        stream_buffer.append(
+                            message_id, {'type': 'sources', 'sources': sources})
 
                 # Ghi nhận toàn bộ văn bản hoàn chỉnh của AI vào DB
                 db.save_chat_message(session_id, 'BOT', full_answer)
 
                 # Phát tín hiệu kết thúc luồng (End of Stream)
-                yield f"data: {json.dumps({'type': 'done'})}\n\n"
+                stream_buffer.append(message_id, {'type': 'done'}, final=True)
             except Exception as e:
+                if 'REQUEST_CANCELLED' in str(e):
+                    # Lưu phần đã sinh kèm dấu hiệu bị hủy (bị loại khỏi lịch sử gửi LLM)
+                    partial = cancel_token.partial_answer or full_answer
+                    db.save_chat_message(
+                        session_id, 'BOT', f"{CANCELLED_MARKER} {partial}".strip())
+                    logger.info(
+                        f"Stream cancelled (session {session_id}): da luu {len(partial)} ky tu")
+                    stream_buffer.append(
+                        message_id, {'type': 'cancelled'}, final=True)
+                    return
                 logger.error(
                     f"Error in stream generation: {e}", exc_info=True)
-                yield f"data: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
+                stream_buffer.append(
+                    message_id, {'type': 'error', 'error': str(e)}, final=True)
+
+        threading.Thread(target=produce, name="sse-producer",
+                         daemon=True).start()
 
         # Đóng gói Generator thành một Response Stream với Mimetype đặc thù 'text/event-stream'
-        return Response(stream_with_context(generate()), mimetype='text/event-stream')
+        return Response(stream_with_context(sse_events(message_id)), mimetype='text/event-stream')
 
     except Exception as e:
         logger.error(f"Error in chat_stream endpoint: {e}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
 
+# =====================================================================
+# API GIÁM SÁT VẬN HÀNH (MONITORING)
+# =====================================================================
+
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    if session.get('role') != 'ADMIN':
+        return jsonify({'error': 'Forbidden'}), 403
+
+    # Không ép khởi tạo chatbot (nặng) chỉ để đọc số liệu giám sát
+    if chatbot is None:
+        return jsonify({'chatbot_initialized': False})
+
+    try:
+        return jsonify({'chatbot_initialized': True, **chatbot.rag_chain.get_stats(),
+                        'stream_buffer': stream_buffer.get_stats()})
+    except Exception as e:
+        logger.error(f"Error collecting metrics: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+
 # Khởi động máy chủ phát triển (Development Server)
 if __name__ == '__main__':
     print("=" * 70)
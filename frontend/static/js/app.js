@@ -294,75 +294,127 @@ class HealthChatbot {
   }
 
   async streamResponse(message, typingId) {
-    try {
-      console.log("📤 Sending message:", message);
-
-      const response = await fetch("/api/chat/stream", {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-        },
-        body: JSON.stringify({
-          message: message,
-          session_id: this.sessionId,
-        }),
-      });
+    // Trạng thái dùng chung giữa các lần nối lại (mất mạng giữa chừng)
+    const state = {
+      lastEventId: null,
+      finished: false,
+      messageEl: null,
+      contentEl: null,
+      fullAnswer: "",
+      sources: [],
+    };
+    const maxRetries = 3;
+
+    for (let attempt = 0; ; attempt++) {
+      try {
+        await this.readStream(message, typingId, state);
+      } catch (error) {
+        // Chưa nhận được sự kiện nào có id -> không có gì để nối lại
+        if (!state.lastEventId || attempt >= maxRetries) {
+          console.error("❌ Stream error:", error);
+          throw error;
+        }
+        console.warn("⚠️ Stream interrupted:", error);
+      }
+      if (state.finished) return;
+      if (!state.lastEventId || attempt >= maxRetries) {
+        throw new Error("Stream ended unexpectedly");
+      }
+      // Chờ lùi dần rồi nối lại bằng Last-Event-ID (server phát tiếp từ bộ đệm)
+      await new Promise((resolve) => setTimeout(resolve, 500 * 2 ** attempt));
+      console.log("🔄 Resuming stream from", state.lastEventId);
+    }
+  }
 
-      console.log("📥 Response status:", response.status);
+  async readStream(message, typingId, state) {
+    const resuming = state.lastEventId !== null;
+    if (!resuming) console.log("📤 Sending message:", message);
 
-      if (!response.ok) {
-        throw new Error(`Network response was not ok: ${response.status}`);
-      }
+    const headers = { "Content-Type": "application/json" };
+    if (resuming) headers["Last-Event-ID"] = state.lastEventId;
 
+    const response = await fetch("/api/chat/stream", {
+      method: "POST",
+      headers: headers,
+      body: JSON.stringify({
+        message: resuming ? "" : message,
+        session_id: this.sessionId,
+      }),
+    });
+
+    console.log("📥 Response status:", response.status);
+
+    if (!response.ok) {
+      throw new Error(`Network response was not ok: ${response.status}`);
+    }
+
+    if (!state.messageEl) {
       this.removeTypingIndicator(typingId);
+      state.messageEl = this.createBotMessage("");
+      state.contentEl = state.messageEl.querySelector(".message-content");
+    }
 
-      const messageEl = this.createBotMessage("");
-      const contentEl = messageEl.querySelector(".message-content");
-      let fullAnswer = "";
-      let sources = [];
-
-      const reader = response.body.getReader();
-      const decoder = new TextDecoder();
-
-      while (true) {
-        const { value, done } = await reader.read();
-        if (done) break;
-
-        const chunk = decoder.decode(value);
-        const lines = chunk.split("\n");
-
-        for (const line of lines) {
-          if (line.startsWith("data: ")) {
-            try {
-              const data = JSON.parse(line.slice(6));
-
-              // --- HỨNG SESSION ID TỪ BACKEND ĐỂ GÁN VÀO BIẾN ---
-              if (data.type === "session_id") {
-                this.sessionId = data.session_id;
-                this.loadSessions(); // Load lại Sidebar để hiện Chat mới
-              } else if (data.type === "token") {
-                fullAnswer += data.content;
-                contentEl.innerHTML = this.formatText(fullAnswer);
-                this.scrollToBottom();
-              } else if (data.type === "sources") {
-                sources = data.sources;
-              } else if (data.type === "done") {
-                console.log("✅ Stream done");
-                if (sources && sources.length > 0) {
-                  this.addSources(messageEl, sources);
-                }
-              } else if (data.type === "error") {
-                throw new Error(data.error);
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    // Dòng chưa trọn vẹn ở cuối mỗi lần đọc được giữ lại cho lần đọc sau
+    let pending = "";
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+
+      pending += decoder.decode(value, { stream: true });
+      const lines = pending.split("\n");
+      pending = lines.pop();
+
+      for (const line of lines) {
+        if (line.startsWith("id: ")) {
+          state.lastEventId = line.slice(4).trim();
+        } else if (line.startsWith("data: ")) {
+          try {
+            const data = JSON.parse(line.slice(6));
+
+            // --- HỨNG SESSION ID TỪ BACKEND ĐỂ GÁN VÀO BIẾN ---
+            if (data.type === "session_id") {
+              this.sessionId = data.session_id;
+              this.loadSessions(); // Load lại Sidebar để hiện Chat mới
+            } else if (data.type === "token") {
+              // Bộ đệm đã hết hạn: server gửi lại toàn bộ câu trả lời đã lưu
+              state.fullAnswer = data.replace
+                ? data.content
+                : state.fullAnswer + data.content;
+              state.contentEl.innerHTML = this.formatText(state.fullAnswer);
+              this.scrollToBottom();
+            } else if (data.type === "degraded") {
+              // LLM không khả dụng: server gửi trích đoạn tài liệu thay cho câu trả lời AI
+              console.warn(`⚠️ Degraded mode (${data.reason})`);
+              state.fullAnswer = data.content;
+              state.contentEl.classList.add("degraded");
+              state.contentEl.innerHTML = this.formatText(state.fullAnswer);
+              this.scrollToBottom();
+            } else if (data.type === "retrieval_done") {
+              // Truy xuất xong trước khi LLM sinh token đầu tiên: hiển thị nguồn sớm
+              console.log(`🔎 Retrieval done in ${data.retrieval_ms} ms`);
+              this.addSources(state.messageEl, data.sources);
+            } else if (data.type === "sources") {
+              state.sources = data.sources;
+            } else if (data.type === "done") {
+              console.log("✅ Stream done");
+              state.finished = true;
+              if (state.sources && state.sources.length > 0) {
+                this.addSources(state.messageEl, state.sources);
               }
-            } catch (e) {
-              console.warn("JSON parse error in stream:", e, "Line:", line);
+            } else if (data.type === "cancelled") {
+              state.finished = true;
+            } else if (data.type === "error") {
+              state.finished = true;
+              throw new Error(data.error);
             }
+          } catch (e) {
+            console.warn("JSON parse error in stream:", e, "Line:", line);
           }
         }
       }
-    } catch (error) {
-      console.error("❌ Stream error:", error);
-      throw error;
     }
   }
 
@@ -413,7 +465,10 @@ class HealthChatbot {
     if (!sources || sources.length === 0) return;
 
     const messageBody = messageEl.querySelector(".message-body");
-    if (!messageBody || messageBody.querySelector(".message-sources")) return;
+    if (!messageBody) return;
+    // Nguồn tạm (hiển thị ngay khi truy xuất xong) được thay bằng nguồn đã trích dẫn
+    const existing = messageBody.querySelector(".message-sources");
+    if (existing) existing.remove();
 
     const sourcesDiv = document.createElement("div");
     sourcesDiv.className = "message-sources";
@@ -0,0 +1,333 @@
+"""
+Benchmark bộ quét an toàn: so sánh verify_answer/sanitize_answer hiện tại với bản quét tuần tự cũ
+"""
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from backend.rag.prompts import (  # noqa: E402
+    ANSWER_STOP_LABELS,
+    DATASET_DISEASE_TERMS,
+    STRICT_FALLBACK_RESPONSE,
+    StructuredContext,
+    extract_sources_from_answer,
+    extract_sources_from_context,
+    format_context,
+    sanitize_answer,
+    scan_policy_terms,
+    verify_answer,
+)
+
+# Bản cài đặt cũ (mỗi danh sách cụm từ là một vòng `term in text` riêng, regex biên dịch
+# ở mỗi lần gọi) được giữ nguyên văn làm chuẩn đối chiếu: bộ quét mới phải cho ra
+# đúng cùng quyết định và cùng câu trả lời trên mọi mẫu.
+
+def legacy_violates_policy(answer: str) -> bool:
+    """Kiểm tra xem câu trả lời có vi phạm chính sách không"""
+    if not answer:
+        return False
+
+    text_lower = answer.lower()
+
+    diagnosis_flags = [
+        "tôi chẩn đoán",
+        "bạn bị bệnh",
+        "tôi kết luận"
+    ]
+
+    if any(flag in text_lower for flag in diagnosis_flags):
+        return True
+
+    return False
+
+
+def legacy_sanitize_answer(answer: str) -> str:
+    """Làm sạch câu trả lời và áp dụng safety filter"""
+    if not answer or not answer.strip():
+        return STRICT_FALLBACK_RESPONSE
+
+    if legacy_violates_policy(answer):
+        return STRICT_FALLBACK_RESPONSE
+
+    return answer
+
+
+def legacy_verify_answer(question: str, context: str, draft_answer: str) -> str:
+    """Xác minh và sửa lỗi câu trả lời trước khi trả về user."""
+    import re
+
+    _FALLBACK_MARKERS_V = [
+        "hiện tài liệu chưa cung cấp",
+        "không có thông tin về nội dung này",
+        "nguồn: không có",
+    ]
+
+    if not draft_answer or any(m in draft_answer.lower() for m in _FALLBACK_MARKERS_V):
+        return STRICT_FALLBACK_RESPONSE
+
+    if not context or str(context).strip() == StructuredContext.EMPTY_TEXT:
+        return f"{STRICT_FALLBACK_RESPONSE}\n\nNguồn: Không có"
+
+    context_lower = context.lower()
+    answer_lower = draft_answer.lower()
+
+    # [RULE 1]: HALLUCINATION DETECTION (Phát hiện Ảo giác)
+    DATASET_DISEASE_TERMS = [
+        'ebola', 'malaria', 'sốt rét', 'viêm màng não',
+        'viêm não nhật bản', 'parkinson', 'alzheimer',
+        'multiple sclerosis', 'xơ cứng bì', 'lupus', 'bệnh crohn',
+        'lao phổi', 'bệnh lao', 'bạch hầu', 'uốn ván', 'bại liệt',
+        'covid-19', 'covid19', 'covid 19', 'coronavirus', 'sars-cov', 'sars',
+        'sốt xuất huyết', 'dengue',
+        'đái tháo đường', 'tiểu đường type',
+        'tăng huyết áp', 'cao huyết áp',
+        'hen phế quản', 'hen suyễn',
+        'bệnh gút', 'gout',
+        'mụn trứng cá',
+        'viêm gan b',
+        'viêm da cơ địa',
+        'sỏi thận',
+        'nhiễm trùng đường tiết niệu',
+        'rối loạn lo âu',
+        'trầm cảm',
+        'ung thư',
+        'u nang buồng trứng',
+        'suy giáp',
+        'viêm kết mạc', 'đau mắt đỏ',
+        'thoái hóa khớp',
+        'còi xương',
+        'say nắng',
+        'suy dinh dưỡng',
+        'béo phì',
+        'rối loạn tiêu hóa',
+        'viêm họng cấp', 'viêm họng kích ứng',
+        'cảm lạnh',
+        'cúm mùa',
+        'mất nước',
+        'mất ngủ',
+        'stress',
+        'suy tim', 'nhồi máu cơ tim', 'rối loạn nhịp tim',
+        'đau lưng',
+        'đau bụng kinh',
+        'sỏi tiết niệu',
+        'giang mai', 'lậu', 'hiv', 'aids', 'sùi mào gà', 'đậu mùa khỉ',
+        'dại', 'tay chân miệng', 'thủy đậu', 'rubella',
+    ]
+
+    for term in DATASET_DISEASE_TERMS:
+        if term in answer_lower and term not in context_lower:
+            print(
+                f"[CANH BAO] HALLUCINATION DETECTED: '{term}' not in retrieved context")
+            return f"{STRICT_FALLBACK_RESPONSE}\n\nNguồn: Không có"
+
+    # [RULE 2]: TONE SOFTENING (Làm mềm sắc thái chẩn đoán)
+    diagnosis_phrases = [
+        'bạn bị bệnh', 'bạn mắc bệnh', 'bạn đang bị',
+        'tôi chẩn đoán', 'tôi kết luận'
+    ]
+    if any(phrase in answer_lower for phrase in diagnosis_phrases):
+        draft_answer = re.sub(
+            r'bạn (bị|mắc|đang bị) ([\w\s]+?)(?=[,.\n]|$)',
+            r'các triệu chứng này có thể liên quan đến \2',
+            draft_answer,
+            flags=re.IGNORECASE
+        )
+    # [RULE 2.5]: CHỐNG SUY LUẬN PHỦ ĐỊNH SAI LỆCH VỀ TRIỆU CHỨNG (Symptom Denial Prevention)
+    # Bắt các câu trả lời khẳng định "không phải là dấu hiệu của ung thư/bệnh hiểm nghèo"
+    # vì hệ thống không được phép loại trừ bệnh lý lâm sàng.
+    denial_patterns = [
+        r'không phải( là)? (dấu hiệu|triệu chứng) của (ung thư|khối u|bệnh tim)',
+        r'không có dấu hiệu( của)? ung thư',
+    ]
+    if any(re.search(pattern, answer_lower) for pattern in denial_patterns):
+        print(
+            "[CANH BAO] PHAT HIEN SUY LUAN PHU DINH NGUY HIEM (Negative Medical Denial).")
+        return f"{STRICT_FALLBACK_RESPONSE}\n\nNguồn: Không có"
+    # [RULE 3]: METADATA COMMENTARY REMOVAL (Xóa bỏ các câu bình luận rác của AI)
+    commentary_patterns = [
+        r'thông tin không được đề cập rõ ràng trong tài liệu',
+        r'tài liệu (không|chưa) (cung cấp|mô tả|nói đến|nhắc đến|ghi rõ|đề cập)( đầy đủ| chi tiết| rõ ràng)?',
+        r'thông tin (không|chưa) (được|đề cập)( chi tiết| đầy đủ| rõ ràng)?',
+        r'dataset (không|chưa) có( đủ)? thông tin',
+        r'theo tài liệu hiện có[,]?',
+        r'trong phạm vi tài liệu[,]?',
+        r'thông tin (trong|từ) (tài liệu|dataset) (không|chưa|hạn chế)',
+        r'không có tài liệu nào (mô tả|nói đến|đề cập)',
+        r'ngoài phạm vi của tài liệu',
+        r'các tài liệu (không|chưa) (cung cấp|đề cập)',
+        r'[Tt]uy nhiên[,\s]+không có thông tin[^.!?]*[.!?]\s*',
+        r'không có thông tin cụ thể về(?: việc)?[^.!?]*[.!?]\s*',
+        r'không có thông tin(?: cụ thể)? về(?: việc)?[^.!?\n]*[.!?]\s*',
+        r'chưa có thông tin(?: cụ thể)?[^.!?\n]*[.!?]\s*',
+        r'[Tt]uy nhiên[,\s]+chưa có thông tin[^.!?]*[.!?]\s*',
+        r'[^.!?\n]*không được đề cập trực tiếp[^.!?]*[.!?]\s*',
+        r'[^.!?\n]*trong các tài liệu cung cấp[^.!?]*[.!?]\s*',
+        r'[Tt]uy nhiên[,\s]+[^.!?]*được khuyến nghị[^.!?]*[.!?]\s*',
+        r'[Tt]uy nhiên[,\s]+[^.!?]*được khuyến khích[^.!?]*[.!?]\s*',
+        r'[Vv]í dụ[,\s]+trong chăm sóc cho[^.!?]*[.!?]\s*',
+        r'trong chăm sóc[^.!?]*được khuyến[^.!?]*[.!?]\s*',
+    ]
+    for pattern in commentary_patterns:
+        draft_answer = re.sub(pattern, '', draft_answer, flags=re.IGNORECASE)
+
+    # [RULE 4]: SOURCE GROUNDING (Đối chiếu và Sửa lỗi Nguồn tham khảo)
+    sources_in_context = extract_sources_from_context(context)
+    sources_in_answer = extract_sources_from_answer(draft_answer)
+
+    if sources_in_answer:
+        invalid_sources = [
+            s for s in sources_in_answer if s not in sources_in_context]
+        if invalid_sources:
+            print(
+                f"[CANH BAO] INVALID SOURCES in answer: {invalid_sources}. Replacing with context sources.")
+            valid_sources = [
+                s for s in sources_in_answer if s in sources_in_context]
+            replacement = ', '.join(
+                valid_sources) if valid_sources else ', '.join(sources_in_context)
+            draft_answer = re.sub(
+                r'Nguồn:.*?(?:\n|$)',
+                f'Nguồn: {replacement}\n',
+                draft_answer,
+                flags=re.IGNORECASE
+            )
+
+    # [RULE 5]: HARD LENGTH ENFORCEMENT (Kiểm soát độ dài bằng thuật toán cắt tỉa)
+    lines = draft_answer.split('\n')
+    main_lines, source_line = [], ""
+    for line in lines:
+        if line.strip().lower().startswith('ngu\u1ed3n:'):
+            source_line = line.strip()
+        elif line.strip():
+            main_lines.append(line)
+
+    main_text = ' '.join(main_lines).strip()
+
+    if not main_text:
+        return f"{STRICT_FALLBACK_RESPONSE}\n\nNguồn: Không có"
+
+    sentences = re.split(r'(?<=[.!?])\s+', main_text)
+
+    # =====================================================
+    # THUẬT TOÁN ĐIỀU CHỈNH ĐỘ DÀI DỰA THEO Ý ĐỊNH NGƯỜI DÙNG
+    # =====================================================
+    is_pure_question = bool(re.search(
+        r'(là (dấu hiệu|triệu chứng|biểu hiện) của bệnh gì)|(là bệnh gì)|((dấu hiệu|triệu chứng|biểu hiện) của (bệnh )?)|(có phải (là )?(dấu hiệu|triệu chứng))',
+        question.lower()
+    ))
+
+    if is_pure_question and len(sentences) > 1:
+        main_text = sentences[0].strip()
+        if not main_text.endswith(('.', '!', '?')):
+            main_text += '.'
+
+    elif len(sentences) > 3:
+        main_text = ' '.join(sentences[:3]).strip()
+        if not main_text.endswith(('.', '!', '?')):
+            main_text += '.'
+
+    final = main_text.strip()
+    if source_line:
+        final += f"\n\n{source_line}"
+
+    return final.strip()
+
+
+# ==========================================================
+# BỘ MẪU THỬ
+# Sinh tổ hợp câu trả lời/ngữ cảnh chạm tới mọi nhánh: ảo giác tên bệnh, câu chẩn đoán,
+# phủ định bệnh hiểm nghèo, bình luận về tài liệu, sửa nguồn, cắt độ dài.
+# ==========================================================
+
+_SOURCES = ['cum_mua.txt', 'sot_xuat_huyet.txt', 'ung_thu.txt', 'benh_tim.txt']
+_SENTENCES = [
+    "Sốt cao đột ngột, đau đầu và đau cơ là triệu chứng thường gặp.",
+    "Bạn bị bệnh cúm mùa, nên nghỉ ngơi.",
+    "Tôi chẩn đoán đây là sốt xuất huyết.",
+    "Đau ngực không phải là dấu hiệu của ung thư.",
+    "Không có dấu hiệu ung thư trong trường hợp này.",
+    "Theo tài liệu hiện có, cần uống nhiều nước.",
+    "Tuy nhiên, không có thông tin về việc dùng thuốc.",
+    "Bạn đang bị mất nước, hãy bù điện giải.",
+    "Bệnh có thể liên quan đến tăng huyết áp và suy tim.",
+    "Hiện tài liệu chưa cung cấp thông tin về nội dung này.",
+    "Người bệnh covid-19 cần cách ly.",
+    "Nên đi khám nếu triệu chứng kéo dài.",
+]
+_QUESTIONS = [
+    "Sốt và đau đầu là dấu hiệu của bệnh gì?",
+    "Triệu chứng của cúm mùa?",
+    "Đau ngực có phải triệu chứng ung thư không?",
+    "Làm sao phòng sốt xuất huyết?",
+]
+
+
+def build_samples(n: int = 400, seed: int = 7):
+    """Danh sách (câu hỏi, context dạng StructuredContext, câu trả lời nháp)"""
+    rng = random.Random(seed)
+    samples = []
+    for _ in range(n):
+        docs = [{
+            'content': " ".join(rng.sample(_SENTENCES, 3)) + " " +
+            " ".join(rng.sample(DATASET_DISEASE_TERMS, 4)),
+            'metadata': {'source': src}
+        } for src in rng.sample(_SOURCES, 2)]
+        cited = ", ".join(rng.sample(_SOURCES, rng.randint(1, 2)))
+        answer = " ".join(rng.sample(_SENTENCES, rng.randint(1, 5)))
+        if rng.random() < 0.3:
+            answer += " " + rng.choice(DATASET_DISEASE_TERMS) + "."
+        answer += f"\n\nNguồn: {cited}"
+        samples.append((rng.choice(_QUESTIONS), format_context(docs), answer))
+    return samples
+
+
+def legacy_pipeline(question, context, answer):
+    answer = legacy_sanitize_answer(answer)
+    if answer == STRICT_FALLBACK_RESPONSE:
+        return answer
+    return legacy_verify_answer(question, str(context), answer)
+
+
+def compiled_pipeline(question, context, answer):
+    hits = scan_policy_terms(answer, stop_labels=ANSWER_STOP_LABELS)
+    answer = sanitize_answer(answer, hits)
+    if answer == STRICT_FALLBACK_RESPONSE:
+        return answer
+    return verify_answer(question, context, answer, answer_hits=hits)
+
+
+def run(n: int = 400, rounds: int = 5):
+    """Trả về (số mẫu khác kết quả, thời gian cũ, thời gian mới) tính bằng giây"""
+    import contextlib
+    import io
+
+    samples = build_samples(n)
+    mismatches = 0
+    timings = {}
+    # Các hàm in cảnh báo ra stdout -> bỏ qua để không làm nhiễu số đo
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name, fn in (('legacy', legacy_pipeline), ('compiled', compiled_pipeline)):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                # Context mới mỗi vòng: không hưởng lợi từ bộ nhớ đệm của lần quét trước
+                for question, context, answer in samples:
+                    fn(question, StructuredContext(context.chunks), answer)
+            timings[name] = time.perf_counter() - start
+
+        for question, context, answer in samples:
+            if legacy_pipeline(question, context, answer) != compiled_pipeline(question, context, answer):
+                mismatches += 1
+    return mismatches, timings['legacy'], timings['compiled']
+
+
+if __name__ == "__main__":
+    mismatches, legacy_s, compiled_s = run()
+    print("=" * 70)
+    print("BENCHMARK - SAFETY ENGINE (verify_answer + sanitize_answer)")
+    print("=" * 70)
+    print(f"Quet tuan tu (cu):   {legacy_s * 1000:.1f} ms")
+    print(f"Quet mot luot (moi): {compiled_s * 1000:.1f} ms")
+    print(f"Tang toc:            x{legacy_s / compiled_s:.2f}")
+    print(f"Khac ket qua:        {mismatches}")
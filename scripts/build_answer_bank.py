@@ -0,0 +1,97 @@
+"""
+Script dựng kho câu trả lời (Answer Bank) cho mọi cặp (bệnh, ý định)
+Chạy lại sau mỗi lần build vector DB hoặc sửa tài liệu: chỉ các cặp có file nguồn thay đổi
+mới được hỏi lại LLM.
+"""
+from backend.rag.answer_bank import AnswerBank, canonical_questions, file_hash
+from backend.rag.chain import RAGChain
+from backend.rag.degraded import DEGRADED_NOTICE
+from backend.rag.prompts import STRICT_FALLBACK_RESPONSE, PROMPT_VERSION
+from config.config import config
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Can thiệp đường dẫn hệ thống để script độc lập import được các module nội bộ
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+
+def is_verified(answer: str) -> bool:
+    """Chỉ lưu câu trả lời đã qua mọi cổng kiểm duyệt và có trích dẫn nguồn"""
+    if not answer or "Nguồn:" not in answer:
+        # Thông báo lỗi LLM (hết hạn mức, quá tải, timeout) không có dòng nguồn
+        return False
+    if answer.startswith((STRICT_FALLBACK_RESPONSE, DEGRADED_NOTICE)):
+        return False
+    return "Nguồn: Không có" not in answer
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Dung kho cau tra loi dung san cho cac cap (benh, y dinh)")
+    parser.add_argument('--force', action='store_true',
+                        help="Hoi lai LLM cho moi cap (bo qua dung lai tang dan)")
+    parser.add_argument('--workers', type=int, default=config.ANSWER_BANK_WORKERS,
+                        help="So cau hoi gui song song (van qua bo gioi han RPM/TPM cua GroqClient)")
+    parser.add_argument('--db', default=None,
+                        help=f"File SQLite cua kho (mac dinh: {config.ANSWER_BANK_DB})")
+    args = parser.parse_args()
+
+    # Job offline: chờ bộ giới hạn lưu lượng thay vì bị từ chối ngay; không phục vụ từ chính
+    # kho đang dựng và không dùng câu trả lời trích xuất (cần câu trả lời của LLM)
+    config.GROQ_LIMITER_MAX_WAIT = max(config.GROQ_LIMITER_MAX_WAIT, 300.0)
+    config.ANSWER_BANK_ENABLED = False
+    config.EXTRACTIVE_ENABLED = False
+
+    print("=" * 70)
+    print("[TIEN TRINH] DUNG KHO CAU TRA LOI (ANSWER BANK)")
+    print("=" * 70)
+
+    chain = RAGChain()
+    index_version = chain.retriever.index_version
+    bank = AnswerBank(args.db)
+
+    files = sorted(config.HEALTH_KNOWLEDGE_DIR.glob('*.txt'))
+    hashes = {f.name: file_hash(f) for f in files}
+    questions = canonical_questions(hashes)
+    removed = bank.prune(questions)
+    rebuild, carry = bank.plan(questions, hashes, index_version, force=args.force)
+    bank.retag(carry, index_version)
+
+    print(f"[THONG TIN] Chi muc {index_version}, prompt {PROMPT_VERSION}")
+    print(f"[THONG TIN] {len(questions)} cap: {len(rebuild)} can hoi LLM, "
+          f"{len(carry)} giu nguyen (gan phien ban moi), {removed} da xoa")
+
+    stored, failed = 0, []
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = {pool.submit(chain.ask, questions[key]): key for key in rebuild}
+        for done, future in enumerate(as_completed(futures), 1):
+            source, intent = futures[future]
+            try:
+                answer = future.result()
+            except Exception as e:
+                answer = f"[LOI] {e}"
+            ok = is_verified(answer)
+            if ok:
+                bank.store(source, intent, questions[(source, intent)], answer,
+                           hashes[source], index_version)
+                stored += 1
+            else:
+                failed.append((source, intent, answer.split('\n')[0][:80]))
+            print(f"  [{done}/{len(rebuild)}] {source} x {intent}: {'OK' if ok else 'BO QUA'}")
+
+    print("\n" + "-" * 70)
+    print(f"[THANH CONG] Da luu {stored} cau tra loi trong {time.time() - start:.0f}s")
+    for source, intent, reason in failed:
+        print(f"  [BO QUA] {source} x {intent}: {reason}")
+    if failed:
+        # Các cặp bỏ qua (lỗi LLM, câu trả lời dự phòng) được thử lại ở lần chạy sau
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
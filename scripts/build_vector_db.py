@@ -98,6 +98,26 @@ def build_vector_database():
     # thành các tệp tin nhị phân (.faiss và .pkl).
     vector_store.save()
 
+    # ============================================
+    # BƯỚC 5.5: CHỈ MỤC SONG SONG CHO CASCADE RETRIEVAL (TÙY CHỌN)
+    # ============================================
+    # Chỉ mục của model nhỏ BẮT BUỘC được build từ cùng danh sách chunks, cùng thứ tự
+    # với chỉ mục chính để hai tầng trả về cùng một tập tài liệu.
+    if config.EMBEDDING_CASCADE_ENABLED:
+        print("\n[BUOC 5.5] BUILD FAST INDEX (CASCADE)")
+        print("-" * 70)
+        fast_embedder = EmbeddingModel(model_name=config.EMBEDDING_MODEL_FAST)
+        fast_docs = fast_embedder.encode_documents([
+            {'content': doc['content'], 'metadata': doc.get('metadata', {})}
+            for doc in encoded_docs
+        ])
+        fast_store = VectorStore(
+            dimension=fast_embedder.embedding_dim,
+            index_path=str(config.VECTOR_STORE_DIR / "health_faiss_fast.index")
+        )
+        fast_store.add_documents(fast_docs)
+        fast_store.save()
+
     # ============================================
     # BƯỚC 6: REPORTING (BÁO CÁO THỐNG KÊ)
     # ============================================
@@ -0,0 +1,64 @@
+"""
+Script chuẩn bị kho model nhúng cục bộ (Model Artifact Store)
+Chạy MỘT LẦN trên máy có mạng, sau đó sao chép thư mục MODEL_STORE_DIR sang các node ngoại tuyến.
+"""
+from backend.rag.model_store import ModelArtifactStore, ModelArtifactError
+from config.config import config
+import argparse
+import sys
+from pathlib import Path
+
+# Can thiệp đường dẫn hệ thống để script độc lập import được các module nội bộ
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+
+def default_models() -> list:
+    """Danh sách model mà hệ thống cần khi chạy (theo cấu hình hiện tại)"""
+    models = [config.EMBEDDING_MODEL_VI]
+    if config.EMBEDDING_CASCADE_ENABLED:
+        models.append(config.EMBEDDING_MODEL_FAST)
+    return models
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Chuan bi artifact model nhung cuc bo (safetensors + checksum)")
+    parser.add_argument('models', nargs='*',
+                        help="Ten model tren Hugging Face Hub (mac dinh: theo config)")
+    parser.add_argument('--force', action='store_true',
+                        help="Tai lai va ghi de artifact da ton tai")
+    parser.add_argument('--verify', action='store_true',
+                        help="Chi kiem tra checksum day du cua artifact da co")
+    parser.add_argument('--store-dir', default=None,
+                        help=f"Thu muc kho (mac dinh: {config.MODEL_STORE_DIR})")
+    args = parser.parse_args()
+
+    store = ModelArtifactStore(args.store_dir)
+    models = args.models or default_models()
+
+    print("=" * 70)
+    print("[TIEN TRINH] MODEL ARTIFACT STORE")
+    print("=" * 70)
+    print(f"[THONG TIN] Thu muc kho: {store.root}")
+
+    failed = False
+    for model_name in models:
+        try:
+            if args.verify:
+                manifest = store.verify(model_name, full=True)
+                print(
+                    f"[THANH CONG] {model_name}: {len(manifest['files'])} files khop checksum")
+            else:
+                path = store.prepare(model_name, force=args.force)
+                print(f"[THANH CONG] {model_name} -> {path}")
+        except ModelArtifactError as e:
+            print(f"[LOI] {e}")
+            failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
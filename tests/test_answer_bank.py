@@ -0,0 +1,42 @@
+from backend.rag.answer_bank import AnswerBank, canonical_questions
+from backend.rag.pipeline import RAGPipeline
+from backend.rag.pre_gate import PreGate
+
+
+class VersionedRetriever:
+    index_version = 'v2'
+    calls = 0
+
+    def retrieve(self, question, top_k=None, apply_threshold=True, trace=None):
+        self.calls += 1
+        return []
+
+
+def test_incremental_rebuild_and_first_turn_lookup(tmp_path):
+    questions = canonical_questions(['cum_mua.txt', 'soi_than.txt'], ['symptom', 'general'])
+    assert questions[('cum_mua.txt', 'symptom')] == "Triệu chứng của cúm mùa là gì?"
+
+    bank = AnswerBank(str(tmp_path / 'bank.sqlite'))
+    for (source, intent), question in questions.items():
+        bank.store(source, intent, question, f"{source}:{intent}\n\nNguồn: x", 'h1', 'v1')
+
+    # Chỉ file đã sửa được hỏi lại LLM; phần còn lại chỉ gắn phiên bản chỉ mục mới
+    rebuild, carry = bank.plan(questions, {'cum_mua.txt': 'h1', 'soi_than.txt': 'h2'}, 'v2')
+    assert sorted(rebuild) == [('soi_than.txt', 'general'), ('soi_than.txt', 'symptom')]
+    assert sorted(carry) == [('cum_mua.txt', 'general'), ('cum_mua.txt', 'symptom')]
+    bank.retag(carry, 'v2')
+
+    retriever = VersionedRetriever()
+    pipeline = RAGPipeline(retriever, top_k=3, pre_gate=PreGate(), answer_bank=bank)
+    for question in ("Cúm mùa có dấu hiệu gì?", "triệu chứng của bệnh cúm mùa"):
+        ctx = pipeline.prepare(question)
+        assert ctx.short_circuit_stage == 'answer_bank'
+        assert ctx.short_answer.startswith("cum_mua.txt:symptom")
+    assert retriever.calls == 0
+
+    # Câu hỏi cụ thể hơn câu hỏi chuẩn, bản ghi chưa dựng lại, hoặc đã có lịch sử -> RAG đầy đủ
+    for question, history in (("Triệu chứng cúm mùa ở trẻ sơ sinh?", None),
+                              ("Triệu chứng sỏi thận?", None),
+                              ("Triệu chứng cúm mùa?", [("Xin chào", "Chào bạn")])):
+        assert pipeline.prepare(question, history).short_circuit_stage != 'answer_bank'
+    assert bank.get_stats()['hits'] == 2
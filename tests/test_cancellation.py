@@ -0,0 +1,110 @@
+import threading
+import time
+
+import pytest
+
+from backend.api.groq_client import GroqClient
+from backend.api.mock_server import DEFAULT_CANNED_ANSWER, MockGroqServer
+from backend.api.resilience import CancellationToken
+from backend.rag.chain import RAGChain
+from config.config import config
+
+
+class FakeRetriever:
+    index_version = 'test'
+
+    def retrieve(self, question, top_k=None, apply_threshold=True, trace=None):
+        return [{
+            'content': "Cúm mùa - Dấu hiệu thường gặp:\n\nSốt cao.\nHo, đau họng.",
+            'metadata': {'source': 'cum_mua.txt', 'section_title': 'Dấu hiệu thường gặp'}
+        }]
+
+    def get_stats(self):
+        return {}
+
+
+@pytest.fixture
+def chain(monkeypatch):
+    monkeypatch.setattr(config, 'COMPLETION_CACHE_ENABLED', False)
+    monkeypatch.setattr(config, 'SINGLE_FLIGHT_ENABLED', False)
+    monkeypatch.setattr(config, 'ROUTER_MODE', 'off')
+    # Luồng chậm (~20 token/giây) để việc hủy chắc chắn rơi vào giữa câu trả lời
+    with MockGroqServer(ttft=0.05, tokens_per_second=20, seed=1) as server:
+        llm = GroqClient(api_key="mock-key-cancel", model="mock-model",
+                         base_url=server.base_url, max_retries=1)
+        yield RAGChain(retriever=FakeRetriever(), llm_client=llm), server
+
+
+def _wait_until(predicate, timeout=3.0):
+    end = time.time() + timeout
+    while time.time() < end and not predicate():
+        time.sleep(0.02)
+    return predicate()
+
+
+def test_cancel_mid_stream_closes_upstream_and_keeps_partial(chain):
+    chain, server = chain
+    token = CancellationToken()
+    events = chain.ask_events("Triệu chứng cúm mùa là gì?", cancel_token=token)
+    assert next(events)['type'] == 'retrieval_done'
+
+    threading.Timer(0.5, token.cancel, args=('client_disconnected',)).start()
+    start = time.time()
+    with pytest.raises(Exception, match="REQUEST_CANCELLED"):
+        next(events)
+
+    assert token.cancelled and token.reason == 'client_disconnected'
+    # Luồng HTTP tới Groq bị đóng ngay, không đợi model sinh hết câu trả lời (~2 giây)
+    assert _wait_until(lambda: server.stats['in_flight'] == 0, timeout=1.0)
+    assert time.time() - start < 1.5
+    assert token.partial_answer and DEFAULT_CANNED_ANSWER.startswith(token.partial_answer)
+    assert token.partial_answer != DEFAULT_CANNED_ANSWER
+    assert chain.get_stats()['requests_cancelled'] == 1
+
+
+def test_cancelled_stream_is_persisted_with_marker(chain, monkeypatch):
+    # frontend.app kết nối SQL Server lúc import
+    pytest.importorskip("pyodbc")
+    from backend.api.stream_buffer import StreamBuffer
+    import frontend.app as web
+
+    chain, server = chain
+
+    class RecordingDB:
+        def __init__(self):
+            self.saved = []
+
+        def create_chat_session(self, user_id, name):
+            return 1
+
+        def get_chat_history(self, session_id):
+            return []
+
+        def save_chat_message(self, session_id, sender, text):
+            self.saved.append((sender, text))
+
+    class Bot:
+        rag_chain = chain
+
+    db = RecordingDB()
+    monkeypatch.setattr(web, 'db', db)
+    monkeypatch.setattr(web, 'get_chatbot', lambda: Bot())
+    monkeypatch.setattr(web, 'stream_buffer', StreamBuffer(grace=0.05))
+
+    client = web.app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+    response = client.post('/api/chat/stream', json={'message': "Triệu chứng cúm mùa là gì?"},
+                           buffered=False)
+    body = iter(response.response)
+    assert b'session_id' in next(body)
+    time.sleep(0.4)
+    # Client đóng tab giữa chừng: hết thời gian chờ nối lại -> token bị hủy
+    response.close()
+
+    assert _wait_until(lambda: any(sender == 'BOT' for sender, _ in db.saved))
+    bot_text = [text for sender, text in db.saved if sender == 'BOT'][0]
+    assert bot_text.startswith(web.CANCELLED_MARKER)
+    assert bot_text != web.CANCELLED_MARKER
+    assert chain.get_stats()['requests_cancelled'] == 1
+    assert _wait_until(lambda: server.stats['in_flight'] == 0, timeout=1.0)
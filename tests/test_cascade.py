@@ -0,0 +1,73 @@
+from backend.rag.cascade import CascadeDenseSearcher
+
+
+class StubEmbedder:
+    embedding_dim = 4
+
+    def __init__(self, name):
+        self.model_name = name
+        self.calls = 0
+
+    def encode_text(self, text):
+        self.calls += 1
+        return [0.1] * self.embedding_dim
+
+
+class StubStore:
+    """Trả về danh sách kết quả cố định (score = khoảng cách L2, càng thấp càng gần)"""
+
+    def __init__(self, results):
+        self.results = results
+
+    def search(self, embedding, top_k=5):
+        return self.results[:top_k]
+
+
+def _doc(source, score):
+    return {'content': source, 'metadata': {'source': source}, 'score': score}
+
+
+def _searcher(fast_results):
+    full = StubStore([_doc('full.txt', 5.0)])
+    return CascadeDenseSearcher(
+        full_embedder=StubEmbedder('full'), full_store=full,
+        fast_embedder=StubEmbedder('fast'), fast_store=StubStore(fast_results),
+        max_distance=10.0, min_margin=2.0)
+
+
+def test_confident_fast_results_skip_the_full_model():
+    # Chunk cùng nguồn sát nhau không làm giảm biên độ: đo với nguồn khác (cum_mua vs cam_lanh)
+    searcher = _searcher([_doc('cum_mua.txt', 4.0), _doc('cum_mua.txt', 4.1),
+                          _doc('cam_lanh.txt', 7.0)])
+
+    results, _, tier = searcher.search("triệu chứng cúm", top_k=3)
+    assert tier == 'fast' and results[0]['metadata']['source'] == 'cum_mua.txt'
+    assert searcher.full_embedder.calls == 0
+
+
+def test_escalates_on_distance_margin_and_empty_results():
+    far = _searcher([_doc('cum_mua.txt', 12.0), _doc('cam_lanh.txt', 20.0)])
+    assert far.search("q", top_k=2)[2] == 'full'
+    assert far.full_embedder.calls == 1
+
+    close_call = _searcher([_doc('cum_mua.txt', 4.0), _doc('cam_lanh.txt', 5.0)])
+    results, _, tier = close_call.search("q", top_k=2)
+    assert tier == 'full' and results[0]['metadata']['source'] == 'full.txt'
+
+    assert _searcher([]).search("q", top_k=2)[2] == 'full'
+
+
+def test_stats_count_fast_hits_and_escalation_reasons():
+    searcher = _searcher([_doc('cum_mua.txt', 4.0), _doc('cam_lanh.txt', 9.0)])
+    searcher.search("q", top_k=2)
+    searcher.fast_store.results = [_doc('cum_mua.txt', 4.0), _doc('cam_lanh.txt', 5.0)]
+    searcher.search("q", top_k=2)
+    searcher.fast_store.results = []
+    searcher.search("q", top_k=2)
+
+    stats = searcher.get_stats()
+    assert stats['total_queries'] == 3 and stats['fast_served'] == 1
+    assert stats['escalated'] == 2
+    assert stats['escalation_rate'] == 2 / 3
+    assert stats['escalation_reasons'] == {'distance': 0, 'margin': 1, 'empty': 1}
+    assert stats['fast_model'] == 'fast' and stats['full_model'] == 'full'
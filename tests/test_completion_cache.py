@@ -0,0 +1,44 @@
+from backend.rag.completion_cache import CompletionCache, replay_stream
+
+MESSAGES = [{"role": "user", "content": "Triệu chứng cảm cúm là gì?"}]
+
+
+def test_key_depends_on_every_input():
+    base = CompletionCache.make_key("m", MESSAGES, 0.0, 512, "v1")
+    assert base == CompletionCache.make_key("m", MESSAGES, 0.0, 512, "v1")
+    assert base != CompletionCache.make_key("m2", MESSAGES, 0.0, 512, "v1")
+    assert base != CompletionCache.make_key("m", MESSAGES, 0.0, 256, "v1")
+    assert base != CompletionCache.make_key("m", MESSAGES, 0.0, 512, "v2")
+
+
+def test_lru_eviction_in_memory():
+    cache = CompletionCache(max_entries=2, db_path="")
+    for name in ("a", "b"):
+        cache.put(name, "ns", name.upper())
+    cache.get("a", "ns")          # 'a' vừa được dùng -> 'b' bị loại trước
+    cache.put("c", "ns", "C")
+    assert cache.get("b", "ns") is None
+    assert cache.get("a", "ns") == "A"
+    assert cache.get("c", "ns") == "C"
+
+
+def test_sqlite_tier_survives_restart_and_invalidates_on_namespace_change(tmp_path):
+    db = tmp_path / "completions.sqlite"
+    first = CompletionCache(db_path=str(db))
+    first.put("k", "index1:prompt1", "Câu trả lời")
+
+    second = CompletionCache(db_path=str(db))
+    assert second.get("k", "index1:prompt1") == "Câu trả lời"
+    assert second.get_stats()["hits_disk"] == 1
+
+    # Build lại chỉ mục -> namespace mới, bản ghi cũ không được trả về nữa
+    assert second.get("k", "index2:prompt1") is None
+    third = CompletionCache(db_path=str(db))
+    assert third.get("k", "index1:prompt1") is None
+
+
+def test_replay_stream_reconstructs_answer():
+    answer = "Cảm cúm gây sốt,  ho.\n\nNguồn: Cảm cúm"
+    pieces = list(replay_stream(answer))
+    assert len(pieces) > 1
+    assert "".join(pieces) == answer
@@ -0,0 +1,41 @@
+from backend.rag.context_compressor import ContextCompressor
+from backend.rag.prompts import extract_sources_from_context, format_context
+
+
+def _doc(source, text):
+    return {'content': text, 'metadata': {'source': source}}
+
+
+def test_compression_keeps_relevant_sentences_in_order_and_all_sources():
+    filler = "Bệnh có lịch sử nghiên cứu lâu đời tại nhiều quốc gia. " * 10
+    docs = [
+        _doc('sot_xuat_huyet.txt',
+             filler + "Triệu chứng gồm sốt cao đột ngột và xuất huyết dưới da. " + filler),
+        _doc('cum.txt', filler + "Cúm gây sốt, ho và đau họng."),
+    ]
+    compressor = ContextCompressor(max_chars=300, embedding_weight=0.0)
+
+    compressed = compressor.compress(docs, "triệu chứng sốt xuất huyết")
+    context = format_context(compressed)
+
+    assert "sốt cao đột ngột" in compressed[0]['content']
+    assert len(context) < len(format_context(docs))
+    assert extract_sources_from_context(context) == ['sot_xuat_huyet.txt', 'cum.txt']
+    assert docs[0]['content'].startswith(filler)  # Không sửa tài liệu gốc
+
+
+def test_short_context_is_left_untouched():
+    docs = [_doc('cum.txt', "Cúm gây sốt.")]
+    assert ContextCompressor(max_chars=1000).compress(docs, "cúm") is docs
+
+
+def test_compressed_docs_drop_stale_index_time_lowercase():
+    text = "Bệnh có lịch sử nghiên cứu lâu đời. " * 20 + "Cúm gây sốt, ho và đau họng."
+    doc = dict(_doc('cum.txt', text), content_lower=text.lower())
+    compressor = ContextCompressor(max_chars=100, embedding_weight=0.0)
+
+    compressed = compressor.compress([doc], "cúm gây sốt")
+    context = format_context(compressed)
+
+    assert 'content_lower' not in compressed[0]
+    assert context.chunks[0].lower == compressed[0]['content'].lower()
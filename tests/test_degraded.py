@@ -0,0 +1,66 @@
+from backend.rag.chain import RAGChain
+from backend.rag.degraded import DEGRADED_NOTICE
+from config.config import config
+
+
+class FakeRetriever:
+    index_version = 'test'
+
+    def retrieve(self, question, top_k=None, apply_threshold=True, trace=None):
+        return [{
+            'content': "Cúm mùa - Dấu hiệu thường gặp:\n\nSốt cao.\nHo, đau họng.\nUống thuốc hạ sốt.",
+            'metadata': {'source': 'cum_mua.txt', 'section_title': 'Dấu hiệu thường gặp'}
+        }]
+
+
+class ExhaustedLLM:
+    model = 'fake'
+    calls = 0
+
+    def __init__(self, error="API_DAILY_LIMIT"):
+        self.error = error
+
+    def chat_stream(self, messages, temperature=None, deadline=None):
+        self.calls += 1
+        raise Exception(self.error)
+        yield  # pragma: no cover
+
+
+def test_quota_exhaustion_serves_retrieval_summary_without_retrying(monkeypatch):
+    monkeypatch.setattr(config, 'COMPLETION_CACHE_ENABLED', False)
+    monkeypatch.setattr(config, 'SINGLE_FLIGHT_ENABLED', False)
+    monkeypatch.setattr(config, 'ROUTER_MODE', 'off')
+    llm = ExhaustedLLM()
+    chain = RAGChain(retriever=FakeRetriever(), llm_client=llm)
+
+    for _ in range(3):
+        events = list(chain.ask_events("Triệu chứng cúm mùa là gì?"))
+        assert events[-1]['type'] == 'degraded'
+        assert events[-1]['reason'] == 'API_DAILY_LIMIT'
+        answer = events[-1]['content']
+        assert answer.startswith(DEGRADED_NOTICE)
+        assert "sốt cao; ho, đau họng" in answer
+        assert "thuốc" not in answer
+        assert answer.endswith("Nguồn: Cúm mùa")
+
+    # Chỉ lần đầu chạm tới LLM; các request sau trong thời gian hồi phục bỏ qua LLM
+    assert llm.calls == 1
+    stats = chain.degraded.get_stats()
+    assert stats['active'] and stats['times_entered'] == 1 and stats['served'] == 3
+
+
+def test_client_side_load_shedding_does_not_trip_degraded_mode(monkeypatch):
+    monkeypatch.setattr(config, 'COMPLETION_CACHE_ENABLED', False)
+    monkeypatch.setattr(config, 'SINGLE_FLIGHT_ENABLED', False)
+    monkeypatch.setattr(config, 'ROUTER_MODE', 'off')
+    llm = ExhaustedLLM("API_LOAD_SHED")
+    chain = RAGChain(retriever=FakeRetriever(), llm_client=llm)
+
+    for _ in range(2):
+        events = list(chain.ask_events("Triệu chứng cúm mùa là gì?"))
+        assert events[-1]['type'] != 'degraded'
+        assert "quá tải" in events[-1]['content']
+
+    # Hàng đợi cục bộ đầy không phải sự cố Groq: mỗi request vẫn thử gọi LLM
+    assert llm.calls == 2
+    assert chain.degraded.get_stats()['times_entered'] == 0
@@ -0,0 +1,71 @@
+from pathlib import Path
+
+from backend.rag.extractive import ExtractiveAnswerer
+from backend.rag.pipeline import RAGPipeline
+from backend.rag.pre_gate import PreGate
+from backend.utils.chunking import SectionBasedChunker
+
+KNOWLEDGE_DIR = Path(__file__).parent.parent / 'data' / 'health_knowledge'
+
+
+def _indexed_docs():
+    chunker = SectionBasedChunker()
+    docs = []
+    for path in sorted(KNOWLEDGE_DIR.glob('*.txt')):
+        docs.extend(chunker.chunk_by_sections(
+            path.read_text(encoding='utf-8'), {'source': path.name}))
+    return docs
+
+
+def test_single_intent_disease_question_skips_retrieval_and_llm():
+    class CountingRetriever:
+        calls = 0
+
+        def retrieve(self, question, top_k=None, apply_threshold=True, trace=None):
+            self.calls += 1
+            return []
+
+    extractive = ExtractiveAnswerer(_indexed_docs())
+    retriever = CountingRetriever()
+    pipeline = RAGPipeline(retriever, top_k=3, pre_gate=PreGate(), extractive=extractive)
+
+    ctx = pipeline.prepare("Triệu chứng của cúm mùa?")
+    assert ctx.short_circuit_stage == 'extractive'
+    assert retriever.calls == 0
+    assert ctx.short_answer.endswith("Nguồn: Cúm mùa")
+
+    # Hai ý định trong cùng câu hỏi -> đi tiếp luồng RAG
+    ctx = pipeline.prepare("Triệu chứng và nguyên nhân của cúm mùa?")
+    assert ctx.short_circuit_stage != 'extractive'
+    assert retriever.calls == 1
+
+    stats = extractive.get_stats()
+    assert stats['checked'] == 2 and stats['answered'] == 1
+    assert stats['by_intent']['symptom'] == 1
+
+
+def test_qualified_or_follow_up_questions_fall_through_to_rag():
+    class CountingRetriever:
+        calls = 0
+
+        def retrieve(self, question, top_k=None, apply_threshold=True, trace=None):
+            self.calls += 1
+            return []
+
+    extractive = ExtractiveAnswerer(_indexed_docs())
+    retriever = CountingRetriever()
+    pipeline = RAGPipeline(retriever, top_k=3, pre_gate=PreGate(), extractive=extractive)
+
+    # Câu hỏi có điều kiện không nhận mục chung của bệnh
+    for question in ["Triệu chứng cúm mùa ở trẻ sơ sinh?",
+                     "Triệu chứng cúm mùa ở phụ nữ mang thai có khác không?",
+                     "Tôi bị cúm mùa 5 ngày rồi, khi nào cần đi khám?"]:
+        assert extractive.match(question) is None, question
+        assert pipeline.prepare(question).short_circuit_stage != 'extractive'
+    assert extractive.match("Khi nào cần đi khám cúm mùa?") is not None
+
+    # Câu hỏi nối tiếp hội thoại luôn đi luồng RAG
+    history = [("Cúm mùa là gì?", "Cúm mùa là bệnh nhiễm virus cúm.")]
+    ctx = pipeline.prepare("Triệu chứng của cúm mùa?", chat_history=history)
+    assert ctx.short_circuit_stage != 'extractive'
+    assert retriever.calls == 4
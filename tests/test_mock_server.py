@@ -0,0 +1,164 @@
+import asyncio
+import time
+
+import pytest
+
+from backend.api.groq_client import GroqClient
+from backend.api.mock_server import MockGroqServer
+
+MESSAGES = [{"role": "user", "content": "Triệu chứng cảm cúm là gì?"}]
+
+
+@pytest.fixture
+def server():
+    with MockGroqServer(ttft=0.05, tokens_per_second=500, seed=1) as srv:
+        yield srv
+
+
+def test_chat_and_stream_against_mock(server):
+    client = GroqClient(api_key="mock-key-0001", base_url=server.base_url)
+
+    answer = client.chat(MESSAGES, temperature=0.0)
+    assert answer.endswith("Nguồn: cam_cum.txt")
+
+    start = time.time()
+    chunks = list(client.chat_stream(MESSAGES, temperature=0.0))
+    assert len(chunks) > 5
+    assert "".join(chunks) == answer
+    assert time.time() - start >= 0.05
+    assert server.stats["streams"] == 1
+
+
+def test_stream_reconciles_limiter_from_final_chunk_usage(server, monkeypatch):
+    client = GroqClient(api_key="mock-key-0006", base_url=server.base_url)
+    calls = []
+    monkeypatch.setattr(client.limiter, "reconcile",
+                        lambda estimated, actual: calls.append((estimated, actual)))
+
+    list(client.chat_stream(MESSAGES, max_tokens=500))
+    assert len(calls) == 1
+    estimated, actual = calls[0]
+    assert 0 < actual < estimated
+
+
+def test_async_stream_against_mock(server):
+    client = GroqClient(api_key="mock-key-0002", base_url=server.base_url)
+
+    async def run():
+        try:
+            return [c async for c in client.chat_stream_async(MESSAGES)]
+        finally:
+            await client.aclose()
+
+    assert "".join(asyncio.run(run())).startswith("Cảm cúm")
+
+
+def test_async_client_is_kept_per_event_loop(server):
+    client = GroqClient(api_key="mock-key-0007", base_url=server.base_url)
+
+    async def ask():
+        return await client.chat_async(MESSAGES), client._get_async_client()
+
+    # Loop đầu không gọi aclose(): client của nó bị bỏ khi loop đã đóng, không dùng lại
+    first_answer, first = asyncio.run(ask())
+    second_answer, second = asyncio.run(ask())
+    assert first_answer == second_answer
+    assert first is not second
+    assert len(client._async_clients) == 1
+
+
+def test_daily_limit_injection_maps_to_api_daily_limit():
+    with MockGroqServer(ttft=0, daily_token_limit=1) as srv:
+        client = GroqClient(api_key="mock-key-0003", base_url=srv.base_url)
+        with pytest.raises(Exception, match="API_DAILY_LIMIT"):
+            client.chat(MESSAGES)
+        assert srv.stats["daily_limited"] == 1
+
+
+def test_echo_mode_returns_question(server):
+    server.answer_mode = "echo"
+    client = GroqClient(api_key="mock-key-0004", base_url=server.base_url)
+    assert "Triệu chứng cảm cúm" in client.chat(MESSAGES)
+
+
+def test_pool_fails_over_and_ejects_exhausted_key():
+    from backend.api.client_pool import GroqClientPool
+
+    with MockGroqServer(ttft=0, daily_token_limit=1) as exhausted, \
+            MockGroqServer(ttft=0, tokens_per_second=1000) as healthy:
+        pool = GroqClientPool(api_keys=["pool-key-aaaa", "pool-key-bbbb"],
+                              models=[("mock-model", 1.0)], base_url=exhausted.base_url)
+        pool.endpoints[1].client = GroqClient(
+            api_key="pool-key-bbbb", model="mock-model", base_url=healthy.base_url)
+        # Ưu tiên endpoint hết quota trước để kiểm tra failover
+        pool.endpoints[0].weight = 100.0
+
+        assert pool.chat(MESSAGES).startswith("Cảm cúm")
+        assert "".join(pool.chat_stream(MESSAGES)).startswith("Cảm cúm")
+
+        stats = pool.get_stats()
+        assert stats["failovers"] == 1
+        assert stats["endpoints"][0]["eject_reason"] == "daily_limit"
+        assert exhausted.stats["daily_limited"] == 1
+        assert healthy.stats["requests"] == 2
+
+
+def test_stream_ttft_timeout_and_circuit_breaker(monkeypatch):
+    from config.config import config
+    from backend.api.resilience import Deadline
+
+    monkeypatch.setattr(config, "GROQ_STREAM_TTFT_TIMEOUT", 0.2)
+    monkeypatch.setattr(config, "CIRCUIT_MIN_REQUESTS", 1)
+    with MockGroqServer(ttft=2.0, tokens_per_second=500, seed=1) as slow:
+        client = GroqClient(api_key="mock-key-0005", base_url=slow.base_url)
+        client.client = client.client.with_options(max_retries=0)
+
+        start = time.time()
+        with pytest.raises(Exception, match="API_TIMEOUT"):
+            list(client.chat_stream(MESSAGES, deadline=Deadline(5.0)))
+        assert time.time() - start < 1.5
+
+        # Tỉ lệ lỗi 100% -> cầu dao mở, lệnh gọi tiếp theo thất bại ngay không chạm mạng
+        assert client.get_stats()["circuit_breaker"]["state"] == "open"
+        with pytest.raises(Exception, match="API_CIRCUIT_OPEN"):
+            client.chat(MESSAGES)
+
+
+def test_pool_endpoints_fail_fast_on_rate_limit():
+    from backend.api.client_pool import GroqClientPool
+
+    with MockGroqServer(ttft=0, rate_limit_rate=1.0, retry_after=5.0) as limited, \
+            MockGroqServer(ttft=0, tokens_per_second=1000) as healthy:
+        pool = GroqClientPool(api_keys=["pool-key-cccc", "pool-key-dddd"],
+                              models=[("mock-model", 1.0)], base_url=limited.base_url)
+        pool.endpoints[1].client = GroqClient(
+            api_key="pool-key-dddd", model="mock-model", base_url=healthy.base_url)
+        pool.endpoints[0].weight = 100.0
+
+        # 429 được báo ngay cho pool: không chờ retry-after (5s) trên endpoint bị giới hạn
+        start = time.time()
+        assert pool.chat(MESSAGES).startswith("Cảm cúm")
+        assert time.time() - start < 2.0
+        assert limited.stats["requests"] == 1
+        assert pool.get_stats()["endpoints"][0]["eject_reason"] == "rate_limit"
+
+
+def test_pool_reads_limiter_quota_outside_its_lock():
+    from backend.api.client_pool import GroqClientPool
+
+    pool = GroqClientPool(api_keys=["pool-key-eeee", "pool-key-ffff"],
+                          models=[("mock-model", 1.0)], base_url="http://127.0.0.1:9")
+    locked_reads = []
+    for endpoint in pool.endpoints:
+        limiter = endpoint.client.limiter
+        original = limiter.get_stats
+
+        def get_stats(original=original):
+            locked_reads.append(pool._lock.locked())
+            return original()
+        limiter.get_stats = get_stats
+
+    endpoint = pool._acquire(set())
+    pool._release(endpoint, latency=0.1)
+    pool.get_stats()
+    assert locked_reads and not any(locked_reads)
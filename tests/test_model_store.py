@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+
+import pytest
+
+from backend.rag.model_store import (
+    MANIFEST_FILE,
+    VERIFIED_STAMP_FILE,
+    ModelArtifactError,
+    ModelArtifactStore,
+)
+
+MODEL = "org/tiny-model"
+
+
+def _store(tmp_path):
+    """Kho artifact nhỏ trên đĩa, manifest ghi tay (không truy cập Hub)"""
+    store = ModelArtifactStore(tmp_path)
+    model_dir = store.path_for(MODEL)
+    (model_dir / "1_Pooling").mkdir(parents=True)
+    contents = {"model.safetensors": b"weights-0123456789", "config.json": b'{"dim": 4}',
+                "1_Pooling/config.json": b'{"mode": "mean"}'}
+    files = {}
+    for rel, data in contents.items():
+        (model_dir / rel).write_bytes(data)
+        files[rel] = {"sha256": hashlib.sha256(data).hexdigest(), "size": len(data)}
+    (model_dir / MANIFEST_FILE).write_text(
+        json.dumps({"model_name": MODEL, "embedding_dimension": 4, "files": files}),
+        encoding="utf-8")
+    return store, model_dir
+
+
+def test_verify_accepts_intact_artifact_and_writes_stamp(tmp_path):
+    store, model_dir = _store(tmp_path)
+    assert store.has(MODEL) and not store.has("org/other")
+    assert model_dir.name == "org__tiny-model"
+
+    manifest = store.verify(MODEL)
+    assert manifest["embedding_dimension"] == 4
+    stamp = json.loads((model_dir / VERIFIED_STAMP_FILE).read_text(encoding="utf-8"))
+    assert set(stamp) == set(manifest["files"])
+
+
+@pytest.mark.parametrize("damage", ["missing", "size", "tampered"])
+def test_verify_fails_loudly_on_damaged_artifact(tmp_path, damage):
+    store, model_dir = _store(tmp_path)
+    store.verify(MODEL)
+    weights = model_dir / "model.safetensors"
+    if damage == "missing":
+        weights.unlink()
+    elif damage == "size":
+        weights.write_bytes(b"truncated")
+    else:
+        # Cùng kích thước, khác nội dung -> chỉ SHA-256 phát hiện được
+        weights.write_bytes(b"weights-9876543210")
+
+    with pytest.raises(ModelArtifactError):
+        store.verify(MODEL)
+
+
+def test_manifest_must_exist_and_belong_to_the_model(tmp_path):
+    store, model_dir = _store(tmp_path)
+    with pytest.raises(ModelArtifactError, match="prepare_models"):
+        store.verify("org/not-prepared")
+
+    manifest = json.loads((model_dir / MANIFEST_FILE).read_text(encoding="utf-8"))
+    manifest["model_name"] = "org/other-model"
+    (model_dir / MANIFEST_FILE).write_text(json.dumps(manifest), encoding="utf-8")
+    with pytest.raises(ModelArtifactError, match="other-model"):
+        store.verify(MODEL)
+
+
+def test_stamp_fast_path_skips_rehash_until_file_changes(tmp_path, monkeypatch):
+    store, model_dir = _store(tmp_path)
+    store.verify(MODEL)
+
+    hashed = []
+    original = ModelArtifactStore._sha256
+    monkeypatch.setattr(ModelArtifactStore, "_sha256",
+                        staticmethod(lambda path: hashed.append(path.name) or original(path)))
+
+    store.verify(MODEL)
+    assert hashed == []
+
+    # Ghi đè giữ nguyên kích thước + mtime: dấu vẫn khớp, chỉ full=True mới băm lại
+    weights = model_dir / "model.safetensors"
+    stat = weights.stat()
+    weights.write_bytes(b"weights-9876543210")
+    os.utime(weights, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    store.verify(MODEL)
+    assert hashed == []
+    with pytest.raises(ModelArtifactError, match="Checksum"):
+        store.verify(MODEL, full=True)
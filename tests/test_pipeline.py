@@ -0,0 +1,51 @@
+from backend.rag.pipeline import RAGPipeline
+from backend.rag.prompts import NO_DOCS_FOUND_RESPONSE
+
+
+class FakeRetriever:
+    def __init__(self, docs):
+        self.docs = docs
+        self.calls = 0
+
+    def retrieve(self, question, top_k=None, apply_threshold=True, trace=None):
+        self.calls += 1
+        return self.docs
+
+
+DOCS = [{
+    'content': "Cúm mùa gây sốt cao, ho, đau họng và đau nhức cơ thể.",
+    'metadata': {'source': 'cum_mua.txt'}
+}]
+
+
+def test_greeting_short_circuits_before_retrieval():
+    retriever = FakeRetriever(DOCS)
+    pipeline = RAGPipeline(retriever, top_k=3)
+
+    ctx = pipeline.prepare("Xin chào")
+
+    assert ctx.short_answer
+    assert ctx.short_circuit_stage == 'pre_gates'
+    assert retriever.calls == 0
+    assert pipeline.get_stats()['pre_gates']['short_circuits'] == 1
+
+
+def test_food_gate_and_timed_stages():
+    pipeline = RAGPipeline(FakeRetriever(DOCS), top_k=3)
+
+    blocked = pipeline.prepare("Mật ong có chữa được cúm không?")
+    assert blocked.short_circuit_stage == 'context_gates'
+    assert blocked.short_answer.startswith(NO_DOCS_FOUND_RESPONSE)
+
+    ctx = pipeline.prepare("Triệu chứng cúm mùa là gì?")
+    assert ctx.short_answer is None
+    assert ctx.messages
+    assert set(ctx.timings) == {'pre_gates', 'retrieve', 'context_gates', 'build_prompt'}
+    assert pipeline.prompt_sources(ctx) == ['Cúm mùa']
+
+
+def test_source_rewrite_maps_filenames_and_cleans_text():
+    pipeline = RAGPipeline(FakeRetriever(DOCS), top_k=3)
+    answer = pipeline._rewrite_sources(
+        "Sốt cao,  , ho.\n\nNguồn: cum_mua.txt, tiem_chung.txt", "")
+    assert answer == "Sốt cao, ho.\n\nNguồn: Cúm mùa"
@@ -0,0 +1,87 @@
+import random
+from pathlib import Path
+
+from backend.rag.pipeline import RAGPipeline
+from backend.rag.pre_gate import (
+    PreGate,
+    VERDICT_BLOCKED,
+    VERDICT_FAREWELL,
+    VERDICT_GREETING,
+    VERDICT_OUT_OF_DOMAIN,
+    VERDICT_PROCEED,
+)
+from backend.rag.prompts import NO_DOCS_FOUND_RESPONSE, is_farewell, is_greeting
+from backend.utils.query_normalizer import should_block_query
+from config.config import config
+
+KNOWLEDGE_DIR = Path(__file__).parent.parent / 'data' / 'health_knowledge'
+SYMPTOM_QUESTIONS = ["mắt tôi bị đỏ và ngứa", "bé nhà em nổi mẩn đỏ khắp người",
+                     "trieu chung cum mua la gi"]
+
+
+def _gate():
+    return PreGate([{'content': f.read_text(encoding='utf-8')}
+                    for f in KNOWLEDGE_DIR.glob('*.txt')])
+
+
+def _legacy_verdict(question):
+    if is_greeting(question):
+        return VERDICT_GREETING
+    if is_farewell(question):
+        return VERDICT_FAREWELL
+    if should_block_query(question)[0]:
+        return VERDICT_BLOCKED
+    return VERDICT_PROCEED
+
+
+def test_single_pass_matches_legacy_gates():
+    gate = PreGate()
+    words = ["xin chào", "Chào bạn", "hi", "hiv", "thank", "tạm biệt", "bye", "cảm ơn",
+             "điều trị", "uống thuốc", "liều", "kháng sinh", "thuốc", "aspirin", "chữa trị",
+             "sốt", "đau đầu", "cúm", "là gì", "như thế nào", "chàoo", "this", "hey", "?"]
+    rng = random.Random(5)
+    for _ in range(2000):
+        question = " ".join(rng.sample(words, rng.randint(1, 4)))
+        assert gate.classify(question)[0] == _legacy_verdict(question), question
+
+
+def test_symptom_questions_are_never_out_of_domain(monkeypatch):
+    # Mặc định tắt: không dựng từ vựng, mọi câu hỏi y khoa đều được truy xuất
+    assert _gate().vocabulary is None
+
+    monkeypatch.setattr(config, 'PRE_GATE_OUT_OF_DOMAIN_ENABLED', True)
+    gate = _gate()
+    for question in SYMPTOM_QUESTIONS + ["Đau bụng kinh phải làm sao?", "rụng tóc",
+                                         "Cách làm bánh kem"]:
+        assert gate.classify(question)[0] == VERDICT_PROCEED, question
+
+
+def test_out_of_domain_and_negative_cache_skip_retrieval(monkeypatch):
+    monkeypatch.setattr(config, 'PRE_GATE_OUT_OF_DOMAIN_ENABLED', True)
+    gate = _gate()
+
+    assert gate.classify("bitcoin price today")[0] == VERDICT_OUT_OF_DOMAIN
+
+    class EmptyRetriever:
+        calls = 0
+
+        def retrieve(self, question, top_k=None, apply_threshold=True, trace=None):
+            self.calls += 1
+            return []
+
+    retriever = EmptyRetriever()
+    pipeline = RAGPipeline(retriever, top_k=3, pre_gate=gate)
+    assert pipeline.prepare("bitcoin price today").short_circuit_stage == 'pre_gates'
+    assert retriever.calls == 0
+
+    pipeline = RAGPipeline(retriever, top_k=3, pre_gate=PreGate())
+    assert pipeline.prepare("Bệnh ù tai").short_answer == NO_DOCS_FOUND_RESPONSE
+    again = pipeline.prepare("bệnh  Ù tai ")
+    assert again.short_circuit_stage == 'pre_gates'
+    assert again.short_answer == NO_DOCS_FOUND_RESPONSE
+    assert retriever.calls == 1
+
+    # Build lại chỉ mục: kết quả âm của phiên bản cũ không còn được dùng
+    retriever.index_version = 'v2'
+    assert pipeline.prepare("Bệnh ù tai").short_circuit_stage == 'retrieve'
+    assert retriever.calls == 2
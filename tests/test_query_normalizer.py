@@ -0,0 +1,43 @@
+import random
+import re
+
+from backend.utils.query_normalizer import FILLER_WORDS, SYNONYM_PATTERNS, normalize_query
+
+
+def _legacy_normalize_query(query):
+    """Bản tuần tự cũ (re.search rồi re.sub cho từng mẫu), bỏ các lệnh print"""
+    if not query or not query.strip():
+        return query
+    normalized = query.lower().strip()
+    for pattern, replacement in SYNONYM_PATTERNS.items():
+        if re.search(pattern, normalized):
+            normalized = re.sub(pattern, replacement, normalized)
+    for filler in FILLER_WORDS:
+        if re.search(filler, normalized):
+            normalized = re.sub(filler, '', normalized)
+    normalized = re.sub(r'[?!.,;]+', ' ', normalized)
+    return re.sub(r'\s+', ' ', normalized).strip()
+
+
+_PHRASES = [
+    "Tôi bị ho khan", "bị sốt cao", "sốt kéo dài", "bị đau đầu", "đau họng", "viêm phổi",
+    "làm gì khi", "phòng tránh", "điều trị", "cách xử lý", "nên làm gì", "Tại sao",
+    "lý do", "biểu hiện", "các dấu hiệu của", "triệu chứng là gì", "khi nào nên đi khám",
+    "đến bác sĩ", "bị mệt", "uể oải", "nôn ói", "hoa mắt", "thở gấp", "ỉa chảy",
+    "nổi mề đay", "ngạt mũi", "rát họng", "đau lưng dưới", "nhức khớp", "viêm xoang",
+    "căng thẳng", "tiểu đường", "tieu duong", "béo phì", "trào ngược", "đau dạ dày",
+    "như thế nào", "ra sao", "giúp tôi", "cho mình", "hãy", "vui lòng", "xin",
+    "bệnh cúm", "trẻ em", "hoặc", "bịho", "xinh", "mệtmỏi", "COVID-19",
+]
+
+
+def test_compiled_rules_match_sequential_regexes():
+    rng = random.Random(11)
+    queries = ["", "   ", "Xin chào!", "Sốt xuất huyết có nguy hiểm không?"]
+    for _ in range(2000):
+        words = rng.sample(_PHRASES, rng.randint(1, 6))
+        query = " ".join(w.upper() if rng.random() < 0.1 else w for w in words)
+        queries.append(query + rng.choice(["", "?", " ...", "!!", ","]))
+
+    for query in queries:
+        assert normalize_query(query) == _legacy_normalize_query(query), query
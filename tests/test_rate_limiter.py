@@ -0,0 +1,140 @@
+import threading
+import time
+
+import pytest
+
+from backend.api.rate_limiter import RateLimiter, estimate_tokens, parse_reset_duration
+
+
+def test_parse_reset_duration():
+    """Kiểm tra đọc thời lượng từ header của Groq"""
+    assert parse_reset_duration("7.66s") == pytest.approx(7.66)
+    assert parse_reset_duration("2m59.56s") == pytest.approx(179.56)
+    assert parse_reset_duration("120ms") == pytest.approx(0.12)
+    assert parse_reset_duration("12") == 12.0
+    assert parse_reset_duration(None) is None
+
+
+def test_estimate_tokens_includes_completion_budget():
+    messages = [{"role": "user", "content": "a" * 300}]
+    assert estimate_tokens(messages, max_tokens=100) == 100 + 4 + 100
+
+
+def test_requests_are_served_in_fifo_order():
+    """Các request chờ hạn mức phải được phục vụ theo thứ tự đến"""
+    limiter = RateLimiter(name="fifo", rpm=600, tpm=100000,
+                          max_wait=5, state_file="")
+    # Rút cạn bucket request: 600 RPM = 10 request/giây
+    for _ in range(600):
+        limiter.acquire(1)
+
+    order = []
+
+    def worker(i):
+        limiter.acquire(1)
+        order.append(i)
+
+    threads = []
+    for i in range(5):
+        t = threading.Thread(target=worker, args=(i,))
+        t.start()
+        threads.append(t)
+        time.sleep(0.02)
+    for t in threads:
+        t.join()
+
+    assert order == [0, 1, 2, 3, 4]
+    stats = limiter.get_stats()
+    assert stats["max_queue_depth"] >= 2
+    assert stats["max_wait_s"] > 0
+
+
+def test_load_shedding_when_projected_wait_exceeds_deadline():
+    limiter = RateLimiter(name="shed", rpm=60, tpm=600,
+                          max_wait=1, state_file="")
+    limiter.acquire(600)
+    with pytest.raises(Exception, match="API_LOAD_SHED"):
+        limiter.acquire(300)
+    assert limiter.get_stats()["shed"] == 1
+
+
+def test_deep_queue_projects_beyond_one_bucket_refill():
+    limiter = RateLimiter(name="deep", rpm=60, tpm=600,
+                          max_wait=90, state_file="")
+    limiter.acquire(600)
+    # Ba request đầy bucket đang xếp hàng phía trước -> phải chờ ~4 lượt nạp lại
+    limiter._queue = [(i, 600) for i in range(3)]
+    assert limiter._projected_wait(600) > 200
+    with pytest.raises(Exception, match="API_LOAD_SHED"):
+        limiter.acquire(10)
+    # Một request lớn hơn bucket vẫn chỉ chờ bucket đầy
+    limiter._queue = []
+    assert limiter._projected_wait(5000) <= 60.5
+
+
+def test_headers_shrink_token_bucket_and_pause_on_retry_after():
+    limiter = RateLimiter(name="headers", rpm=60, tpm=6000,
+                          max_wait=1, state_file="")
+    limiter.update_from_headers({
+        "x-ratelimit-limit-tokens": "6000",
+        "x-ratelimit-remaining-tokens": "100",
+        "retry-after": "30",
+    })
+    stats = limiter.get_stats()
+    assert stats["tokens_available"] <= 200
+    assert stats["paused_for_s"] > 25
+    with pytest.raises(Exception, match="API_LOAD_SHED"):
+        limiter.acquire(10)
+
+
+def test_sqlite_state_is_shared_between_limiters(tmp_path):
+    """Hai limiter cùng file SQLite (mô phỏng hai tiến trình) dùng chung một bucket"""
+    state_file = tmp_path / "limiter.sqlite"
+    a = RateLimiter(name="shared", rpm=60, tpm=1000,
+                    max_wait=0.5, state_file=str(state_file))
+    b = RateLimiter(name="shared", rpm=60, tpm=1000,
+                    max_wait=0.5, state_file=str(state_file))
+    a.acquire(900)
+    assert b.get_stats()["tokens_available"] < 200
+    with pytest.raises(Exception, match="API_LOAD_SHED"):
+        b.acquire(900)
+
+
+def test_acquire_async_keeps_event_loop_free_and_cleans_up_on_cancel():
+    """Khóa/giao dịch bị chiếm không được chặn event loop; request bị huỷ rời hàng đợi"""
+    import asyncio
+
+    limiter = RateLimiter(name="async", rpm=60, tpm=100000, max_wait=30, state_file="")
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticking = asyncio.ensure_future(ticker())
+        # Giả lập giao dịch SQLite đang bận ở tiến trình/thread khác
+        holder = threading.Thread(target=lambda: (limiter._lock.acquire(), time.sleep(0.3),
+                                                  limiter._lock.release()))
+        holder.start()
+        await asyncio.sleep(0.01)
+        await limiter.acquire_async(1)
+        holder.join()
+        assert ticks >= 10
+
+        # Rút cạn bucket rồi huỷ một request đang chờ
+        for _ in range(59):
+            await limiter.acquire_async(1)
+        waiting = asyncio.ensure_future(limiter.acquire_async(1))
+        await asyncio.sleep(0.1)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        await asyncio.sleep(0.1)
+        ticking.cancel()
+
+    asyncio.run(scenario())
+    assert limiter._queue == []
@@ -0,0 +1,40 @@
+import time
+
+from backend.rag.router import ModelRouter, ROUTE_LARGE, ROUTE_SMALL
+
+
+def test_simple_single_disease_question_routes_small():
+    router = ModelRouter(mode='active')
+
+    assert router.decide(['symptoms'], ['cum'], "x" * 500, []) == ROUTE_SMALL
+    assert router.decide(['comparison'], ['cum'], "x" * 500, []) == ROUTE_LARGE
+    assert router.decide(['symptoms'], ['cum', 'covid'], "x" * 500, []) == ROUTE_LARGE
+    assert router.decide(['symptoms', 'treatment'], ['cum'], "x" * 500, []) == ROUTE_LARGE
+    assert router.decide(['symptoms'], ['cum'], "x" * 50000, []) == ROUTE_LARGE
+
+
+def test_shadow_mode_answers_with_large_and_compares_small():
+    router = ModelRouter(mode='shadow', shadow_rate=1.0)
+    route = router.decide(['symptoms'], ['cum'], "ngu canh", [])
+
+    assert router.effective_route(route) == ROUTE_LARGE
+    assert router.should_shadow(route)
+
+    large = "Sốt, ho, đau họng.\n\nNguồn: Cúm"
+    router.run_shadow(
+        call_small=lambda: "Sốt, ho.\n\nNguồn: Cúm",
+        finalize=lambda answer: answer,
+        large_answer=large,
+        large_latency=1.0,
+        fallback_answers=("Xin lỗi",)
+    )
+    for _ in range(50):
+        if router.get_stats()['shadow']['runs']:
+            break
+        time.sleep(0.02)
+
+    shadow = router.get_stats()['shadow']
+    assert shadow['runs'] == 1
+    assert shadow['source_agreement'] == 1.0
+    assert 0 < shadow['avg_similarity'] < 1
+    assert shadow['small_fallback_rate'] == 0.0
@@ -0,0 +1,32 @@
+from backend.utils.multi_pattern import MultiPatternMatcher, group_matches
+from scripts.benchmark_safety import build_samples, compiled_pipeline, legacy_pipeline
+
+
+def test_matcher_finds_overlapping_terms_like_substring_search():
+    terms = ['hen', 'hen suyễn', 'suyễn', 'viêm họng', 'họng']
+    matcher = MultiPatternMatcher({'disease': terms})
+    text = "bé bị hen suyễn kèm viêm họng, họng đỏ"
+
+    expected = {t: [i for i in range(len(text)) if text.startswith(t, i)] for t in terms}
+    assert matcher.find_grouped(text) == {'disease': expected}
+    assert group_matches(matcher.find_all(text)) == matcher.find_grouped(text)
+
+    scanner = matcher.scanner()
+    for i in range(0, len(text), 4):
+        scanner.feed(text[i:i + 4])
+    assert sorted(scanner.matches) == sorted(matcher.find_all(text))
+
+
+def test_compiled_safety_pipeline_matches_legacy_decisions():
+    for question, context, answer in build_samples(150, seed=3):
+        assert compiled_pipeline(question, context, answer) == \
+            legacy_pipeline(question, context, answer)
+
+
+def test_grouped_scan_stops_at_first_stop_label():
+    matcher = MultiPatternMatcher({'policy': ['tôi chẩn đoán'], 'disease': ['cúm', 'sốt rét']})
+    text = "bệnh cúm. tôi chẩn đoán sốt rét"
+
+    assert matcher.find_grouped(text, stop_labels=('policy',)) == {
+        'disease': {'cúm': [5]}, 'policy': {'tôi chẩn đoán': [10]}}
+    assert 'sốt rét' in matcher.find_grouped(text)['disease']
@@ -0,0 +1,58 @@
+import numpy as np
+
+from backend.rag.pipeline import RAGPipeline
+from backend.rag.pre_gate import PreGate
+from backend.rag.semantic_cache import SemanticCache
+
+
+def _vec(*values):
+    return np.array(values, dtype='float32')
+
+
+def test_near_duplicate_hit_requires_same_intent_and_disease():
+    cache = SemanticCache(max_entries=2, max_distance=0.05)
+    flu = ['cum_mua.txt']
+    cache.put("cúm có triệu chứng gì", _vec(1, 0, 0), ['symptom'], flu, "A1", 'v1')
+
+    assert cache.get(_vec(0.99, 0.05, 0), ['symptom'], flu, 'v1') == "A1"
+    assert cache.get(_vec(0.99, 0.05, 0), ['prevention'], flu, 'v1') is None
+    assert cache.get(_vec(0.7, 0.7, 0), ['symptom'], flu, 'v1') is None
+
+    # LRU: bản ghi vừa được dùng ("A1") được giữ lại khi vượt dung lượng
+    cache.put("q2", _vec(0, 1, 0), ['cause'], flu, "A2", 'v1')
+    cache.get(_vec(1, 0, 0), ['symptom'], flu, 'v1')
+    cache.put("q3", _vec(0, 0, 1), ['general'], flu, "A3", 'v1')
+    assert cache.get(_vec(0, 1, 0), ['cause'], flu, 'v1') is None
+    assert cache.get(_vec(1, 0, 0), ['symptom'], flu, 'v1') == "A1"
+
+    # Chỉ mục build lại -> toàn bộ bản ghi bị vô hiệu hóa
+    assert cache.get(_vec(1, 0, 0), ['symptom'], flu, 'v2') is None
+    stats = cache.get_stats()
+    assert stats['hits'] == 3 and stats['evictions'] == 1
+    assert stats['rejected_by_intent_or_disease'] == 1 and stats['invalidations'] == 1
+
+
+def test_pipeline_serves_first_turn_questions_from_retrieval_embedding():
+    class EmbeddingRetriever:
+        index_version = 'v1'
+
+        def retrieve(self, question, top_k=None, apply_threshold=True, trace=None):
+            trace.update({'query_embedding': _vec(1, 0.01 * len(question), 0),
+                          'intents': ['symptom'], 'target_diseases': ['cum_mua.txt'],
+                          'dense_tier': 'full'})
+            return [{'content': "Cúm mùa gây sốt cao, ho.", 'metadata': {'source': 'cum_mua.txt'}}]
+
+    pipeline = RAGPipeline(EmbeddingRetriever(), top_k=3, pre_gate=PreGate(),
+                           semantic_cache=SemanticCache())
+    first = pipeline.prepare("Cúm có triệu chứng gì?")
+    assert first.short_answer is None
+    # Câu trả lời không có nguồn thật không được đệm
+    pipeline.remember(first, "Cúm mùa gây sốt cao.\n\nNguồn: Không có")
+    assert pipeline.semantic_cache.get_stats()['stores'] == 0
+    pipeline.remember(first, "Cúm mùa gây sốt cao, ho.\n\nNguồn: Cúm mùa")
+
+    again = pipeline.prepare("Dấu hiệu bệnh cúm là gì?")
+    assert again.short_circuit_stage == 'semantic_cache'
+    assert again.short_answer.endswith("Nguồn: Cúm mùa")
+    follow_up = pipeline.prepare("Dấu hiệu bệnh cúm là gì?", [("Xin chào", "Chào bạn")])
+    assert follow_up.short_answer is None
@@ -0,0 +1,91 @@
+import threading
+import time
+
+from backend.rag.single_flight import SingleFlight
+
+
+def test_identical_concurrent_requests_share_one_producer():
+    flight = SingleFlight()
+    calls = []
+
+    def producer():
+        calls.append(1)
+        for part in ("Sốt ", "xuất ", "huyết"):
+            time.sleep(0.05)
+            yield part
+
+    key = SingleFlight.make_key("Sốt xuất huyết là gì?", [], "v1")
+    results = []
+
+    def worker():
+        results.append("".join(flight.stream(key, producer)))
+
+    threads = [threading.Thread(target=worker) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert results == ["Sốt xuất huyết"] * 5
+    stats = flight.get_stats()
+    assert stats["requests_coalesced"] == 4
+    assert stats["max_subscribers"] == 5
+    assert stats["in_flight"] == 0
+
+
+def test_key_only_for_first_turn_and_index_version():
+    assert SingleFlight.make_key("Cảm cúm?", [("a", "b")], "v1") is None
+    assert SingleFlight.make_key("Cảm cúm?", [], "v1") != SingleFlight.make_key("Cảm cúm?", [], "v2")
+
+
+def test_producer_error_reaches_every_subscriber():
+    flight = SingleFlight()
+
+    def producer():
+        time.sleep(0.05)
+        raise RuntimeError("API_RATE_LIMIT")
+        yield  # pragma: no cover
+
+    errors = []
+
+    def worker():
+        try:
+            list(flight.stream("k", producer))
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=worker) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == ["API_RATE_LIMIT"] * 3
+
+
+def test_flight_is_cancelled_when_last_subscriber_leaves():
+    from backend.api.resilience import CancellationToken
+
+    flight = SingleFlight()
+    seen_tokens = []
+    stopped = threading.Event()
+
+    def producer():
+        token = SingleFlight.current_cancel_token()
+        seen_tokens.append(token)
+        for _ in range(100):
+            if token.cancelled:
+                stopped.set()
+                return
+            time.sleep(0.02)
+            yield "."
+
+    subscriber_token = CancellationToken()
+    stream = flight.stream("k", producer, cancel_token=subscriber_token)
+    assert next(stream) == "."
+    subscriber_token.cancel("client_disconnected")
+    stream.close()
+
+    assert stopped.wait(2.0)
+    assert seen_tokens[0].reason == "all_subscribers_left"
+    assert flight.get_stats()["in_flight"] == 0
@@ -0,0 +1,47 @@
+import threading
+import time
+
+from backend.api.stream_buffer import StreamBuffer, format_event_id, parse_event_id
+
+
+def test_resume_replays_only_events_after_last_seq():
+    buffer = StreamBuffer(ttl=60, grace=1)
+    mid = buffer.create()
+    for part in ("Sốt ", "xuất ", "huyết"):
+        buffer.append(mid, {'type': 'token', 'content': part})
+    buffer.append(mid, {'type': 'done'}, final=True)
+
+    parsed = parse_event_id(format_event_id(mid, 2))
+    assert parsed == (mid, 2)
+    events = [e for _, e in buffer.follow(*parsed, heartbeat=0.01, resume=True)]
+    assert events == [{'type': 'token', 'content': 'huyết'}, {'type': 'done'}]
+    assert buffer.get_stats()['resumes'] == 1
+    assert parse_event_id("khong-hop-le") is None
+
+
+def test_resume_requires_the_owner():
+    buffer = StreamBuffer(ttl=60, grace=1)
+    mid = buffer.create(owner=7)
+    assert buffer.has(mid, owner=7)
+    assert not buffer.has(mid, owner=8)
+
+
+def test_abandon_only_after_grace_without_reconnect():
+    buffer = StreamBuffer(ttl=60, grace=0.1)
+    abandoned = threading.Event()
+    mid = buffer.create(on_abandon=abandoned.set)
+    buffer.append(mid, {'type': 'token', 'content': 'a'})
+
+    # Client rời đi rồi nối lại trong thời gian chờ -> không hủy
+    first = buffer.follow(mid, heartbeat=0.01)
+    next(first)
+    first.close()
+    second = buffer.follow(mid, 1, heartbeat=0.01)
+    assert next(second) == (None, None)
+    time.sleep(0.2)
+    assert not abandoned.is_set()
+
+    # Rời đi hẳn -> hủy sau thời gian chờ
+    second.close()
+    assert abandoned.wait(1.0)
+    assert buffer.get_stats()['abandoned'] == 1
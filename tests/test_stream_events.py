@@ -0,0 +1,113 @@
+import json
+
+import pytest
+
+from backend.api.groq_client import GroqClient
+from backend.api.mock_server import MockGroqServer
+from backend.rag.chain import RAGChain
+from config.config import config
+
+QUESTION = "Triệu chứng cúm mùa là gì?"
+
+
+class FakeRetriever:
+    index_version = 'test'
+
+    def retrieve(self, question, top_k=None, apply_threshold=True, trace=None):
+        return [{
+            'content': "Cúm mùa - Dấu hiệu thường gặp:\n\nSốt cao.\nHo, đau họng.",
+            'metadata': {'source': 'cum_mua.txt', 'section_title': 'Dấu hiệu thường gặp'}
+        }]
+
+    def get_stats(self):
+        return {}
+
+
+@pytest.fixture
+def chain(monkeypatch):
+    monkeypatch.setattr(config, 'COMPLETION_CACHE_ENABLED', False)
+    monkeypatch.setattr(config, 'SINGLE_FLIGHT_ENABLED', False)
+    monkeypatch.setattr(config, 'ROUTER_MODE', 'off')
+    with MockGroqServer(ttft=0.05, tokens_per_second=500, seed=1) as server:
+        llm = GroqClient(api_key="mock-key-events", model="mock-model",
+                         base_url=server.base_url, max_retries=1)
+        yield RAGChain(retriever=FakeRetriever(), llm_client=llm)
+
+
+def test_retrieval_done_precedes_first_token(chain):
+    events = list(chain.ask_events(QUESTION))
+    types = [e['type'] for e in events]
+    assert types[0] == 'retrieval_done' and 'token' in types
+    assert types.index('retrieval_done') < types.index('token')
+
+    retrieval = events[0]
+    assert retrieval['sources'] == ['Cúm mùa']
+    assert retrieval['retrieval_ms'] is not None and retrieval['elapsed_ms'] >= 0
+    assert events[-1]['content'].endswith("Nguồn: Cúm mùa")
+
+
+def test_sse_stream_sends_sources_early_and_confirms_them_last(chain, monkeypatch):
+    # frontend.app kết nối SQL Server lúc import
+    pytest.importorskip("pyodbc")
+    from backend.api.stream_buffer import StreamBuffer
+    import frontend.app as web
+
+    class RecordingDB:
+        def create_chat_session(self, user_id, name):
+            return 1
+
+        def get_chat_history(self, session_id):
+            return []
+
+        def save_chat_message(self, session_id, sender, text):
+            pass
+
+    class Bot:
+        rag_chain = chain
+
+    monkeypatch.setattr(web, 'db', RecordingDB())
+    monkeypatch.setattr(web, 'get_chatbot', lambda: Bot())
+    monkeypatch.setattr(web, 'stream_buffer', StreamBuffer())
+
+    client = web.app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+    body = client.post('/api/chat/stream', json={'message': QUESTION}).get_data(as_text=True)
+    events = [json.loads(line[len('data: '):]) for line in body.split('\n')
+              if line.startswith('data: ')]
+
+    types = [e['type'] for e in events]
+    assert types == ['session_id', 'retrieval_done', 'token', 'sources', 'done']
+    assert events[1]['sources'] == ['Cúm mùa']
+    # Sự kiện cuối xác nhận nguồn mà câu trả lời thực sự trích dẫn
+    assert events[3]['sources'] == ['Cúm mùa']
+
+
+def test_health_chatbot_async_entry_points_forward_deadline():
+    import asyncio
+
+    from backend.api.resilience import Deadline
+    from backend.rag.chain import HealthChatbot
+
+    class SpyChain:
+        deadlines = []
+
+        async def ask_async(self, question, chat_history=None, return_sources=True,
+                            deadline=None):
+            self.deadlines.append(deadline)
+            return "Trả lời"
+
+        async def ask_stream_async(self, question, chat_history=None, return_sources=True,
+                                   deadline=None):
+            self.deadlines.append(deadline)
+            yield "Trả lời"
+
+    async def scenario(bot, deadline):
+        await bot.chat_async(QUESTION, deadline=deadline)
+        return [chunk async for chunk in bot.chat_stream_async(QUESTION, deadline=deadline)]
+
+    bot = HealthChatbot(rag_chain=SpyChain())
+    deadline = Deadline(5.0)
+    assert asyncio.run(scenario(bot, deadline)) == ["Trả lời"]
+    assert SpyChain.deadlines == [deadline, deadline]
+    assert len(bot.get_history()) == 2
@@ -0,0 +1,53 @@
+from backend.rag.prompts import build_messages
+
+
+def _context(n_chunks, chunk_chars):
+    return "\n---\n".join(
+        f"[Tài liệu {i} - benh_{i}.txt]\n" + ("triệu chứng sốt ho " * chunk_chars)[:chunk_chars]
+        for i in range(1, n_chunks + 1)
+    )
+
+
+def test_budget_drops_oldest_history_and_lowest_ranked_chunks():
+    history = [(f"câu hỏi {i} " * 50, f"trả lời {i} " * 200) for i in range(10)]
+    context = _context(5, 3000)
+    sources = ", ".join(f"benh_{i}.txt" for i in range(1, 6))
+
+    report = {}
+    messages = build_messages("Sốt là gì?", context, chat_history=history,
+                              sources=sources, token_budget=3000, budget_report=report)
+
+    assert report['total'] <= 3000
+    assert report['chunks_kept'] < 5
+    assert isinstance(report['context'], int) and report['context'] > 0
+    assert report['context_obj'].startswith("[Tài liệu 1 - benh_1.txt]")
+    assert "benh_5.txt" not in messages[-1]['content']
+    # Lịch sử giữ lại luôn là các lượt mới nhất
+    if report['turns_kept']:
+        assert messages[-2]['content'].startswith("trả lời 9")
+
+
+def test_budget_disabled_keeps_full_prompt():
+    context = _context(3, 500)
+    report = {}
+    messages = build_messages("Sốt là gì?", context, chat_history=[("a", "b")],
+                              token_budget=0, budget_report=report)
+
+    assert report['context_obj'] == context
+    assert len(messages) == 4
+
+
+def test_structured_context_is_trimmed_without_reparsing():
+    from backend.rag.prompts import extract_sources_from_context, format_context
+
+    docs = [{'content': ("triệu chứng sốt ho " * 200)[:3000], 'metadata': {'source': f'benh_{i}.txt'}}
+            for i in range(1, 6)]
+    context = format_context(docs)
+    report = {}
+    build_messages("Sốt là gì?", context, sources=", ".join(context.sources()),
+                   token_budget=3000, budget_report=report)
+
+    fitted = report['context_obj']
+    assert fitted.sources() == extract_sources_from_context(str(fitted))
+    assert 0 < len(fitted.chunks) < 5
+    assert str(fitted).startswith("[Tài liệu 1 - benh_1.txt]")
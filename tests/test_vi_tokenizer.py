@@ -0,0 +1,18 @@
+from backend.rag.prompts import check_context_relevance, format_context
+from backend.utils import vi_tokenizer
+
+
+def test_relevance_gate_tokenizes_each_question_once():
+    docs = [{'content': "Sốt xuất huyết gây sốt cao và xuất huyết dưới da.",
+             'metadata': {'source': 'sot_xuat_huyet.txt'}}]
+    context = format_context(docs)
+    question = "Dấu hiệu xuất huyết dưới da là gì?"
+
+    before = vi_tokenizer.tokenize.cache_info()
+    assert check_context_relevance(question, context)
+    assert check_context_relevance(question, str(context))
+    after = vi_tokenizer.tokenize.cache_info()
+
+    assert after.misses - before.misses <= 1
+    assert after.hits - before.hits >= 1
+    assert not check_context_relevance("Giá vàng hôm nay thế nào?", context)